@@ -0,0 +1,54 @@
+# Generated by Django 4.2.30 on 2026-10-18 05:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pretixbase", "0281_event_is_remote"),
+        ("pretixapi", "0013_alter_webhookcallretry_retry_not_before"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="webhook",
+            name="batch_delay",
+            field=models.PositiveIntegerField(default=10),
+        ),
+        migrations.AddField(
+            model_name="webhook",
+            name="batch_size",
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.CreateModel(
+            name="WebHookQueuedEvent",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("action_type", models.CharField(max_length=255)),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("retry_not_before", models.DateTimeField(null=True)),
+                ("retry_count", models.PositiveIntegerField(default=0)),
+                (
+                    "logentry",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="webhook_queued_events",
+                        to="pretixbase.logentry",
+                    ),
+                ),
+                (
+                    "webhook",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="queued_events",
+                        to="pretixapi.webhook",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ("id",),
+            },
+        ),
+    ]
@@ -21,6 +21,7 @@
 #
 from datetime import timedelta
 
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.urls import reverse
 from django.utils.timezone import now
@@ -118,6 +119,17 @@ class WebHook(models.Model):
     all_events = models.BooleanField(default=True, verbose_name=_("All events (including newly created ones)"))
     limit_events = models.ManyToManyField('pretixbase.Event', verbose_name=_("Limit to events"), blank=True)
     comment = models.CharField(verbose_name=_("Comment"), max_length=255, null=True, blank=True)
+    batch_size = models.PositiveIntegerField(
+        verbose_name=_("Batch size"), null=True, blank=True,
+        validators=[MinValueValidator(1), MaxValueValidator(1000)],
+        help_text=_("If set, notifications are collected and delivered in batches of up to this many notifications "
+                    "per request. The request body will then be a list of notifications in the order they occurred.")
+    )
+    batch_delay = models.PositiveIntegerField(
+        verbose_name=_("Maximum batch delay"), default=10,
+        validators=[MaxValueValidator(3600)],
+        help_text=_("In seconds. An incomplete batch is sent at the latest after this time.")
+    )
 
     class Meta:
         ordering = ('id',)
@@ -165,6 +177,22 @@ class WebHookCallRetry(models.Model):
         unique_together = (('webhook', 'logentry'),)
 
 
+class WebHookQueuedEvent(models.Model):
+    """
+    A notification waiting to be delivered to a webhook with batched delivery.
+    """
+    id = models.BigAutoField(primary_key=True)
+    webhook = models.ForeignKey('WebHook', on_delete=models.CASCADE, related_name='queued_events')
+    logentry = models.ForeignKey('pretixbase.LogEntry', on_delete=models.CASCADE, related_name='webhook_queued_events')
+    action_type = models.CharField(max_length=255)
+    created = models.DateTimeField(auto_now_add=True)
+    retry_not_before = models.DateTimeField(null=True)
+    retry_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ('id',)
+
+
 class ApiCall(models.Model):
     idempotency_key = models.CharField(max_length=190, db_index=True)
     auth_hash = models.CharField(max_length=190, db_index=True)
@@ -19,8 +19,18 @@
 # You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
 # <https://www.gnu.org/licenses/>.
 #
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.filters import OrderingFilter
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 from pretix.helpers import get_deterministic_ordering
 
@@ -30,6 +40,124 @@ class Pagination(PageNumberPagination):
     max_page_size = 50
 
 
+class CursorPagination(Pagination):
+    """
+    Page number pagination that can be switched to keyset pagination by passing ``pagination=cursor``. In that mode,
+    every page is selected by a filter on the ordering field and the primary key of the last object of the previous
+    page instead of an offset, and no total count is computed. This keeps the cost per page constant for large lists.
+
+    Only a single non-nullable ordering field is used as the key. If the requested ordering can't be used, the list
+    is ordered by primary key instead.
+    """
+    cursor_query_param = 'cursor'
+    cursor_max_page_size = 1000
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = request.query_params.get('pagination') == 'cursor'
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_cursor_page_size(request)
+        self.key_name, self.key_field, descending = self.get_cursor_key(queryset)
+        if self.key_name == 'pk':
+            queryset = queryset.order_by('-pk' if descending else 'pk')
+        else:
+            queryset = queryset.order_by(*(('-' + f if descending else f) for f in (self.key_name, 'pk')))
+
+        cursor = self.decode_cursor(request)
+        if cursor:
+            value, pk = cursor
+            op = 'lt' if descending else 'gt'
+            if self.key_name == 'pk':
+                queryset = queryset.filter(**{f'pk__{op}': pk})
+            else:
+                queryset = queryset.filter(
+                    Q(**{f'{self.key_name}__{op}': value}) | Q(**{self.key_name: value, f'pk__{op}': pk})
+                )
+
+        results = list(queryset[:page_size + 1])
+        self.has_next = len(results) > page_size
+        self.page = results[:page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_cursor_link()),
+            ('previous', None),
+            ('results', data)
+        ]))
+
+    def get_cursor_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+            if page_size > 0:
+                return min(page_size, self.cursor_max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def get_cursor_key(self, queryset):
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        if ordering and isinstance(ordering[0], str):
+            name = ordering[0]
+            descending = name.startswith('-')
+            name = name.lstrip('-')
+            field = self._resolve_key_field(queryset, name)
+            if field is not None:
+                return name, field, descending
+        return 'pk', queryset.model._meta.pk, False
+
+    def _resolve_key_field(self, queryset, name):
+        if name == 'pk':
+            return queryset.model._meta.pk
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        model = queryset.model
+        parts = name.split('__')
+        for i, part in enumerate(parts):
+            try:
+                field = model._meta.get_field(part)
+            except FieldDoesNotExist:
+                return None
+            if field.null or field.many_to_many or field.one_to_many:
+                # Keyset pagination can't deal with NULL values or multiple values per row
+                return None
+            if i < len(parts) - 1:
+                if not field.is_relation:
+                    return None
+                model = field.related_model
+            elif field.is_relation:
+                return None
+        return field
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            return self.key_field.to_python(value), int(pk)
+        except (TypeError, ValueError, ValidationError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, obj):
+        value = obj
+        for part in self.key_name.split('__'):
+            value = getattr(value, part)
+        cursor = json.dumps([str(value), obj.pk])
+        return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+    def get_next_cursor_link(self):
+        if not self.has_next:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+
 class TotalOrderingFilter(OrderingFilter):
     def get_ordering(self, request, queryset, view):
         o = super().get_ordering(request, queryset, view)
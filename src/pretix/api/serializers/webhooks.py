@@ -55,7 +55,8 @@ class WebHookSerializer(I18nAwareModelSerializer):
 
     class Meta:
         model = WebHook
-        fields = ('id', 'enabled', 'target_url', 'all_events', 'limit_events', 'action_types', 'comment')
+        fields = ('id', 'enabled', 'target_url', 'all_events', 'limit_events', 'action_types', 'comment',
+                  'batch_size', 'batch_delay')
 
     def validate(self, data):
         data = super().validate(data)
@@ -20,6 +20,7 @@
 # <https://www.gnu.org/licenses/>.
 #
 import operator
+from collections import Counter
 from functools import reduce
 
 import django_filters
@@ -27,8 +28,7 @@ from django.conf import settings
 from django.core.exceptions import ValidationError as BaseValidationError
 from django.db import transaction
 from django.db.models import (
-    Count, Exists, F, Max, OrderBy, OuterRef, Prefetch, Q, Subquery,
-    prefetch_related_objects,
+    F, Max, OrderBy, OuterRef, Prefetch, Q, Subquery, prefetch_related_objects,
 )
 from django.db.models.functions import Coalesce
 from django.http import Http404
@@ -47,6 +47,7 @@ from rest_framework.generics import ListAPIView
 from rest_framework.permissions import SAFE_METHODS
 from rest_framework.response import Response
 
+from pretix.api.pagination import CursorPagination
 from pretix.api.serializers.checkin import (
     CheckinListSerializer, CheckinRPCRedeemInputSerializer,
     MiniCheckinListSerializer,
@@ -56,16 +57,18 @@ from pretix.api.serializers.order import (
     CheckinListOrderPositionSerializer, FailedCheckinSerializer,
 )
 from pretix.api.views import RichOrderingFilter
-from pretix.api.views.order import OrderPositionFilter
+from pretix.api.views.order import OrderPositionFilter, RetryException
 from pretix.base.i18n import language
 from pretix.base.models import (
     CachedFile, Checkin, CheckinList, Device, Event, Order, OrderPosition,
     Question, ReusableMedium, RevokedTicketSecret, TeamAPIToken,
 )
 from pretix.base.models.orders import PrintLog
+from pretix.base.services import checkincounters, checkinlookup, checkinsync
 from pretix.base.services.checkin import (
     CheckInError, RequiredQuestionsError, SQLLogic, perform_checkin,
 )
+from pretix.helpers.http import ChunkBasedFileResponse
 
 with scopes_disabled():
     class CheckinListFilter(FilterSet):
@@ -211,43 +214,68 @@ class CheckinListViewSet(viewsets.ModelViewSet):
 
         return Response(serializer.data, status=201)
 
+    @action(detail=True, methods=['GET'])
+    def snapshot(self, *args, **kwargs):
+        clist = self.get_object()
+        cf = checkinsync.get_snapshot(clist)
+        if not cf:
+            raise RetryException()
+        resp = ChunkBasedFileResponse(cf.file.file, content_type=cf.type)
+        resp['Content-Disposition'] = 'attachment; filename="{}"'.format(cf.filename).encode("ascii", "ignore")
+        return resp
+
+    @action(detail=True, methods=['GET'])
+    def changes(self, *args, **kwargs):
+        clist = self.get_object()
+        try:
+            limit = min(
+                int(self.request.query_params.get('limit', checkinsync.DELTA_PAGE_SIZE)),
+                checkinsync.DELTA_MAX_PAGE_SIZE
+            )
+        except ValueError:
+            raise ValidationError('Invalid limit.')
+        if limit < 1:
+            raise ValidationError('Invalid limit.')
+        try:
+            results, sync_token, has_more = checkinsync.get_changes(
+                clist, self.request.query_params.get('since'), limit
+            )
+        except checkinsync.InvalidSyncToken:
+            raise ValidationError('Invalid sync token.')
+        return Response({
+            'results': results,
+            'sync_token': sync_token,
+            'has_more': has_more,
+        })
+
     @action(detail=True, methods=['GET'])
     def status(self, *args, **kwargs):
         with language(self.request.event.settings.locale):
             clist = self.get_object()
-            cqs = clist.positions.annotate(
-                checkedin=Exists(Checkin.objects.filter(list_id=clist.pk, position=OuterRef('pk'), type=Checkin.TYPE_ENTRY))
-            ).filter(
-                checkedin=True,
-            )
-            pqs = clist.positions
+            counts = checkincounters.read(clist)
+            if counts is None:
+                counts = checkincounters.count(clist)
 
             ev = clist.subevent or clist.event
             response = {
                 'event': {
                     'name': str(ev.name),
                 },
-                'checkin_count': cqs.count(),
-                'position_count': pqs.count(),
-                'inside_count': clist.inside_count,
+                'checkin_count': sum(counts['checkins'].values()),
+                'position_count': sum(counts['positions'].values()),
+                'inside_count': counts['inside'],
             }
 
-            op_by_item = {
-                p['item']: p['cnt']
-                for p in pqs.order_by().values('item').annotate(cnt=Count('id'))
-            }
-            op_by_variation = {
-                p['variation']: p['cnt']
-                for p in pqs.order_by().values('variation').annotate(cnt=Count('id'))
-            }
-            c_by_item = {
-                p['item']: p['cnt']
-                for p in cqs.order_by().values('item').annotate(cnt=Count('id'))
-            }
-            c_by_variation = {
-                p['variation']: p['cnt']
-                for p in cqs.order_by().values('variation').annotate(cnt=Count('id'))
-            }
+            op_by_item = Counter()
+            op_by_variation = Counter()
+            for (item_id, variation_id), cnt in counts['positions'].items():
+                op_by_item[item_id] += cnt
+                op_by_variation[variation_id] += cnt
+            c_by_item = Counter()
+            c_by_variation = Counter()
+            for (item_id, variation_id), cnt in counts['checkins'].items():
+                c_by_item[item_id] += cnt
+                c_by_variation[variation_id] += cnt
 
             if not clist.all_products:
                 items = clist.limit_products
@@ -466,27 +494,36 @@ def _redeem_process(*, checkinlists, raw_barcode, answers_data, datetime, force,
         F('addon_to').asc(nulls_first=True)
     )
 
-    q = Q(secret=raw_barcode)
-    if any(cl.addon_match for cl in checkinlists):
-        q |= Q(addon_to__secret=raw_barcode)
-    if raw_barcode.isnumeric() and not untrusted_input and legacy_url_support:
-        q |= Q(pk=raw_barcode)
-
-    op_candidates = list(queryset.filter(q))
-    if not op_candidates and '+' in raw_barcode and legacy_url_support:
-        # In application/x-www-form-urlencoded, you can encodes space ' ' with '+' instead of '%20'.
-        # `id`, however, is part of a path where this technically is not allowed. Old versions of our
-        # scan apps still do it, so we try work around it!
-        q = Q(secret=raw_barcode.replace('+', ' '))
-        if any(cl.addon_match for cl in checkinlists):
-            q |= Q(addon_to__secret=raw_barcode.replace('+', ' '))
-        op_candidates = list(queryset.filter(q))
+    lookup_options = dict(
+        addon_match=any(cl.addon_match for cl in checkinlists),
+        allow_pk=raw_barcode.isnumeric() and not untrusted_input and legacy_url_support,
+    )
+    negative_cache_key = checkinlookup.negative_cache_key(
+        checkinlists[0].event.organizer_id, list(list_by_event), raw_barcode, source_type,
+        legacy_url_support=legacy_url_support, **lookup_options
+    )
+    known_unknown = checkinlookup.is_known_unknown(negative_cache_key)
+
+    op_candidates = []
+    if not known_unknown:
+        position_ids = checkinlookup.find_position_ids(list(list_by_event), raw_barcode, **lookup_options)
+        if not position_ids and '+' in raw_barcode and legacy_url_support:
+            # In application/x-www-form-urlencoded, you can encodes space ' ' with '+' instead of '%20'.
+            # `id`, however, is part of a path where this technically is not allowed. Old versions of our
+            # scan apps still do it, so we try work around it!
+            position_ids = checkinlookup.find_position_ids(
+                list(list_by_event), raw_barcode.replace('+', ' '), addon_match=lookup_options['addon_match']
+            )
+        if position_ids:
+            op_candidates = list(queryset.filter(pk__in=position_ids))
 
     # 2. Handle the "nothing found" case: Either it's really a bogus secret that we don't know (-> error), or it
     #    might be a revoked one that we actually know (-> error, but with better error message and logging and
     #    with respecting the force option), or it's a reusable medium (-> proceed with that)
     if not op_candidates:
         try:
+            if known_unknown:
+                raise ReusableMedium.DoesNotExist()
             media = ReusableMedium.objects.select_related('linked_orderposition').active().get(
                 organizer_id=checkinlists[0].event.organizer_id,
                 type=source_type,
@@ -495,9 +532,11 @@ def _redeem_process(*, checkinlists, raw_barcode, answers_data, datetime, force,
             )
             raw_barcode_for_checkin = raw_barcode
         except ReusableMedium.DoesNotExist:
-            revoked_matches = list(
+            revoked_matches = [] if known_unknown else list(
                 RevokedTicketSecret.objects.filter(event_id__in=list_by_event.keys(), secret=raw_barcode))
             if len(revoked_matches) == 0:
+                if not known_unknown:
+                    checkinlookup.remember_unknown(negative_cache_key)
                 if not simulate:
                     checkinlists[0].event.log_action('pretix.event.checkin.unknown', data={
                         'datetime': datetime,
@@ -783,6 +822,7 @@ class CheckinListPositionViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = CheckinListOrderPositionSerializer
     queryset = OrderPosition.all.none()
     filter_backends = (ExtendedBackend, RichOrderingFilter)
+    pagination_class = CursorPagination
     ordering = (F('attendee_name_cached').asc(nulls_last=True), 'pk')
     ordering_fields = (
         'order__code', 'order__datetime', 'positionid', 'attendee_name',
@@ -61,6 +61,7 @@ from pretix.base.models import (
     TaxRule, TeamAPIToken,
 )
 from pretix.base.models.event import SubEvent
+from pretix.base.services import seatoccupancy
 from pretix.base.services.quotas import QuotaAvailability
 from pretix.helpers.dicts import merge_dicts
 from pretix.helpers.i18n import i18ncomp
@@ -701,6 +702,13 @@ class SeatViewSet(ConditionalListView, viewsets.ModelViewSet):
     filterset_class = SeatFilter
 
     def get_queryset(self):
+        # Seat.annotated() needs to look at the taken seats right away if distancing is enabled, so we only want to
+        # do it once per request
+        if not hasattr(self, '_seat_queryset'):
+            self._seat_queryset = self._get_seat_queryset()
+        return self._seat_queryset.all()
+
+    def _get_seat_queryset(self):
         if self.request.event.has_subevents and 'subevent' in self.request.resolver_match.kwargs:
             try:
                 subevent = self.request.event.subevents.get(pk=self.request.resolver_match.kwargs['subevent'])
@@ -758,6 +766,8 @@ class SeatViewSet(ConditionalListView, viewsets.ModelViewSet):
         for seat in seats:
             seat.blocked = blocked
         Seat.objects.bulk_update(seats, ["blocked"], batch_size=1000)
+        for subevent_id in {seat.subevent_id for seat in seats}:
+            seatoccupancy.invalidate(self.request.event.pk, subevent_id)
         return Response({})
 
     @action(methods=["POST"], detail=False)
@@ -52,7 +52,7 @@ from rest_framework.response import Response
 
 from pretix.api.filters import MultipleCharFilter
 from pretix.api.models import OAuthAccessToken
-from pretix.api.pagination import TotalOrderingFilter
+from pretix.api.pagination import CursorPagination, TotalOrderingFilter
 from pretix.api.serializers.order import (
     BlockedTicketSecretSerializer, InvoiceSerializer, OrderCreateSerializer,
     OrderPaymentCreateSerializer, OrderPaymentSerializer,
@@ -216,6 +216,7 @@ class OrderViewSetMixin:
     serializer_class = OrderSerializer
     queryset = Order.objects.none()
     filter_backends = (DjangoFilterBackend, TotalOrderingFilter)
+    pagination_class = CursorPagination
     ordering = ('datetime',)
     ordering_fields = ('datetime', 'code', 'status', 'last_modified', 'cancellation_date')
     filterset_class = OrderFilter
@@ -1066,6 +1067,7 @@ class OrderPositionViewSet(viewsets.ModelViewSet):
     serializer_class = OrderPositionSerializer
     queryset = OrderPosition.all.none()
     filter_backends = (DjangoFilterBackend, RichOrderingFilter)
+    pagination_class = CursorPagination
     ordering = ('order__datetime', 'positionid')
     ordering_fields = ('order__code', 'order__datetime', 'positionid', 'attendee_name', 'order__status',)
     filterset_class = OrderPositionFilter
@@ -1892,6 +1894,7 @@ class InvoiceViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = InvoiceSerializer
     queryset = Invoice.objects.none()
     filter_backends = (DjangoFilterBackend, TotalOrderingFilter)
+    pagination_class = CursorPagination
     ordering = ('nr',)
     ordering_fields = ('nr', 'date')
     filterset_class = InvoiceFilter
@@ -39,7 +39,7 @@ from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
 from pretix.api.models import OAuthAccessToken
-from pretix.api.pagination import TotalOrderingFilter
+from pretix.api.pagination import CursorPagination, TotalOrderingFilter
 from pretix.api.serializers.organizer import (
     CustomerCreateSerializer, CustomerSerializer, DeviceSerializer,
     GiftCardSerializer, GiftCardTransactionSerializer, MembershipSerializer,
@@ -256,6 +256,7 @@ class GiftCardViewSet(viewsets.ModelViewSet):
 class GiftCardTransactionViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = GiftCardTransactionSerializer
     queryset = GiftCardTransaction.objects.none()
+    pagination_class = CursorPagination
     permission = 'can_manage_gift_cards'
     write_permission = 'can_manage_gift_cards'
 
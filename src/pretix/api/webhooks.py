@@ -19,13 +19,19 @@
 # You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
 # <https://www.gnu.org/licenses/>.
 #
+import http.cookiejar
 import json
 import logging
+import threading
 import time
+import uuid
 from collections import OrderedDict
 from datetime import timedelta
+from urllib.parse import urlsplit
 
 import requests
+from django.conf import settings
+from django.core.cache import cache
 from django.db import DatabaseError, connection, transaction
 from django.db.models import Exists, OuterRef, Q
 from django.dispatch import receiver
@@ -36,6 +42,7 @@ from requests import RequestException
 
 from pretix.api.models import (
     WebHook, WebHookCall, WebHookCallRetry, WebHookEventListener,
+    WebHookQueuedEvent,
 )
 from pretix.api.signals import register_webhook_events
 from pretix.base.models import LogEntry
@@ -46,6 +53,51 @@ from pretix.helpers import OF_SELF
 
 logger = logging.getLogger(__name__)
 _ALL_EVENTS = None
+_sessions = threading.local()
+
+RETRY_INTERVALS = (
+    5,  # + 5 seconds
+    30,  # + 30 seconds
+    60,  # + 1 minute
+    300,  # + 5 minutes
+    1200,  # + 20 minutes
+    3600,  # + 60 minutes
+    14400,  # + 4 hours
+    21600,  # + 6 hours
+    43200,  # + 12 hours
+    43200,  # + 24 hours
+    86400,  # + 24 hours
+)  # added up, these are approximately 3 days, as documented
+RETRY_CELERY_CUTOFF = 300
+
+# Maximum number of batches sent to the same webhook by one run of send_webhook_batch, before it hands over to a
+# new task to keep individual tasks short
+BATCHES_PER_RUN = 10
+
+# Batches of a webhook are delivered by one worker at a time. The lock needs to outlive the request, which times out
+# after 30 seconds, and the bookkeeping around it. If a worker dies while holding it, the webhook is stuck until then.
+BATCH_LOCK_TIMEOUT = 120
+
+
+def get_session(target_url):
+    """
+    Returns a ``requests`` session for the host of ``target_url``. Sessions are kept per worker thread, so
+    subsequent calls to the same receiver reuse a kept-alive connection instead of opening a new one every time.
+    The same session is used for the webhooks of all organizers, so it never stores cookies.
+    """
+    if not hasattr(_sessions, 'by_host'):
+        _sessions.by_host = OrderedDict()
+    url = urlsplit(target_url)
+    key = (url.scheme, url.netloc)
+    if key in _sessions.by_host:
+        _sessions.by_host.move_to_end(key)
+    else:
+        session = requests.Session()
+        session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        _sessions.by_host[key] = session
+        while len(_sessions.by_host) > 100:
+            _sessions.by_host.popitem(last=False)[1].close()
+    return _sessions.by_host[key]
 
 
 class WebhookEvent:
@@ -400,8 +452,9 @@ def register_default_webhook_events(sender, **kwargs):
 def notify_webhooks(logentry_ids: list):
     if not isinstance(logentry_ids, list):
         logentry_ids = [logentry_ids]
-    qs = LogEntry.all.select_related('event', 'event__organizer', 'organizer').filter(id__in=logentry_ids)
+    qs = LogEntry.all.select_related('event', 'event__organizer', 'organizer').filter(id__in=logentry_ids).order_by('id')
     _org, _at, webhooks = None, None, None
+    queued, batched_webhooks = [], {}
     for logentry in qs:
         if not logentry.organizer:
             break  # We need to know the organizer
@@ -431,7 +484,18 @@ def notify_webhooks(logentry_ids: list):
                 )
 
         for wh in webhooks:
-            send_webhook.apply_async(args=(logentry.id, notification_type.action_type, wh.pk))
+            if wh.batch_size:
+                queued.append(WebHookQueuedEvent(
+                    webhook=wh, logentry=logentry, action_type=notification_type.action_type,
+                ))
+                batched_webhooks[wh.pk] = wh
+            else:
+                send_webhook.apply_async(args=(logentry.id, notification_type.action_type, wh.pk))
+
+    if queued:
+        WebHookQueuedEvent.objects.bulk_create(queued)
+        for wh in batched_webhooks.values():
+            schedule_webhook_batch(wh)
 
 
 @app.task(base=ProfiledTask, bind=True, max_retries=5, default_retry_delay=60, acks_late=True, autoretry_for=(DatabaseError,),)
@@ -469,20 +533,8 @@ def send_webhook(self, logentry_id: int, action_type: str, webhook_id: int, retr
       periodic task ``schedule_webhook_retries_on_celery`` will schedule celery tasks for them
       once their time has come.
     """
-    retry_intervals = (
-        5,  # + 5 seconds
-        30,  # + 30 seconds
-        60,  # + 1 minute
-        300,  # + 5 minutes
-        1200,  # + 20 minutes
-        3600,  # + 60 minutes
-        14400,  # + 4 hours
-        21600,  # + 6 hours
-        43200,  # + 12 hours
-        43200,  # + 24 hours
-        86400,  # + 24 hours
-    )  # added up, these are approximately 3 days, as documented
-    retry_celery_cutoff = 300
+    retry_intervals = RETRY_INTERVALS
+    retry_celery_cutoff = RETRY_CELERY_CUTOFF
 
     with scopes_disabled():
         webhook = WebHook.objects.get(id=webhook_id)
@@ -502,7 +554,7 @@ def send_webhook(self, logentry_id: int, action_type: str, webhook_id: int, retr
         t = time.time()
 
         try:
-            resp = requests.post(
+            resp = get_session(webhook.target_url).post(
                 webhook.target_url,
                 json=payload,
                 allow_redirects=False,
@@ -574,6 +626,149 @@ def send_webhook(self, logentry_id: int, action_type: str, webhook_id: int, retr
                 return 'retry-via-db'
 
 
+def schedule_webhook_batch(webhook: WebHook):
+    """
+    Makes sure a ``send_webhook_batch`` task will run for the given webhook once its current batch is due. Only one
+    such task is scheduled per batch delay, no matter how many notifications are queued in the meantime.
+    """
+    if not settings.HAS_CELERY:
+        # Without a task queue, we can't delay anything and deliver right away
+        send_webhook_batch.apply_async(args=(webhook.pk,))
+    elif cache.add(f'webhook_batch_scheduled:{webhook.pk}', True, timeout=max(webhook.batch_delay, 1)):
+        send_webhook_batch.apply_async(args=(webhook.pk,), countdown=webhook.batch_delay)
+
+
+@app.task(base=TransactionAwareTask, bind=True, max_retries=5, default_retry_delay=60, acks_late=True,
+          autoretry_for=(DatabaseError,),)
+def send_webhook_batch(self, webhook_id: int):
+    """
+    Delivers the queued notifications of a webhook with batched delivery in batches of up to ``batch_size``
+    notifications, oldest first.
+
+    We hold a lock in the cache (not in the database) while we deliver a batch, so there is never more than one request
+    in flight per webhook and batches arrive in order without keeping a database transaction open during the request.
+    If the receiver fails, the batch at the head of the queue is retried with the same intervals as in
+    ``send_webhook``, and all later notifications wait behind it in the database instead of piling up as tasks in the
+    task queue. Follow-up runs that start right away are only queued once the lock has been released.
+    """
+    for i in range(BATCHES_PER_RUN):
+        result = _send_next_batch(webhook_id)
+        if result != 'sent':
+            return result
+
+    # More to do, continue in a fresh task
+    send_webhook_batch.apply_async(args=(webhook_id,))
+    return 'continued'
+
+
+def _send_next_batch(webhook_id):
+    key = f'webhook_batch_sending:{webhook_id}'
+    uniqid = str(uuid.uuid4())
+    if not cache.add(key, uniqid, timeout=BATCH_LOCK_TIMEOUT):
+        return 'locked'
+    try:
+        with scopes_disabled():
+            webhook = WebHook.objects.select_related('organizer').filter(id=webhook_id).first()
+        if not webhook:
+            return 'deleted'
+        with scope(organizer=webhook.organizer):
+            return _send_queued_batch(webhook)
+    finally:
+        if cache.get(key) == uniqid:
+            cache.delete(key)
+
+
+def _send_queued_batch(webhook):
+    if not webhook.enabled:
+        webhook.queued_events.all().delete()
+        return 'obsolete-webhook'
+
+    if not webhook.batch_size:
+        # Batching has been turned off in the meantime, hand over to regular delivery
+        for qe in webhook.queued_events.all():
+            send_webhook.apply_async(args=(qe.logentry_id, qe.action_type, webhook.pk, qe.retry_count))
+            qe.delete()
+        return 'unbatched'
+
+    batch = list(webhook.queued_events.select_related('logentry')[:webhook.batch_size])
+    if not batch:
+        return 'ok'
+
+    head = batch[0]
+    if head.retry_not_before and head.retry_not_before > now():
+        return 'retry-pending'
+    if len(batch) < webhook.batch_size and head.created > now() - timedelta(seconds=webhook.batch_delay):
+        if settings.HAS_CELERY:
+            countdown = (head.created + timedelta(seconds=webhook.batch_delay) - now()).total_seconds()
+            send_webhook_batch.apply_async(args=(webhook.pk,), countdown=max(countdown, 1))
+            return 'waiting'
+
+    types = get_all_webhook_events()
+    payload = []
+    for qe in batch:
+        event_type = types.get(qe.action_type)
+        p = event_type.build_payload(qe.logentry) if event_type else None
+        if p is not None:  # otherwise, plugin not installed or content object deleted
+            payload.append(p)
+    if payload:
+        result = _deliver_batch(webhook, batch, payload)
+        if result != 'ok':
+            return result
+    WebHookQueuedEvent.objects.filter(pk__in=[qe.pk for qe in batch]).delete()
+    return 'sent'
+
+
+def _deliver_batch(webhook, batch, payload):
+    head = batch[0]
+    action_types = sorted({qe.action_type for qe in batch})
+    t = time.time()
+    try:
+        resp = get_session(webhook.target_url).post(
+            webhook.target_url,
+            json=payload,
+            allow_redirects=False,
+            timeout=30,
+        )
+    except RequestException as e:
+        return_code, response_body, success = 0, str(e), False
+    else:
+        return_code, response_body, success = resp.status_code, resp.text, 200 <= resp.status_code <= 299
+
+    WebHookCall.objects.create(
+        webhook=webhook,
+        action_type=", ".join(action_types)[:255],
+        target_url=webhook.target_url,
+        is_retry=head.retry_count > 0,
+        execution_time=time.time() - t,
+        return_code=return_code,
+        payload=json.dumps(payload),
+        response_body=response_body[:1024 * 1024],
+        success=success,
+    )
+    if success:
+        return 'ok'
+    if return_code == 410:
+        webhook.enabled = False
+        webhook.save()
+        webhook.queued_events.all().delete()
+        return 'gone'
+
+    queued = WebHookQueuedEvent.objects.filter(pk__in=[qe.pk for qe in batch])
+    if head.retry_count >= len(RETRY_INTERVALS):
+        queued.delete()
+        return 'retry-given-up'
+
+    interval = RETRY_INTERVALS[head.retry_count]
+    queued.update(
+        retry_count=head.retry_count + 1,
+        retry_not_before=now() + timedelta(seconds=interval),
+    )
+    if interval < RETRY_CELERY_CUTOFF:
+        send_webhook_batch.apply_async(args=(webhook.pk,), countdown=interval)
+        return 'retry-via-celery'
+    return 'retry-via-db'
+
+
 @app.task(base=TransactionAwareTask)
 def manually_retry_all_calls(webhook_id: int):
     with scopes_disabled():
@@ -587,6 +782,8 @@ def manually_retry_all_calls(webhook_id: int):
                 args=(whcr.logentry_id, whcr.action_type, whcr.webhook_id, whcr.retry_count),
             )
             whcr.delete()
+        webhook.queued_events.update(retry_not_before=None)
+    send_webhook_batch.apply_async(args=(webhook_id,))
 
 
 @receiver(signal=periodic_task, dispatch_uid='pretixapi_schedule_webhook_retries_on_celery')
@@ -601,3 +798,17 @@ def schedule_webhook_retries_on_celery(sender, **kwargs):
                 args=(whcr.logentry_id, whcr.action_type, whcr.webhook_id, whcr.retry_count),
             )
             whcr.delete()
+
+
+@receiver(signal=periodic_task, dispatch_uid='pretixapi_schedule_webhook_batches_on_celery')
+@scopes_disabled()
+def schedule_webhook_batches_on_celery(sender, **kwargs):
+    # Safety net for batches whose scheduled task got lost or which are waiting for a retry via the database
+    due = WebHook.objects.filter(
+        Exists(WebHookQueuedEvent.objects.filter(
+            Q(retry_not_before__isnull=True) | Q(retry_not_before__lt=now()),
+            webhook=OuterRef('pk'),
+        ))
+    )
+    for webhook in due:
+        schedule_webhook_batch(webhook)
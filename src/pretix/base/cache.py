@@ -20,19 +20,203 @@
 # <https://www.gnu.org/licenses/>.
 #
 import hashlib
+import json
+import logging
+import os
+import pickle
+import threading
 import time
+from collections import OrderedDict
 from typing import Callable, Dict, List
 
+from django.conf import settings
 from django.core.cache import caches
 from django.db.models import Model
 
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = 'pretix:cache:invalidate'
+PREFIX_CHECK_BATCH_SIZE = 100
+
+_MISSING = object()
+
+
+class LocalCacheTier:
+    """
+    A bounded in-process LRU cache that is put in front of the shared cache by ``NamespacedCache`` if
+    ``CACHE_LOCAL_TIER`` is enabled. Values are kept for at most ``timeout`` seconds, so another process can
+    observe a value that was overwritten in the shared cache for at most that long. Deletions and namespace
+    invalidations are broadcast to all processes through redis and take effect immediately.
+
+    Namespace prefixes are revalidated against the shared cache at most every ``timeout`` seconds. When a prefix
+    needs to be revalidated, all other prefixes that are due are checked in the same round trip.
+
+    Values are stored pickled, just like in Django's local-memory cache, to make sure callers cannot modify
+    cached objects by accident. The instance is shared between all threads of a process.
+    """
+
+    def __init__(self, max_entries: int, timeout: int):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._values = OrderedDict()
+        self._prefixes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> any:
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                return _MISSING
+            if entry[0] < time.monotonic():
+                del self._values[key]
+                return _MISSING
+            self._values.move_to_end(key)
+        return pickle.loads(entry[1])
+
+    def set(self, key: str, value: any, timeout: int=None):
+        if value is None:
+            # None can't be told apart from a cache miss in the shared cache, so we don't cache it either
+            return
+        if timeout is not None and timeout <= 0:
+            self.delete(key)
+            return
+        timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._values[key] = (time.monotonic() + timeout, data)
+            self._values.move_to_end(key)
+            while len(self._values) > self.max_entries:
+                self._values.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._values.pop(key, None)
+
+    def get_prefix(self, prefixkey: str, shared) -> any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._prefixes.get(prefixkey)
+            if entry and entry[0] > now:
+                return entry[1]
+            # All prefixes share the same validity period, so the ones that are due are at the front
+            due = [prefixkey]
+            for k, (valid_until, prefix) in self._prefixes.items():
+                if valid_until > now or len(due) >= PREFIX_CHECK_BATCH_SIZE:
+                    break
+                if k != prefixkey:
+                    due.append(k)
+
+        values = shared.get_many(due)
+        with self._lock:
+            for k in due:
+                if values.get(k) is not None:
+                    self._store_prefix(k, values[k])
+                else:
+                    self._prefixes.pop(k, None)
+        return values.get(prefixkey)
+
+    def set_prefix(self, prefixkey: str, prefix: any):
+        with self._lock:
+            self._store_prefix(prefixkey, prefix)
+
+    def _store_prefix(self, prefixkey: str, prefix: any):
+        self._prefixes[prefixkey] = (time.monotonic() + self.timeout, prefix)
+        self._prefixes.move_to_end(prefixkey)
+        while len(self._prefixes) > self.max_entries:
+            self._prefixes.popitem(last=False)
+
+    def forget_prefix(self, prefixkey: str):
+        with self._lock:
+            self._prefixes.pop(prefixkey, None)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+            self._prefixes.clear()
+
+
+_local_tiers = {}
+_local_tiers_lock = threading.Lock()
+_listener_pid = None
+
+
+def get_local_tier(alias: str):
+    """
+    Returns the in-process cache tier for the given cache alias, or ``None`` if it is not enabled.
+    """
+    if not settings.CACHE_LOCAL_TIER or not settings.HAS_REDIS:
+        return None
+    tier = _local_tiers.get(alias)
+    if tier is None:
+        with _local_tiers_lock:
+            tier = _local_tiers.setdefault(
+                alias, LocalCacheTier(settings.CACHE_LOCAL_TIER_SIZE, settings.CACHE_LOCAL_TIER_TIMEOUT)
+            )
+    _ensure_listener()
+    return tier
+
+
+def _ensure_listener():
+    global _listener_pid
+    # Checking the pid makes sure we start a new listener in processes forked off after the first use
+    if _listener_pid == os.getpid():
+        return
+    with _local_tiers_lock:
+        if _listener_pid == os.getpid():
+            return
+        _listener_pid = os.getpid()
+        threading.Thread(target=_listen, name='pretix-cache-invalidation', daemon=True).start()
+
+
+def _listen():
+    import django_redis
+
+    while True:
+        try:
+            pubsub = django_redis.get_redis_connection("redis").pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+            for message in pubsub.listen():
+                handle_invalidation(message['data'])
+        except Exception:
+            logger.exception('Cache invalidation listener failed, reconnecting.')
+        # We might have missed invalidations while we were disconnected
+        for tier in list(_local_tiers.values()):
+            tier.clear()
+        time.sleep(1)
+
+
+def publish_invalidation(alias: str, prefixkey: str=None, keys: List[str]=None):
+    import django_redis
+
+    try:
+        django_redis.get_redis_connection("redis").publish(INVALIDATION_CHANNEL, json.dumps({
+            'alias': alias,
+            'prefix': prefixkey,
+            'keys': keys or [],
+        }))
+    except Exception:
+        logger.exception('Could not publish cache invalidation.')
+
+
+def handle_invalidation(data):
+    message = json.loads(data)
+    tier = _local_tiers.get(message['alias'])
+    if not tier:
+        return
+    if message.get('prefix'):
+        tier.forget_prefix(message['prefix'])
+    for key in message.get('keys', []):
+        tier.delete(key)
+
 
 class NamespacedCache:
 
     def __init__(self, prefixkey: str, cache: str='default'):
         self.cache = caches[cache]
+        self.alias = cache
         self.prefixkey = prefixkey
         self._last_prefix = None
+        self._local = get_local_tier(cache)
 
     def _prefix_key(self, original_key: str, known_prefix=None) -> str:
         # Race conditions can happen here, but should be very very rare.
@@ -40,10 +224,17 @@ class NamespacedCache:
         # memcached's `add` keyword instead of `set`.
         # See also:
         # https://code.google.com/p/memcached/wiki/NewProgrammingTricks#Namespacing
-        prefix = known_prefix or self.cache.get(self.prefixkey)
+        if known_prefix:
+            prefix = known_prefix
+        elif self._local:
+            prefix = self._local.get_prefix(self.prefixkey, self.cache)
+        else:
+            prefix = self.cache.get(self.prefixkey)
         if prefix is None:
             prefix = int(time.time())
             self.cache.set(self.prefixkey, prefix)
+            if self._local:
+                self._local.set_prefix(self.prefixkey, prefix)
         self._last_prefix = prefix
         key = '%s:%d:%s' % (self.prefixkey, prefix, original_key)
         if len(key) > 200:  # Hash long keys, as memcached has a length limit
@@ -61,22 +252,63 @@ class NamespacedCache:
         except ValueError:
             prefix = int(time.time())
             self.cache.set(self.prefixkey, prefix)
+        if self._local:
+            self._local.forget_prefix(self.prefixkey)
+            publish_invalidation(self.alias, prefixkey=self.prefixkey)
+
+    def _forget_local(self, keys: List[str]):
+        if self._local:
+            for key in keys:
+                self._local.delete(key)
+            publish_invalidation(self.alias, keys=keys)
 
     def set(self, key: str, value: any, timeout: int=300):
-        return self.cache.set(self._prefix_key(key), value, timeout)
+        key = self._prefix_key(key)
+        if self._local:
+            self._local.set(key, value, timeout)
+        return self.cache.set(key, value, timeout)
 
     def get(self, key: str) -> any:
-        return self.cache.get(self._prefix_key(key, known_prefix=self._last_prefix))
+        key = self._prefix_key(key, known_prefix=self._last_prefix)
+        if self._local:
+            value = self._local.get(key)
+            if value is not _MISSING:
+                return value
+            value = self.cache.get(key)
+            self._local.set(key, value)
+            return value
+        return self.cache.get(key)
 
     def get_or_set(self, key: str, default: Callable, timeout=300) -> any:
-        return self.cache.get_or_set(
-            self._prefix_key(key, known_prefix=self._last_prefix),
+        key = self._prefix_key(key, known_prefix=self._last_prefix)
+        if self._local:
+            value = self._local.get(key)
+            if value is not _MISSING:
+                return value
+        value = self.cache.get_or_set(
+            key,
             default=default,
             timeout=timeout
         )
+        if self._local:
+            self._local.set(key, value, timeout)
+        return value
 
     def get_many(self, keys: List[str]) -> Dict[str, any]:
-        values = self.cache.get_many([self._prefix_key(key) for key in keys])
+        prefixed_keys = [self._prefix_key(key) for key in keys]
+        values = {}
+        if self._local:
+            for k in prefixed_keys:
+                value = self._local.get(k)
+                if value is not _MISSING:
+                    values[k] = value
+            prefixed_keys = [k for k in prefixed_keys if k not in values]
+        if prefixed_keys:
+            fetched = self.cache.get_many(prefixed_keys)
+            if self._local:
+                for k, v in fetched.items():
+                    self._local.set(k, v)
+            values.update(fetched)
         newvalues = {}
         for k, v in values.items():
             newvalues[self._strip_prefix(k)] = v
@@ -86,19 +318,38 @@ class NamespacedCache:
         newvalues = {}
         for k, v in values.items():
             newvalues[self._prefix_key(k)] = v
+        if self._local:
+            for k, v in newvalues.items():
+                self._local.set(k, v, timeout)
         return self.cache.set_many(newvalues, timeout)
 
     def delete(self, key: str):  # NOQA
-        return self.cache.delete(self._prefix_key(key))
+        key = self._prefix_key(key)
+        try:
+            return self.cache.delete(key)
+        finally:
+            self._forget_local([key])
 
     def delete_many(self, keys: List[str]):  # NOQA
-        return self.cache.delete_many([self._prefix_key(key) for key in keys])
+        keys = [self._prefix_key(key) for key in keys]
+        try:
+            return self.cache.delete_many(keys)
+        finally:
+            self._forget_local(keys)
 
     def incr(self, key: str, by: int=1):  # NOQA
-        return self.cache.incr(self._prefix_key(key), by)
+        key = self._prefix_key(key)
+        try:
+            return self.cache.incr(key, by)
+        finally:
+            self._forget_local([key])
 
     def decr(self, key: str, by: int=1):  # NOQA
-        return self.cache.decr(self._prefix_key(key), by)
+        key = self._prefix_key(key)
+        try:
+            return self.cache.decr(key, by)
+        finally:
+            self._forget_local([key])
 
     def close(self):  # NOQA
         pass
@@ -47,6 +47,10 @@ from django.utils.formats import localize
 from django.utils.translation import gettext, gettext_lazy as _
 
 from pretix.base.models import Event
+from pretix.helpers.columnar import (
+    FORMAT_ARROW, FORMAT_PARQUET, columnar_formats_available, write_columnar,
+)
+from pretix.helpers.iter import iterate_in_background, ordered_parallel_map
 from pretix.helpers.safe_openpyxl import (  # NOQA: backwards compatibility for plugins using excel_safe
     SafeWorkbook, remove_invalid_excel_chars as excel_safe,
 )
@@ -175,9 +179,31 @@ class OrganizerLevelExportMixin:
         return 'can_view_orders'
 
 
+COLUMNAR_FORMATS = (
+    (FORMAT_PARQUET, _('Apache Parquet (.parquet)'), 'application/vnd.apache.parquet'),
+    (FORMAT_ARROW, _('Apache Arrow IPC (.arrow)'), 'application/vnd.apache.arrow.file'),
+)
+
+
 class ListExporter(BaseExporter):
     ProgressSetTotal = namedtuple('ProgressSetTotal', 'total')
 
+    #: Set this to ``True`` to offer typed columnar file formats (Parquet and Arrow IPC) if ``pyarrow`` is installed.
+    #: Column types are inferred from the Python types of the values yielded by ``iterate_list``.
+    columnar_formats = False
+
+    @staticmethod
+    def is_columnar_format(form_data):
+        """
+        Returns whether the export is rendered in a typed columnar format, in which case dates, times and IDs should
+        be yielded as native Python objects instead of formatted strings.
+        """
+        return (form_data.get('_format') or '').split(':')[-1] in (FORMAT_PARQUET, FORMAT_ARROW)
+
+    @property
+    def _columnar_formats(self):
+        return COLUMNAR_FORMATS if self.columnar_formats and columnar_formats_available() else ()
+
     @property
     def export_form_fields(self) -> dict:
         ff = OrderedDict(
@@ -190,7 +216,7 @@ class ListExporter(BaseExporter):
                          ('default', _('CSV (with commas)')),
                          ('csv-excel', _('CSV (Excel-style)')),
                          ('semicolon', _('CSV (with semicolons)')),
-                     ),
+                     ) + tuple((f, label) for f, label, content_type in self._columnar_formats),
                  )),
             ]
         )
@@ -204,6 +230,26 @@ class ListExporter(BaseExporter):
     def iterate_list(self, form_data):
         raise NotImplementedError()  # noqa
 
+    def _iterate_rows(self, rows):
+        if settings.PRETIX_EXPORT_WORKERS > 1:
+            # Build the rows in a separate thread while the output file is being written
+            return iterate_in_background(rows)
+        return rows
+
+    def parallel_map(self, func, chunks):
+        """
+        Calls ``func`` for every element of ``chunks`` and yields the results in order. If the ``export_workers``
+        option is configured, multiple chunks are processed concurrently, each in a thread with its own database
+        connection. This is useful for exporters that split their data into chunks of primary keys anyway, e.g.::
+
+            def render_chunk(ids):
+                return [[op.secret] for op in OrderPosition.objects.filter(pk__in=ids)]
+
+            for rows in self.parallel_map(render_chunk, chunked_iterable(all_ids, 1000)):
+                yield from rows
+        """
+        return ordered_parallel_map(func, chunks, settings.PRETIX_EXPORT_WORKERS)
+
     def get_filename(self):
         return 'export'
 
@@ -217,7 +263,7 @@ class ListExporter(BaseExporter):
             writer = csv.writer(output_file, **kwargs)
             total = 0
             counter = 0
-            for line in self.iterate_list(form_data):
+            for line in self._iterate_rows(self.iterate_list(form_data)):
                 if isinstance(line, self.ProgressSetTotal):
                     total = line.total
                     continue
@@ -236,7 +282,7 @@ class ListExporter(BaseExporter):
             writer = csv.writer(output, **kwargs)
             total = 0
             counter = 0
-            for line in self.iterate_list(form_data):
+            for line in self._iterate_rows(self.iterate_list(form_data)):
                 if isinstance(line, self.ProgressSetTotal):
                     total = line.total
                     continue
@@ -251,6 +297,32 @@ class ListExporter(BaseExporter):
                 writer.writerow(line)
             return self.get_filename() + '.csv', 'text/csv', output.getvalue().encode(self.get_csv_encoding(), errors='replace')
 
+    def _iterate_with_progress(self, lines):
+        total = 0
+        counter = 0
+        for line in self._iterate_rows(lines):
+            if isinstance(line, self.ProgressSetTotal):
+                total = line.total
+                continue
+            yield line
+            if total:
+                counter += 1
+                if counter % max(10, total // 100) == 0:
+                    self.progress_callback(counter / total * 100)
+
+    def _render_columnar(self, lines, fmt, output_file=None):
+        content_type = {f: content_type for f, label, content_type in COLUMNAR_FORMATS}[fmt]
+        lines = self._iterate_with_progress(lines)
+        headers = next(lines, [])
+        if output_file:
+            write_columnar(headers, lines, output_file, fmt)
+            return self.get_filename() + '.' + fmt, content_type, None
+        else:
+            with tempfile.NamedTemporaryFile(suffix='.' + fmt) as f:
+                write_columnar(headers, lines, f, fmt)
+                f.seek(0)
+                return self.get_filename() + '.' + fmt, content_type, f.read()
+
     def prepare_xlsx_sheet(self, ws):
         pass
 
@@ -264,7 +336,7 @@ class ListExporter(BaseExporter):
             pass
         total = 0
         counter = 0
-        for i, line in enumerate(self.iterate_list(form_data)):
+        for i, line in enumerate(self._iterate_rows(self.iterate_list(form_data))):
             if isinstance(line, self.ProgressSetTotal):
                 total = line.total
                 continue
@@ -294,6 +366,8 @@ class ListExporter(BaseExporter):
             return self._render_csv(form_data, dialect='excel', output_file=output_file)
         elif form_data.get('_format') == 'semicolon':
             return self._render_csv(form_data, dialect='excel', delimiter=';', output_file=output_file)
+        elif form_data.get('_format') in (FORMAT_PARQUET, FORMAT_ARROW):
+            return self._render_columnar(self.iterate_list(form_data), form_data['_format'], output_file=output_file)
 
 
 class MultiSheetListExporter(ListExporter):
@@ -313,6 +387,9 @@ class MultiSheetListExporter(ListExporter):
                 (s + ':excel', str(l) + ' – ' + gettext('CSV (Excel-style)')),
                 (s + ':semicolon', str(l) + ' – ' + gettext('CSV (with semicolons)')),
             ]
+            choices += [
+                (s + ':' + f, str(l) + ' – ' + str(label)) for f, label, content_type in self._columnar_formats
+            ]
         ff = OrderedDict(
             [
                 ('_format',
@@ -341,7 +418,7 @@ class MultiSheetListExporter(ListExporter):
             if 'b' in output_file.mode:
                 output_file = io.TextIOWrapper(output_file, encoding='utf-8', newline='')
             writer = csv.writer(output_file, **kwargs)
-            for line in self.iterate_sheet(form_data, sheet):
+            for line in self._iterate_rows(self.iterate_sheet(form_data, sheet)):
                 if isinstance(line, self.ProgressSetTotal):
                     total = line.total
                     continue
@@ -358,7 +435,7 @@ class MultiSheetListExporter(ListExporter):
         else:
             output = io.StringIO()
             writer = csv.writer(output, **kwargs)
-            for line in self.iterate_sheet(form_data, sheet):
+            for line in self._iterate_rows(self.iterate_sheet(form_data, sheet)):
                 if isinstance(line, self.ProgressSetTotal):
                     total = line.total
                     continue
@@ -383,7 +460,7 @@ class MultiSheetListExporter(ListExporter):
 
             total = 0
             counter = 0
-            for i, line in enumerate(self.iterate_sheet(form_data, sheet=s)):
+            for i, line in enumerate(self._iterate_rows(self.iterate_sheet(form_data, sheet=s))):
                 if isinstance(line, self.ProgressSetTotal):
                     total = line.total
                     continue
@@ -416,3 +493,5 @@ class MultiSheetListExporter(ListExporter):
                 return self._render_sheet_csv(form_data, sheet, dialect='excel', output_file=output_file)
             elif f == 'semicolon':
                 return self._render_sheet_csv(form_data, sheet, dialect='excel', delimiter=';', output_file=output_file)
+            elif f in (FORMAT_PARQUET, FORMAT_ARROW):
+                return self._render_columnar(self.iterate_sheet(form_data, sheet), f, output_file=output_file)
@@ -33,12 +33,14 @@
 # License for the specific language governing permissions and limitations under the License.
 
 import os
+import shutil
 import tempfile
 from collections import OrderedDict
 from decimal import Decimal
 from zipfile import ZipFile
 
 from django import forms
+from django.conf import settings
 from django.db.models import CharField, Exists, F, OuterRef, Q, Subquery, Sum
 from django.dispatch import receiver
 from django.utils.formats import date_format
@@ -52,7 +54,7 @@ from pretix.base.models import Invoice, InvoiceLine, OrderPayment
 
 from ...control.forms.filter import get_all_payment_providers
 from ...helpers import GroupConcat
-from ...helpers.iter import chunked_iterable
+from ...helpers.iter import chunked_iterable, ordered_parallel_map
 from ..exporter import BaseExporter, MultiSheetListExporter
 from ..services.export import ExportError
 from ..services.invoices import invoice_pdf_task
@@ -126,6 +128,23 @@ class InvoiceExporter(InvoiceExporterMixin, BaseExporter):
     verbose_name = _('All invoices')
     description = _('Download all invoices created by the system as a ZIP file of PDF files.')
 
+    def _generate_missing_files(self, ids, progress):
+        """
+        Generates the PDF files of all given invoices, in multiple threads if ``PRETIX_EXPORT_WORKERS`` is set.
+        ``progress`` is called with the number of invoices processed after every chunk.
+        """
+        def generate_chunk(chunk):
+            for pk in chunk:
+                invoice_pdf_task.apply(args=(pk,))
+            return len(chunk)
+
+        for n in ordered_parallel_map(generate_chunk, chunked_iterable(ids, 10), settings.PRETIX_EXPORT_WORKERS):
+            progress(n)
+
+    def _write_file(self, zipf, invoice):
+        with invoice.file.open('rb') as f, zipf.open('{}-{}.pdf'.format(invoice.number, invoice.order.code), 'w') as zf:
+            shutil.copyfileobj(f, zf, 1024 * 1024)
+
     def render(self, form_data: dict, output_file=None):
         qs = self.invoices_queryset(form_data).filter(shredded=False)
 
@@ -135,7 +154,19 @@ class InvoiceExporter(InvoiceExporterMixin, BaseExporter):
             if not total:
                 return None
 
+            missing = list(qs.filter(Q(file__isnull=True) | Q(file='')).values_list('pk', flat=True))
+            steps = total + len(missing)
             counter = 0
+
+            def progress(n):
+                nonlocal counter
+                previous = counter
+                counter += n
+                if counter // max(10, steps // 100) != previous // max(10, steps // 100):
+                    self.progress_callback(counter / steps * 100)
+
+            self._generate_missing_files(missing, progress)
+
             with ZipFile(output_file or os.path.join(d, 'tmp.zip'), 'w') as zipf:
                 for i in qs.iterator():
                     try:
@@ -144,18 +175,12 @@ class InvoiceExporter(InvoiceExporterMixin, BaseExporter):
                             i.refresh_from_db()
                         if not i.file:
                             raise ExportError('Could not generate PDF for invoice {nr}'.format(nr=i.full_invoice_no))
-                        i.file.open('rb')
-                        zipf.writestr('{}-{}.pdf'.format(i.number, i.order.code), i.file.read())
-                        i.file.close()
+                        self._write_file(zipf, i)
                     except FileNotFoundError:
                         invoice_pdf_task.apply(args=(i.pk,))
                         i.refresh_from_db()
-                        i.file.open('rb')
-                        zipf.writestr('{}-{}.pdf'.format(i.number, i.order.code), i.file.read())
-                        i.file.close()
-                    counter += 1
-                    if total and counter % max(10, total // 100) == 0:
-                        self.progress_callback(counter / total * 100)
+                        self._write_file(zipf, i)
+                    progress(1)
 
             if self.is_multievent:
                 filename = '{}_invoices.zip'.format(self.organizer.slug)
@@ -81,6 +81,12 @@ from ..timeframes import (
 )
 
 
+def _date_and_time(dt, typed):
+    if typed:
+        return dt.date(), dt.time().replace(microsecond=0)
+    return dt.strftime('%Y-%m-%d'), dt.strftime('%H:%M:%S')
+
+
 class OrderListExporter(MultiSheetListExporter):
     identifier = 'orderlist'
     verbose_name = gettext_lazy('Order data')
@@ -89,6 +95,7 @@ class OrderListExporter(MultiSheetListExporter):
                                'with a line for every order, one with a line for every order position, and one with '
                                'a line for every additional fee charged in an order.')
     featured = True
+    columnar_formats = True
 
     @cached_property
     def providers(self):
@@ -255,6 +262,7 @@ class OrderListExporter(MultiSheetListExporter):
 
     def iterate_orders(self, form_data: dict):
         qs = self.orders_qs(form_data)
+        typed = self.is_columnar_format(form_data)
         tax_rates = self._get_all_tax_rates(qs)
 
         headers = [
@@ -342,8 +350,7 @@ class OrderListExporter(MultiSheetListExporter):
                 order.get_extended_status_display(),
                 order.email,
                 str(order.phone) if order.phone else '',
-                order.datetime.astimezone(tz).strftime('%Y-%m-%d'),
-                order.datetime.astimezone(tz).strftime('%H:%M:%S'),
+                *_date_and_time(order.datetime.astimezone(tz), typed),
             ]
             try:
                 row += [
@@ -435,6 +442,7 @@ class OrderListExporter(MultiSheetListExporter):
 
     def iterate_fees(self, form_data: dict):
         qs = self.fees_qs(form_data)
+        typed = self.is_columnar_format(form_data)
 
         headers = [
             _('Event slug'),
@@ -480,8 +488,7 @@ class OrderListExporter(MultiSheetListExporter):
                 _("canceled") if op.canceled else order.get_extended_status_display(),
                 order.email,
                 str(order.phone) if order.phone else '',
-                order.datetime.astimezone(tz).strftime('%Y-%m-%d'),
-                order.datetime.astimezone(tz).strftime('%H:%M:%S'),
+                *_date_and_time(order.datetime.astimezone(tz), typed),
                 op.get_fee_type_display(),
                 op.description,
                 op.value,
@@ -530,6 +537,7 @@ class OrderListExporter(MultiSheetListExporter):
 
     def iterate_positions(self, form_data: dict):
         base_qs = self.positions_qs(form_data)
+        typed = self.is_columnar_format(form_data)
 
         p_providers = OrderPayment.objects.filter(
             order=OuterRef('order'),
@@ -669,8 +677,10 @@ class OrderListExporter(MultiSheetListExporter):
 
         all_ids = list(base_qs.order_by('order__datetime', 'positionid').values_list('pk', flat=True))
         yield self.ProgressSetTotal(total=len(all_ids))
-        for ids in chunked_iterable(all_ids, 1000):
-            ops = sorted(qs.filter(id__in=ids), key=lambda k: ids.index(k.pk))
+
+        def iterate_chunk(ids):
+            positions = {pk: i for i, pk in enumerate(ids)}
+            ops = sorted(qs.filter(id__in=ids), key=lambda k: positions[k.pk])
 
             for op in ops:
                 order = op.order
@@ -683,8 +693,7 @@ class OrderListExporter(MultiSheetListExporter):
                     _("canceled") if op.canceled else order.get_extended_status_display(),
                     order.email,
                     str(order.phone) if order.phone else '',
-                    order.datetime.astimezone(tz).strftime('%Y-%m-%d'),
-                    order.datetime.astimezone(tz).strftime('%H:%M:%S'),
+                    *_date_and_time(order.datetime.astimezone(tz), typed),
                 ]
                 if has_subevents:
                     if op.subevent:
@@ -700,9 +709,9 @@ class OrderListExporter(MultiSheetListExporter):
                         row.append('')
                 row += [
                     str(op.item),
-                    str(op.item_id),
+                    op.item_id if typed else str(op.item_id),
                     str(op.variation) if op.variation else '',
-                    str(op.variation_id) if op.variation_id else '',
+                    (op.variation_id if typed else str(op.variation_id)) if op.variation_id else '',
                     op.price,
                     op.tax_rate,
                     str(op.tax_rule) if op.tax_rule else '',
@@ -810,6 +819,9 @@ class OrderListExporter(MultiSheetListExporter):
                         row += [''] * len(meta_data_labels)
                 yield row
 
+        for rows in self.parallel_map(lambda ids: list(iterate_chunk(ids)), chunked_iterable(all_ids, 1000)):
+            yield from rows
+
     def get_filename(self):
         if self.is_multievent:
             return '{}_orders'.format(self.organizer.slug)
@@ -824,6 +836,7 @@ class TransactionListExporter(ListExporter):
     description = gettext_lazy('Download a spreadsheet of all substantial changes to orders, i.e. all changes to '
                                'products, prices or tax rates. The information is only accurate for changes made with '
                                'pretix versions released after October 2021.')
+    columnar_formats = True
 
     @cached_property
     def providers(self):
@@ -857,6 +870,7 @@ class TransactionListExporter(ListExporter):
         qs = Transaction.objects.filter(
             order__event__in=self.events,
         )
+        typed = self.is_columnar_format(form_data)
 
         if form_data.get('date_range'):
             dt_start, dt_end = resolve_timeframe_to_datetime_start_inclusive_end_exclusive(now(), form_data['date_range'], self.timezone)
@@ -931,11 +945,9 @@ class TransactionListExporter(ListExporter):
                 t.order.event.currency,
 
                 t.order.code,
-                t.order.datetime.astimezone(self.timezone).strftime('%Y-%m-%d'),
-                t.order.datetime.astimezone(self.timezone).strftime('%H:%M:%S'),
+                *_date_and_time(t.order.datetime.astimezone(self.timezone), typed),
 
-                t.datetime.astimezone(self.timezone).strftime('%Y-%m-%d'),
-                t.datetime.astimezone(self.timezone).strftime('%H:%M:%S'),
+                *_date_and_time(t.datetime.astimezone(self.timezone), typed),
                 _('Converted from legacy version') if t.migrated else '',
 
                 t.positionid,
@@ -40,7 +40,8 @@ from django.core.cache import cache
 from django.core.management.base import BaseCommand
 from django.dispatch.dispatcher import NO_RECEIVERS
 
-from pretix.helpers.periodic import SKIPPED
+from pretix.base.services.periodic import dispatch
+from pretix.helpers.periodic import SKIPPED, run_receiver
 
 from ...signals import periodic_task
 
@@ -54,6 +55,8 @@ class Command(BaseCommand):
         parser.add_argument('--list-tasks', action='store_true', help='Only list all tasks')
         parser.add_argument('--exclude', action='store', type=str, help='Exclude the tasks with this name '
                                                                         '(dotted path, comma separation)')
+        parser.add_argument('--dispatch', action='store_true', help='Queue every task as a separate background '
+                                                                    'task instead of running them one by one')
 
     def handle(self, *args, **options):
         verbosity = int(options['verbosity'])
@@ -75,11 +78,20 @@ class Command(BaseCommand):
                 if name in options.get('exclude').split(','):
                     continue
 
+            if options.get('dispatch'):
+                queued = dispatch(receiver)
+                if verbosity > 1:
+                    if queued:
+                        self.stdout.write(self.style.SUCCESS(f'INFO Queued {name}'))
+                    else:
+                        self.stdout.write(self.style.SUCCESS(f'INFO Skipped {name}'))
+                continue
+
             if verbosity > 1:
                 self.stdout.write(f'INFO Running {name}…')
             t0 = time.time()
             try:
-                r = receiver(signal=periodic_task, sender=self)
+                r = run_receiver(receiver, sender=self)
             except Exception as err:
                 if isinstance(err, KeyboardInterrupt):
                     raise err
@@ -319,3 +319,15 @@ pretix_task_duration_seconds = Histogram("pretix_task_duration_seconds", "Call t
                                          ["task_name"])
 pretix_successful_logins = Counter("pretix_logins_successful", "Successful logins", [])
 pretix_failed_logins = Counter("pretix_logins_failed", "Failed logins", ["reason"])
+pretix_lock_wait_seconds = Histogram("pretix_lock_wait_seconds", "Time spent waiting for database locks",
+                                     ["keyspace", "granularity"])
+pretix_lock_timeouts_total = Counter("pretix_lock_timeouts_total", "Lock acquisitions that timed out",
+                                     ["keyspace", "granularity"])
+pretix_plugin_receiver_duration_seconds = Histogram("pretix_plugin_receiver_duration_seconds",
+                                                    "Call time of plugin signal receivers",
+                                                    ["plugin", "receiver"])
+pretix_periodic_task_runs_total = Counter("pretix_periodic_task_runs_total", "Total runs of periodic tasks",
+                                          ["task_name", "status"])
+pretix_periodic_task_duration_seconds = Histogram("pretix_periodic_task_duration_seconds", "Call time of periodic tasks",
+                                                  ["task_name"],
+                                                  buckets=(.1, .5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0, _INF))
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pretixbase", "0281_event_is_remote"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportProgress",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False)),
+                ("rows", models.PositiveIntegerField(default=0)),
+                ("file", models.OneToOneField(on_delete=django.db.models.deletion.CASCADE,
+                                              related_name="import_progress", to="pretixbase.cachedfile")),
+            ],
+        ),
+    ]
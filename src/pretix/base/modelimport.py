@@ -19,9 +19,11 @@
 # You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
 # <https://www.gnu.org/licenses/>.
 #
+import codecs
 import csv
 import datetime
 import io
+import itertools
 import re
 from decimal import Decimal, DecimalException
 
@@ -73,6 +75,41 @@ def parse_csv(file, length=None, mode="strict", charset=None):
     return reader
 
 
+def parse_csv_stream(file, mode="strict", charset=None):
+    """
+    Like ``parse_csv``, but decodes the file line by line while it is being read instead of loading it into memory
+    at once.
+    """
+    file.seek(0)
+    if not charset:
+        try:
+            from chardet.universaldetector import UniversalDetector
+            detector = UniversalDetector()
+            for chunk in iter(lambda: file.read(64 * 1024), b''):
+                detector.feed(chunk)
+                if detector.done:
+                    break
+            detector.close()
+            charset = detector.result['encoding']
+        except ImportError:
+            charset = file.charset
+        file.seek(0)
+    # StreamReader splits lines at \r as well, so we do not need special handling for files modified on a Mac
+    lines = codecs.getreader(charset or "utf-8")(file, mode)
+
+    first_line = lines.readline()
+    try:
+        dialect = csv.Sniffer().sniff(first_line.rstrip("\r\n"), delimiters=";,.#:")
+    except csv.Error:
+        return None
+
+    if dialect is None:
+        return None
+
+    reader = csv.DictReader(itertools.chain([first_line], lines), dialect=dialect)
+    return reader
+
+
 class ImportColumn:
 
     @property
@@ -21,7 +21,7 @@
 #
 from ..settings import GlobalSettingsObject_SettingsStore
 from .auth import U2FDevice, User, WebAuthnDevice
-from .base import CachedFile, LoggedModel, cachedfile_name
+from .base import CachedFile, ImportProgress, LoggedModel, cachedfile_name
 from .checkin import Checkin, CheckinList
 from .currencies import ExchangeRate
 from .customers import Customer
@@ -0,0 +1,60 @@
+#
+# This file is part of pretix (Community Edition).
+#
+# Copyright (C) 2014-2020 Raphael Michel and contributors
+# Copyright (C) 2020-2021 rami.io GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+#
+
+"""
+This module contains a helper for code that needs to collect changes made during a database transaction and act on
+them once, after the transaction has been committed, e.g. to update counters or caches outside of the database.
+"""
+import threading
+from collections import Counter
+
+from django.db import transaction
+
+
+class OnCommitCounter:
+    """
+    Collects counts per key in memory for the duration of the current database transaction and passes them to
+    ``flush`` once the transaction has been committed. ``flush`` is only called once per transaction, no matter how
+    often :py:meth:`add` has been called, and never for transactions that have been rolled back.
+
+    Outside of a transaction, ``flush`` is called right away.
+    """
+
+    def __init__(self, flush):
+        self._flush = flush
+        self._local = threading.local()
+
+    def _run(self):
+        counts = getattr(self._local, 'counts', None)
+        self._local.counts = Counter()
+        if counts:
+            self._flush(counts)
+
+    def add(self, key, delta=1, using=None):
+        conn = transaction.get_connection(using)
+        registered = self._run in [func for (savepoint_id, func, *__) in conn.run_on_commit]
+        if not registered or getattr(self._local, 'counts', None) is None:
+            # Counts left over in this thread from a transaction that has been rolled back
+            self._local.counts = Counter()
+        self._local.counts[key] += delta
+        if not registered:
+            transaction.on_commit(self._run, using)
@@ -59,6 +59,15 @@ class CachedFile(models.Model):
     session_key = models.TextField(null=True, blank=True)  # only allow download in this session
 
 
+class ImportProgress(models.Model):
+    """
+    Remembers how many rows of an uploaded import file have already been imported, so an import that failed half-way
+    can be started again without importing the same rows twice.
+    """
+    file = models.OneToOneField(CachedFile, on_delete=models.CASCADE, related_name='import_progress')
+    rows = models.PositiveIntegerField(default=0)
+
+
 @receiver(post_delete, sender=CachedFile)
 def cached_file_delete(sender, instance, **kwargs):
     if instance.file:
@@ -106,6 +106,13 @@ class CheckinList(LoggedModel):
     class Meta:
         ordering = ('subevent__date_from', 'name', 'pk')
 
+    def save(self, **kwargs):
+        from ..services import checkincounters
+
+        super().save(**kwargs)
+        # The set of positions on the list might have changed, so the counters need to be rebuilt
+        checkincounters.invalidate(self.pk)
+
     def positions_query(self, ignore_status=False):
         from . import Order, OrderPosition
 
@@ -216,6 +223,11 @@ class CheckinList(LoggedModel):
 
     @property
     def inside_count(self):
+        from ..services import checkincounters
+
+        counts = checkincounters.read(self)
+        if counts is not None:
+            return counts['inside']
         return self.positions_inside_query(None).count()
 
     @property
@@ -223,6 +235,11 @@ class CheckinList(LoggedModel):
     # Disable scopes, because this query is safe and the additional organizer filter in the EXISTS() subquery tricks PostgreSQL into a bad
     # subplan that sequentially scans all events
     def checkin_count(self):
+        from ..services import checkincounters
+
+        counts = checkincounters.read(self)
+        if counts is not None:
+            return sum(counts['checkins'].values())
         return self.event.cache.get_or_set(
             'checkin_list_{}_checkin_count'.format(self.pk),
             lambda: self.positions.using(settings.DATABASE_REPLICA).annotate(
@@ -240,6 +257,11 @@ class CheckinList(LoggedModel):
 
     @property
     def position_count(self):
+        from ..services import checkincounters
+
+        counts = checkincounters.read(self)
+        if counts is not None:
+            return sum(counts['positions'].values())
         return self.event.cache.get_or_set(
             'checkin_list_{}_position_count'.format(self.pk),
             lambda: self.positions.count(),
@@ -453,14 +475,24 @@ class Checkin(models.Model):
         )
 
     def save(self, **kwargs):
+        from ..services import checkincounters
+
+        counter_state = checkincounters.state_before_checkin(self) if not self.pk else None
         super().save(**kwargs)
+        if counter_state is not None:
+            checkincounters.track_checkin(self, counter_state, 1, using=kwargs.get('using'))
         if self.position:
             self.position.order.touch()
         self.list.event.cache.delete('checkin_count')
         self.list.touch()
 
     def delete(self, **kwargs):
+        from ..services import checkincounters
+
+        counter_state = checkincounters.state_before_checkin(self)
         super().delete(**kwargs)
+        if counter_state is not None:
+            checkincounters.track_checkin(self, counter_state, -1, using=kwargs.get('using'))
         self.position.order.touch()
         self.list.touch()
 
@@ -2132,13 +2132,19 @@ class Quota(LoggedModel):
             self.event.cache.clear()
 
     def save(self, *args, **kwargs):
+        from ..services import quotacounters
+
         # This is *not* called when the db-level cache is upated, since we use bulk_update there
         clear_cache = kwargs.pop('clear_cache', True)
         super().save(*args, **kwargs)
         if self.event and clear_cache:
             self.event.cache.clear()
+            # The set of items or variations might have changed, so the counters need to be rebuilt
+            quotacounters.invalidate(self.pk)
 
     def rebuild_cache(self, now_dt=None):
+        from ..services import quotacounters
+
         if settings.HAS_REDIS:
             rc = django_redis.get_redis_connection("redis")
             p = rc.pipeline()
@@ -2147,7 +2153,10 @@ class Quota(LoggedModel):
             p.hdel(f'quotas:{self.event_id}:availabilitycache:igcl', str(self.pk))
             p.hdel(f'quotas:{self.event_id}:availabilitycache:nocw:igcl', str(self.pk))
             p.execute()
-            self.availability(now_dt=now_dt)
+            if quotacounters.counters_enabled():
+                quotacounters.reconcile([self], now_dt=now_dt)
+            else:
+                self.availability(now_dt=now_dt)
 
     def availability(
             self, now_dt: datetime=None, count_waitinglist=True, _cache=None, allow_cache=False
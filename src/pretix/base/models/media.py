@@ -115,6 +115,12 @@ class ReusableMedium(LoggedModel):
     def media_type(self):
         return MEDIA_TYPES[self.type]
 
+    def save(self, *args, **kwargs):
+        from pretix.base.services import checkinlookup
+
+        super().save(*args, **kwargs)
+        checkinlookup.invalidate(self.organizer_id, [self.identifier], using=kwargs.get('using', None))
+
     @property
     def is_expired(self):
         return self.expires and self.expires > now()
@@ -349,6 +349,10 @@ class Order(LockModel, LoggedModel):
 
     def _transaction_key_reset(self):
         self.__initial_status_paid_or_pending = self.status in (Order.STATUS_PENDING, Order.STATUS_PAID) and not self.require_approval
+        self._quota_counter_status = self.status
+        self._seat_occupancy_status = self.status
+        if 'valid_if_pending' not in self.get_deferred_fields():
+            self._checkin_counter_status = self.status, self.valid_if_pending
 
     def gracefully_delete(self, user=None, auth=None):
         from . import GiftCard, GiftCardTransaction, Membership, Voucher
@@ -594,9 +598,61 @@ class Order(LockModel, LoggedModel):
 
         if is_new:
             _transactions_mark_order_dirty(self.pk, using=kwargs.get('using', None))
+        else:
+            self._track_quota_counter_status_change(using=kwargs.get('using', None))
+            self._track_checkin_counter_status_change(using=kwargs.get('using', None))
+            self._track_seat_occupancy_status_change(using=kwargs.get('using', None))
 
         return r
 
+    def _track_seat_occupancy_status_change(self, using=None):
+        from ..services import seatoccupancy
+
+        previous_status = getattr(self, '_seat_occupancy_status', None)
+        if previous_status is None or previous_status == self.status:
+            return
+        occupying = (Order.STATUS_PENDING, Order.STATUS_PAID)
+        if (previous_status in occupying) != (self.status in occupying):
+            seatoccupancy.track_order(self, using=using)
+        self._seat_occupancy_status = self.status
+
+    def _track_quota_counter_status_change(self, using=None):
+        from ..services import quotacounters
+
+        previous_status = getattr(self, '_quota_counter_status', None)
+        if previous_status == self.status or 'status' in self.get_deferred_fields():
+            return
+        if (
+            previous_status in (Order.STATUS_PENDING, Order.STATUS_PAID) and
+            self.status in (Order.STATUS_PENDING, Order.STATUS_PAID) and
+            not self.require_approval and
+            quotacounters.counters_enabled()
+        ):
+            # The positions stay counted against the quota, they just move between states. All other status changes
+            # are tracked through create_transactions().
+            for p in self.positions.values('item_id', 'variation_id', 'subevent_id'):
+                quotacounters.track(quotacounters.STATE_PAID, 1 if self.status == Order.STATUS_PAID else -1, using=using, **p)
+                quotacounters.track(quotacounters.STATE_PENDING, 1 if self.status == Order.STATUS_PENDING else -1, using=using, **p)
+            self._quota_counter_status = self.status
+
+    def _track_checkin_counter_status_change(self, using=None):
+        from ..services import checkincounters
+
+        previous = getattr(self, '_checkin_counter_status', None)
+        if (
+            previous is None or {'status', 'valid_if_pending'} & self.get_deferred_fields() or
+            previous == (self.status, self.valid_if_pending)
+        ):
+            return
+        previous_status = checkincounters.status_class(*previous)
+        current_status = checkincounters.status_class(self.status, self.valid_if_pending)
+        if previous_status and current_status and not self.require_approval:
+            # Positions move between status classes, e.g. from pending to paid. All other status changes are tracked
+            # through create_transactions().
+            if previous_status != current_status:
+                checkincounters.track_order_status_change(self, previous_status, current_status, using=using)
+            self._checkin_counter_status = self.status, self.valid_if_pending
+
     def touch(self):
         self.save(update_fields=['last_modified'])
 
@@ -1282,10 +1338,38 @@ class Order(LockModel, LoggedModel):
         create.sort(key=lambda t: (0 if t.count < 0 else 1, t.positionid or 0))
         if save:
             Transaction.objects.bulk_create(create)
+            self._track_quota_counter_transactions(create)
+            self._track_checkin_counter_transactions(create, is_new=is_new)
         self._transaction_key_reset()
         _transactions_mark_order_clean(self.pk)
         return create
 
+    def _track_quota_counter_transactions(self, transactions):
+        from ..services import quotacounters
+
+        states = {
+            Order.STATUS_PAID: quotacounters.STATE_PAID,
+            Order.STATUS_PENDING: quotacounters.STATE_PENDING,
+        }
+        current_state = states.get(self.status)
+        # Removed positions need to be taken from the state they have been counted in before the status change
+        previous_state = states.get(getattr(self, '_quota_counter_status', None), current_state)
+        for t in transactions:
+            if t.fee_type or not t.item_id:
+                continue
+            state = previous_state if t.count < 0 else current_state
+            if state:
+                quotacounters.track(state, t.count, item_id=t.item_id, variation_id=t.variation_id,
+                                    subevent_id=t.subevent_id)
+
+    def _track_checkin_counter_transactions(self, transactions, is_new=False):
+        from ..services import checkincounters
+
+        current_status = checkincounters.status_class(self.status, self.valid_if_pending)
+        previous = getattr(self, '_checkin_counter_status', None)
+        previous_status = checkincounters.status_class(*previous) if previous else current_status
+        checkincounters.track_order_transactions(self, transactions, previous_status, current_status, is_new=is_new)
+
     def tagged_secret(self, tag, secret_length=64):
         return salted_hmac(value=tag, key_salt=b"", algorithm="sha256",
                            secret=self.internal_secret or self.secret).hexdigest()[:secret_length]
@@ -2541,6 +2625,8 @@ class OrderPosition(AbstractPosition):
     def _transaction_key_reset(self):
         self.__initial_transaction_key = Transaction.key(self)
         self.__initial_canceled = self.canceled
+        self.__initial_lookup_key = self.secret, self.addon_to_id
+        self.__initial_seat = self.seat_id, self.subevent_id
 
     class Meta:
         verbose_name = _("Order position")
@@ -2743,6 +2829,7 @@ class OrderPosition(AbstractPosition):
 
     def save(self, *args, **kwargs):
         from pretix.base.secrets import assign_ticket_secret
+        from pretix.base.services import checkinlookup, seatoccupancy
 
         if self.tax_rate is None:
             self._calculate_tax()
@@ -2777,12 +2864,34 @@ class OrderPosition(AbstractPosition):
         if not self.get_deferred_fields():
             if Transaction.key(self) != self.__initial_transaction_key or self.canceled != self.__initial_canceled or not self.pk:
                 _transactions_mark_order_dirty(self.order_id, using=kwargs.get('using', None))
+            lookup_changed = (
+                not self.pk or self.canceled != self.__initial_canceled or
+                (self.secret, self.addon_to_id) != self.__initial_lookup_key
+            )
+            seats_changed = {self.__initial_seat, (self.seat_id, self.subevent_id)} if (
+                not self.pk or self.canceled != self.__initial_canceled or
+                (self.seat_id, self.subevent_id) != self.__initial_seat
+            ) else set()
         elif not kwargs.get('force_save_with_deferred_fields', None):
             _fail("It is unsafe to call save() on an OrderFee with deferred fields since we can't check if you missed "
                   "creating a transaction. Call save(force_save_with_deferred_fields=True) if you really want to do "
                   "this.")
-
-        return super().save(*args, **kwargs)
+        else:
+            lookup_changed = True
+            seats_changed = {(self.seat_id, self.subevent_id)}
+
+        r = super().save(*args, **kwargs)
+        if lookup_changed:
+            # A barcode that has previously been scanned without a match might be known now
+            checkinlookup.invalidate(
+                self.organizer_id,
+                [self.secret, self.pk, self.addon_to.secret if self.addon_to_id else None],
+                using=kwargs.get('using', None)
+            )
+        for seat_id, subevent_id in seats_changed:
+            if seat_id:
+                seatoccupancy.invalidate(self.order.event_id, subevent_id, using=kwargs.get('using', None))
+        return r
 
     @scopes_disabled()
     def assign_pseudonymization_id(self):
@@ -3137,13 +3246,28 @@ class CartPosition(AbstractPosition):
         )
 
     def save(self, *args, **kwargs):
+        from ..services import quotacounters, seatoccupancy
+
+        is_new = not self.pk
         super().save(*args, **kwargs)
+        if is_new:
+            quotacounters.track_cart_position(self, 1)
+        if self.seat_id:
+            seatoccupancy.invalidate(self.event_id, self.subevent_id)
         # invalidate cached values of cached properties that likely have changed
         try:
             del self.sort_key
         except AttributeError:
             pass
 
+    def delete(self, *args, **kwargs):
+        from ..services import quotacounters, seatoccupancy
+
+        quotacounters.track_cart_position(self, -1)
+        if self.seat_id:
+            seatoccupancy.invalidate(self.event_id, self.subevent_id)
+        return super().delete(*args, **kwargs)
+
     @property
     def tax_value(self):
         net = round_decimal(self.price - (self.price * (1 - 100 / (100 + self.tax_rate))),
@@ -3439,6 +3563,12 @@ class RevokedTicketSecret(models.Model):
     secret = models.TextField(db_index=True)
     created = models.DateTimeField(auto_now_add=True)
 
+    def save(self, *args, **kwargs):
+        from pretix.base.services import checkinlookup
+
+        super().save(*args, **kwargs)
+        checkinlookup.invalidate(self.event.organizer_id, [self.secret], using=kwargs.get('using', None))
+
 
 class BlockedTicketSecret(models.Model):
     event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='blocked_secrets')
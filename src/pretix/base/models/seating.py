@@ -20,14 +20,15 @@
 # <https://www.gnu.org/licenses/>.
 #
 import json
-from collections import namedtuple
+from collections import defaultdict, namedtuple
 
 import jsonschema
 from django.contrib.staticfiles import finders
 from django.core.exceptions import ValidationError
 from django.db import models
-from django.db.models import Exists, F, OuterRef, Q, Subquery, Value
-from django.db.models.functions import Power
+from django.db.models import (
+    BooleanField, Case, Exists, F, OuterRef, Q, Subquery, Value, When,
+)
 from django.utils.deconstruct import deconstructible
 from django.utils.timezone import now
 from django.utils.translation import gettext, gettext_lazy as _
@@ -162,6 +163,68 @@ class SeatCategoryMapping(models.Model):
     product = models.ForeignKey(Item, related_name='seat_category_mappings', on_delete=models.CASCADE)
 
 
+def seats_closer_than(x1, y1, x2, y2, distance):
+    return (x1 - x2) ** 2 + (y1 - y2) ** 2 < distance ** 2
+
+
+class SeatIndex:
+    """
+    A grid-based spatial index of all seats of an event or date. Every seat is put into a square cell with an edge
+    length of ``cell_size``, so all seats closer than ``cell_size`` to a given point can be found by looking at only
+    nine cells instead of at every seat.
+    """
+    CACHE_TIMEOUT = 3600
+
+    def __init__(self, seats, cell_size):
+        self.cell_size = cell_size
+        self.pks = set()
+        self.positions = {}
+        self.cells = defaultdict(list)
+        for pk, x, y, row_name in seats:
+            self.pks.add(pk)
+            if x is not None and y is not None:
+                self.positions[pk] = (x, y, row_name)
+                self.cells[self._cell(x, y)].append((pk, x, y, row_name))
+        self.cells = dict(self.cells)
+
+    def _cell(self, x, y):
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    def closeby(self, x, y, distance, row_name=None):
+        """
+        Yields the IDs of all seats closer than ``distance`` to the given point, optionally only those in the row
+        ``row_name``. ``distance`` may not be larger than the cell size of the index.
+        """
+        cx, cy = self._cell(x, y)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for pk, sx, sy, srow in self.cells.get((cx + dx, cy + dy), ()):
+                    if (row_name is None or srow == row_name) and seats_closer_than(x, y, sx, sy, distance):
+                        yield pk
+
+    @staticmethod
+    def _cache_key(subevent):
+        return 'seat_index:{}'.format(subevent.pk if subevent else 0)
+
+    @classmethod
+    def get(cls, event_id, subevent, cell_size):
+        cache = Event(pk=event_id).cache
+        index = cache.get(cls._cache_key(subevent))
+        if index is None or index.cell_size != cell_size:
+            index = cls(
+                Seat.objects.filter(event_id=event_id, subevent=subevent).order_by().values_list(
+                    'pk', 'x', 'y', 'row_name'
+                ),
+                cell_size
+            )
+            cache.set(cls._cache_key(subevent), index, timeout=cls.CACHE_TIMEOUT)
+        return index
+
+    @classmethod
+    def invalidate(cls, event, subevent):
+        event.cache.delete(cls._cache_key(subevent))
+
+
 class Seat(models.Model):
     """
     This model is used to represent every single specific seat within an (sub)event that can be selected. It's mainly
@@ -184,6 +247,12 @@ class Seat(models.Model):
     class Meta:
         ordering = ['sorting_rank', 'seat_guid']
 
+    def save(self, *args, **kwargs):
+        from ..services import seatoccupancy
+
+        super().save(*args, **kwargs)
+        seatoccupancy.invalidate(self.event_id, self.subevent_id, using=kwargs.get('using'))
+
     @property
     def name(self):
         return str(self)
@@ -258,24 +327,39 @@ class Seat(models.Model):
             )
 
         if minimal_distance > 0:
-            # TODO: Is there a more performant implementation on PostgreSQL using
-            # https://www.postgresql.org/docs/8.2/functions-geometry.html ?
-            sq_closeby = qs_annotated.annotate(
-                distance=(
-                    Power(F('x') - OuterRef('x'), Value(2), output_field=models.FloatField()) +
-                    Power(F('y') - OuterRef('y'), Value(2), output_field=models.FloatField())
+            # Computing the distance of every seat to every taken seat in the database gets slow very quickly with
+            # large plans, so we only fetch the taken seats and look up their neighbours in a spatial index.
+            taken = qs_annotated.filter(
+                (Q(orderposition_id__isnull=False) | Q(cartposition_id__isnull=False) | Q(voucher_id__isnull=False))
+                if annotate_ids else
+                (Q(has_order=True) | Q(has_cart=True) | Q(has_voucher=True)),
+                x__isnull=False,
+                y__isnull=False,
+            ).order_by().values_list('x', 'y', 'row_name')
+            closeby_taken = set()
+            if taken:
+                index = SeatIndex.get(event_id, subevent, minimal_distance)
+                for x, y, row_name in taken:
+                    closeby_taken.update(index.closeby(
+                        x, y, minimal_distance, row_name=row_name if distance_only_within_row else None
+                    ))
+
+            if not closeby_taken:
+                has_closeby_taken = Value(False)
+            elif len(closeby_taken) * 2 > len(index.pks):
+                # Keep the list of IDs we send to the database short
+                has_closeby_taken = Case(
+                    When(pk__in=index.pks - closeby_taken, then=Value(False)),
+                    default=Value(True),
+                    output_field=BooleanField(),
                 )
-            ).filter(
-                (
-                    (Q(orderposition_id__isnull=False) | Q(cartposition_id__isnull=False) | Q(voucher_id__isnull=False))
-                    if annotate_ids else
-                    (Q(has_order=True) | Q(has_cart=True) | Q(has_voucher=True))
-                ),
-                distance__lt=minimal_distance ** 2
-            )
-            if distance_only_within_row:
-                sq_closeby = sq_closeby.filter(row_name=OuterRef('row_name'))
-            qs_annotated = qs_annotated.annotate(has_closeby_taken=Exists(sq_closeby))
+            else:
+                has_closeby_taken = Case(
+                    When(pk__in=closeby_taken, then=Value(True)),
+                    default=Value(False),
+                    output_field=BooleanField(),
+                )
+            qs_annotated = qs_annotated.annotate(has_closeby_taken=has_closeby_taken)
         return qs_annotated
 
     def is_available(self, ignore_cart=None, ignore_orderpos=None, ignore_voucher_id=None,
@@ -321,33 +405,22 @@ class Seat(models.Model):
             if ignore_cart is not True:
                 q |= Q(has_cart=True)
 
-            # The following looks like it makes no sense. Why wouldn't we just use ``Value(self.x)``, we already now
-            # the value? The reason is that x and y are floating point values generated from our JSON files. As it turns
-            # out, PostgreSQL MIGHT store floating point values with a different precision based on the underlying system
-            # architecture. So if we generate e.g. 670.247128887222289 from the JSON file and store it to the database,
-            # PostgreSQL will store it as 670.247128887222289 internally. However if we query it again, we only get
-            # 670.247128887222 back. But if we do calculations with a field in PostgreSQL itself, it uses the full
-            # precision for the calculation.
-            # We don't actually care about the results with this precision, but we care that the results from this
-            # function are exactly the same as from event.free_seats(), so we do this subquery trick to deal with
-            # PostgreSQL's internal values in both cases.
-            # In the long run, we probably just want to round the numbers on insert...
-            # See also https://www.postgresql.org/docs/11/runtime-config-client.html#GUC-EXTRA-FLOAT-DIGITS
-            self_x = Subquery(Seat.objects.filter(pk=self.pk).values('x'))
-            self_y = Subquery(Seat.objects.filter(pk=self.pk).values('y'))
-
-            qs_closeby_taken = qs_annotated.annotate(
-                distance=(
-                    Power(F('x') - self_x, Value(2), output_field=models.FloatField()) +
-                    Power(F('y') - self_y, Value(2), output_field=models.FloatField())
-                )
-            ).exclude(pk=self.pk).filter(
+            if self.x is None or self.y is None:
+                return True
+            distance = self.event.settings.seating_minimal_distance
+            # Compare in Python, with the same floating point values and the same formula as in Seat.annotated(),
+            # so the result is always consistent with event.free_seats()
+            qs_closeby_taken = qs_annotated.exclude(pk=self.pk).filter(
                 q,
-                distance__lt=self.event.settings.seating_minimal_distance ** 2
+                x__gt=self.x - distance - 1, x__lt=self.x + distance + 1,
+                y__gt=self.y - distance - 1, y__lt=self.y + distance + 1,
             )
             if self.event.settings.seating_distance_within_row:
                 qs_closeby_taken = qs_closeby_taken.filter(row_name=self.row_name)
-            if qs_closeby_taken.exists():
+            if any(
+                seats_closer_than(self.x, self.y, x, y, distance)
+                for x, y in qs_closeby_taken.values_list('x', 'y')
+            ):
                 return False
 
         return True
@@ -521,14 +521,29 @@ class Voucher(LoggedModel):
         return seat
 
     def save(self, *args, **kwargs):
+        from ..services import quotacounters, seatoccupancy
+
         if self.code != self.code.upper():
             self.code = self.code.upper()
             if 'update_fields' in kwargs:
                 kwargs['update_fields'] = {'code'}.union(kwargs['update_fields'])
+        previous = None
+        if self.pk and (quotacounters.counters_enabled() or seatoccupancy.occupancy_enabled()):
+            with scopes_disabled():
+                previous = Voucher.objects.filter(pk=self.pk).first()
         super().save(*args, **kwargs)
+        quotacounters.track_voucher(previous, self)
+        for v in (previous, self):
+            if v and v.seat_id:
+                seatoccupancy.invalidate(v.event_id, v.subevent_id)
         self.event.cache.set('vouchers_exist', True)
 
     def delete(self, using=None, keep_parents=False):
+        from ..services import quotacounters, seatoccupancy
+
+        quotacounters.track_voucher(self, None)
+        if self.seat_id:
+            seatoccupancy.invalidate(self.event_id, self.subevent_id, using=using)
         super().delete(using, keep_parents)
         self.event.cache.delete('vouchers_exist')
 
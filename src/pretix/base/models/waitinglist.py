@@ -27,7 +27,7 @@ from django.db import models, transaction
 from django.db.models import F, Q, Sum
 from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _, pgettext_lazy
-from django_scopes import ScopedManager
+from django_scopes import ScopedManager, scopes_disabled
 from i18nfield.strings import LazyI18nString
 from phonenumber_field.modelfields import PhoneNumberField
 
@@ -126,6 +126,8 @@ class WaitingListEntry(LoggedModel):
             raise ValidationError('Invalid input')
 
     def save(self, *args, **kwargs):
+        from ..services import quotacounters
+
         update_fields = kwargs.get('update_fields', set())
         if 'name_parts' in update_fields:
             kwargs['update_fields'] = {'name_cached'}.union(kwargs['update_fields'])
@@ -139,7 +141,21 @@ class WaitingListEntry(LoggedModel):
             self.name_parts = {}
             if 'update_fields' in kwargs:
                 kwargs['update_fields'] = {'name_parts'}.union(kwargs['update_fields'])
+
+        previous = None
+        if self.pk and quotacounters.counters_enabled():
+            with scopes_disabled():
+                previous = WaitingListEntry.objects.filter(pk=self.pk).only(
+                    'item_id', 'variation_id', 'subevent_id', 'voucher_id'
+                ).first()
         super().save(*args, **kwargs)
+        quotacounters.track_waitinglist_entry(previous, self)
+
+    def delete(self, *args, **kwargs):
+        from ..services import quotacounters
+
+        quotacounters.track_waitinglist_entry(self, None)
+        return super().delete(*args, **kwargs)
 
     @property
     def name(self):
@@ -191,36 +207,55 @@ class WaitingListEntry(LoggedModel):
             raise WaitingListException(_('This entry is anonymized and can no longer be used.'))
 
         with transaction.atomic():
-            e = self.email
-            if self.name:
-                e += ' / ' + self.name
-            v = Voucher.objects.create(
-                event=self.event,
-                max_usages=1,
-                valid_until=now() + timedelta(hours=self.event.settings.waiting_list_hours),
-                item=self.item,
-                variation=self.variation,
-                tag='waiting-list',
-                comment=_('Automatically created from waiting list entry for {email}').format(
-                    email=e
-                ),
-                block_quota=True,
-                subevent=self.subevent,
-            )
-            v.log_action('pretix.voucher.added.waitinglist', {
-                'item': self.item.pk,
-                'variation': self.variation.pk if self.variation else None,
-                'tag': 'waiting-list',
-                'block_quota': True,
-                'valid_until': v.valid_until.isoformat(),
-                'max_usages': 1,
-                'email': self.email,
-                'waitinglistentry': self.pk,
-                'subevent': self.subevent.pk if self.subevent else None,
-            }, user=user, auth=auth)
+            v = self.build_voucher()
+            v.save()
+            v.log_action('pretix.voucher.added.waitinglist', self.voucher_log_data(v), user=user, auth=auth)
             self.voucher = v
             self.save()
 
+        self.send_voucher_mail(user=user, auth=auth)
+
+    def build_voucher(self, code=None):
+        """
+        Returns a new, unsaved voucher for this entry.
+        """
+        e = self.email
+        if self.name:
+            e += ' / ' + self.name
+        v = Voucher(
+            event=self.event,
+            max_usages=1,
+            valid_until=now() + timedelta(hours=self.event.settings.waiting_list_hours),
+            item=self.item,
+            variation=self.variation,
+            tag='waiting-list',
+            comment=_('Automatically created from waiting list entry for {email}').format(
+                email=e
+            ),
+            block_quota=True,
+            subevent=self.subevent,
+        )
+        if code:
+            v.code = code
+        return v
+
+    def voucher_log_data(self, v):
+        return {
+            'item': self.item_id,
+            'variation': self.variation_id,
+            'tag': 'waiting-list',
+            'block_quota': True,
+            'valid_until': v.valid_until.isoformat(),
+            'max_usages': 1,
+            'email': self.email,
+            'waitinglistentry': self.pk,
+            'subevent': self.subevent_id,
+        }
+
+    def send_voucher_mail(self, user=None, auth=None):
+        """
+        Sends the email that informs the entry's contact address about the voucher assigned to this entry.
+        """
         with language(self.locale, self.event.settings.region):
             self.send_mail(
                 self.event.settings.mail_subject_waiting_list,
@@ -228,7 +263,7 @@ class WaitingListEntry(LoggedModel):
                 get_email_context(
                     event=self.event,
                     waiting_list_entry=self,
-                    waiting_list_voucher=v,
+                    waiting_list_voucher=self.voucher,
                     event_or_subevent=self.subevent or self.event,
                 ),
                 user=user,
@@ -39,13 +39,15 @@ import json
 import logging
 import os
 import re
+import shutil
 import subprocess
 import tempfile
 import unicodedata
 import uuid
 from collections import OrderedDict, defaultdict
-from functools import partial
+from functools import lru_cache, partial
 from io import BytesIO
+from typing import Callable, List
 
 import jsonschema
 import reportlab.rl_config
@@ -58,6 +60,7 @@ from django.db.models.fields.files import FieldFile
 from django.dispatch import receiver
 from django.utils.deconstruct import deconstructible
 from django.utils.formats import date_format
+from django.utils.functional import cached_property
 from django.utils.html import conditional_escape
 from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _, pgettext
@@ -66,6 +69,7 @@ from pypdf import PdfReader, PdfWriter
 from reportlab.graphics import renderPDF
 from reportlab.graphics.barcode.qr import QrCodeWidget
 from reportlab.graphics.shapes import Drawing
+from reportlab.lib import pagesizes
 from reportlab.lib.colors import Color
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 from reportlab.lib.styles import ParagraphStyle
@@ -747,7 +751,34 @@ def generate_compressed_addon_list(op, order, event):
     return addonlist
 
 
+@lru_cache(maxsize=4096)
+def _prepare_text(text):
+    """
+    Converts escaped text into the markup we pass to reportlab. The result only depends on the text, so we cache it,
+    since many values (event names, dates, static labels) repeat on every ticket of a bulk job.
+    """
+    # add an almost-invisible space &hairsp; after hyphens as word-wrap in ReportLab only works on space chars
+    text = text.replace("\n", "<br/>\n").replace("-", "-&hairsp;")
+
+    # reportlab does not support unicode combination characters
+    # It's important we do this before we use ArabicReshaper
+    text = unicodedata.normalize("NFC", text)
+
+    # reportlab does not support RTL, ligature-heavy scripts like Arabic. Therefore, we use ArabicReshaper
+    # to resolve all ligatures and python-bidi to switch RTL texts.
+    try:
+        text = "<br/>".join(get_display(reshaper.reshape(l)) for l in text.split("<br/>"))
+    except:
+        logger.exception('Reshaping/Bidi fixes failed on string {}'.format(repr(text)))
+    return text
+
+
 class Renderer:
+    """
+    Draws a ticket or badge layout for any number of order positions. Everything that does not depend on the
+    position (the per-page draw plan, resolved fonts, paragraph styles, images of static elements and the parsed
+    background) is computed once per instance, so a renderer should be reused for all positions sharing a layout.
+    """
 
     def __init__(self, event, layout, background_file):
         self.layout = layout
@@ -762,6 +793,37 @@ class Renderer:
             self.bg_bytes = None
             self.bg_pdf = None
         self.event_fonts = list(get_fonts(event, pdf_support_required=True).keys()) + ['Open Sans']
+        self._fonts = {}
+        self._styles = {}
+        self._static_images = {}
+        self.plan = self._compile_layout()
+
+    def _compile_layout(self):
+        draw_functions = {
+            'barcodearea': self._draw_barcodearea,
+            'imagearea': self._draw_imagearea,
+            'textcontainer': self._draw_textcontainer,
+            'textarea': self._draw_textarea,
+            'poweredby': lambda canvas, op, order, o: self._draw_poweredby(canvas, op, o),
+        }
+        plan = defaultdict(list)
+        for o in self.layout:
+            if o['type'] in draw_functions:
+                plan[o.get('page', 1)].append((draw_functions[o['type']], o))
+        return plan
+
+    @cached_property
+    def page_size(self):
+        if not self.bg_pdf:
+            return None
+        page_size = (
+            self.bg_pdf.pages[0].mediabox[2] - self.bg_pdf.pages[0].mediabox[0],
+            self.bg_pdf.pages[0].mediabox[3] - self.bg_pdf.pages[0].mediabox[1]
+        )
+        if self.bg_pdf.pages[0].get('/Rotate') in (90, 270):
+            # swap dimensions due to pdf being rotated
+            page_size = page_size[::-1]
+        return page_size
 
     @classmethod
     def _register_fonts(cls, event: Event = None):
@@ -787,14 +849,17 @@ class Renderer:
         content = o.get('content', 'dark')
         if content not in ('dark', 'white'):
             content = 'dark'
-        img = finders.find('pretixpresale/pdf/powered_by_pretix_{}.png'.format(content))
-
-        ir = ThumbnailingImageReader(img)
-        try:
-            width, height = ir.resize(None, float(o['size']) * mm, 300)
-        except:
-            logger.exception("Can not resize image")
-            pass
+        key = (content, o['size'])
+        if key not in self._static_images:
+            img = finders.find('pretixpresale/pdf/powered_by_pretix_{}.png'.format(content))
+            ir = ThumbnailingImageReader(img)
+            try:
+                width, height = ir.resize(None, float(o['size']) * mm, 300)
+            except:
+                logger.exception("Can not resize image")
+                pass
+            self._static_images[key] = ir, width, height
+        ir, width, height = self._static_images[key]
         canvas.drawImage(ir,
                          float(o['left']) * mm, float(o['bottom']) * mm,
                          width=width, height=height,
@@ -960,27 +1025,49 @@ class Renderer:
             )
             canvas.restoreState()
 
-    def _text_paragraph(self, op: OrderPosition, order: Order, o: dict, legacy_lineheight=False, override_fontsize=None):
-        font = o['fontfamily']
+    def _resolve_font(self, family, bold, italic):
+        key = (family, bold, italic)
+        if key not in self._fonts:
+            font = family
+
+            # Since pdfmetrics.registerFont is global, we want to make sure that no one tries to sneak in a font, they
+            # should not have access to.
+            if font not in self.event_fonts:
+                logger.warning(f'Unauthorized use of font "{font}"')
+                font = 'Open Sans'
 
-        # Since pdfmetrics.registerFont is global, we want to make sure that no one tries to sneak in a font, they
-        # should not have access to.
-        if font not in self.event_fonts:
-            logger.warning(f'Unauthorized use of font "{font}"')
-            font = 'Open Sans'
+            if bold:
+                font += ' B'
+            if italic:
+                font += ' I'
 
-        if o['bold']:
-            font += ' B'
-        if o['italic']:
-            font += ' I'
+            try:
+                pdfmetrics.getFont(font)
+            except KeyError:  # font not known, fall back
+                logger.warning(f'Use of unknown font "{font}"')
+                font = 'Open Sans'
+            self._fonts[key] = font
+        return self._fonts[key]
+
+    def _paragraph_style(self, font, fontsize, lineheight, auto_leading, color, alignment, split_long_words):
+        key = (font, fontsize, lineheight, auto_leading, tuple(color[:3]), alignment, split_long_words)
+        if key not in self._styles:
+            self._styles[key] = ParagraphStyle(
+                name=uuid.uuid4().hex,
+                fontName=font,
+                fontSize=fontsize,
+                leading=lineheight * fontsize,
+                autoLeading=auto_leading,
+                textColor=Color(color[0] / 255, color[1] / 255, color[2] / 255),
+                alignment=alignment,
+                splitLongWords=split_long_words,
+            )
+        return self._styles[key]
 
+    def _text_paragraph(self, op: OrderPosition, order: Order, o: dict, legacy_lineheight=False, override_fontsize=None):
+        font = self._resolve_font(o['fontfamily'], o['bold'], o['italic'])
         fontsize = override_fontsize if override_fontsize is not None else float(o['fontsize'])
-        try:
-            ad = getAscentDescent(font, fontsize)
-        except KeyError:  # font not known, fall back
-            logger.warning(f'Use of unknown font "{font}"')
-            font = 'Open Sans'
-            ad = getAscentDescent(font, fontsize)
+        ad = getAscentDescent(font, fontsize)
 
         align_map = {
             'left': TA_LEFT,
@@ -991,32 +1078,17 @@ class Renderer:
         # reportlab render similarly to browser canvas.
         # for backwards compatability use „uncorrected“ lineheight of 1.0 instead of 1.15
         lineheight = float(o['lineheight']) * 1.15 if not legacy_lineheight or 'lineheight' in o else 1.0
-        style = ParagraphStyle(
-            name=uuid.uuid4().hex,
-            fontName=font,
-            fontSize=fontsize,
-            leading=lineheight * fontsize,
+        style = self._paragraph_style(
+            font,
+            fontsize,
+            lineheight,
             # for backwards compatability use autoLeading if no lineheight is given
-            autoLeading='off' if not legacy_lineheight or 'lineheight' in o else 'max',
-            textColor=Color(o['color'][0] / 255, o['color'][1] / 255, o['color'][2] / 255),
-            alignment=align_map[o['align']],
-            splitLongWords=o.get('splitlongwords', True),
+            'off' if not legacy_lineheight or 'lineheight' in o else 'max',
+            o['color'],
+            align_map[o['align']],
+            o.get('splitlongwords', True),
         )
-        # add an almost-invisible space &hairsp; after hyphens as word-wrap in ReportLab only works on space chars
-        text = conditional_escape(
-            self._get_text_content(op, order, o) or "",
-        ).replace("\n", "<br/>\n").replace("-", "-&hairsp;")
-
-        # reportlab does not support unicode combination characters
-        # It's important we do this before we use ArabicReshaper
-        text = unicodedata.normalize("NFC", text)
-
-        # reportlab does not support RTL, ligature-heavy scripts like Arabic. Therefore, we use ArabicReshaper
-        # to resolve all ligatures and python-bidi to switch RTL texts.
-        try:
-            text = "<br/>".join(get_display(reshaper.reshape(l)) for l in text.split("<br/>"))
-        except:
-            logger.exception('Reshaping/Bidi fixes failed on string {}'.format(repr(text)))
+        text = _prepare_text(str(conditional_escape(self._get_text_content(op, order, o) or "")))
 
         p = Paragraph(text, style=style)
         return p, ad, lineheight
@@ -1085,28 +1157,10 @@ class Renderer:
         for page in range(page_count):
             if only_page and only_page != page + 1:
                 continue
-            for o in self.layout:
-                if o.get('page', 1) != page + 1:
-                    continue
-                if o['type'] == "barcodearea":
-                    self._draw_barcodearea(canvas, op, order, o)
-                elif o['type'] == "imagearea":
-                    self._draw_imagearea(canvas, op, order, o)
-                elif o['type'] == "textcontainer":
-                    self._draw_textcontainer(canvas, op, order, o)
-                elif o['type'] == "textarea":
-                    self._draw_textarea(canvas, op, order, o)
-                elif o['type'] == "poweredby":
-                    self._draw_poweredby(canvas, op, o)
-                if self.bg_pdf:
-                    page_size = (
-                        self.bg_pdf.pages[0].mediabox[2] - self.bg_pdf.pages[0].mediabox[0],
-                        self.bg_pdf.pages[0].mediabox[3] - self.bg_pdf.pages[0].mediabox[1]
-                    )
-                    if self.bg_pdf.pages[0].get('/Rotate') in (90, 270):
-                        # swap dimensions due to pdf being rotated
-                        page_size = page_size[::-1]
-                    canvas.setPageSize(page_size)
+            for draw, o in self.plan[page + 1]:
+                draw(canvas, op, order, o)
+            if self.page_size:
+                canvas.setPageSize(self.page_size)
             if show_page:
                 canvas.showPage()
 
@@ -1259,6 +1313,112 @@ def merge_background(fg_pdf: PdfWriter, bg_pdf: PdfWriter, out_file, compress):
         fg_pdf.write(out_file)
 
 
+class PdfCollector:
+    """
+    Collects the pages drawn by one or more :py:class:`Renderer` instances for many order positions into a single PDF
+    file. All foregrounds are drawn onto the same canvas and all backgrounds are merged in a single pass when the file
+    is written, instead of creating and re-parsing an intermediate PDF file for every position.
+    """
+
+    def __init__(self, title):
+        self.title = title
+        self.buffer = BytesIO()
+        self.canvas = Canvas(self.buffer, pagesize=pagesizes.A4)
+        self.bg_pdf = PdfWriter()
+        self.num_pages = 0
+
+    def add(self, renderer: Renderer, order: Order, op: OrderPosition):
+        renderer.draw_page(self.canvas, order, op)
+        for page in renderer.bg_pdf.pages:
+            self.bg_pdf.add_page(page)
+        self.num_pages += len(renderer.bg_pdf.pages)
+
+    def write(self, output_file):
+        if not self.num_pages:
+            PdfWriter().write(output_file)
+            return
+        self.canvas.save()
+        fg_pdf = PdfWriter()
+        fg_pdf.append(self.buffer)
+        fg_pdf.add_metadata({
+            '/Title': str(self.title),
+            '/Creator': 'pretix',
+        })
+        merge_background(fg_pdf, self.bg_pdf, output_file, compress=True)
+
+    def read(self):
+        # pdftk writes to a file descriptor, so we can't use a BytesIO here
+        with tempfile.TemporaryFile() as f:
+            self.write(f)
+            f.seek(0)
+            return f.read()
+
+
+def concatenate_pdfs(file_names: List[str], output_file):
+    """
+    Concatenates the PDF files named in ``file_names`` into ``output_file``, which needs to be a real file if pdftk
+    is used.
+    """
+    if settings.PDFTK:
+        subprocess.run([settings.PDFTK, *file_names, 'cat', 'output', '-'], check=True, stdout=output_file)
+    else:
+        merger = PdfWriter()
+        for file_name in file_names:
+            merger.append(file_name)
+        merger.write(output_file)
+        merger.close()
+
+
+# Number of positions rendered into one intermediate PDF file by render_sharded
+SHARD_SIZE = 250
+
+
+def render_sharded(shards, render_shard: Callable[[object, PdfCollector], None], title, output_file,
+                   progress_callback=None):
+    """
+    Renders a large PDF file in parts. ``render_shard`` is called with every element of ``shards`` and a fresh
+    :py:class:`PdfCollector` to add pages to. Every shard is merged with its backgrounds into a temporary file, and
+    the parts are concatenated into ``output_file`` (which needs to be a real file) in their original order.
+
+    Rendering is CPU-bound, so it does not gain anything from threads. To render shards in parallel, render them in
+    separate tasks with :py:func:`render_shard_to_file` and join the parts with :py:func:`concatenate_parts`.
+    """
+    shards = list(shards)
+    with tempfile.TemporaryDirectory() as d:
+        file_names = []
+        for i, shard in enumerate(shards):
+            file_name = os.path.join(d, f'part-{i}.pdf')
+            with open(file_name, 'wb') as f:
+                if render_shard_to_file(shard, render_shard, title, f):
+                    file_names.append(file_name)
+            if progress_callback:
+                progress_callback((i + 1) / len(shards) * 100)
+        concatenate_parts(file_names, output_file)
+
+
+def render_shard_to_file(shard, render_shard: Callable[[object, PdfCollector], None], title, output_file):
+    """
+    Renders a single shard for :py:func:`render_sharded` into ``output_file`` and returns the number of pages.
+    """
+    collector = PdfCollector(title)
+    render_shard(shard, collector)
+    collector.write(output_file)
+    return collector.num_pages
+
+
+def concatenate_parts(file_names: List[str], output_file):
+    """
+    Joins the non-empty parts rendered by :py:func:`render_shard_to_file` into ``output_file``.
+    """
+    if len(file_names) == 1:
+        with open(file_names[0], 'rb') as f:
+            shutil.copyfileobj(f, output_file)
+    elif file_names:
+        concatenate_pdfs(file_names, output_file)
+    else:
+        PdfWriter().write(output_file)
+
+
 @deconstructible
 class PdfLayoutValidator:
     def __call__(self, value):
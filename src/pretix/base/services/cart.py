@@ -63,6 +63,7 @@ from pretix.base.models.event import SubEvent
 from pretix.base.models.orders import OrderFee
 from pretix.base.models.tax import TaxRule
 from pretix.base.reldate import RelativeDateWrapper
+from pretix.base.services import quotacounters, seatoccupancy
 from pretix.base.services.checkin import _save_answers
 from pretix.base.services.locking import LockTimeoutException, lock_objects
 from pretix.base.services.pricing import (
@@ -1398,7 +1399,12 @@ class CartManager:
                 if not p.pk:  # We stored some to the database already before
                     p.save()
                 _save_answers(p, {}, p._answers)
-        CartPosition.objects.bulk_create([p for p in new_cart_positions if not getattr(p, '_answers', None) and not p.pk])
+        bulk_positions = [p for p in new_cart_positions if not getattr(p, '_answers', None) and not p.pk]
+        CartPosition.objects.bulk_create(bulk_positions)
+        for p in bulk_positions:
+            quotacounters.track_cart_position(p, 1, now_dt=self.real_now_dt)
+            if p.seat_id:
+                seatoccupancy.invalidate(p.event_id, p.subevent_id)
 
         if 'sleep-before-commit' in debugflags_var.get():
             sleep(2)
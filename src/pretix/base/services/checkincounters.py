@@ -0,0 +1,387 @@
+#
+# This file is part of pretix (Community Edition).
+#
+# Copyright (C) 2014-2020 Raphael Michel and contributors
+# Copyright (C) 2020-2021 rami.io GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+#
+"""
+This module contains an optional store of incrementally maintained check-in list counters. If it is enabled through
+the ``checkin_counters`` option in the ``[pretix]`` section of the configuration file (and redis is configured), we
+keep one small redis hash per check-in list with the number of valid positions and checked-in positions per product
+and variation, as well as the number of positions currently inside. This allows the check-in list status (which door
+dashboards tend to poll every few seconds) to be served without counting the list in the database.
+
+Successful check-ins, changes to the positions of an order (which are tracked through the same transactions that
+drive the quota counters) and changes of the order status call :py:func:`track`, which collects the changes in memory
+and applies them to redis once the surrounding database transaction has been committed.
+
+Not every write in the system is tracked (e.g. bulk deletions of check-ins or orders that require approval), so the
+counters can drift. A periodic task therefore recounts every check-in list in use from the database and overwrites
+the counters. Counters of lists that have not been reconciled recently are ignored.
+"""
+import logging
+import time
+from collections import Counter, defaultdict
+
+import django_redis
+from django.conf import settings
+from django.db.models import Count, Exists, Max, OuterRef, Q
+from django.dispatch import receiver
+from django_scopes import scopes_disabled
+
+from pretix.base.models import Checkin, CheckinList, Order
+from pretix.base.models._oncommit import OnCommitCounter
+from pretix.base.services.counters import (
+    KEY_TIMEOUT, RecentlyRead, is_reconciled,
+)
+from pretix.base.signals import periodic_task
+from pretix.helpers.periodic import minimum_interval
+
+logger = logging.getLogger(__name__)
+
+STATUS_PAID = 'paid'
+STATUS_PENDING = 'pending'
+STATUS_PENDING_VALID = 'pending_valid'
+
+FIELD_POSITIONS = 'p'
+FIELD_CHECKINS = 'c'
+FIELD_INSIDE = 'inside'
+
+RECONCILE_CHUNK_SIZE = 100
+
+KNOWN_KEY = 'checkincounters:known'
+known = RecentlyRead(KNOWN_KEY)
+
+
+def counters_enabled():
+    return settings.HAS_REDIS and settings.PRETIX_CHECKIN_COUNTERS
+
+
+def _key(list_id):
+    return f'checkincounters:{list_id}'
+
+
+def status_class(status, valid_if_pending):
+    """
+    Returns the status class an order with the given attributes is counted in, or ``None`` if its positions are not
+    part of any check-in list.
+    """
+    if status == Order.STATUS_PAID:
+        return STATUS_PAID
+    if status == Order.STATUS_PENDING:
+        return STATUS_PENDING_VALID if valid_if_pending else STATUS_PENDING
+    return None
+
+
+def _list_counts(clist, status):
+    return status in (STATUS_PAID, STATUS_PENDING_VALID) or (status == STATUS_PENDING and clist['include_pending'])
+
+
+def _flush(deltas):
+    event_ids = {k[0] for k in deltas if not k[1]}
+    list_ids = {k[1] for k in deltas if k[1]}
+
+    # Resolve the deltas to the lists they are counted in, in the same way CheckinList.positions_query does it.
+    with scopes_disabled():
+        lists = {
+            cl['pk']: cl for cl in CheckinList.objects.filter(
+                Q(event_id__in=event_ids) | Q(pk__in=list_ids)
+            ).values('pk', 'event_id', 'subevent_id', 'all_products', 'include_pending')
+        }
+    limit_products = defaultdict(set)
+    for list_id, item_id in CheckinList.limit_products.through.objects.filter(
+            checkinlist_id__in=[cl['pk'] for cl in lists.values() if not cl['all_products']]
+    ).values_list('checkinlist_id', 'item_id'):
+        limit_products[list_id].add(item_id)
+    event_lists = defaultdict(list)
+    for cl in lists.values():
+        event_lists[cl['event_id']].append(cl)
+
+    list_deltas = Counter()
+    for (event_id, list_id, status, subevent_id, item_id, variation_id, field), d in deltas.items():
+        if not d:
+            continue
+        if list_id:
+            candidates = [lists[list_id]] if list_id in lists else []
+        else:
+            candidates = event_lists[event_id]
+        for cl in candidates:
+            if cl['subevent_id'] and cl['subevent_id'] != subevent_id:
+                continue
+            if not cl['all_products'] and item_id not in limit_products[cl['pk']]:
+                continue
+            if not _list_counts(cl, status):
+                continue
+            if field == FIELD_INSIDE:
+                list_deltas[cl['pk'], field] += d
+            else:
+                list_deltas[cl['pk'], f'{field}:{item_id}:{variation_id or ""}'] += d
+
+    if not list_deltas:
+        return
+
+    rc = django_redis.get_redis_connection("redis")
+    p = rc.pipeline()
+    for (list_id, field), d in list_deltas.items():
+        if d:
+            p.hincrby(_key(list_id), field, d)
+    p.execute()
+
+
+_pending = OnCommitCounter(_flush)
+
+
+def track(field, delta, event_id, status, item_id, variation_id=None, subevent_id=None, list_id=None, using=None):
+    """
+    Records that ``delta`` positions with the given properties have been added to (or, if ``delta`` is negative,
+    removed from) the given counter of all check-in lists of the event that include them. Check-in and inside counters
+    need to pass the ``list_id`` of the list the check-ins have been made on. The change is applied when the current
+    database transaction is committed.
+    """
+    if not delta or not status or not counters_enabled():
+        return
+
+    _pending.add((event_id, list_id, status, subevent_id, item_id, variation_id, field), delta, using)
+
+
+def _flags(last_entry, last_exit):
+    """
+    Returns whether a position has been checked in and whether it is currently inside, given its last successful
+    entry and exit on a list.
+    """
+    return (
+        last_entry is not None,
+        last_entry is not None and (last_exit is None or last_exit < last_entry)
+    )
+
+
+@scopes_disabled()
+def checkin_states(checkins, key):
+    """
+    Returns a dictionary mapping the value of ``key`` for all positions in the given check-in queryset to a dictionary
+    mapping list IDs to a tuple of flags whether the position has been checked in and whether it is inside.
+    """
+    result = defaultdict(dict)
+    for r in checkins.order_by().values(key, 'list_id').annotate(
+        last_entry=Max('datetime', filter=Q(type=Checkin.TYPE_ENTRY)),
+        last_exit=Max('datetime', filter=Q(type=Checkin.TYPE_EXIT)),
+    ):
+        result[r[key]][r['list_id']] = _flags(r['last_entry'], r['last_exit'])
+    return result
+
+
+@scopes_disabled()
+def state_before_checkin(checkin):
+    """
+    Returns the last entry and exit time of the check-in's position on its list, not considering the check-in itself,
+    or ``None`` if the check-in does not need to be tracked.
+    """
+    if not checkin.successful or not checkin.position_id or not counters_enabled():
+        return None
+    qs = Checkin.objects.filter(position_id=checkin.position_id, list_id=checkin.list_id)
+    if checkin.pk:
+        qs = qs.exclude(pk=checkin.pk)
+    return qs.order_by().aggregate(
+        last_entry=Max('datetime', filter=Q(type=Checkin.TYPE_ENTRY)),
+        last_exit=Max('datetime', filter=Q(type=Checkin.TYPE_EXIT)),
+    )
+
+
+def track_checkin(checkin, state, delta, using=None):
+    """
+    Records the creation (``delta=1``) or deletion (``delta=-1``) of a successful check-in. ``state`` is the result
+    of :py:func:`state_before_checkin` for the check-in.
+    """
+    last_entry, last_exit = state['last_entry'], state['last_exit']
+    if checkin.type == Checkin.TYPE_ENTRY:
+        with_checkin = _flags(max(filter(None, (last_entry, checkin.datetime))), last_exit)
+    else:
+        with_checkin = _flags(last_entry, max(filter(None, (last_exit, checkin.datetime))))
+    without_checkin = _flags(last_entry, last_exit)
+
+    position = checkin.position
+    if position.canceled:
+        return
+    kwargs = dict(
+        event_id=checkin.list.event_id, list_id=checkin.list_id,
+        status=status_class(position.order.status, position.order.valid_if_pending),
+        item_id=position.item_id, variation_id=position.variation_id, subevent_id=position.subevent_id,
+        using=using,
+    )
+    track(FIELD_CHECKINS, delta * (with_checkin[0] - without_checkin[0]), **kwargs)
+    track(FIELD_INSIDE, delta * (with_checkin[1] - without_checkin[1]), **kwargs)
+
+
+def track_order_transactions(order, transactions, previous_status, current_status, is_new=False):
+    """
+    Records the addition or removal of order positions based on newly created transactions. Removed positions are
+    taken from the status class they have been counted in before.
+    """
+    if not counters_enabled():
+        return
+    transactions = [t for t in transactions if t.item_id and not t.fee_type]
+    if not transactions:
+        return
+
+    states = {} if is_new else checkin_states(Checkin.objects.filter(position__order_id=order.pk), 'position__positionid')
+    for t in transactions:
+        kwargs = dict(
+            event_id=order.event_id, status=previous_status if t.count < 0 else current_status,
+            item_id=t.item_id, variation_id=t.variation_id, subevent_id=t.subevent_id,
+        )
+        track(FIELD_POSITIONS, t.count, **kwargs)
+        for list_id, (checked_in, inside) in states.get(t.positionid, {}).items():
+            track(FIELD_CHECKINS, t.count * checked_in, list_id=list_id, **kwargs)
+            track(FIELD_INSIDE, t.count * inside, list_id=list_id, **kwargs)
+
+
+def track_order_status_change(order, previous_status, current_status, using=None):
+    """
+    Records that all positions of an order moved from one status class to another one.
+    """
+    if not counters_enabled():
+        return
+    states = checkin_states(Checkin.objects.filter(position__order_id=order.pk), 'position_id')
+    for p in order.positions.values('id', 'item_id', 'variation_id', 'subevent_id'):
+        for status, d in ((previous_status, -1), (current_status, 1)):
+            kwargs = dict(
+                event_id=order.event_id, status=status, item_id=p['item_id'], variation_id=p['variation_id'],
+                subevent_id=p['subevent_id'], using=using,
+            )
+            track(FIELD_POSITIONS, d, **kwargs)
+            for list_id, (checked_in, inside) in states.get(p['id'], {}).items():
+                track(FIELD_CHECKINS, d * checked_in, list_id=list_id, **kwargs)
+                track(FIELD_INSIDE, d * inside, list_id=list_id, **kwargs)
+
+
+def _parse(data):
+    counts = {
+        'positions': Counter(),
+        'checkins': Counter(),
+        'inside': 0,
+    }
+    for k, v in data.items():
+        if k == FIELD_INSIDE:
+            counts['inside'] = int(v)
+        elif k.startswith((FIELD_POSITIONS + ':', FIELD_CHECKINS + ':')):
+            field, item_id, variation_id = k.split(':')
+            counts['positions' if field == FIELD_POSITIONS else 'checkins'][
+                int(item_id), int(variation_id) if variation_id else None
+            ] += int(v)
+    return counts
+
+
+def read(checkinlist):
+    """
+    Returns the counters of the given check-in list if they have been reconciled recently, and ``None`` otherwise. The
+    result is a dictionary with the number of ``positions`` and ``checkins`` per tuple of item and variation ID, as
+    well as the number of positions currently ``inside``. Lists without reliable counters are scheduled for
+    initialization by the next reconciliation run.
+    """
+    if not counters_enabled():
+        return None
+
+    rc = django_redis.get_redis_connection("redis")
+    p = rc.pipeline()
+    p.hgetall(_key(checkinlist.pk))
+    known.touch(p, [checkinlist.pk])
+    data = p.execute()[0]
+
+    data = {k.decode(): v for k, v in data.items()}
+    if not is_reconciled(data):
+        return None
+    return _parse(data)
+
+
+def count(checkinlist):
+    """
+    Counts the given check-in list from the database. The result has the same structure as the result of
+    :py:func:`read`.
+    """
+    pqs = checkinlist.positions
+    cqs = pqs.annotate(
+        checkedin=Exists(Checkin.objects.filter(list_id=checkinlist.pk, position=OuterRef('pk'), type=Checkin.TYPE_ENTRY))
+    ).filter(
+        checkedin=True,
+    )
+    return {
+        'positions': Counter({
+            (r['item_id'], r['variation_id']): r['cnt']
+            for r in pqs.order_by().values('item_id', 'variation_id').annotate(cnt=Count('id'))
+        }),
+        'checkins': Counter({
+            (r['item_id'], r['variation_id']): r['cnt']
+            for r in cqs.order_by().values('item_id', 'variation_id').annotate(cnt=Count('id'))
+        }),
+        'inside': checkinlist.positions_inside_query().count(),
+    }
+
+
+def invalidate(list_id):
+    if counters_enabled():
+        rc = django_redis.get_redis_connection("redis")
+        rc.delete(_key(list_id))
+
+
+@scopes_disabled()
+def reconcile(checkinlists):
+    """
+    Counts the given check-in lists from the database and overwrites their counters. Returns the total absolute drift
+    that has been repaired.
+    """
+    if not checkinlists or not counters_enabled():
+        return 0
+
+    rc = django_redis.get_redis_connection("redis")
+    drift = 0
+    for cl in checkinlists:
+        prev = {k.decode(): v for k, v in rc.hgetall(_key(cl.pk)).items()}
+        counts = count(cl)
+        if 'reconciled' in prev:
+            prev = _parse(prev)
+            drift += abs(prev['inside'] - counts['inside'])
+            for field in ('positions', 'checkins'):
+                drift += sum(abs(prev[field][k] - counts[field][k]) for k in set(prev[field]) | set(counts[field]))
+
+        mapping = {FIELD_INSIDE: counts['inside'], 'reconciled': str(time.time())}
+        for field, prefix in (('positions', FIELD_POSITIONS), ('checkins', FIELD_CHECKINS)):
+            for (item_id, variation_id), c in counts[field].items():
+                mapping[f'{prefix}:{item_id}:{variation_id or ""}'] = c
+
+        p = rc.pipeline()
+        p.delete(_key(cl.pk))
+        p.hset(_key(cl.pk), mapping=mapping)
+        p.expire(_key(cl.pk), KEY_TIMEOUT)
+        p.execute()
+    return drift
+
+
+@receiver(signal=periodic_task)
+@scopes_disabled()
+@minimum_interval(minutes_after_success=5)
+def reconcile_checkin_counters(sender, **kwargs):
+    if not counters_enabled():
+        return
+
+    drift = known.reconcile(
+        lambda ids: list(CheckinList.objects.filter(pk__in=ids).select_related('event')),
+        reconcile,
+        RECONCILE_CHUNK_SIZE,
+    )
+    if drift:
+        logger.info(f'Repaired a total drift of {drift} in check-in list counters.')
@@ -0,0 +1,110 @@
+#
+# This file is part of pretix (Community Edition).
+#
+# Copyright (C) 2014-2020 Raphael Michel and contributors
+# Copyright (C) 2020-2021 rami.io GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+#
+"""
+Resolution of scanned barcodes to order positions for the check-in API.
+
+Looking up a barcode first only resolves the IDs of matching positions through the indexed secret column, so that the
+expensive check-in queryset with all its annotations and prefetches is only evaluated once we know there is a match.
+
+Barcodes that are not known at all (no position, reusable medium or revoked secret matches) are remembered in a
+negative cache, since scanners at busy entrances tend to scan the same foreign or broken barcode over and over again.
+All negative entries of a barcode are keyed on a generation token that is dropped whenever a position, a reusable medium
+or a revoked secret of the organizer with that barcode is created or changed.
+"""
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db.models import Q, Subquery
+from django.utils.crypto import get_random_string
+
+from pretix.base.models import OrderPosition
+from pretix.base.models._oncommit import OnCommitCounter
+
+NEGATIVE_CACHE_TTL = 3600
+
+
+def _generation_key(organizer_id, barcode):
+    # Old versions of our scan apps send spaces as '+', which we retry as spaces, so both share one generation
+    h = hashlib.sha256(barcode.replace('+', ' ').encode()).hexdigest()
+    return f'checkinlookup:{organizer_id}:{h}:generation'
+
+
+def negative_cache_key(organizer_id, event_ids, barcode, source_type, **options):
+    """
+    Returns the cache key for a negative lookup result. The key needs to be computed *before* the database is
+    queried, so that a result computed concurrently with an invalidation is never stored under the new generation.
+    """
+    generation_key = _generation_key(organizer_id, barcode)
+    generation = cache.get(generation_key)
+    if generation is None:
+        generation = get_random_string(12)
+        if not cache.add(generation_key, generation, NEGATIVE_CACHE_TTL):
+            generation = cache.get(generation_key, generation)
+    h = hashlib.sha256(
+        json.dumps([sorted(event_ids), barcode, source_type, sorted(options.items())]).encode()
+    ).hexdigest()
+    return f'checkinlookup:{organizer_id}:{generation}:{h}'
+
+
+def is_known_unknown(key):
+    """
+    Returns whether the barcode has recently been looked up with the same parameters and was not known.
+    """
+    return bool(cache.get(key))
+
+
+def remember_unknown(key):
+    cache.set(key, True, NEGATIVE_CACHE_TTL)
+
+
+def _flush(keys):
+    cache.delete_many([_generation_key(organizer_id, barcode) for organizer_id, barcode in keys])
+
+
+_pending = OnCommitCounter(_flush)
+
+
+def invalidate(organizer_id, barcodes, using=None):
+    """
+    Drops all negative cache entries of the given barcodes of the organizer once the current database transaction has
+    been committed.
+    """
+    for barcode in barcodes:
+        if barcode:
+            _pending.add((organizer_id, str(barcode)), using=using)
+
+
+def find_position_ids(event_ids, barcode, addon_match=False, allow_pk=False):
+    """
+    Returns the IDs of all non-canceled positions in the given events whose secret (or, if ``allow_pk`` is set, whose
+    ID) matches the barcode. If ``addon_match`` is set, add-ons of positions with a matching secret are included as
+    well, even if the matching position itself is canceled.
+    """
+    q = Q(secret=barcode)
+    if addon_match:
+        q |= Q(addon_to_id__in=Subquery(
+            OrderPosition.all.filter(order__event_id__in=event_ids, secret=barcode).values('pk')
+        ))
+    if allow_pk:
+        q |= Q(pk=barcode)
+    return list(OrderPosition.objects.filter(q, order__event_id__in=event_ids).values_list('pk', flat=True))
@@ -0,0 +1,213 @@
+#
+# This file is part of pretix (Community Edition).
+#
+# Copyright (C) 2014-2020 Raphael Michel and contributors
+# Copyright (C) 2020-2021 rami.io GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+#
+"""
+Compact check-in data for scanner devices that keep a local copy of a check-in list.
+
+Devices first download a gzip-compressed snapshot of all positions on the list, which is generated in the background
+and shared between all devices, and then keep it up to date through a feed of changed positions. Both are keyed on
+``Order.last_modified``, which is touched on every change to an order, its positions and their check-ins.
+"""
+import base64
+import binascii
+import gzip
+import json
+import tempfile
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.files import File
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import now
+
+from pretix.base.models import CachedFile, Checkin, Event, OrderPosition
+from pretix.base.services.tasks import ProfiledEventTask
+from pretix.celery_app import app
+
+SNAPSHOT_VERSION = 1
+# A snapshot older than this is still served, but a new one is generated in the background
+SNAPSHOT_MAX_AGE = timedelta(minutes=15)
+SNAPSHOT_EXPIRES = timedelta(hours=12)
+# Changes are only visible once their transaction commits, which might be a while after last_modified was set. When
+# a device starts a new round of synchronization, we therefore go back this far in time and accept some duplicates.
+SYNC_OVERLAP = timedelta(minutes=2)
+DELTA_PAGE_SIZE = 1000
+DELTA_MAX_PAGE_SIZE = 5000
+
+
+class InvalidSyncToken(ValueError):
+    pass
+
+
+def encode_token(last_modified, pk, complete):
+    data = [last_modified.isoformat(), pk, complete]
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+
+def decode_token(token):
+    try:
+        last_modified, pk, complete = json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+        last_modified = parse_datetime(last_modified)
+    except (TypeError, ValueError, binascii.Error):
+        raise InvalidSyncToken()
+    if last_modified is None:
+        raise InvalidSyncToken()
+    return last_modified, int(pk), bool(complete)
+
+
+def _position_record(p, checkins, active):
+    return {
+        'id': p.pk,
+        'order': p.order.code,
+        'positionid': p.positionid,
+        'secret': p.secret,
+        'item': p.item_id,
+        'variation': p.variation_id,
+        'subevent': p.subevent_id,
+        'addon_to': p.addon_to_id,
+        'attendee_name': p.attendee_name_cached,
+        'seat': p.seat.seat_guid if p.seat else None,
+        'blocked': p.blocked,
+        'valid_from': p.valid_from.isoformat() if p.valid_from else None,
+        'valid_until': p.valid_until.isoformat() if p.valid_until else None,
+        'order_status': p.order.status,
+        'require_attention': p.order.checkin_attention,
+        'checkins': checkins.get(p.pk, []),
+        'active': active,
+    }
+
+
+def _checkins_by_position(checkinlist, positions=None):
+    qs = Checkin.objects.filter(list=checkinlist)
+    if positions is not None:
+        qs = qs.filter(position_id__in=positions)
+    result = defaultdict(list)
+    for c in qs.order_by('datetime').values('position_id', 'type', 'datetime').iterator():
+        result[c['position_id']].append({'type': c['type'], 'datetime': c['datetime'].isoformat()})
+    return result
+
+
+def _scope_query(checkinlist):
+    qs = OrderPosition.all.filter(order__event_id=checkinlist.event_id)
+    if checkinlist.subevent_id:
+        qs = qs.filter(subevent_id=checkinlist.subevent_id)
+    return qs.select_related('order', 'seat')
+
+
+def _snapshot_filename(checkinlist):
+    return 'checkinlist-{}-{}-{}-snapshot.json.gz'.format(
+        checkinlist.event.organizer.slug, checkinlist.event.slug, checkinlist.pk
+    )
+
+
+def _latest_snapshot(checkinlist):
+    return CachedFile.objects.filter(
+        filename=_snapshot_filename(checkinlist), expires__gt=now(),
+    ).order_by('-date').first()
+
+
+def get_snapshot(checkinlist):
+    """
+    Returns the most recent snapshot of the check-in list as a ``CachedFile``, or ``None``, if there is none. If the
+    snapshot is outdated or missing, a new one is generated in the background.
+    """
+    snapshot = _latest_snapshot(checkinlist)
+    if not snapshot or snapshot.date < now() - SNAPSHOT_MAX_AGE:
+        # Only one generation at a time, no matter how many devices ask for it
+        if cache.add('checkin_list_{}_snapshot_pending'.format(checkinlist.pk), True, 300):
+            generate_snapshot.apply_async(kwargs={'event': checkinlist.event_id, 'checkinlist': checkinlist.pk})
+            # If tasks are executed synchronously, the new snapshot already exists
+            snapshot = _latest_snapshot(checkinlist) or snapshot
+    return snapshot
+
+
+@app.task(base=ProfiledEventTask, acks_late=True)
+def generate_snapshot(event: Event, checkinlist: int) -> None:
+    checkinlist = event.checkin_lists.get(pk=checkinlist)
+    try:
+        started = now()
+        checkins = _checkins_by_position(checkinlist)
+        positions = checkinlist.positions.select_related('order', 'seat').order_by('pk')
+
+        with tempfile.TemporaryFile() as f:
+            with gzip.GzipFile(fileobj=f, mode='wb') as gz:
+                header = {
+                    'version': SNAPSHOT_VERSION,
+                    'list': checkinlist.pk,
+                    'generated': started.isoformat(),
+                    # Everything that changed after we started might or might not be part of the snapshot
+                    'sync_token': encode_token(started, 0, True),
+                }
+                gz.write(json.dumps(header)[:-1].encode() + b', "positions": [')
+                for i, p in enumerate(positions.iterator(chunk_size=2000)):
+                    if i:
+                        gz.write(b',')
+                    gz.write(json.dumps(_position_record(p, checkins, True)).encode())
+                gz.write(b']}')
+
+            f.seek(0)
+            cf = CachedFile(
+                expires=started + SNAPSHOT_EXPIRES,
+                date=started,
+                filename=_snapshot_filename(checkinlist),
+                type='application/gzip',
+                web_download=False,
+            )
+            cf.file.save(cf.filename, File(f), save=True)
+
+        for old in CachedFile.objects.filter(filename=cf.filename, date__lt=started):
+            old.delete()
+    finally:
+        cache.delete('checkin_list_{}_snapshot_pending'.format(checkinlist.pk))
+
+
+def get_changes(checkinlist, token=None, limit=DELTA_PAGE_SIZE):
+    """
+    Returns all positions within the scope of the check-in list that changed after the state described by ``token``,
+    including positions that are no longer valid on the list (marked with ``"active": false``), together with the
+    token to pass for the next call and whether there are further changes.
+    """
+    qs = _scope_query(checkinlist)
+    if token:
+        last_modified, pk, complete = decode_token(token)
+        if complete:
+            qs = qs.filter(order__last_modified__gte=last_modified - SYNC_OVERLAP)
+        else:
+            qs = qs.filter(
+                Q(order__last_modified__gt=last_modified) | Q(order__last_modified=last_modified, pk__gt=pk)
+            )
+
+    page = list(qs.order_by('order__last_modified', 'pk')[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    if page:
+        pks = [p.pk for p in page]
+        active = set(checkinlist.positions.filter(pk__in=pks).values_list('pk', flat=True))
+        checkins = _checkins_by_position(checkinlist, pks)
+        results = [_position_record(p, checkins, p.pk in active) for p in page]
+        next_token = encode_token(page[-1].order.last_modified, page[-1].pk, not has_more)
+    else:
+        results = []
+        next_token = token or encode_token(now(), 0, True)
+    return results, next_token, has_more
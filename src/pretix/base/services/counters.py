@@ -0,0 +1,81 @@
+#
+# This file is part of pretix (Community Edition).
+#
+# Copyright (C) 2014-2020 Raphael Michel and contributors
+# Copyright (C) 2020-2021 rami.io GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+#
+"""
+This module contains the parts shared by the optional, incrementally maintained counters in
+:py:mod:`pretix.base.services.quotacounters` and :py:mod:`pretix.base.services.checkincounters`.
+
+Both keep one redis hash per object. Since not every write in the system is tracked, the counters can drift, so a
+periodic task recounts all objects whose counters have been read recently from the database and stores the time of
+this reconciliation in the hash. Counters that have not been reconciled within ``MAX_AGE`` seconds are not trusted.
+"""
+import time
+
+import django_redis
+
+# Counters are only trusted if they have been reconciled with the database within this number of seconds
+MAX_AGE = 30 * 60
+# Objects are only kept up to date if their counters have been read within this number of seconds
+KEEP_ALIVE = 24 * 3600
+KEY_TIMEOUT = 7 * 24 * 3600
+
+
+def is_reconciled(data, ts=None):
+    """
+    Returns whether the given counter hash (with decoded keys) has been reconciled recently enough to be trusted.
+    """
+    return 'reconciled' in data and (ts or time.time()) - float(data['reconciled']) < MAX_AGE
+
+
+class RecentlyRead:
+    """
+    Keeps track of the objects whose counters have been read recently in a sorted set in redis, so the periodic
+    reconciliation only recounts objects that are actually in use.
+    """
+
+    def __init__(self, key):
+        self.key = key
+
+    def touch(self, rc, ids):
+        """
+        Records that the counters of the given object IDs have been read. ``rc`` can be a redis connection or pipeline.
+        """
+        ts = time.time()
+        rc.zadd(self.key, {str(i): ts for i in ids})
+
+    def reconcile(self, load, reconcile, chunk_size):
+        """
+        Passes all objects read within the last ``KEEP_ALIVE`` seconds to ``reconcile`` in chunks of ``chunk_size``
+        and returns the sum of its results. ``load`` receives a list of IDs and returns the objects that still exist.
+        """
+        rc = django_redis.get_redis_connection("redis")
+        rc.zremrangebyscore(self.key, '-inf', time.time() - KEEP_ALIVE)
+        ids = [int(i) for i in rc.zrange(self.key, 0, -1)]
+
+        drift = 0
+        for i in range(0, len(ids), chunk_size):
+            chunk = ids[i:i + chunk_size]
+            objects = load(chunk)
+            missing = set(chunk) - {o.pk for o in objects}
+            if missing:
+                rc.zrem(self.key, *[str(i) for i in missing])
+            drift += reconcile(objects)
+        return drift
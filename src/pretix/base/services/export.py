@@ -19,13 +19,16 @@
 # You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
 # <https://www.gnu.org/licenses/>.
 #
+import inspect
 import logging
+import os
+import tempfile
 from datetime import timedelta
 from typing import Any, Dict, Union
 
 from celery.exceptions import MaxRetriesExceededError
 from django.conf import settings
-from django.core.files.base import ContentFile
+from django.core.files.base import ContentFile, File
 from django.db import close_old_connections, connection, transaction
 from django.dispatch import receiver
 from django.utils.timezone import now, override
@@ -63,6 +66,32 @@ class ExportEmptyError(ExportError):
     pass
 
 
+def _render_to_cached_file(exporter, form_data, file):
+    """
+    Renders the export and stores the result in ``file``. If the exporter supports writing to a file handle, the
+    export is written to a temporary file and streamed to the storage backend from there instead of being held in
+    memory as a whole.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'export')
+        with open(path, 'wb') as tmp:
+            if 'output_file' in inspect.signature(exporter.render).parameters:
+                d = exporter.render(form_data, output_file=tmp)
+            else:
+                d = exporter.render(form_data)
+        if d is None:
+            raise ExportError(
+                gettext('Your export did not contain any data.')
+            )
+        file.filename, file.type, data = d
+
+        close_old_connections()  # This task can run very long, we might need a new DB connection
+
+        with open(path, 'rb') as tmp:
+            f = File(tmp) if data is None else ContentFile(data)
+            file.file.save(cachedfile_name(file, file.filename), f)
+
+
 @app.task(base=ProfiledEventTask, throws=(ExportError, ExportEmptyError), bind=True)
 def export(self, event: Event, fileid: str, provider: str, form_data: Dict[str, Any]) -> None:
     def set_progress(val):
@@ -80,17 +109,7 @@ def export(self, event: Event, fileid: str, provider: str, form_data: Dict[str,
                 continue
             ex = response(event, event.organizer, set_progress)
             if ex.identifier == provider:
-                d = ex.render(form_data)
-                if d is None:
-                    raise ExportError(
-                        gettext('Your export did not contain any data.')
-                    )
-                file.filename, file.type, data = d
-
-                close_old_connections()  # This task can run very long, we might need a new DB connection
-
-                f = ContentFile(data)
-                file.file.save(cachedfile_name(file, file.filename), f)
+                _render_to_cached_file(ex, form_data, file)
     return str(file.pk)
 
 
@@ -151,17 +170,7 @@ def multiexport(self, organizer: Organizer, user: User, device: int, token: int,
                         gettext('You do not have sufficient permission to perform this export.')
                     )
 
-                d = ex.render(form_data)
-                if d is None:
-                    raise ExportError(
-                        gettext('Your export did not contain any data.')
-                    )
-                file.filename, file.type, data = d
-
-                close_old_connections()  # This task can run very long, we might need a new DB connection
-
-                f = ContentFile(data)
-                file.file.save(cachedfile_name(file, file.filename), f)
+                _render_to_cached_file(ex, form_data, file)
     return str(file.pk)
 
 
@@ -21,12 +21,17 @@
 #
 
 import logging
+import time
 from itertools import groupby
 
 from django.conf import settings
-from django.db import DatabaseError, connection
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
 from django.utils.timezone import now
 
+from pretix.base.metrics import (
+    pretix_lock_timeouts_total, pretix_lock_wait_seconds,
+)
 from pretix.base.models import Event, Membership, Quota, Seat, Voucher
 from pretix.testutils.middleware import debugflags_var
 
@@ -51,6 +56,16 @@ KEY_SPACES = {
     Membership: 5
 }
 
+# The number of exclusive locks above which we fall back to an exclusive event-level lock is raised for events that
+# currently see a lot of lock contention, up to LOCK_GRANULARITY_THRESHOLD_MAX. An exclusive event-level lock blocks
+# every other checkout of the event, which is cheap in a quiet shop but serializes all sales during a busy on-sale.
+# Contention is tracked as an exponentially weighted moving average of the lock wait time per event, and the threshold
+# reaches its maximum once that average reaches LOCK_CONTENTION_HIGH seconds.
+LOCK_GRANULARITY_THRESHOLD_MAX = 200
+LOCK_CONTENTION_HIGH = 0.5
+LOCK_CONTENTION_WEIGHT = 0.2
+LOCK_CONTENTION_TTL = 600
+
 
 def pg_lock_key(obj):
     """
@@ -72,6 +87,48 @@ class LockTimeoutException(Exception):
     pass
 
 
+def _contention_key(event_id):
+    return f'pretix_lock_contention:{event_id}'
+
+
+def get_lock_contention(events):
+    """
+    Returns the moving average of the lock wait time in seconds for each of the given events.
+    """
+    if not events:
+        return {}
+    values = cache.get_many([_contention_key(e.pk) for e in events])
+    return {e.pk: values.get(_contention_key(e.pk), 0.0) for e in events}
+
+
+def record_lock_contention(contention, wait):
+    """
+    Feeds a new lock wait time into the moving averages returned by ``get_lock_contention``.
+    """
+    if not contention:
+        return
+    cache.set_many({
+        _contention_key(event_id): (1 - LOCK_CONTENTION_WEIGHT) * average + LOCK_CONTENTION_WEIGHT * wait
+        for event_id, average in contention.items()
+    }, LOCK_CONTENTION_TTL)
+
+
+def adapt_lock_threshold(threshold, contention):
+    """
+    Raises the number of exclusive locks we are willing to take before falling back to an event-level lock,
+    depending on the lock contention observed for the affected events.
+    """
+    if not threshold or not contention:
+        return threshold
+    factor = min(1.0, max(contention.values()) / LOCK_CONTENTION_HIGH)
+    return int(threshold + max(0, LOCK_GRANULARITY_THRESHOLD_MAX - threshold) * factor)
+
+
+def _record_lock_wait(keyspaces, granularity, wait):
+    for keyspace in keyspaces:
+        pretix_lock_wait_seconds.observe(wait, keyspace=keyspace, granularity=granularity)
+
+
 def lock_objects(objects, *, shared_lock_objects=None, replace_exclusive_with_shared_when_exclusive_are_more_than=20):
     """
     Create an exclusive lock on the objects passed in `objects`. This function MUST be called within an atomic
@@ -85,6 +142,10 @@ def lock_objects(objects, *, shared_lock_objects=None, replace_exclusive_with_sh
     The idea behind it is this: Usually we create a lock on every quota, voucher, or seat contained in an order.
     However, this has a large performance penalty in case we have hundreds of locks required. Therefore, we always
     place a shared lock in the event, and if we have too many affected objects, we fall back to event-level locks.
+    While an event sees a lot of lock contention, the threshold is raised (see ``adapt_lock_threshold``) since an
+    event-level lock would block all other sales of the event.
+
+    The time spent waiting for the locks as well as timeouts are recorded as metrics per key space and granularity.
     """
     if (not objects and not shared_lock_objects) or 'skip-locking' in debugflags_var.get():
         return
@@ -100,14 +161,23 @@ def lock_objects(objects, *, shared_lock_objects=None, replace_exclusive_with_sh
     if 'postgresql' in settings.DATABASES['default']['ENGINE']:
         shared_keys = set(pg_lock_key(obj) for obj in shared_lock_objects) if shared_lock_objects else set()
         exclusive_keys = set(pg_lock_key(obj) for obj in objects)
-        if replace_exclusive_with_shared_when_exclusive_are_more_than and shared_keys and \
-                len(exclusive_keys) > replace_exclusive_with_shared_when_exclusive_are_more_than:
+        contention = get_lock_contention(
+            {o for o in list(objects) + list(shared_lock_objects or []) if isinstance(o, Event)}
+        )
+        threshold = adapt_lock_threshold(replace_exclusive_with_shared_when_exclusive_are_more_than, contention)
+        granularity = 'object'
+        exclusive_objects = objects
+        if threshold and shared_keys and len(exclusive_keys) > threshold:
             exclusive_keys = shared_keys
+            exclusive_objects = shared_lock_objects
+            granularity = 'event'
+        keyspaces = sorted({type(o).__name__ for o in exclusive_objects} or {'Event'})
         keys = sorted(list(shared_keys | exclusive_keys))
         calls = ", ".join([
             (f"pg_advisory_xact_lock({k})" if k in exclusive_keys else f"pg_advisory_xact_lock_shared({k})") for k in keys
         ])
 
+        t0 = time.monotonic()
         try:
             with connection.cursor() as cursor:
                 cursor.execute(f"SET LOCAL lock_timeout = '{LOCK_ACQUISITION_TIMEOUT}s';")
@@ -115,8 +185,16 @@ def lock_objects(objects, *, shared_lock_objects=None, replace_exclusive_with_sh
                 cursor.execute("SET LOCAL lock_timeout = '0';")  # back to default
         except DatabaseError as e:
             logger.warning(f"Waiting for locks timed out: {e} on SELECT {calls};")
+            for keyspace in keyspaces:
+                pretix_lock_timeouts_total.inc(keyspace=keyspace, granularity=granularity)
+            record_lock_contention(contention, LOCK_ACQUISITION_TIMEOUT)
             raise LockTimeoutException()
 
+        # Reporting is deferred until the locks are released to not extend the time we hold them
+        wait = time.monotonic() - t0
+        transaction.on_commit(lambda: _record_lock_wait(keyspaces, granularity, wait))
+        transaction.on_commit(lambda: record_lock_contention(contention, wait))
+
     else:
         for model, instances in groupby(objects, key=lambda o: type(o)):
             model.objects.select_for_update().filter(pk__in=[o.pk for o in instances])
@@ -24,19 +24,23 @@ from typing import List
 
 from django.conf import settings as django_settings
 from django.core.exceptions import ValidationError
-from django.db import transaction
+from django.db import connection, models, transaction
 from django.utils.timezone import now
 from django.utils.translation import gettext as _
 
 from pretix.base.i18n import language
-from pretix.base.modelimport import DataImportError, ImportColumn, parse_csv
+from pretix.base.modelimport import (
+    DataImportError, ImportColumn, parse_csv_stream,
+)
 from pretix.base.modelimport_orders import get_order_import_columns
 from pretix.base.modelimport_vouchers import get_voucher_import_columns
 from pretix.base.models import (
-    CachedFile, Event, InvoiceAddress, Order, OrderPayment, OrderPosition,
-    User, Voucher,
+    CachedFile, Event, ImportProgress, InvoiceAddress, LogEntry, Order,
+    OrderPayment, OrderPosition, User, Voucher,
 )
 from pretix.base.models.orders import Transaction
+from pretix.base.secrets import assign_ticket_secret
+from pretix.base.services import checkinlookup, seatoccupancy
 from pretix.base.services.invoices import generate_invoice, invoice_qualified
 from pretix.base.services.locking import lock_objects
 from pretix.base.services.tasks import ProfiledEventTask
@@ -44,9 +48,33 @@ from pretix.base.signals import order_paid, order_placed
 from pretix.celery_app import app
 
 
-def _validate(cf: CachedFile, charset: str, cols: List[ImportColumn], settings: dict):
+def _iter_validated(cf: CachedFile, charset: str, cols: List[ImportColumn], settings: dict, skip: int = 0):
     try:
-        parsed = parse_csv(cf.file, charset=charset)
+        parsed = parse_csv_stream(cf.file, charset=charset)
+        if parsed is None:
+            return
+        for i, record in enumerate(parsed):
+            if not any(record.values()):
+                continue
+            if skip:
+                # Already imported by an earlier, interrupted run
+                skip -= 1
+                continue
+            values = {}
+            for c in cols:
+                val = c.resolve(settings, record)
+                if isinstance(val, str):
+                    val = val.strip()
+                try:
+                    values[c.identifier] = c.clean(val, values)
+                except ValidationError as e:
+                    raise DataImportError(
+                        _(
+                            'Error while importing value "{value}" for column "{column}" in line "{line}": {message}').format(
+                            value=val if val is not None else '', column=c.verbose_name, line=i + 1, message=e.message
+                        )
+                    )
+            yield values
     except UnicodeDecodeError as e:
         raise DataImportError(
             _(
@@ -54,60 +82,224 @@ def _validate(cf: CachedFile, charset: str, cols: List[ImportColumn], settings:
                 message=str(e)
             )
         )
-    data = []
-    for i, record in enumerate(parsed):
-        if not any(record.values()):
-            continue
-        values = {}
-        for c in cols:
-            val = c.resolve(settings, record)
-            if isinstance(val, str):
-                val = val.strip()
-            try:
-                values[c.identifier] = c.clean(val, values)
-            except ValidationError as e:
-                raise DataImportError(
-                    _(
-                        'Error while importing value "{value}" for column "{column}" in line "{line}": {message}').format(
-                        value=val if val is not None else '', column=c.verbose_name, line=i + 1, message=e.message
-                    )
-                )
-        data.append(values)
-    return data
 
 
-@app.task(base=ProfiledEventTask, throws=(DataImportError,))
-def import_orders(event: Event, fileid: str, settings: dict, locale: str, user, charset=None) -> None:
+def _validate(cf: CachedFile, charset: str, cols: List[ImportColumn], settings: dict):
+    return list(_iter_validated(cf, charset, cols, settings))
+
+
+def _bulk_insert(model, objects):
+    if connection.features.can_return_rows_from_bulk_insert:
+        model.objects.bulk_create(objects)
+    else:
+        for o in objects:
+            # We prepared the objects ourselves, so we deliberately skip the custom save() logic of the model
+            models.Model.save(o)
+
+
+def _prepare_orders(event: Event, orders: List[Order]):
+    # This replicates what Order.save(), OrderPosition.save() and InvoiceAddress.save() would do, since we skip them
+    # for bulk insertion.
+    codes = set()
+    for o in orders:
+        o.organizer_id = event.organizer_id
+        if not o.datetime:
+            o.datetime = now()
+        if not o.expires:
+            o.set_expires()
+        while not o.code or o.code in codes:
+            o.assign_code()
+        codes.add(o.code)
+
+        for p in o._positions:
+            p.order = o
+            p.organizer_id = event.organizer_id
+            if p.tax_rate is None:
+                p._calculate_tax()
+            if p.attendee_name_parts is None:
+                p.attendee_name_parts = {}
+            p.attendee_name_cached = p.attendee_name
+            if not p.blocked:
+                p.blocked = None
+            if not p.secret:
+                assign_ticket_secret(event=event, position=p, force_invalidate=True, save=False)
+
+        a = o._address
+        a.order = o
+        if a.name_parts:
+            a.name_cached = a.name
+        else:
+            a.name_cached = ""
+            a.name_parts = {}
+
+    positions = [p for o in orders for p in o._positions]
+    taken = set(OrderPosition.all.filter(
+        order__event__organizer_id=event.organizer_id, secret__in=[p.secret for p in positions]
+    ).values_list('secret', flat=True))
+    seen = set()
+    for p in positions:
+        while p.secret in taken or p.secret in seen:
+            assign_ticket_secret(event=event, position=p, force_invalidate=True, save=False)
+            if OrderPosition.all.filter(order__event__organizer_id=event.organizer_id, secret=p.secret).exists():
+                taken.add(p.secret)
+        seen.add(p.secret)
+
+
+def _save_orders(event: Event, orders: List[Order], cols: List[ImportColumn], settings: dict, user: User,
+                 progress: ImportProgress, rows: int):
+    with transaction.atomic():
+        # We don't support vouchers, quotas, or memberships here, so we only need to lock if seats are in use
+        lock_seats = [(o.sales_channel, p.seat) for o in orders for p in o._positions if p.seat is not None]
+        if lock_seats:
+            lock_objects([s for c, s in lock_seats], shared_lock_objects=[event])
+            for c, s in lock_seats:
+                if not s.is_available(sales_channel=c):
+                    raise DataImportError(_('The seat you selected has already been taken. Please select a different seat.'))
+
+        payments = []
+        for o in orders:
+            o.total = sum([c.price for c in o._positions])  # currently no support for fees
+            if o.total == Decimal('0.00'):
+                o.status = Order.STATUS_PAID
+                payments.append(OrderPayment(
+                    local_id=1,
+                    order=o,
+                    amount=Decimal('0.00'),
+                    provider='free',
+                    info='{}',
+                    payment_date=now(),
+                    state=OrderPayment.PAYMENT_STATE_CONFIRMED
+                ))
+            elif settings['status'] == 'paid':
+                o.status = Order.STATUS_PAID
+                payments.append(OrderPayment(
+                    local_id=1,
+                    order=o,
+                    amount=o.total,
+                    provider='manual',
+                    info='{}',
+                    payment_date=now(),
+                    state=OrderPayment.PAYMENT_STATE_CONFIRMED
+                ))
+            else:
+                o.status = Order.STATUS_PENDING
+
+        _prepare_orders(event, orders)
+        _bulk_insert(Order, orders)
+        _bulk_insert(OrderPosition, [p for o in orders for p in o._positions])
+        _bulk_insert(InvoiceAddress, [o._address for o in orders])
+        _bulk_insert(OrderPayment, payments)
+        checkinlookup.invalidate(
+            event.organizer_id, [b for o in orders for p in o._positions for b in (p.secret, p.pk)]
+        )
+        for subevent_id in {p.subevent_id for o in orders for p in o._positions if p.seat_id is not None}:
+            seatoccupancy.invalidate(event.pk, subevent_id)
+
+        save_transactions = []
+        log_entries = []
+        for o in orders:
+            for c in cols:
+                c.save(o)
+            log_entries.append(o.log_action(
+                'pretix.event.order.placed',
+                user=user,
+                data={'source': 'import'},
+                save=False
+            ))
+            t = o.create_transactions(is_new=True, fees=[], positions=o._positions, save=False)
+            o._track_quota_counter_transactions(t)
+            o._track_checkin_counter_transactions(t, is_new=True)
+            save_transactions += t
+        Transaction.objects.bulk_create(save_transactions)
+        LogEntry.bulk_create_and_postprocess(log_entries)
+
+        progress.rows += rows
+        progress.save(update_fields=['rows'])
+
+
+@app.task(base=ProfiledEventTask, acks_late=True)
+def process_imported_orders(event: Event, orders: List[int]) -> None:
+    for o in event.orders.filter(pk__in=orders).order_by('pk'):
+        with language(o.locale, event.settings.region):
+            order_placed.send(event, order=o)
+            if o.status == Order.STATUS_PAID:
+                order_paid.send(event, order=o)
+
+            gen_invoice = invoice_qualified(o) and (
+                (event.settings.get('invoice_generate') == 'True') or
+                (event.settings.get('invoice_generate') == 'paid' and o.status == Order.STATUS_PAID)
+            ) and not o.invoices.last()
+            if gen_invoice:
+                generate_invoice(o, trigger_pdf=True)
+
+
+@app.task(base=ProfiledEventTask, throws=(DataImportError,), bind=True)
+def import_orders(self, event: Event, fileid: str, settings: dict, locale: str, user, charset=None) -> None:
+    def set_progress(val):
+        if not self.request.called_directly:
+            self.update_state(
+                state='PROGRESS',
+                meta={'value': val}
+            )
+
     cf = CachedFile.objects.get(id=fileid)
     user = User.objects.get(pk=user)
     with language(locale, event.settings.region):
-        cols = get_order_import_columns(event)
-        data = _validate(cf, charset, cols, settings)
+        # If an earlier run of this import failed half-way, the chunks it committed are skipped.
+        progress, __ = ImportProgress.objects.get_or_create(file=cf)
+        skip = progress.rows
 
-        if settings['orders'] == 'one' and len(data) > django_settings.PRETIX_MAX_ORDER_SIZE:
+        # The file is read twice instead of being kept in memory: First, we validate all rows, so we do not import
+        # half of a file that later turns out to be broken.
+        row_count = skip + sum(1 for __ in _iter_validated(cf, charset, get_order_import_columns(event), settings, skip))
+
+        if settings['orders'] == 'one' and row_count > django_settings.PRETIX_MAX_ORDER_SIZE:
             raise DataImportError(
                 _('Orders cannot have more than %(max)s positions.') % {'max': django_settings.PRETIX_MAX_ORDER_SIZE}
             )
 
+        # Then, we build the model objects again and persist them in chunks, each in its own database transaction, to
+        # keep both memory usage and the time we hold locks bounded. Every chunk records its rows as imported in the
+        # same transaction, so a failed import can be started again with the same file. Column objects keep state
+        # during validation, so we need fresh ones for the second pass.
+        cols = get_order_import_columns(event)
         orders = []
         order = None
+        rows_done = skip
+        chunk_rows = 0
 
-        # Prepare model objects. Yes, this might consume lots of RAM, but allows us to make the actual SQL transaction
-        # shorter. We'll see what works better in reality…
-        lock_seats = []
-        for i, record in enumerate(data):
+        def flush():
             try:
-                if order is None or settings['orders'] == 'many':
-                    order = Order(
-                        event=event,
-                        testmode=settings['testmode'],
+                _save_orders(event, orders, cols, settings, user, progress, chunk_rows)
+            except DataImportError as e:
+                if not progress.rows:
+                    raise
+                raise DataImportError(
+                    _('{message} The first {done} of {total} rows of your file have already been imported. If you '
+                      'start the import of the same file again, they will be skipped.').format(
+                        message=str(e), done=progress.rows, total=row_count
                     )
-                    order.meta_info = {}
-                    order._positions = []
-                    order._address = InvoiceAddress()
-                    order._address.name_parts = {'_scheme': event.settings.name_scheme}
-                    orders.append(order)
+                )
+            process_imported_orders.apply_async(kwargs={'event': event.pk, 'orders': [o.pk for o in orders]})
+            orders.clear()
+            set_progress(rows_done / row_count * 100)
+
+        for i, record in enumerate(_iter_validated(cf, charset, cols, settings, skip), start=skip):
+            if order is None or settings['orders'] == 'many':
+                if chunk_rows >= django_settings.PRETIX_IMPORT_CHUNK_SIZE:
+                    flush()
+                    chunk_rows = 0
+                order = Order(
+                    event=event,
+                    testmode=settings['testmode'],
+                )
+                order.meta_info = {}
+                order._positions = []
+                order._address = InvoiceAddress()
+                order._address.name_parts = {'_scheme': event.settings.name_scheme}
+                orders.append(order)
 
+            try:
                 position = OrderPosition(positionid=len(order._positions) + 1)
                 position.attendee_name_parts = {'_scheme': event.settings.name_scheme}
                 position.meta_info = {}
@@ -116,83 +308,15 @@ def import_orders(event: Event, fileid: str, settings: dict, locale: str, user,
 
                 for c in cols:
                     c.assign(record.get(c.identifier), order, position, order._address)
-
-                if position.seat is not None:
-                    lock_seats.append((order.sales_channel, position.seat))
             except (ValidationError, ImportError) as e:
                 raise DataImportError(
                     _('Invalid data in row {row}: {message}').format(row=i, message=str(e))
                 )
+            rows_done += 1
+            chunk_rows += 1
 
-        try:
-            with transaction.atomic():
-                # We don't support vouchers, quotas, or memberships here, so we only need to lock if seats are in use
-                if lock_seats:
-                    lock_objects([s for c, s in lock_seats], shared_lock_objects=[event])
-                    for c, s in lock_seats:
-                        if not s.is_available(sales_channel=c):
-                            raise DataImportError(_('The seat you selected has already been taken. Please select a different seat.'))
-
-                save_transactions = []
-                for o in orders:
-                    o.total = sum([c.price for c in o._positions])  # currently no support for fees
-                    if o.total == Decimal('0.00'):
-                        o.status = Order.STATUS_PAID
-                        o.save()
-                        OrderPayment.objects.create(
-                            local_id=1,
-                            order=o,
-                            amount=Decimal('0.00'),
-                            provider='free',
-                            info='{}',
-                            payment_date=now(),
-                            state=OrderPayment.PAYMENT_STATE_CONFIRMED
-                        )
-                    elif settings['status'] == 'paid':
-                        o.status = Order.STATUS_PAID
-                        o.save()
-                        OrderPayment.objects.create(
-                            local_id=1,
-                            order=o,
-                            amount=o.total,
-                            provider='manual',
-                            info='{}',
-                            payment_date=now(),
-                            state=OrderPayment.PAYMENT_STATE_CONFIRMED
-                        )
-                    else:
-                        o.status = Order.STATUS_PENDING
-                        o.save()
-                    for p in o._positions:
-                        p.order = o
-                        p.save()
-                    o._address.order = o
-                    o._address.save()
-                    for c in cols:
-                        c.save(o)
-                    o.log_action(
-                        'pretix.event.order.placed',
-                        user=user,
-                        data={'source': 'import'}
-                    )
-                    save_transactions += o.create_transactions(is_new=True, fees=[], positions=o._positions, save=False)
-                Transaction.objects.bulk_create(save_transactions)
-
-            for o in orders:
-                with language(o.locale, event.settings.region):
-                    order_placed.send(event, order=o)
-                    if o.status == Order.STATUS_PAID:
-                        order_paid.send(event, order=o)
-
-                    gen_invoice = invoice_qualified(o) and (
-                        (event.settings.get('invoice_generate') == 'True') or
-                        (event.settings.get('invoice_generate') == 'paid' and o.status == Order.STATUS_PAID)
-                    ) and not o.invoices.last()
-                    if gen_invoice:
-                        generate_invoice(o, trigger_pdf=True)
-        except DataImportError:
-            raise ValidationError(_('We were not able to process your request completely as the server was too busy. '
-                                    'Please try again.'))
+        if orders:
+            flush()
     cf.delete()
 
 
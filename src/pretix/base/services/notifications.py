@@ -19,14 +19,20 @@
 # You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
 # <https://www.gnu.org/licenses/>.
 #
+from collections import defaultdict
+
 import css_inline
 from django.conf import settings
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
 from django.template.loader import get_template
 from django.utils.timezone import override
+from django.utils.translation import ngettext
 from django_scopes import scope, scopes_disabled
 
+from pretix.base.cache import NamespacedCache
 from pretix.base.i18n import language
-from pretix.base.models import LogEntry, NotificationSetting, User
+from pretix.base.models import LogEntry, NotificationSetting, Team, User
 from pretix.base.notifications import Notification, get_all_notification_types
 from pretix.base.services.mail import mail_send_task
 from pretix.base.services.tasks import ProfiledTask, TransactionAwareTask
@@ -34,6 +40,77 @@ from pretix.base.signals import notification
 from pretix.celery_app import app
 from pretix.helpers.urls import build_absolute_uri
 
+RECIPIENTS_CACHE_TIMEOUT = 3600
+
+
+def _recipients_cache():
+    return NamespacedCache('pretix_notification_recipients')
+
+
+def get_notification_recipients(event, notification_type) -> dict:
+    """
+    Returns a dictionary mapping the IDs of all users that should be notified of ``notification_type`` on ``event``
+    to the list of methods they want to be notified with, based on their team permissions and notification settings.
+
+    The result is cached until team memberships or notification settings change. Whether users are active and have
+    notifications turned on is not part of the result and needs to be checked separately.
+    """
+    cache = _recipients_cache()
+    key = '{}:{}'.format(event.pk, notification_type.action_type)
+    recipients = cache.get(key)
+    if recipients is not None:
+        return recipients
+
+    users = event.get_users_with_permission(notification_type.required_permission)
+    # Get all notification settings, both specific to this event as well as global
+    notify_specific = {
+        (user_id, method): enabled
+        for user_id, method, enabled in NotificationSetting.objects.filter(
+            event=event,
+            action_type=notification_type.action_type,
+            user__pk__in=users.values_list('pk', flat=True)
+        ).values_list('user_id', 'method', 'enabled')
+    }
+    notify_global = {
+        (user_id, method): enabled
+        for user_id, method, enabled in NotificationSetting.objects.filter(
+            event__isnull=True,
+            action_type=notification_type.action_type,
+            user__pk__in=users.values_list('pk', flat=True)
+        ).values_list('user_id', 'method', 'enabled')
+    }
+
+    recipients = defaultdict(list)
+    for (user_id, method), enabled in notify_specific.items():
+        if enabled:
+            recipients[user_id].append(method)
+    for (user_id, method), enabled in notify_global.items():
+        if enabled and (user_id, method) not in notify_specific:
+            recipients[user_id].append(method)
+
+    recipients = dict(recipients)
+    cache.set(key, recipients, timeout=RECIPIENTS_CACHE_TIMEOUT)
+    return recipients
+
+
+def invalidate_notification_recipients():
+    _recipients_cache().clear()
+
+
+@receiver(post_save, sender=NotificationSetting, dispatch_uid='notification_recipients_setting_saved')
+@receiver(post_delete, sender=NotificationSetting, dispatch_uid='notification_recipients_setting_deleted')
+@receiver(post_save, sender=Team, dispatch_uid='notification_recipients_team_saved')
+@receiver(post_delete, sender=Team, dispatch_uid='notification_recipients_team_deleted')
+def invalidate_notification_recipients_on_change(sender, **kwargs):
+    invalidate_notification_recipients()
+
+
+@receiver(m2m_changed, sender=Team.members.through, dispatch_uid='notification_recipients_team_members')
+@receiver(m2m_changed, sender=Team.limit_events.through, dispatch_uid='notification_recipients_team_events')
+def invalidate_notification_recipients_on_team_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_notification_recipients()
+
 
 @app.task(base=TransactionAwareTask, acks_late=True, max_retries=9, default_retry_delay=900)
 @scopes_disabled()
@@ -41,9 +118,11 @@ def notify(logentry_ids: list):
     if not isinstance(logentry_ids, list):
         logentry_ids = [logentry_ids]
 
-    qs = LogEntry.all.select_related('event', 'event__organizer').filter(id__in=logentry_ids)
+    qs = LogEntry.all.select_related('event', 'event__organizer').filter(id__in=logentry_ids).order_by('id')
 
-    _event, _at, notify_specific, notify_global = None, None, None, None
+    # Collect everything we need to send to the same user with the same method, so we need only one task for it
+    pending = defaultdict(list)
+    recipients = {}
     for logentry in qs:
         if not logentry.event:
             break  # Ignore, we only have event-related notifications right now
@@ -53,74 +132,76 @@ def notify(logentry_ids: list):
         if not notification_type:
             break  # No suitable plugin
 
-        if _event != logentry.event or _at != logentry.action_type or notify_global is None:
-            _event = logentry.event
-            _at = logentry.action_type
-            # All users that have the permission to get the notification
-            users = logentry.event.get_users_with_permission(
-                notification_type.required_permission
-            ).filter(notifications_send=True, is_active=True)
-            if logentry.user:
-                users = users.exclude(pk=logentry.user.pk)
-
-            # Get all notification settings, both specific to this event as well as global
-            notify_specific = {
-                (ns.user, ns.method): ns.enabled
-                for ns in NotificationSetting.objects.filter(
-                    event=logentry.event,
-                    action_type=notification_type.action_type,
-                    user__pk__in=users.values_list('pk', flat=True)
-                )
-            }
-            notify_global = {
-                (ns.user, ns.method): ns.enabled
-                for ns in NotificationSetting.objects.filter(
-                    event__isnull=True,
-                    action_type=notification_type.action_type,
-                    user__pk__in=users.values_list('pk', flat=True)
-                )
-            }
-
-        for um, enabled in notify_specific.items():
-            user, method = um
-            if enabled:
-                send_notification.apply_async(args=(logentry.id, notification_type.action_type, user.pk, method))
+        key = (logentry.event_id, notification_type.action_type)
+        if key not in recipients:
+            recipients[key] = get_notification_recipients(logentry.event, notification_type)
 
-        for um, enabled in notify_global.items():
-            user, method = um
-            if enabled and um not in notify_specific:
-                send_notification.apply_async(args=(logentry.id, notification_type.action_type, user.pk, method))
+        for user_id, methods in recipients[key].items():
+            if user_id == logentry.user_id:
+                continue
+            for method in methods:
+                pending[user_id, method].append((logentry.id, notification_type.action_type))
 
         notification.send(logentry.event, logentry_id=logentry.id, notification_type=notification_type.action_type)
 
+    if pending:
+        active_users = set(User.objects.filter(
+            pk__in={user_id for user_id, method in pending.keys()},
+            notifications_send=True,
+            is_active=True,
+        ).values_list('pk', flat=True))
+        for (user_id, method), items in pending.items():
+            if user_id in active_users:
+                send_notifications.apply_async(args=(user_id, method, items))
+
 
 @app.task(base=ProfiledTask, acks_late=True, max_retries=9, default_retry_delay=900)
 def send_notification(logentry_id: int, action_type: str, user_id: int, method: str):
-    logentry = LogEntry.all.get(id=logentry_id)
-    if logentry.event:
-        sm = lambda: scope(organizer=logentry.event.organizer)  # noqa
-    else:
-        sm = lambda: scopes_disabled()  # noqa
-    with sm():
-        user = User.objects.get(id=user_id)
-        types = get_all_notification_types(logentry.event)
-        notification_type = types.get(action_type)
-        if not notification_type:
-            return  # Ignore, e.g. plugin not active for this event
+    send_notifications(user_id, method, [(logentry_id, action_type)])
 
-        with language(user.locale), override(logentry.event.timezone if logentry.event else user.timezone):
-            notification = notification_type.build_notification(logentry)
 
-            if method == "mail":
-                send_notification_mail(notification, user)
+@app.task(base=ProfiledTask, acks_late=True, max_retries=9, default_retry_delay=900)
+def send_notifications(user_id: int, method: str, notifications: list):
+    """
+    Sends a list of ``(logentry_id, action_type)`` notifications to a user. All notifications concerning the same
+    event are combined into a single message.
+    """
+    logentries = LogEntry.all.select_related('event', 'event__organizer').in_bulk(
+        [logentry_id for logentry_id, action_type in notifications]
+    )
+    by_event = defaultdict(list)
+    for logentry_id, action_type in notifications:
+        if logentry_id in logentries:
+            by_event[logentries[logentry_id].event_id].append((logentries[logentry_id], action_type))
 
+    with scopes_disabled():
+        user = User.objects.get(id=user_id)
 
-def send_notification_mail(notification: Notification, user: User):
-    ctx = {
+    for event_id, items in by_event.items():
+        event = items[0][0].event
+        if event:
+            sm = lambda: scope(organizer=event.organizer)  # noqa
+        else:
+            sm = lambda: scopes_disabled()  # noqa
+        with sm():
+            types = get_all_notification_types(event)
+            with language(user.locale), override(event.timezone if event else user.timezone):
+                built = [
+                    types[action_type].build_notification(logentry)
+                    for logentry, action_type in items
+                    if action_type in types  # Ignore others, e.g. plugin not active for this event
+                ]
+                if method == "mail" and len(built) == 1:
+                    send_notification_mail(built[0], user)
+                elif method == "mail" and built:
+                    send_notification_digest_mail(built, user)
+
+
+def _mail_context(user: User):
+    return {
         'site': settings.PRETIX_INSTANCE_NAME,
         'site_url': settings.SITE_URL,
         'color': settings.PRETIX_PRIMARY_COLOR,
-        'notification': notification,
         'settings_url': build_absolute_uri(
             'control:user.settings.notifications',
         ),
@@ -133,21 +214,23 @@ def send_notification_mail(notification: Notification, user: User):
         )
     }
 
-    tpl_html = get_template('pretixbase/email/notification.html')
+
+def _send_mail(user: User, event, title: str, template: str, ctx: dict):
+    tpl_html = get_template('pretixbase/email/{}.html'.format(template))
 
     body_html = tpl_html.render(ctx)
     inliner = css_inline.CSSInliner(keep_style_tags=False)
     body_html = inliner.inline(body_html)
 
-    tpl_plain = get_template('pretixbase/email/notification.txt')
+    tpl_plain = get_template('pretixbase/email/{}.txt'.format(template))
     body_plain = tpl_plain.render(ctx)
 
     mail_send_task.apply_async(kwargs={
         'to': [user.email],
         'subject': '[{}] {}: {}'.format(
             settings.PRETIX_INSTANCE_NAME,
-            notification.event.settings.mail_prefix or notification.event.slug.upper(),
-            notification.title
+            event.settings.mail_prefix or event.slug.upper(),
+            title
         ),
         'body': body_plain,
         'html': body_html,
@@ -155,3 +238,20 @@ def send_notification_mail(notification: Notification, user: User):
         'headers': {},
         'user': user.pk
     })
+
+
+def send_notification_mail(notification: Notification, user: User):
+    ctx = _mail_context(user)
+    ctx['notification'] = notification
+    _send_mail(user, notification.event, notification.title, 'notification', ctx)
+
+
+def send_notification_digest_mail(notifications: list, user: User):
+    ctx = _mail_context(user)
+    ctx['notifications'] = notifications
+    title = ngettext(
+        '{count} new notification',
+        '{count} new notifications',
+        len(notifications)
+    ).format(count=len(notifications))
+    _send_mail(user, notifications[0].event, title, 'notification_digest', ctx)
@@ -46,12 +46,11 @@ from typing import List, Optional
 
 from celery.exceptions import MaxRetriesExceededError
 from django.conf import settings
-from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.db import transaction
 from django.db.models import (
-    Count, Exists, F, IntegerField, Max, Min, OuterRef, Q, QuerySet, Sum,
-    Value,
+    Count, Exists, F, IntegerField, Max, Min, OuterRef, Q, QuerySet, Subquery,
+    Sum, Value,
 )
 from django.db.models.functions import Coalesce, Greatest
 from django.db.transaction import get_connection
@@ -66,9 +65,9 @@ from pretix.base.email import get_email_context
 from pretix.base.i18n import get_language_without_region, language
 from pretix.base.media import MEDIA_TYPES
 from pretix.base.models import (
-    CartPosition, Device, Event, GiftCard, Item, ItemVariation, Membership,
-    Order, OrderPayment, OrderPosition, Quota, Seat, SeatCategoryMapping, User,
-    Voucher,
+    CartPosition, Device, Event, GiftCard, Item, ItemVariation, LogEntry,
+    Membership, Order, OrderPayment, OrderPosition, Quota, Seat,
+    SeatCategoryMapping, User, Voucher,
 )
 from pretix.base.models.event import SubEvent
 from pretix.base.models.orders import (
@@ -94,7 +93,9 @@ from pretix.base.services.memberships import (
 from pretix.base.services.pricing import (
     apply_discounts, get_listed_price, get_price,
 )
-from pretix.base.services.quotas import QuotaAvailability
+from pretix.base.services.quotas import (
+    QuotaAvailability, invalidate_availability_cache,
+)
 from pretix.base.services.tasks import ProfiledEventTask, ProfiledTask
 from pretix.base.signals import (
     order_approved, order_canceled, order_changed, order_denied, order_expired,
@@ -205,6 +206,9 @@ error_messages = {
 
 logger = logging.getLogger(__name__)
 
+# Number of orders expired in one database transaction by the periodic task
+EXPIRE_ORDERS_CHUNK_SIZE = 50
+
 
 def mark_order_paid(*args, **kwargs):
     raise NotImplementedError("This method is no longer supported since pretix 1.17.")
@@ -343,19 +347,26 @@ def mark_order_expired(order, user=None, auth=None):
             order = Order.objects.get(pk=order)
         if isinstance(user, int):
             user = User.objects.get(pk=user)
-        order.status = Order.STATUS_EXPIRED
-        order.save(update_fields=['status'])
-
-        order.log_action('pretix.event.order.expired', user=user, auth=auth)
-        i = order.invoices.filter(is_cancellation=False).last()
-        if i and not i.refered.exists():
-            generate_cancellation(i)
-        order.create_transactions()
+        _mark_order_expired(order, user=user, auth=auth)
 
     order_expired.send(order.event, order=order)
     return order
 
 
+def _mark_order_expired(order, user=None, auth=None, log_entries=None):
+    # If a list is passed as log_entries, the log entry is appended to it instead of being saved
+    order.status = Order.STATUS_EXPIRED
+    order.save(update_fields=['status'])
+
+    le = order.log_action('pretix.event.order.expired', user=user, auth=auth, save=log_entries is None)
+    if log_entries is not None:
+        log_entries.append(le)
+    i = order.invoices.filter(is_cancellation=False).last()
+    if i and not i.refered.exists():
+        generate_cancellation(i)
+    order.create_transactions()
+
+
 def approve_order(order, user=None, send_mail: bool=True, auth=None, force=False):
     """
     Mark this order as approved
@@ -1327,14 +1338,21 @@ def _perform_order(event: Event, payment_requests: List[dict], position_ids: Lis
     }
 
 
+def _events_with_orders(qs):
+    # Resolves the events of all orders in qs at once, together with their settings
+    return Event.objects.filter(
+        pk__in=qs.order_by().values('event_id')
+    ).prefetch_related(
+        '_settings_objects', 'organizer___settings_objects'
+    ).select_related('organizer').order_by('pk')
+
+
 @receiver(signal=periodic_task)
 @scopes_disabled()
 def expire_orders(sender, **kwargs):
-    event_id = None
-    expire = None
-
+    now_dt = now()
     qs = Order.objects.filter(
-        expires__lt=now(),
+        expires__lt=now_dt,
         status=Order.STATUS_PENDING,
         valid_if_pending=False,
         require_approval=False
@@ -1342,13 +1360,43 @@ def expire_orders(sender, **kwargs):
         Exists(
             OrderFee.objects.filter(order_id=OuterRef('pk'), fee_type=OrderFee.FEE_TYPE_CANCELLATION)
         )
-    ).prefetch_related('event').order_by('event_id')
-    for o in qs:
-        if o.event_id != event_id:
-            expire = o.event.settings.get('payment_term_expire_automatically', as_type=bool)
-            event_id = o.event_id
-        if expire and now() >= o.payment_term_expire_date:
-            mark_order_expired(o)
+    )
+    for event in _events_with_orders(qs):
+        if not event.settings.get('payment_term_expire_automatically', as_type=bool):
+            continue
+
+        orders = list(qs.filter(event=event).order_by('pk'))
+        for o in orders:
+            o.event = event
+        if event.settings.get('payment_term_expire_delay_days', as_type=int):
+            # The expiry date then depends on the last date of payments, which we can only compute in Python
+            orders = [o for o in orders if now_dt >= o.payment_term_expire_date]
+
+        for i in range(0, len(orders), EXPIRE_ORDERS_CHUNK_SIZE):
+            _expire_orders(orders[i:i + EXPIRE_ORDERS_CHUNK_SIZE])
+
+        if orders:
+            # The released tickets should be available right away and not only once the cache runs out
+            invalidate_availability_cache(event.pk)
+
+
+def _expire_orders(orders):
+    log_entries = []
+    with transaction.atomic():
+        # Orders might have been paid or changed since we looked at them
+        still_pending = set(Order.objects.select_for_update(of=OF_SELF).filter(
+            pk__in=[o.pk for o in orders],
+            status=Order.STATUS_PENDING,
+            valid_if_pending=False,
+            require_approval=False,
+        ).values_list('pk', flat=True))
+        orders = [o for o in orders if o.pk in still_pending]
+        for o in orders:
+            _mark_order_expired(o, log_entries=log_entries)
+        LogEntry.bulk_create_and_postprocess(log_entries)
+
+    for o in orders:
+        order_expired.send(o.event, order=o)
 
 
 @receiver(signal=periodic_task)
@@ -1356,61 +1404,76 @@ def expire_orders(sender, **kwargs):
 @minimum_interval(minutes_after_success=60)
 def send_expiry_warnings(sender, **kwargs):
     today = now().replace(hour=0, minute=0, second=0)
-    days = None
-    settings = None
-    event_id = None
+    qs = Order.objects.filter(
+        expires__gte=today, expiry_reminder_sent=False, status=Order.STATUS_PENDING,
+        datetime__lte=now() - timedelta(hours=2), require_approval=False
+    )
+    last_payment = OrderPayment.objects.filter(order_id=OuterRef('pk')).order_by('-local_id')
 
-    for o in Order.objects.filter(
-            expires__gte=today, expiry_reminder_sent=False, status=Order.STATUS_PENDING,
-            datetime__lte=now() - timedelta(hours=2), require_approval=False
-    ).only('pk', 'event_id', 'expires').order_by('event_id'):
-
-        lp = o.payments.last()
-        if (
-                lp and
-                lp.state in [OrderPayment.PAYMENT_STATE_CREATED, OrderPayment.PAYMENT_STATE_PENDING] and
-                lp.payment_provider and
-                lp.payment_provider.prevent_reminder_mail(o, lp)
-        ):
+    for event in _events_with_orders(qs):
+        days = event.settings.get('mail_days_order_expire_warning', as_type=int)
+        if not days:
             continue
 
-        if event_id != o.event_id:
-            settings = o.event.settings
-            days = cache.get_or_set('{}:{}:setting_mail_days_order_expire_warning'.format('event', o.event_id),
-                                    default=lambda: settings.get('mail_days_order_expire_warning', as_type=int),
-                                    timeout=3600)
-            event_id = o.event_id
+        orders = list(qs.filter(
+            event=event,
+            expires__lt=today + timedelta(days=days + 1),
+        ).annotate(
+            last_payment_id=Subquery(last_payment.values('pk')[:1]),
+            last_payment_state=Subquery(last_payment.values('state')[:1]),
+            has_cancellation_fee=Exists(
+                OrderFee.objects.filter(order_id=OuterRef('pk'), fee_type=OrderFee.FEE_TYPE_CANCELLATION)
+            ),
+        ).only('pk', 'event_id', 'expires').order_by('pk'))
 
-        if days and (o.expires - today).days <= days:
-            with transaction.atomic():
-                o = Order.objects.select_related('event').select_for_update(of=OF_SELF).get(pk=o.pk)
-                if o.status != Order.STATUS_PENDING or o.expiry_reminder_sent:
-                    # Race condition
+        # Payment providers may prevent reminders for payments that are still in progress
+        open_payments = OrderPayment.objects.in_bulk([
+            o.last_payment_id for o in orders
+            if o.last_payment_state in (OrderPayment.PAYMENT_STATE_CREATED, OrderPayment.PAYMENT_STATE_PENDING)
+        ])
+        for o in orders:
+            o.event = event
+            lp = open_payments.get(o.last_payment_id)
+            if lp:
+                lp.order = o
+                if lp.payment_provider and lp.payment_provider.prevent_reminder_mail(o, lp):
                     continue
+            _send_expiry_warning(o, event, event.settings.payment_term_expire_automatically)
 
-                with language(o.locale, settings.region):
-                    o.expiry_reminder_sent = True
-                    o.save(update_fields=['expiry_reminder_sent'])
-                    email_context = get_email_context(event=o.event, order=o)
-                    can_autoexpire = (
-                        settings.payment_term_expire_automatically and
-                        not o.valid_if_pending and
-                        not o.fees.filter(fee_type=OrderFee.FEE_TYPE_CANCELLATION).exists()
-                    )
-                    if can_autoexpire:
-                        email_template = settings.mail_text_order_expire_warning
-                        email_subject = settings.mail_subject_order_expire_warning
-                    else:
-                        email_template = settings.mail_text_order_pending_warning
-                        email_subject = settings.mail_subject_order_pending_warning
 
-                    try:
-                        o.send_mail(
-                            email_subject, email_template, email_context,
-                            'pretix.event.order.email.expire_warning_sent'
-                        )
-                    except SendMailException:
-                        logger.exception('Reminder email could not be sent')
+def _send_expiry_warning(o, event, expire_automatically):
+    settings = event.settings
+    with transaction.atomic():
+        has_cancellation_fee = o.has_cancellation_fee
+        o = Order.objects.select_for_update(of=OF_SELF).get(pk=o.pk)
+        if o.status != Order.STATUS_PENDING or o.expiry_reminder_sent:
+            # Race condition
+            return
+        o.event = event
+
+        with language(o.locale, settings.region):
+            o.expiry_reminder_sent = True
+            o.save(update_fields=['expiry_reminder_sent'])
+            email_context = get_email_context(event=event, order=o)
+            can_autoexpire = (
+                expire_automatically and
+                not o.valid_if_pending and
+                not has_cancellation_fee
+            )
+            if can_autoexpire:
+                email_template = settings.mail_text_order_expire_warning
+                email_subject = settings.mail_subject_order_expire_warning
+            else:
+                email_template = settings.mail_text_order_pending_warning
+                email_subject = settings.mail_subject_order_pending_warning
+
+            try:
+                o.send_mail(
+                    email_subject, email_template, email_context,
+                    'pretix.event.order.email.expire_warning_sent'
+                )
+            except SendMailException:
+                logger.exception('Reminder email could not be sent')
 
 
 @receiver(signal=periodic_task)
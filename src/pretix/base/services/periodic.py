@@ -0,0 +1,88 @@
+#
+# This file is part of pretix (Community Edition).
+#
+# Copyright (C) 2014-2020 Raphael Michel and contributors
+# Copyright (C) 2020-2021 rami.io GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+#
+import logging
+
+from django.core.cache import cache
+from django.dispatch.dispatcher import NO_RECEIVERS
+
+from pretix.base.services.tasks import ProfiledTask
+from pretix.base.signals import periodic_task
+from pretix.celery_app import app
+from pretix.helpers.periodic import (
+    is_due, receiver_name, record_run, run_receiver,
+)
+
+logger = logging.getLogger(__name__)
+
+# A dispatched task is considered lost after this time if its receiver does not configure its own running timeout
+# through minimum_interval()
+DISPATCH_TIMEOUT = 30 * 60
+
+
+def periodic_receivers():
+    """
+    Returns a dictionary mapping the dotted names of all receivers of the ``periodic_task`` signal to the receivers.
+    """
+    if not periodic_task.receivers or periodic_task.sender_receivers_cache.get(None) is NO_RECEIVERS:
+        return {}
+    return {receiver_name(r): r for r in periodic_task._live_receivers(None)}
+
+
+def _dispatch_key(name):
+    return f'pretix_periodic_{name}_dispatched'
+
+
+def dispatch(receiver):
+    """
+    Queues a background task that runs the given receiver of the ``periodic_task`` signal, unless such a task is
+    already queued or running or the receiver has run too recently according to its ``minimum_interval``. Returns
+    ``True`` if a task has been queued.
+    """
+    name = receiver_name(receiver)
+    if not is_due(receiver):
+        record_run(name, 'skipped')
+        return False
+
+    interval = getattr(receiver, 'minimum_interval', None)
+    timeout = interval.minutes_running_timeout * 60 if interval else DISPATCH_TIMEOUT
+    if not cache.add(_dispatch_key(name), '1', timeout=timeout):
+        record_run(name, 'skipped')
+        return False
+
+    try:
+        run_periodic_task.apply_async(args=(name,))
+    except Exception:
+        cache.delete(_dispatch_key(name))
+        raise
+    return True
+
+
+@app.task(base=ProfiledTask)
+def run_periodic_task(name):
+    try:
+        receiver = periodic_receivers().get(name)
+        if receiver is None:
+            logger.warning(f'Periodic task {name} is not known to this worker.')
+            return
+        run_receiver(receiver)
+    finally:
+        cache.delete(_dispatch_key(name))
@@ -0,0 +1,309 @@
+#
+# This file is part of pretix (Community Edition).
+#
+# Copyright (C) 2014-2020 Raphael Michel and contributors
+# Copyright (C) 2020-2021 rami.io GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+#
+"""
+This module contains an optional store of incrementally maintained quota counters. If it is enabled through the
+``quota_counters`` option in the ``[pretix]`` section of the configuration file (and redis is configured), we keep
+one small redis hash per quota with the number of paid, pending and exited order positions as well as the number of
+blocking vouchers, cart positions and waiting list entries counted against the quota.
+
+Order, cart, voucher and waiting list writes call :py:func:`track`, which collects the changes in memory and applies
+them to redis once the surrounding database transaction has been committed. This means that rolled back transactions
+never touch the counters.
+
+The counters are only used for computations that are allowed to use cached data anyway (``allow_cache=True`` in
+:py:class:`pretix.base.services.quotas.QuotaAvailability`). Any code path that actually sells a ticket still counts
+from the database. Not every write in the system is tracked (e.g. cart positions that expire without being deleted,
+bulk updates of voucher redemptions or check-in based exits), so the counters slowly drift. A periodic task therefore
+recounts every quota in use from the database with the regular algorithm and overwrites the counters. Counters of
+quotas that have not been reconciled recently are ignored.
+"""
+import logging
+import time
+from collections import Counter, defaultdict
+
+import django_redis
+from django.conf import settings
+from django.dispatch import receiver
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+
+from pretix.base.models import Quota
+from pretix.base.models._oncommit import OnCommitCounter
+from pretix.base.services.counters import (
+    KEY_TIMEOUT, RecentlyRead, is_reconciled,
+)
+from pretix.base.signals import periodic_task
+from pretix.helpers.periodic import minimum_interval
+
+logger = logging.getLogger(__name__)
+
+STATE_PAID = 'paid'
+STATE_PENDING = 'pending'
+STATE_EXITED = 'exited'
+STATE_VOUCHERS = 'vouchers'
+STATE_CART = 'cart'
+STATE_WAITINGLIST = 'waitinglist'
+STATES = (STATE_PAID, STATE_PENDING, STATE_EXITED, STATE_VOUCHERS, STATE_CART, STATE_WAITINGLIST)
+
+RECONCILE_CHUNK_SIZE = 500
+
+KNOWN_KEY = 'quotacounters:known'
+known = RecentlyRead(KNOWN_KEY)
+
+
+def counters_enabled():
+    return settings.HAS_REDIS and settings.PRETIX_QUOTA_COUNTERS
+
+
+def _key(quota_id):
+    return f'quotacounters:{quota_id}'
+
+
+def _flush(deltas):
+    item_ids = {k[2] for k in deltas if k[2] and not k[3] and not k[4]}
+    variation_ids = {k[3] for k in deltas if k[3] and not k[4]}
+
+    # Resolve the items and variations to the quotas they are counted against, in the same way
+    # QuotaAvailability._compute does it.
+    item_to_quotas = defaultdict(set)
+    var_to_quotas = defaultdict(set)
+    if item_ids:
+        for m in Quota.items.through.objects.filter(item_id__in=item_ids).values('quota_id', 'item_id', 'quota__subevent_id'):
+            item_to_quotas[m['item_id']].add((m['quota_id'], m['quota__subevent_id']))
+        for m in Quota.variations.through.objects.filter(itemvariation__item_id__in=item_ids).values(
+                'quota_id', 'itemvariation__item_id', 'quota__subevent_id'):
+            item_to_quotas[m['itemvariation__item_id']].add((m['quota_id'], m['quota__subevent_id']))
+    if variation_ids:
+        for m in Quota.variations.through.objects.filter(itemvariation_id__in=variation_ids).values(
+                'quota_id', 'itemvariation_id', 'quota__subevent_id'):
+            var_to_quotas[m['itemvariation_id']].add((m['quota_id'], m['quota__subevent_id']))
+
+    quota_deltas = Counter()
+    for (state, subevent_id, item_id, variation_id, quota_id), d in deltas.items():
+        if not d:
+            continue
+        if quota_id:
+            quota_deltas[quota_id, state] += d
+            continue
+        elif variation_id:
+            qs = var_to_quotas[variation_id]
+        else:
+            qs = item_to_quotas[item_id]
+        for q_id, q_subevent_id in qs:
+            if q_subevent_id == subevent_id:
+                quota_deltas[q_id, state] += d
+
+    if not quota_deltas:
+        return
+
+    rc = django_redis.get_redis_connection("redis")
+    p = rc.pipeline()
+    for (quota_id, state), d in quota_deltas.items():
+        if d:
+            p.hincrby(_key(quota_id), state, d)
+    p.execute()
+
+
+_pending = OnCommitCounter(_flush)
+
+
+def track(state, delta, item_id=None, variation_id=None, subevent_id=None, quota_id=None, using=None):
+    """
+    Records that ``delta`` objects of the given ``state`` have been added to (or, if ``delta`` is negative, removed
+    from) all quotas the given item or variation is counted against. Vouchers that are directly connected to a quota
+    can pass ``quota_id`` instead. The change is applied when the current database transaction is committed.
+    """
+    if not delta or not counters_enabled():
+        return
+
+    _pending.add((state, subevent_id, item_id, variation_id, quota_id), delta, using)
+
+
+def track_cart_position(position, delta, now_dt=None):
+    """
+    Records the creation (``delta=1``) or deletion (``delta=-1``) of a cart position. Expired cart positions and cart
+    positions with a quota-blocking voucher are not counted against the quota, so they are ignored.
+    """
+    if not counters_enabled():
+        return
+    now_dt = now_dt or now()
+    if position.expires < now_dt:
+        return
+    if position.voucher_id and position.voucher.block_quota and (
+        position.voucher.valid_until is None or position.voucher.valid_until >= now_dt
+    ):
+        return
+    track(STATE_CART, delta, item_id=position.item_id, variation_id=position.variation_id,
+          subevent_id=position.subevent_id)
+
+
+def voucher_contribution(voucher, now_dt=None):
+    """
+    Returns the number of quota spots blocked by the given voucher.
+    """
+    if not voucher.block_quota:
+        return 0
+    if voucher.valid_until is not None and voucher.valid_until < (now_dt or now()):
+        return 0
+    return max(voucher.max_usages - voucher.redeemed, 0)
+
+
+def track_voucher(old, new):
+    """
+    Records a change of a voucher. ``old`` and ``new`` may be ``None`` if the voucher has been created or deleted,
+    respectively.
+    """
+    if not counters_enabled():
+        return
+    now_dt = now()
+    for v, sign in ((old, -1), (new, 1)):
+        if v is None:
+            continue
+        d = voucher_contribution(v, now_dt)
+        if d:
+            track(STATE_VOUCHERS, sign * d, item_id=v.item_id, variation_id=v.variation_id,
+                  subevent_id=v.subevent_id, quota_id=None if (v.item_id or v.variation_id) else v.quota_id)
+
+
+def track_waitinglist_entry(old, new):
+    """
+    Records a change of a waiting list entry. ``old`` and ``new`` may be ``None`` if the entry has been created or
+    deleted, respectively. Only entries that did not yet receive a voucher are counted.
+    """
+    if not counters_enabled():
+        return
+    for e, sign in ((old, -1), (new, 1)):
+        if e is not None and e.voucher_id is None:
+            track(STATE_WAITINGLIST, sign, item_id=e.item_id, variation_id=e.variation_id, subevent_id=e.subevent_id)
+
+
+def read(quotas):
+    """
+    Returns a dictionary mapping all quotas for which we have recently reconciled counters to a dictionary of
+    counts per state. Quotas without reliable counters are scheduled for initialization by the next reconciliation
+    run.
+    """
+    if not quotas or not counters_enabled():
+        return {}
+
+    rc = django_redis.get_redis_connection("redis")
+    p = rc.pipeline()
+    for q in quotas:
+        p.hgetall(_key(q.pk))
+    data = p.execute()
+
+    result = {}
+    for q, d in zip(quotas, data):
+        d = {k.decode(): v for k, v in d.items()}
+        if is_reconciled(d):
+            result[q] = {s: int(d.get(s, 0)) for s in STATES}
+
+    known.touch(rc, [q.pk for q in quotas])
+    return result
+
+
+def availability_from_counts(quota, counts, count_waitinglist=True):
+    """
+    Computes an availability tuple from a set of counters with the same semantics as
+    :py:class:`pretix.base.services.quotas.QuotaAvailability` does from the database.
+    """
+    exited = counts[STATE_EXITED] if quota.release_after_exit else 0
+    paid = max(counts[STATE_PAID] - exited, 0)
+    pending = counts[STATE_PENDING] - max(exited - counts[STATE_PAID], 0)
+
+    size_left = quota.size - paid
+    if size_left <= 0:
+        return Quota.AVAILABILITY_GONE, 0
+    size_left -= pending + counts[STATE_VOUCHERS]
+    if size_left <= 0:
+        return Quota.AVAILABILITY_ORDERED, 0
+    size_left -= counts[STATE_CART]
+    if size_left <= 0:
+        return Quota.AVAILABILITY_RESERVED, 0
+    if count_waitinglist:
+        size_left -= counts[STATE_WAITINGLIST]
+        if size_left <= 0:
+            return Quota.AVAILABILITY_ORDERED, 0
+    return Quota.AVAILABILITY_OK, size_left
+
+
+def invalidate(quota_id):
+    if counters_enabled():
+        rc = django_redis.get_redis_connection("redis")
+        rc.delete(_key(quota_id))
+
+
+def reconcile(quotas, now_dt=None):
+    """
+    Counts the given quotas from the database and overwrites their counters. Returns the total absolute drift that
+    has been repaired.
+    """
+    from .quotas import QuotaAvailability
+
+    if not quotas or not counters_enabled():
+        return 0
+
+    rc = django_redis.get_redis_connection("redis")
+    p = rc.pipeline()
+    for q in quotas:
+        p.hgetall(_key(q.pk))
+    previous = p.execute()
+
+    qa = QuotaAvailability(full_results=True, early_out=False)
+    qa.queue(*quotas)
+    qa.compute(now_dt=now_dt)
+
+    drift = 0
+    ts = time.time()
+    p = rc.pipeline()
+    for q, prev in zip(quotas, previous):
+        prev = {k.decode(): v for k, v in prev.items()}
+        counts = {
+            STATE_PAID: qa.count_paid_orders[q],
+            STATE_PENDING: qa.count_pending_orders[q],
+            STATE_EXITED: qa.count_exited_orders[q],
+            STATE_VOUCHERS: qa.count_vouchers[q],
+            STATE_CART: qa.count_cart[q],
+            STATE_WAITINGLIST: qa.count_waitinglist[q],
+        }
+        if 'reconciled' in prev:
+            drift += sum(abs(int(prev.get(s, 0)) - c) for s, c in counts.items())
+        p.hset(_key(q.pk), mapping={**counts, 'reconciled': str(ts)})
+        p.expire(_key(q.pk), KEY_TIMEOUT)
+    p.execute()
+    return drift
+
+
+@receiver(signal=periodic_task)
+@scopes_disabled()
+@minimum_interval(minutes_after_success=5)
+def reconcile_quota_counters(sender, **kwargs):
+    if not counters_enabled():
+        return
+
+    drift = known.reconcile(
+        lambda ids: list(Quota.objects.filter(pk__in=ids).select_related('event', 'subevent')),
+        reconcile,
+        RECONCILE_CHUNK_SIZE,
+    )
+    if drift:
+        logger.info(f'Repaired a total drift of {drift} in quota counters.')
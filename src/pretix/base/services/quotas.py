@@ -19,10 +19,12 @@
 # You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
 # <https://www.gnu.org/licenses/>.
 #
+import math
+import random
 import sys
 import time
 from collections import Counter, defaultdict
-from itertools import zip_longest
+from itertools import product, zip_longest
 
 import django_redis
 from django.conf import settings
@@ -31,14 +33,36 @@ from django.db.models import (
     Case, Count, F, Func, Max, OuterRef, Q, Subquery, Sum, Value, When,
     prefetch_related_objects,
 )
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
 from django.utils.timezone import now
 
 from pretix.base.models import (
-    CartPosition, Checkin, Order, OrderPosition, Quota, Voucher,
+    CartPosition, Checkin, ItemVariation, Order, OrderPosition, Quota, Voucher,
     WaitingListEntry,
 )
 
 from ..signals import quota_availability
+from . import quotacounters
+
+# Number of seconds entries in the availability cache are considered valid
+CACHE_TTL = 120
+# Number of seconds a worker may take to recompute an expired entry before someone else takes over
+CACHE_REFRESH_LOCK_TIMEOUT = 10
+# Tuning factor for early recomputation, values greater than 1 favor earlier recomputation
+CACHE_XFETCH_BETA = 1.0
+
+
+def _cache_key_suffix(count_waitinglist, ignore_closed):
+    """
+    Returns the suffix of all cache keys of a :py:class:`QuotaAvailability` computed with the given options.
+    """
+    suffix = ""
+    if not count_waitinglist:
+        suffix += ":nocw"
+    if ignore_closed:
+        suffix += ":igcl"
+    return suffix
 
 
 class QuotaAvailability:
@@ -103,13 +127,11 @@ class QuotaAvailability:
         self.count_waitinglist = defaultdict(int)
         self.count_cart = defaultdict(int)
 
-        self._cache_key_suffix = ""
-        if not self._count_waitinglist:
-            self._cache_key_suffix += ":nocw"
-        if self._ignore_closed:
-            self._cache_key_suffix += ":igcl"
+        self._cache_key_suffix = _cache_key_suffix(self._count_waitinglist, self._ignore_closed)
 
         self.sizes = {}
+        self._refresh_locks = set()
+        self._compute_duration = 0
 
     def queue(self, *quota):
         self._queue += quota
@@ -118,6 +140,8 @@ class QuotaAvailability:
         """
         Compute the queued quotas. If ``allow_cache`` is set, results may also be taken from a cache that might
         be a few minutes outdated. In this case, you may not rely on the results in the ``count_*`` properties.
+        Expired cache entries are only recomputed by one caller at a time, all other callers will receive the expired
+        entry until the recomputation is finished.
         """
         now_dt = now_dt or now()
         quota_ids_set = {q.id for q in self._queue}
@@ -129,23 +153,12 @@ class QuotaAvailability:
                 raise ValueError("You cannot combine full_results and allow_cache.")
 
             elif settings.HAS_REDIS:
-                rc = django_redis.get_redis_connection("redis")
-                quotas_by_event = defaultdict(list)
-                for q in [_q for _q in self._queue if _q.id in quota_ids_set]:
-                    quotas_by_event[q.event_id].append(q)
-
-                for eventid, evquotas in quotas_by_event.items():
-                    d = rc.hmget(f'quotas:{eventid}:availabilitycache{self._cache_key_suffix}', [str(q.pk) for q in evquotas])
-                    for redisval, q in zip(d, evquotas):
-                        if redisval is not None:
-                            data = [rv for rv in redisval.decode().split(',')]
-                            # Except for some rare situations, we don't want to use cache entries older than 2 minutes
-                            if time.time() - int(data[2]) < 120 or allow_cache_stale:
-                                quota_ids_set.remove(q.id)
-                                if data[1] == "None":
-                                    self.results[q] = int(data[0]), None
-                                else:
-                                    self.results[q] = int(data[0]), int(data[1])
+                if quotacounters.counters_enabled():
+                    self._compute_from_counters([_q for _q in self._queue if _q.id in quota_ids_set], quota_ids_set)
+                    if not quota_ids_set:
+                        return
+
+                self._read_cache(quota_ids_set, allow_cache_stale)
 
         if not quota_ids_set:
             return
@@ -154,7 +167,9 @@ class QuotaAvailability:
         quotas_original = list(quotas)
         self._queue.clear()
 
+        t0 = time.monotonic()
         self._compute(quotas, now_dt)
+        self._compute_duration = time.monotonic() - t0
 
         for q in quotas_original:
             for recv, resp in quota_availability.send(sender=q.event, quota=q, result=self.results[q],
@@ -164,6 +179,66 @@ class QuotaAvailability:
         self._close(quotas)
         self._write_cache(quotas, now_dt)
 
+    def _read_cache(self, quota_ids_set, allow_cache_stale):
+        rc = django_redis.get_redis_connection("redis")
+        quotas_by_event = defaultdict(list)
+        for q in [_q for _q in self._queue if _q.id in quota_ids_set]:
+            quotas_by_event[q.event_id].append(q)
+
+        stale = {}
+        for eventid, evquotas in quotas_by_event.items():
+            d = rc.hmget(f'quotas:{eventid}:availabilitycache{self._cache_key_suffix}', [str(q.pk) for q in evquotas])
+            for redisval, q in zip(d, evquotas):
+                if redisval is not None:
+                    data = [rv for rv in redisval.decode().split(',')]
+                    result = int(data[0]), (None if data[1] == "None" else int(data[1]))
+                    # Entries written by older versions do not contain the duration of the computation
+                    duration = float(data[3]) if len(data) > 3 else 0
+                    # Except for some rare situations, we don't want to use cache entries older than 2 minutes
+                    if allow_cache_stale or not self._cache_entry_expired(time.time() - int(data[2]), duration):
+                        quota_ids_set.remove(q.id)
+                        self.results[q] = result
+                    else:
+                        stale[q] = result
+
+        if not stale:
+            return
+
+        # Only one worker recomputes an expired entry ("single flight"), everyone else keeps using the expired entry
+        # until the recomputation is done. If the worker holding the lock dies, the lock times out and the next worker
+        # will take over.
+        p = rc.pipeline()
+        for q in stale:
+            p.set(f'quotas:availabilitycacherefresh:{q.pk}{self._cache_key_suffix}', '1', nx=True, ex=CACHE_REFRESH_LOCK_TIMEOUT)
+        for q, acquired in zip(stale, p.execute()):
+            if acquired:
+                self._refresh_locks.add(q.pk)
+            else:
+                quota_ids_set.remove(q.id)
+                self.results[q] = stale[q]
+
+    @staticmethod
+    def _cache_entry_expired(age, duration):
+        # We do not let all entries expire at exactly CACHE_TTL, but refresh them a little earlier with a probability
+        # that increases with the age of the entry and the time it took to compute it (see "Optimal Probabilistic Cache
+        # Stampede Prevention" by Vattani et al.). Combined with the refresh lock, this means that a popular entry is
+        # usually refreshed by a single request before it expires for everyone.
+        return age - duration * CACHE_XFETCH_BETA * math.log(1 - random.random()) >= CACHE_TTL
+
+    def _compute_from_counters(self, quotas, quota_ids_set):
+        # Closed, unlimited or empty quotas do not need any counting, we leave them to the regular computation
+        candidates = [
+            q for q in quotas
+            if q.size is not None and q.size > 0 and (self._ignore_closed or not q.closed)
+        ]
+        counts = quotacounters.read(candidates)
+        for q, c in counts.items():
+            quota_ids_set.discard(q.id)
+            self.results[q] = quotacounters.availability_from_counts(q, c, count_waitinglist=self._count_waitinglist)
+            for recv, resp in quota_availability.send(sender=q.event, quota=q, result=self.results[q],
+                                                      count_waitinglist=self.count_waitinglist):
+                self.results[q] = resp
+
     def _write_cache(self, quotas, now_dt):
         if not settings.HAS_REDIS or not quotas:
             return
@@ -171,22 +246,38 @@ class QuotaAvailability:
         rc = django_redis.get_redis_connection("redis")
         # We write the computed availability to redis in a per-event hash as
         #
-        #   quota_id -> (availability_state, availability_number, timestamp).
+        #   quota_id -> (availability_state, availability_number, timestamp, duration of computation).
         #
         # We store this in a hash instead of individual values to avoid making too many redis requests
         # which would introduce latency.
 
-        # The individual entries in the hash are "valid" for 120 seconds. This means in a typical peak scenario with
-        # high load *to a specific calendar or event*, lots of parallel web requests will receive an "expired" result
-        # around the same time, recompute quotas and write back to the cache. To avoid overloading redis with lots of
-        # simultaneous write queries for the same page, we place a very naive and simple "lock" on the write process for
-        # these quotas. We choose 10 seconds since that should be well above the duration of a write.
+        # The individual entries in the hash are "valid" for CACHE_TTL seconds. Once they expire, only the worker
+        # holding the refresh lock recomputes them (see _read_cache). Callers that do not use the cache at all still
+        # write their results, though. To avoid overloading redis with lots of simultaneous write queries for the same
+        # page, we place a very naive and simple "lock" on the write process for these quotas. We choose 10 seconds
+        # since that should be well above the duration of a write. Workers holding the refresh lock for all quotas are
+        # exempt from this, since they are the only ones recomputing them anyways.
+        quota_ids = {q.pk for q in quotas}
+        refresh_locks = quota_ids & self._refresh_locks
+        try:
+            if refresh_locks != quota_ids:
+                lock_name = '_'.join([str(p) for p in sorted(quota_ids)])
+                if rc.exists(f'quotas:availabilitycachewrite:{lock_name}{self._cache_key_suffix}'):
+                    return
+                rc.setex(f'quotas:availabilitycachewrite:{lock_name}{self._cache_key_suffix}', '1', 10)
 
-        lock_name = '_'.join([str(p) for p in sorted([q.pk for q in quotas])])
-        if rc.exists(f'quotas:availabilitycachewrite:{lock_name}{self._cache_key_suffix}'):
-            return
-        rc.setex(f'quotas:availabilitycachewrite:{lock_name}{self._cache_key_suffix}', '1', 10)
+            self._write_cache_entries(rc, quotas)
+        finally:
+            if refresh_locks:
+                rc.delete(*[f'quotas:availabilitycacherefresh:{pk}{self._cache_key_suffix}' for pk in refresh_locks])
+                self._refresh_locks -= refresh_locks
 
+        # We used to also delete item_quota_cache:* from the event cache here, but as the cache
+        # gets more complex, this does not seem worth it. The cache is only present for up to
+        # 5 seconds to prevent high peaks, and a 5-second delay in availability is usually
+        # tolerable
+
+    def _write_cache_entries(self, rc, quotas):
         update = defaultdict(list)
         for q in quotas:
             update[q.event_id].append(q)
@@ -195,7 +286,7 @@ class QuotaAvailability:
             rc.hset(f'quotas:{eventid}:availabilitycache{self._cache_key_suffix}', mapping={
                 str(q.id): ",".join(
                     [str(i) for i in self.results[q]] +
-                    [str(int(time.time()))]
+                    [str(int(time.time())), '{:.3f}'.format(self._compute_duration)]
                 ) for q in quotas
             })
             # To make sure old events do not fill up our redis instance, we set an expiry on the cache. However, we set it
@@ -203,11 +294,6 @@ class QuotaAvailability:
             # where we set allow_cache_stale and use the old entries anyways to save on performance.
             rc.expire(f'quotas:{eventid}:availabilitycache{self._cache_key_suffix}', 3600 * 24 * 7)
 
-        # We used to also delete item_quota_cache:* from the event cache here, but as the cache
-        # gets more complex, this does not seem worth it. The cache is only present for up to
-        # 5 seconds to prevent high peaks, and a 5-second delay in availability is usually
-        # tolerable
-
     def _close(self, quotas):
         for q in quotas:
             if self.results[q][0] <= Quota.AVAILABILITY_ORDERED and q.close_when_sold_out and not q.closed:
@@ -240,15 +326,10 @@ class QuotaAvailability:
             self.count_waitinglist[q] = 0
 
         # Fetch which quotas belong to which items and variations
-        q_items = Quota.items.through.objects.filter(
-            quota_id__in=[q.pk for q in quotas]
-        ).values('quota_id', 'item_id')
+        q_items, q_vars = self._fetch_topology(quotas)
         for m in q_items:
             self._item_to_quotas[m['item_id']].add(self._quota_objects[m['quota_id']])
 
-        q_vars = Quota.variations.through.objects.filter(
-            quota_id__in=[q.pk for q in quotas]
-        ).values('quota_id', 'itemvariation_id', 'itemvariation__item_id')
         for m in q_vars:
             self._var_to_quotas[m['itemvariation_id']].add(self._quota_objects[m['quota_id']])
             # We can't be 100% certain that a quota, when it is connected to a variation, is also always connected to
@@ -286,6 +367,34 @@ class QuotaAvailability:
                 else:
                     raise ValueError("inconclusive quota")
 
+    def _fetch_topology(self, quotas):
+        event_ids = {q.event_id for q in quotas}
+        if len(event_ids) > QuotaTopology.MAX_EVENTS:
+            # Looking up the cached topology of each event individually would be slower than asking the database
+            q_items = Quota.items.through.objects.filter(
+                quota_id__in=[q.pk for q in quotas]
+            ).values('quota_id', 'item_id')
+            q_vars = Quota.variations.through.objects.filter(
+                quota_id__in=[q.pk for q in quotas]
+            ).values('quota_id', 'itemvariation_id', 'itemvariation__item_id')
+            return q_items, q_vars
+
+        prefetch_related_objects(quotas, 'event')
+        topologies = QuotaTopology.for_events({q.event_id: q.event for q in quotas}.values())
+        q_items = []
+        q_vars = []
+        for q in quotas:
+            topology = topologies[q.event_id]
+            q_items += [
+                {'quota_id': q.pk, 'item_id': item_id}
+                for item_id in topology.items.get(q.pk, ())
+            ]
+            q_vars += [
+                {'quota_id': q.pk, 'itemvariation_id': var_id, 'itemvariation__item_id': item_id}
+                for var_id, item_id in topology.variations.get(q.pk, ())
+            ]
+        return q_items, q_vars
+
     def _compute_orders(self, quotas, q_items, q_vars, size_left):
         events = {q.event_id for q in quotas}
         subevents = {q.subevent_id for q in quotas}
@@ -492,6 +601,87 @@ class QuotaAvailability:
                 self.results[q] = Quota.AVAILABILITY_GONE, 0
 
 
+class QuotaTopology:
+    """
+    Describes which items and variations are counted against which quota of an event. Since this rarely changes but
+    is needed for every availability computation, it is kept in the event's cache. Since that cache is versioned and
+    all of its contents become invalid whenever a quota, item or variation of the event is saved or deleted, we only
+    need to take care of changes to the item and variation assignments of quotas ourselves.
+
+    * items (dict mapping quota IDs to lists of item IDs)
+    * variations (dict mapping quota IDs to lists of tuples of variation IDs and item IDs)
+    """
+    CACHE_KEY = 'quota_topology'
+    CACHE_TIMEOUT = 3600
+    # Quota computations spanning more events than this will fetch the topology from the database instead
+    MAX_EVENTS = 10
+
+    def __init__(self, items, variations):
+        self.items = items
+        self.variations = variations
+
+    @classmethod
+    def for_events(cls, events):
+        """
+        Returns a dictionary mapping event IDs to topologies for all given events.
+        """
+        result = {}
+        missing = []
+        for e in events:
+            cached = e.cache.get(cls.CACHE_KEY)
+            if cached is not None:
+                result[e.pk] = cls(*cached)
+            else:
+                missing.append(e)
+
+        if missing:
+            items = defaultdict(lambda: defaultdict(list))
+            variations = defaultdict(lambda: defaultdict(list))
+            for event_id, quota_id, item_id in Quota.items.through.objects.filter(
+                quota__event_id__in=[e.pk for e in missing]
+            ).values_list('quota__event_id', 'quota_id', 'item_id'):
+                items[event_id][quota_id].append(item_id)
+            for event_id, quota_id, var_id, item_id in Quota.variations.through.objects.filter(
+                quota__event_id__in=[e.pk for e in missing]
+            ).values_list('quota__event_id', 'quota_id', 'itemvariation_id', 'itemvariation__item_id'):
+                variations[event_id][quota_id].append((var_id, item_id))
+
+            for e in missing:
+                data = dict(items[e.pk]), dict(variations[e.pk])
+                e.cache.set(cls.CACHE_KEY, data, timeout=cls.CACHE_TIMEOUT)
+                result[e.pk] = cls(*data)
+        return result
+
+    @classmethod
+    def invalidate(cls, event):
+        event.cache.delete(cls.CACHE_KEY)
+
+
+@receiver(m2m_changed, sender=Quota.items.through, dispatch_uid='quota_topology_items')
+@receiver(m2m_changed, sender=Quota.variations.through, dispatch_uid='quota_topology_variations')
+def invalidate_quota_topology(sender, instance, action, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, ItemVariation):
+        QuotaTopology.invalidate(instance.item.event)
+    else:
+        # Quota or Item
+        QuotaTopology.invalidate(instance.event)
+
+
+def invalidate_availability_cache(event_id):
+    """
+    Drops all cached quota availabilities of an event, e.g. after lots of tickets have been released at once.
+    """
+    if not settings.HAS_REDIS:
+        return
+    rc = django_redis.get_redis_connection("redis")
+    rc.delete(*[
+        f'quotas:{event_id}:availabilitycache{_cache_key_suffix(count_waitinglist, ignore_closed)}'
+        for count_waitinglist, ignore_closed in product((True, False), repeat=2)
+    ])
+
+
 def grouper(iterable, n, fillvalue=None):
     """Collect data into fixed-length chunks or blocks"""
     # grouper('ABCDEFG', 3, 'x') --> ABC DEF Gxx
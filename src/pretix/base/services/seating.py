@@ -19,11 +19,14 @@
 # You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
 # <https://www.gnu.org/licenses/>.
 #
+from django.db import transaction
 from django.db.models import Count, Exists, OuterRef, Q
 from django.utils.translation import gettext_lazy as _
 
 from pretix.base.i18n import LazyLocaleException
 from pretix.base.models import CartPosition, Order, OrderPosition, Seat
+from pretix.base.models.seating import SeatIndex
+from pretix.base.services import seatoccupancy
 
 
 class SeatProtected(LazyLocaleException):
@@ -139,3 +142,9 @@ def generate_seats(event, subevent, plan, mapping, blocked_guids=None):
         seat__in=[s.pk for s in current_seats.values()],
     ).update(seat=None)
     Seat.objects.filter(pk__in=[s.pk for s in current_seats.values()]).delete()
+
+    # Drop the index now for the rest of this transaction and again after commit, in case someone else rebuilt it
+    # from the old seats in the meantime
+    SeatIndex.invalidate(event, subevent)
+    transaction.on_commit(lambda: SeatIndex.invalidate(event, subevent))
+    seatoccupancy.invalidate(event.pk, subevent.pk if subevent else None)
@@ -0,0 +1,275 @@
+#
+# This file is part of pretix (Community Edition).
+#
+# Copyright (C) 2014-2020 Raphael Michel and contributors
+# Copyright (C) 2020-2021 rami.io GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+#
+"""
+This module contains an optional cache of the seat occupancy of events and dates. If it is enabled through the
+``seat_occupancy`` option in the ``[pretix]`` section of the configuration file (and redis is configured), we keep one
+snapshot per event or date in redis. A snapshot contains the list of seats together with three bitmaps that mark the
+seats that are sold, reserved (by a cart or a voucher) or blocked. Bit ``i`` of every bitmap refers to the ``i``-th
+seat of the snapshot, with the most significant bit of the first byte being seat 0 (the same convention as redis'
+``GETBIT``). This allows seating plans (which are requested a lot during a big on-sale) to be rendered without
+computing the state of every seat in the database.
+
+Writes to carts, orders, vouchers and seats call :py:func:`invalidate`, which bumps the version of the (sub)event's
+snapshot once the surrounding database transaction has been committed. The next read then builds a new snapshot from
+the database. The version can be used by clients as an ETag to only fetch the occupancy once it changed.
+
+Not every write in the system is tracked (e.g. bulk deletions of cart positions), and reservations run out without
+any write at all. Snapshots are therefore only valid until the first reservation they contain expires, and for no
+longer than ``MAX_AGE`` seconds. Only one worker at a time rebuilds an outdated snapshot, everyone else keeps using the
+outdated one in the meantime. Snapshots are only meant for display purposes, whether a seat can actually be booked is
+always checked in the database.
+"""
+import base64
+import time
+from array import array
+from collections import Counter
+
+import django_redis
+from django.conf import settings
+from django.db.models import F, Min
+from django.utils.timezone import now
+
+from pretix.base.models import CartPosition, Seat, Voucher
+from pretix.base.models._oncommit import OnCommitCounter
+from pretix.base.models.seating import SeatIndex
+
+# Snapshots are rebuilt from the database at least this often
+MAX_AGE = 60
+KEY_TIMEOUT = 24 * 3600
+BUILD_LOCK_TIMEOUT = 30
+
+
+def occupancy_enabled():
+    return settings.HAS_REDIS and settings.PRETIX_SEAT_OCCUPANCY
+
+
+def _key(event_id, subevent_id):
+    return f'seatoccupancy:{event_id}:{subevent_id or 0}'
+
+
+def _version_key(event_id, subevent_id):
+    return f'seatoccupancy:{event_id}:{subevent_id or 0}:version'
+
+
+def _build_lock_key(event_id, subevent_id):
+    return f'seatoccupancy:{event_id}:{subevent_id or 0}:building'
+
+
+def _bitmap(bits):
+    data = bytearray((len(bits) + 7) // 8)
+    for i, b in enumerate(bits):
+        if b:
+            data[i // 8] |= 0x80 >> (i % 8)
+    return bytes(data)
+
+
+def _bit(data, i):
+    return bool(data[i // 8] & (0x80 >> (i % 8)))
+
+
+class SeatOccupancy:
+    """
+    A snapshot of the occupancy of all seats of an event or date.
+    """
+
+    def __init__(self, version, built, seat_ids, guids, product_ids, sold, reserved, blocked):
+        self.version = version
+        self.built = built
+        self.seat_ids = seat_ids
+        self.guids = guids
+        self.product_ids = product_ids
+        self.sold = sold
+        self.reserved = reserved
+        self.blocked = blocked
+
+    @property
+    def etag(self):
+        return '{}.{}'.format(self.version, int(self.built))
+
+    def available(self, event, subevent=None, sales_channel='web'):
+        """
+        Returns a bitmap of all seats that are available in the given sales channel with the same semantics as
+        ``free_seats()``, including the minimal distance between seats configured for the event.
+        """
+        allow_blocked = sales_channel in event.settings.seating_allow_blocked_seats_for_channel
+        unavailable = {
+            i for i in range(len(self.seat_ids))
+            if _bit(self.sold, i) or _bit(self.reserved, i) or (_bit(self.blocked, i) and not allow_blocked)
+        }
+
+        minimal_distance = event.settings.seating_minimal_distance
+        if minimal_distance > 0:
+            taken = [self.seat_ids[i] for i in range(len(self.seat_ids)) if _bit(self.sold, i) or _bit(self.reserved, i)]
+            if taken:
+                index = SeatIndex.get(event.pk, subevent, minimal_distance)
+                within_row = event.settings.seating_distance_within_row
+                closeby_taken = set()
+                for pk in taken:
+                    if pk in index.positions:
+                        x, y, row_name = index.positions[pk]
+                        closeby_taken.update(index.closeby(x, y, minimal_distance, row_name if within_row else None))
+                unavailable.update(i for i, pk in enumerate(self.seat_ids) if pk in closeby_taken)
+
+        return _bitmap([i not in unavailable for i in range(len(self.seat_ids))])
+
+    def free_seats_by_product(self, event, subevent=None, sales_channel='web'):
+        """
+        Returns a counter of the available seats per product ID, with the same semantics as ``free_seats()``.
+        """
+        available = self.available(event, subevent, sales_channel)
+        return Counter(pk for i, pk in enumerate(self.product_ids) if _bit(available, i))
+
+    def as_json(self, event, subevent=None, sales_channel='web'):
+        return {
+            'version': self.etag,
+            'seats': self.guids,
+            'available': base64.b64encode(self.available(event, subevent, sales_channel)).decode(),
+        }
+
+
+def _build(event, subevent, version):
+    now_dt = now()
+    seats = list(
+        Seat.annotated(
+            Seat.objects.filter(event=event, subevent=subevent).order_by('pk'), event.pk, subevent
+        ).values_list(
+            'pk', 'seat_guid', 'product_id', 'has_order', 'has_cart', 'has_voucher', 'blocked'
+        )
+    )
+    # Reservations stop being reservations without any write to the database, so we need to rebuild the snapshot
+    # once the first of them runs out
+    valid_until = [
+        CartPosition.objects.filter(
+            event=event, subevent=subevent, seat__isnull=False, expires__gte=now_dt
+        ).aggregate(m=Min('expires'))['m'],
+        Voucher.objects.filter(
+            event=event, subevent=subevent, seat__isnull=False, redeemed__lt=F('max_usages'), valid_until__gte=now_dt
+        ).aggregate(m=Min('valid_until'))['m'],
+    ]
+    valid_until = min([time.time() + MAX_AGE] + [v.timestamp() for v in valid_until if v])
+    occupancy = SeatOccupancy(
+        version=version,
+        built=time.time(),
+        seat_ids=[s[0] for s in seats],
+        guids=[s[1] for s in seats],
+        product_ids=[s[2] or 0 for s in seats],
+        sold=_bitmap([s[3] for s in seats]),
+        reserved=_bitmap([s[4] or s[5] for s in seats]),
+        blocked=_bitmap([s[6] for s in seats]),
+    )
+    return occupancy, valid_until
+
+
+def _deserialize(version, data):
+    return SeatOccupancy(
+        version=version,
+        built=float(data[b'built']),
+        seat_ids=array('q', data[b'seat_ids']).tolist(),
+        guids=data[b'guids'].decode().split('\n') if data[b'guids'] else [],
+        product_ids=array('q', data[b'product_ids']).tolist(),
+        sold=data[b'sold'],
+        reserved=data[b'reserved'],
+        blocked=data[b'blocked'],
+    )
+
+
+def read(event, subevent=None):
+    """
+    Returns the current :py:class:`SeatOccupancy` of the given event or date, building it from the database if
+    necessary (or always, if the occupancy cache is not enabled).
+    """
+    if not occupancy_enabled():
+        return _build(event, subevent, 0)[0]
+
+    subevent_id = subevent.pk if subevent else None
+    rc = django_redis.get_redis_connection("redis")
+    p = rc.pipeline()
+    p.get(_version_key(event.pk, subevent_id))
+    p.hgetall(_key(event.pk, subevent_id))
+    version, data = p.execute()
+    version = int(version or 0)
+
+    # Snapshots written by older versions do not contain the products of the seats
+    if data and b'product_ids' not in data:
+        data = None
+    if data and int(data[b'version']) == version and float(data[b'valid_until']) > time.time():
+        return _deserialize(version, data)
+
+    # Only one worker rebuilds an outdated snapshot, everyone else keeps using the outdated one until it is done. If
+    # the worker holding the lock dies, the lock times out and the next worker will take over.
+    if not rc.set(_build_lock_key(event.pk, subevent_id), '1', nx=True, ex=BUILD_LOCK_TIMEOUT):
+        if data:
+            return _deserialize(int(data[b'version']), data)
+        return _build(event, subevent, version)[0]
+
+    try:
+        occupancy, valid_until = _build(event, subevent, version)
+        p = rc.pipeline()
+        p.hset(_key(event.pk, subevent_id), mapping={
+            'version': version,
+            'built': occupancy.built,
+            'valid_until': valid_until,
+            'seat_ids': array('q', occupancy.seat_ids).tobytes(),
+            'guids': '\n'.join(occupancy.guids),
+            'product_ids': array('q', occupancy.product_ids).tobytes(),
+            'sold': occupancy.sold,
+            'reserved': occupancy.reserved,
+            'blocked': occupancy.blocked,
+        })
+        p.expire(_key(event.pk, subevent_id), KEY_TIMEOUT)
+        p.execute()
+    finally:
+        rc.delete(_build_lock_key(event.pk, subevent_id))
+    return occupancy
+
+
+def _flush(keys):
+    rc = django_redis.get_redis_connection("redis")
+    p = rc.pipeline()
+    for event_id, subevent_id in keys:
+        p.incr(_version_key(event_id, subevent_id))
+        p.expire(_version_key(event_id, subevent_id), KEY_TIMEOUT)
+    p.execute()
+
+
+_pending = OnCommitCounter(_flush)
+
+
+def invalidate(event_id, subevent_id=None, using=None):
+    """
+    Records that the occupancy of the given event or date has changed. The change is applied when the current database
+    transaction is committed.
+    """
+    if not occupancy_enabled():
+        return
+
+    _pending.add((event_id, subevent_id), using=using)
+
+
+def track_order(order, using=None):
+    """
+    Records that the positions of the given order might have changed their state, e.g. due to a status change.
+    """
+    if not occupancy_enabled():
+        return
+    for subevent_id in order.all_positions.filter(seat__isnull=False).values_list('subevent_id', flat=True).distinct():
+        invalidate(order.event_id, subevent_id, using=using)
@@ -19,11 +19,11 @@
 # You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
 # <https://www.gnu.org/licenses/>.
 #
-import sys
+import logging
 from collections import defaultdict
 from datetime import timedelta
 
-from django.db import transaction
+from django.db import connection, transaction
 from django.db.models import (
     Exists, F, OuterRef, Prefetch, Q, Sum, prefetch_related_objects,
 )
@@ -32,23 +32,55 @@ from django.utils.timezone import now
 from django_scopes import scopes_disabled
 
 from pretix.base.models import (
-    Event, EventMetaValue, SeatCategoryMapping, User, WaitingListEntry,
+    Event, EventMetaValue, LogEntry, SeatCategoryMapping, User, Voucher,
+    WaitingListEntry,
 )
-from pretix.base.models.waitinglist import WaitingListException
+from pretix.base.models.vouchers import generate_codes
+from pretix.base.services import quotacounters
 from pretix.base.services.locking import lock_objects
+from pretix.base.services.mail import SendMailException
+from pretix.base.services.quotas import QuotaAvailability
 from pretix.base.services.tasks import EventTask
 from pretix.base.signals import periodic_task
 from pretix.celery_app import app
 
+logger = logging.getLogger(__name__)
+
+
+# Vouchers and log entries are written to the database in chunks of this size
+VOUCHER_BATCH_SIZE = 500
+# Number of emails sent by one task after vouchers have been assigned
+MAIL_BATCH_SIZE = 100
+
+
+def _prefetch_event(event):
+    prefetch_related_objects(
+        [event.organizer],
+        'meta_properties'
+    )
+    prefetch_related_objects(
+        [event],
+        Prefetch(
+            'meta_values',
+            EventMetaValue.objects.select_related('property'),
+            to_attr='meta_values_cached'
+        )
+    )
+
 
 @app.task(base=EventTask)
 def assign_automatically(event: Event, user_id: int=None, subevent_id: int=None):
+    """
+    Assigns vouchers to as many waiting list entries as possible. Availability is computed once for all affected
+    quotas and seats, and entries are then served in order of priority with the remaining numbers tracked in memory.
+    The vouchers are created in bulk and the emails are sent by separate tasks after the transaction is committed, so
+    the quotas stay locked only for a short time.
+    """
     if user_id:
         user = User.objects.get(id=user_id)
     else:
         user = None
 
-    quota_cache = {}
     gone = set()
     _seats_available_cache = {}
     seats_used = defaultdict(int)
@@ -73,18 +105,7 @@ def assign_automatically(event: Event, user_id: int=None, subevent_id: int=None)
 
         return _seats_available_cache[item.pk, subevent_id] - seats_used[item.pk, subevent_id]
 
-    prefetch_related_objects(
-        [event.organizer],
-        'meta_properties'
-    )
-    prefetch_related_objects(
-        [event],
-        Prefetch(
-            'meta_values',
-            EventMetaValue.objects.select_related('property'),
-            to_attr='meta_values_cached'
-        )
-    )
+    _prefetch_event(event)
 
     qs = event.waitinglistentries.filter(
         voucher__isnull=True
@@ -96,12 +117,13 @@ def assign_automatically(event: Event, user_id: int=None, subevent_id: int=None)
         subevent = event.subevents.get(id=subevent_id)
         qs = qs.filter(subevent=subevent)
 
-    sent = 0
+    assigned = []
 
     with transaction.atomic(durable=True):
+        entries = list(qs)
         quotas_by_item = {}
         quotas = set()
-        for wle in qs:
+        for wle in entries:
             if (wle.item_id, wle.variation_id, wle.subevent_id) not in quotas_by_item:
                 quotas_by_item[wle.item_id, wle.variation_id, wle.subevent_id] = list(
                     wle.variation.quotas.filter(subevent=wle.subevent)
@@ -112,7 +134,14 @@ def assign_automatically(event: Event, user_id: int=None, subevent_id: int=None)
             quotas |= set(wle._quotas)
 
         lock_objects(quotas, shared_lock_objects=[event])
-        for wle in qs:
+
+        qa = QuotaAvailability(count_waitinglist=False, early_out=False)
+        qa.queue(*quotas)
+        qa.compute()
+        # Remaining number of tickets per quota, None meaning unlimited
+        headroom = {q.pk: qa.results[q][1] for q in quotas}
+
+        for wle in entries:
             if (wle.item_id, wle.variation_id, wle.subevent_id) in gone:
                 continue
             ev = (wle.subevent or event)
@@ -132,31 +161,72 @@ def assign_automatically(event: Event, user_id: int=None, subevent_id: int=None)
                     gone.add((wle.item_id, wle.variation_id, wle.subevent_id))
                     continue
 
-            availability = (
-                wle.variation.check_quotas(count_waitinglist=False, _cache=quota_cache, subevent=wle.subevent)
-                if wle.variation
-                else wle.item.check_quotas(count_waitinglist=False, _cache=quota_cache, subevent=wle.subevent)
-            )
-            if availability[1] is None or availability[1] > 0:
-                try:
-                    wle.send_voucher(quota_cache, user=user)
-                    sent += 1
-                except WaitingListException:  # noqa
-                    continue
+            if any(headroom[q.pk] is not None and headroom[q.pk] < 1 for q in wle._quotas):
+                gone.add((wle.item_id, wle.variation_id, wle.subevent_id))
+                continue
+            if wle._quotas and all(headroom[q.pk] is None for q in wle._quotas):
+                # WaitingListEntry.send_voucher() does not assign vouchers for unlimited quotas. Products without any
+                # quota are treated as having unlimited headroom, just like Item.check_quotas() does.
+                continue
+            if '@' not in wle.email:
+                # Anonymized entry, see WaitingListEntry.send_voucher()
+                continue
 
-                # Reduce affected quotas in cache
-                for q in wle._quotas:
-                    quota_cache[q.pk] = (
-                        quota_cache[q.pk][0] if quota_cache[q.pk][0] > 1 else 0,
-                        quota_cache[q.pk][1] - 1 if quota_cache[q.pk][1] is not None else sys.maxsize
-                    )
+            assigned.append(wle)
+            for q in wle._quotas:
+                if headroom[q.pk] is not None:
+                    headroom[q.pk] -= 1
+            if (wle.item_id, wle.subevent_id) in seated_product_set:
+                seats_used[wle.item_id, wle.subevent_id] += 1
+
+        codes = generate_codes(event.organizer, len(assigned))
+        for i in range(0, len(assigned), VOUCHER_BATCH_SIZE):
+            _create_vouchers(event, assigned[i:i + VOUCHER_BATCH_SIZE], codes[i:i + VOUCHER_BATCH_SIZE], user)
+
+    for i in range(0, len(assigned), MAIL_BATCH_SIZE):
+        send_voucher_mails.apply_async(
+            args=(event.pk, [wle.pk for wle in assigned[i:i + MAIL_BATCH_SIZE]], user.pk if user else None)
+        )
+
+    return len(assigned)
+
+
+def _create_vouchers(event, entries, codes, user):
+    vouchers = [wle.build_voucher(code=code) for wle, code in zip(entries, codes)]
+    Voucher.objects.bulk_create(vouchers)
+    if not connection.features.can_return_rows_from_bulk_insert:
+        by_code = {v.code: v for v in event.vouchers.filter(code__in=codes)}
+        vouchers = [by_code[v.code] for v in vouchers]
+
+    log_entries = []
+    for wle, v in zip(entries, vouchers):
+        quotacounters.track_voucher(None, v)
+        quotacounters.track_waitinglist_entry(wle, None)
+        wle.voucher = v
+        log_entries.append(
+            v.log_action('pretix.voucher.added.waitinglist', wle.voucher_log_data(v), user=user, save=False)
+        )
+    WaitingListEntry.objects.bulk_update(entries, ['voucher'])
+    LogEntry.bulk_create_and_postprocess(log_entries)
+    event.cache.set('vouchers_exist', True)
 
-                if (wle.item_id, wle.subevent_id) in seated_product_set:
-                    seats_used[wle.item_id, wle.subevent_id] += 1
-            else:
-                gone.add((wle.item_id, wle.variation_id, wle.subevent_id))
 
-    return sent
+@app.task(base=EventTask, acks_late=True)
+def send_voucher_mails(event: Event, entry_ids: list, user_id: int=None):
+    if user_id:
+        user = User.objects.get(id=user_id)
+    else:
+        user = None
+
+    _prefetch_event(event)
+    qs = event.waitinglistentries.filter(
+        pk__in=entry_ids, voucher__isnull=False
+    ).select_related('item', 'variation', 'subevent', 'voucher')
+    for wle in qs:
+        try:
+            wle.send_voucher_mail(user=user)
+        except SendMailException:
+            logger.exception('Could not send waiting list voucher to entry %s', wle.pk)
 
 
 @receiver(signal=periodic_task)
@@ -32,13 +32,16 @@
 # distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 # License for the specific language governing permissions and limitations under the License.
 
+import threading
+import time
 import warnings
+import weakref
 from typing import Any, Callable, List, Tuple
 
 import django.dispatch
 from django.apps import apps
 from django.conf import settings
-from django.dispatch.dispatcher import NO_RECEIVERS
+from django.dispatch.dispatcher import NO_RECEIVERS, NONE_ID
 
 from .models import Event
 
@@ -95,13 +98,110 @@ def is_receiver_active(sender, receiver):
     return is_app_active(sender, app)
 
 
+def _app_label(receiver):
+    app = get_defining_app(receiver)
+    if app == 'CORE':
+        return 'core'
+    return getattr(app, 'name', 'unknown')
+
+
 class EventPluginSignal(django.dispatch.Signal):
     """
     This is an extension to Django's built-in signals which differs in a way that it sends
     out it's events only to receivers which belong to plugins that are enabled for the given
     Event.
+
+    Since the set of active receivers only depends on the plugins enabled for the event, the sorted
+    list of active receivers is computed once per set of plugins and reused until receivers are
+    connected or disconnected.
     """
 
+    # Upper bound for the number of distinct plugin combinations we keep dispatch tables for
+    MAX_DISPATCH_TABLES = 1000
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._dispatch_tables = {}
+        self._dispatch_tables_lock = threading.Lock()
+
+    def connect(self, *args, **kwargs):
+        super().connect(*args, **kwargs)
+        self._dispatch_tables = {}
+
+    def disconnect(self, *args, **kwargs):
+        disconnected = super().disconnect(*args, **kwargs)
+        self._dispatch_tables = {}
+        return disconnected
+
+    def _remove_receiver(self, *args, **kwargs):
+        super()._remove_receiver(*args, **kwargs)
+        self._dispatch_tables = {}
+
+    def _dispatch_table(self, sender):
+        """
+        Returns a list of ``(receiver reference, app name)`` tuples for all receivers that are active for
+        the given sender, in the order they should be called in. Weak references are kept as they are,
+        so dispatch tables do not keep otherwise dead receivers alive.
+        """
+        if sender is None:
+            key = None
+        else:
+            key = (sender.plugins, tuple(settings.PRETIX_PLUGINS_EXCLUDE))
+
+        tables = self._dispatch_tables
+        table = tables.get(key)
+        if table is not None:
+            return table
+
+        if not app_cache:
+            _populate_app_cache()
+
+        with self.lock:
+            self._clear_dead_receivers()
+            entries = list(self.receivers)
+
+        if any(r_senderkey != NONE_ID for (receiverkey, r_senderkey), receiver in entries):
+            # Receivers connected to a specific sender are rare and can't be cached per plugin set
+            return [(receiver, _app_label(receiver)) for receiver in self._sorted_receivers(sender)
+                    if is_receiver_active(sender, receiver)]
+
+        table = []
+        for (receiverkey, r_senderkey), ref in entries:
+            receiver = ref() if isinstance(ref, weakref.ReferenceType) else ref
+            if receiver is None or not is_receiver_active(sender, receiver):
+                continue
+            table.append((ref, receiver, _app_label(receiver)))
+        table.sort(key=lambda entry: self._receiver_sort_key(entry[1]))
+        table = [(ref, app_name) for ref, receiver, app_name in table]
+
+        with self._dispatch_tables_lock:
+            if len(tables) >= self.MAX_DISPATCH_TABLES:
+                tables.clear()
+            tables[key] = table
+        return table
+
+    def _active_receivers(self, sender):
+        for ref, app_name in self._dispatch_table(sender):
+            receiver = ref() if isinstance(ref, weakref.ReferenceType) else ref
+            if receiver is not None:
+                yield receiver, app_name
+
+    def _call_receiver(self, receiver, app_name, sender, named):
+        if not settings.PRETIX_SIGNAL_RECEIVER_METRICS:
+            return receiver(signal=self, sender=sender, **named)
+
+        from .metrics import pretix_plugin_receiver_duration_seconds
+
+        t0 = time.perf_counter()
+        try:
+            return receiver(signal=self, sender=sender, **named)
+        finally:
+            pretix_plugin_receiver_duration_seconds.observe(
+                time.perf_counter() - t0,
+                plugin=app_name,
+                receiver=f'{receiver.__module__}.{getattr(receiver, "__name__", type(receiver).__name__)}',
+            )
+
     def send(self, sender: Event, **named) -> List[Tuple[Callable, Any]]:
         """
         Send signal from sender to all connected receivers that belong to
@@ -116,13 +216,9 @@ class EventPluginSignal(django.dispatch.Signal):
         if not self.receivers or self.sender_receivers_cache.get(sender) is NO_RECEIVERS:
             return responses
 
-        if not app_cache:
-            _populate_app_cache()
-
-        for receiver in self._sorted_receivers(sender):
-            if is_receiver_active(sender, receiver):
-                response = receiver(signal=self, sender=sender, **named)
-                responses.append((receiver, response))
+        for receiver, app_name in self._active_receivers(sender):
+            response = self._call_receiver(receiver, app_name, sender, named)
+            responses.append((receiver, response))
         return responses
 
     def send_chained(self, sender: Event, chain_kwarg_name, **named) -> List[Tuple[Callable, Any]]:
@@ -140,13 +236,9 @@ class EventPluginSignal(django.dispatch.Signal):
         if not self.receivers or self.sender_receivers_cache.get(sender) is NO_RECEIVERS:
             return response
 
-        if not app_cache:
-            _populate_app_cache()
-
-        for receiver in self._sorted_receivers(sender):
-            if is_receiver_active(sender, receiver):
-                named[chain_kwarg_name] = response
-                response = receiver(signal=self, sender=sender, **named)
+        for receiver, app_name in self._active_receivers(sender):
+            named[chain_kwarg_name] = response
+            response = self._call_receiver(receiver, app_name, sender, named)
         return response
 
     def send_robust(self, sender: Event, **named) -> List[Tuple[Callable, Any]]:
@@ -167,28 +259,28 @@ class EventPluginSignal(django.dispatch.Signal):
         ):
             return []
 
-        if not app_cache:
-            _populate_app_cache()
-
-        for receiver in self._sorted_receivers(sender):
-            if is_receiver_active(sender, receiver):
-                try:
-                    response = receiver(signal=self, sender=sender, **named)
-                except Exception as err:
-                    responses.append((receiver, err))
-                else:
-                    responses.append((receiver, response))
+        for receiver, app_name in self._active_receivers(sender):
+            try:
+                response = self._call_receiver(receiver, app_name, sender, named)
+            except Exception as err:
+                responses.append((receiver, err))
+            else:
+                responses.append((receiver, response))
         return responses
 
+    @staticmethod
+    def _receiver_sort_key(receiver):
+        return (
+            0 if any(receiver.__module__.startswith(m) for m in settings.CORE_MODULES) else 1,
+            receiver.__module__,
+            receiver.__name__,
+        )
+
     def _sorted_receivers(self, sender):
         orig_list = self._live_receivers(sender)
         sorted_list = sorted(
             orig_list,
-            key=lambda receiver: (
-                0 if any(receiver.__module__.startswith(m) for m in settings.CORE_MODULES) else 1,
-                receiver.__module__,
-                receiver.__name__,
-            )
+            key=self._receiver_sort_key
         )
         return sorted_list
 
@@ -697,10 +697,16 @@ class WebHookForm(forms.ModelForm):
         ]
         if self.instance and self.instance.pk:
             self.fields['events'].initial = list(self.instance.listeners.values_list('action_type', flat=True))
+        self.fields['batch_delay'].required = False
+
+    def clean_batch_delay(self):
+        if self.cleaned_data.get('batch_delay') is None:
+            return WebHook._meta.get_field('batch_delay').default
+        return self.cleaned_data['batch_delay']
 
     class Meta:
         model = WebHook
-        fields = ['target_url', 'enabled', 'all_events', 'limit_events', 'comment']
+        fields = ['target_url', 'enabled', 'all_events', 'limit_events', 'comment', 'batch_size', 'batch_delay']
         widgets = {
             'limit_events': forms.CheckboxSelectMultiple(attrs={
                 'data-inverse-dependency': '#id_all_events',
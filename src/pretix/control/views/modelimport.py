@@ -45,10 +45,9 @@ from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 from django.views.generic import FormView, TemplateView
 
+from pretix.base.modelimport import parse_csv
 from pretix.base.models import CachedFile
-from pretix.base.services.modelimport import (
-    import_orders, import_vouchers, parse_csv,
-)
+from pretix.base.services.modelimport import import_orders, import_vouchers
 from pretix.base.views.tasks import AsyncAction
 from pretix.control.forms.modelimport import (
     OrdersProcessForm, VouchersProcessForm,
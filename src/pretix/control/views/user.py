@@ -67,6 +67,9 @@ from pretix.base.models import (
 )
 from pretix.base.models.auth import StaffSession
 from pretix.base.notifications import get_all_notification_types
+from pretix.base.services.notifications import (
+    invalidate_notification_recipients,
+)
 from pretix.control.forms.users import StaffSessionForm
 from pretix.control.permissions import (
     AdministratorPermissionRequiredMixin, StaffMemberRequiredMixin,
@@ -748,6 +751,8 @@ class UserNotificationsEditView(TemplateView):
                             event=self.event, action_type=at, method=method
                         ).update(enabled=True)
 
+            # The bulk updates and deletes above bypass the signals that usually take care of this
+            invalidate_notification_recipients()
             messages.success(request, _('Your notification settings have been saved.'))
             self.request.user.log_action('pretix.user.settings.notifications.changed', user=self.request.user)
             return redirect(
@@ -51,6 +51,7 @@ from django.views.generic import ListView
 
 from pretix.base.models import Item, LogEntry, Quota, WaitingListEntry
 from pretix.base.models.waitinglist import WaitingListException
+from pretix.base.services import seatoccupancy
 from pretix.base.services.waitinglist import assign_automatically
 from pretix.base.views.tasks import AsyncAction
 from pretix.control.forms.waitinglist import WaitingListEntryTransferForm
@@ -242,6 +243,7 @@ class WaitingListView(EventPermissionRequiredMixin, WaitingListQuerySetMixin, Pa
 
         itemvar_cache = {}
         quota_cache = {}
+        free_seats_cache = {}
         any_avail = False
         for wle in ctx[self.context_object_name]:
             if (wle.item, wle.variation, wle.subevent) in itemvar_cache:
@@ -263,7 +265,11 @@ class WaitingListView(EventPermissionRequiredMixin, WaitingListQuerySetMixin, Pa
                     )
                 if wle.availability[0] == Quota.AVAILABILITY_OK and ev.seat_category_mappings.filter(product=wle.item).exists():
                     # See comment in WaitingListEntry.send_voucher() for rationale
-                    num_free_seats_for_product = ev.free_seats().filter(product=wle.item).count()
+                    if wle.subevent_id not in free_seats_cache:
+                        free_seats_cache[wle.subevent_id] = seatoccupancy.read(
+                            self.request.event, wle.subevent
+                        ).free_seats_by_product(self.request.event, wle.subevent)
+                    num_free_seats_for_product = free_seats_cache[wle.subevent_id][wle.item_id]
                     num_valid_vouchers_for_product = self.request.event.vouchers.filter(
                         Q(valid_until__isnull=True) | Q(valid_until__gte=now()),
                         block_quota=True,
@@ -0,0 +1,162 @@
+#
+# This file is part of pretix (Community Edition).
+#
+# Copyright (C) 2014-2020 Raphael Michel and contributors
+# Copyright (C) 2020-2021 rami.io GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+#
+"""
+Writers for typed, compressed columnar export files (Apache Parquet and Arrow IPC). These require the optional
+``pyarrow`` dependency.
+
+Rows are spooled to a temporary file first, so that the type of every column can be inferred from all of its values
+before the first record batch is written. Memory usage is therefore bounded by the batch size, not the size of the
+export.
+"""
+import pickle
+import tempfile
+from datetime import date, datetime, time, timezone
+from decimal import Decimal
+
+from pretix.helpers.iter import chunked_iterable
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+FORMAT_PARQUET = 'parquet'
+FORMAT_ARROW = 'arrow'
+BATCH_SIZE = 10000
+
+
+def columnar_formats_available():
+    return pyarrow is not None
+
+
+def _kind(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        return bool
+    if isinstance(value, int):
+        return int if -2 ** 63 <= value < 2 ** 63 else Decimal
+    if isinstance(value, Decimal):
+        return Decimal if value.is_finite() else str
+    if isinstance(value, datetime):
+        return datetime if value.tzinfo else str
+    if isinstance(value, date):
+        return date
+    if isinstance(value, time):
+        return time if not value.tzinfo else str
+    return str
+
+
+class _Column:
+    def __init__(self, name):
+        self.name = name
+        self.kinds = set()
+        self.scale = 0
+        self.digits = 0
+
+    def observe(self, value):
+        kind = _kind(value)
+        if kind is None:
+            return
+        self.kinds.add(kind)
+        if kind is Decimal:
+            sign, digits, exponent = Decimal(value).as_tuple()
+            self.scale = max(self.scale, -exponent)
+            self.digits = max(self.digits, len(digits) + exponent)
+
+    @property
+    def type(self):
+        if self.kinds == {bool}:
+            return pyarrow.bool_()
+        if self.kinds == {int}:
+            return pyarrow.int64()
+        if self.kinds and self.kinds <= {int, Decimal}:
+            if self.digits + self.scale <= 38:
+                return pyarrow.decimal128(max(self.digits + self.scale, 1), self.scale)
+        if self.kinds == {datetime}:
+            return pyarrow.timestamp('us', tz='UTC')
+        if self.kinds == {date}:
+            return pyarrow.date32()
+        if self.kinds == {time}:
+            return pyarrow.time64('us')
+        return pyarrow.string()
+
+    def convert(self, values, type):
+        if pyarrow.types.is_string(type):
+            return [None if v is None else str(v) for v in values]
+        if pyarrow.types.is_decimal(type):
+            return [None if _kind(v) is None else Decimal(v) for v in values]
+        if pyarrow.types.is_timestamp(type):
+            return [None if _kind(v) is None else v.astimezone(timezone.utc) for v in values]
+        return [None if _kind(v) is None else v for v in values]
+
+
+def _unique_names(headers):
+    seen = set()
+    names = []
+    for h in headers:
+        name = str(h)
+        i = 2
+        while name in seen:
+            name = f'{h} ({i})'
+            i += 1
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def write_columnar(headers, rows, output_file, fmt=FORMAT_PARQUET):
+    """
+    Writes the given rows to ``output_file`` as a Parquet or Arrow IPC file with one column per header.
+    """
+    columns = [_Column(n) for n in _unique_names(headers)]
+    with tempfile.TemporaryFile() as spool:
+        count = 0
+        for row in rows:
+            row = [v if _kind(v) in (None, bool, int, Decimal, datetime, date, time) else str(v) for v in row]
+            while len(row) > len(columns):
+                columns.append(_Column(f'Column {len(columns) + 1}'))
+            for c, v in zip(columns, row):
+                c.observe(v)
+            pickle.dump(row, spool, protocol=pickle.HIGHEST_PROTOCOL)
+            count += 1
+
+        schema = pyarrow.schema([(c.name, c.type) for c in columns])
+        if fmt == FORMAT_PARQUET:
+            writer = pyarrow.parquet.ParquetWriter(output_file, schema, compression='zstd')
+        else:
+            writer = pyarrow.ipc.new_file(output_file, schema, options=pyarrow.ipc.IpcWriteOptions(compression='zstd'))
+
+        spool.seek(0)
+        try:
+            for batch in chunked_iterable((pickle.load(spool) for i in range(count)), BATCH_SIZE):
+                arrays = []
+                for i, (c, field) in enumerate(zip(columns, schema)):
+                    arrays.append(pyarrow.array(
+                        c.convert([r[i] if i < len(r) else None for r in batch], field.type),
+                        type=field.type
+                    ))
+                writer.write_batch(pyarrow.record_batch(arrays, schema=schema))
+        finally:
+            writer.close()
@@ -19,7 +19,15 @@
 # You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
 # <https://www.gnu.org/licenses/>.
 #
+import collections
+import contextvars
 import itertools
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections
+from django.utils import timezone, translation
 
 
 def chunked_iterable(iterable, size):
@@ -29,3 +37,94 @@ def chunked_iterable(iterable, size):
         if not chunk:
             break
         yield chunk
+
+
+def _in_thread(func):
+    """
+    Wraps ``func`` to run in a worker thread with a copy of the calling thread's context (active language, timezone,
+    django-scopes state) and with the worker thread's database connections being closed afterwards.
+    """
+    ctx = contextvars.copy_context()
+    # Django keeps these thread-local even though they are stored in context variables
+    lng = translation.get_language()
+    tz = timezone.get_current_timezone()
+
+    def run(*args):
+        with translation.override(lng), timezone.override(tz):
+            return func(*args)
+
+    def wrapped(*args):
+        try:
+            return ctx.copy().run(run, *args)
+        finally:
+            connections.close_all()
+    return wrapped
+
+
+def ordered_parallel_map(func, iterable, workers):
+    """
+    Like ``map(func, iterable)``, but calls ``func`` in up to ``workers`` threads concurrently. Results are yielded in
+    the order of ``iterable``, and only a small number of results is computed ahead of the consumer. Every thread uses
+    its own database connection, so ``func`` must not rely on uncommitted data of the calling thread.
+    """
+    if workers <= 1:
+        yield from map(func, iterable)
+        return
+
+    func = _in_thread(func)
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        try:
+            for item in iterable:
+                pending.append(pool.submit(func, item))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for f in pending:
+                f.cancel()
+
+
+def iterate_in_background(iterable, buffer_size=1000):
+    """
+    Evaluates ``iterable`` in a separate thread and yields its items, buffering up to ``buffer_size`` of them. This
+    allows the producer (e.g. database queries) and the consumer (e.g. file output) to make progress concurrently.
+    Exceptions raised by the producer are re-raised in the consumer.
+    """
+    q = queue.Queue(maxsize=buffer_size)
+    stopped = threading.Event()
+    done = object()
+
+    def _put(item):
+        while not stopped.is_set():
+            try:
+                q.put(item, timeout=.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not _put((item, None)):
+                    return
+        except Exception as e:
+            _put((done, e))
+        else:
+            _put((done, None))
+
+    t = threading.Thread(target=_in_thread(produce), daemon=True)
+    t.start()
+    try:
+        while True:
+            item, exc = q.get()
+            if item is done:
+                if exc:
+                    raise exc
+                return
+            yield item
+    finally:
+        stopped.set()
+        t.join()
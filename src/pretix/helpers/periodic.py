@@ -20,15 +20,26 @@
 # <https://www.gnu.org/licenses/>.
 #
 import logging
+import time
 import uuid
+from collections import namedtuple
 from functools import wraps
 
+from django.conf import settings
 from django.core.cache import cache
 
 logger = logging.getLogger(__name__)
 
 SKIPPED = object()
 
+MinimumInterval = namedtuple('MinimumInterval', (
+    'minutes_after_success', 'minutes_after_error', 'minutes_running_timeout', 'key_running', 'key_result'
+))
+
+
+def receiver_name(receiver):
+    return f'{receiver.__module__}.{receiver.__name__}'
+
 
 def minimum_interval(minutes_after_success, minutes_after_error=0, minutes_running_timeout=30):
     """
@@ -37,27 +48,27 @@ def minimum_interval(minutes_after_success, minutes_after_error=0, minutes_runni
     isn't executed less than ``minutes_after_success`` after the last successful run and no less
     than ``minutes_after_error`` after the last failed run. There's also a simple locking mechanism
     implemented making sure the function is not called a second time while it is running, unless
-    ``minutes_running_timeout`` have passed. This locking mechanism is naive and not safe of
-    race-conditions, it should not be relied upon.
+    ``minutes_running_timeout`` have passed. The lock is only reliable if the cache backend supports
+    atomic ``add()`` operations (e.g. redis).
+
+    The configuration is available as the ``minimum_interval`` attribute of the decorated function,
+    see also :py:func:`is_due`.
     """
     def deco(f):
+        key_running = f'pretix_periodic_{f.__module__}.{f.__name__}_running'
+        key_result = f'pretix_periodic_{f.__module__}.{f.__name__}_result'
+
         @wraps(f)
         def wrapper(*args, **kwargs):
-            key_running = f'pretix_periodic_{f.__module__}.{f.__name__}_running'
-            key_result = f'pretix_periodic_{f.__module__}.{f.__name__}_result'
-
-            running_val = cache.get(key_running)
-            if running_val:
-                # Currently running
-                return SKIPPED
-
             result_val = cache.get(key_result)
             if result_val:
                 # Has run recently
                 return SKIPPED
 
             uniqid = str(uuid.uuid4())
-            cache.set(key_running, uniqid, timeout=minutes_running_timeout * 60)
+            if not cache.add(key_running, uniqid, timeout=minutes_running_timeout * 60):
+                # Currently running
+                return SKIPPED
             try:
                 retval = f(*args, **kwargs)
             except Exception as e:
@@ -79,6 +90,55 @@ def minimum_interval(minutes_after_success, minutes_after_error=0, minutes_runni
                 except:
                     logger.exception('Could not release lock')
 
+        wrapper.minimum_interval = MinimumInterval(
+            minutes_after_success, minutes_after_error, minutes_running_timeout, key_running, key_result
+        )
         return wrapper
 
     return deco
+
+
+def is_due(receiver):
+    """
+    Returns ``False`` if the given receiver is decorated with :py:func:`minimum_interval` and would
+    currently skip its execution.
+    """
+    interval = getattr(receiver, 'minimum_interval', None)
+    if not interval:
+        return True
+    return not cache.get(interval.key_result) and not cache.get(interval.key_running)
+
+
+def record_run(name, status, duration=None):
+    """
+    Records the outcome (``success``, ``skipped`` or ``error``) of a periodic task in the metrics.
+    """
+    from pretix.base.metrics import (
+        pretix_periodic_task_duration_seconds, pretix_periodic_task_runs_total,
+    )
+
+    if not settings.METRICS_ENABLED:
+        return
+    pretix_periodic_task_runs_total.inc(1, task_name=name, status=status)
+    if duration is not None:
+        pretix_periodic_task_duration_seconds.observe(duration, task_name=name)
+
+
+def run_receiver(receiver, sender=None):
+    """
+    Calls a receiver of the ``periodic_task`` signal and records its duration and outcome.
+    """
+    from pretix.base.signals import periodic_task
+
+    name = receiver_name(receiver)
+    t0 = time.perf_counter()
+    try:
+        r = receiver(signal=periodic_task, sender=sender)
+    except Exception:
+        record_run(name, 'error', time.perf_counter() - t0)
+        raise
+    if r is SKIPPED:
+        record_run(name, 'skipped')
+    else:
+        record_run(name, 'success', time.perf_counter() - t0)
+    return r
@@ -103,56 +103,113 @@ def cancel_old_payments(order):
             )
 
 
-def _find_order_for_code(base_qs, code):
-    try_codes = [
+# Number of transactions whose matches are resolved and processed at once
+MATCH_CHUNK_SIZE = 500
+
+# Maximum number of invoice number candidates looked up in a single query
+INVOICE_LOOKUP_BATCH_SIZE = 50
+
+
+def _code_candidates(code):
+    return [
         code,
         Order.normalize_code(code, is_fallback=True),
         code[:settings.ENTROPY['order_code']],
         Order.normalize_code(code[:settings.ENTROPY['order_code']], is_fallback=True)
     ]
-    for c in try_codes:
-        try:
-            return base_qs.get(code=c)
-        except Order.DoesNotExist:
-            pass
 
 
-def _find_order_for_invoice_id(base_qs, prefix, number):
-    try:
-        # Working with __iregex here is an experiment, if this turns out to be too slow in production
-        # we might need to switch to a different approach.
-        return base_qs.select_related('order').get(
-            prefix__istartswith=prefix,  # redundant, but hopefully makes it a little faster
-            full_invoice_no__iregex=prefix + r'[\- ]*0*' + number
-        ).order
-    except (Invoice.DoesNotExist, Invoice.MultipleObjectsReturned):
-        pass
+def _invoice_id_regex(prefix, number):
+    return prefix + r'[\- ]*0*' + number
 
 
-@transaction.atomic
-def _handle_transaction(trans: BankTransaction, matches: tuple, event: Event = None, organizer: Organizer = None):
-    orders = []
-    if event:
-        for slug, code in matches:
-            order = _find_order_for_code(event.orders, code)
+class OrderMatcher:
+    """
+    Resolves the order codes and invoice numbers found in bank transaction references to orders. All candidates
+    of a batch of transactions are looked up with a few bulk queries in ``prefetch`` instead of several queries
+    per transaction.
+    """
+
+    def __init__(self, event: Event = None, organizer: Organizer = None):
+        self.event = event
+        self.organizer = organizer
+        self._orders = {}
+        self._invoice_orders = {}
+        self._handed_out = set()
+
+    def _order_key(self, slug, code):
+        # Within an event, the order code is unique. Otherwise, the matched prefix must be the event's slug.
+        return code if self.event else (slug.lower(), code)
+
+    def prefetch(self, matches):
+        matches = set(matches)
+        codes = {c for slug, code in matches for c in _code_candidates(code)}
+        if self.event:
+            qs = self.event.orders.filter(code__in=codes)
+        else:
+            qs = Order.objects.filter(event__organizer=self.organizer, code__in=codes).select_related('event')
+        for o in qs:
+            self._orders[o.code if self.event else (o.event.slug.lower(), o.code)] = o
+
+        unresolved = sorted(m for m in matches if self._find_order_for_code(*m) is None)
+        if self.event:
+            invoice_qs = Invoice.objects.filter(event=self.event)
+        else:
+            invoice_qs = Invoice.objects.filter(event__organizer=self.organizer)
+        for i in range(0, len(unresolved), INVOICE_LOOKUP_BATCH_SIZE):
+            batch = unresolved[i:i + INVOICE_LOOKUP_BATCH_SIZE]
+            q = Q()
+            for prefix, number in batch:
+                # Working with __iregex here is an experiment, if this turns out to be too slow in production
+                # we might need to switch to a different approach.
+                q |= Q(
+                    prefix__istartswith=prefix,  # redundant, but hopefully makes it a little faster
+                    full_invoice_no__iregex=_invoice_id_regex(prefix, number)
+                )
+            invoices = list(invoice_qs.filter(q).select_related('order'))
+            for prefix, number in batch:
+                regex = re.compile(_invoice_id_regex(prefix, number), re.IGNORECASE)
+                candidates = [
+                    inv for inv in invoices
+                    if inv.prefix.lower().startswith(prefix.lower()) and regex.search(inv.full_invoice_no)
+                ]
+                # Only use unambiguous matches
+                if len(candidates) == 1:
+                    self._invoice_orders[prefix, number] = candidates[0].order
+
+    def _find_order_for_code(self, slug, code):
+        for c in _code_candidates(code):
+            order = self._orders.get(self._order_key(slug, c))
             if order:
-                if order.code not in {o.code for o in orders}:
-                    orders.append(order)
-            else:
-                order = _find_order_for_invoice_id(Invoice.objects.filter(event=event), slug, code)
-                if order and order.code not in {o.code for o in orders}:
-                    orders.append(order)
-    else:
-        qs = Order.objects.filter(event__organizer=organizer)
+                return order
+
+    def resolves(self, matches):
+        return any(
+            self._find_order_for_code(slug, code) or self._invoice_orders.get((slug, code))
+            for slug, code in matches
+        )
+
+    def orders_for(self, matches):
+        orders = []
         for slug, code in matches:
-            order = _find_order_for_code(qs.filter(event__slug__iexact=slug), code)
-            if order:
-                if order.code not in {o.code for o in orders}:
-                    orders.append(order)
-            else:
-                order = _find_order_for_invoice_id(Invoice.objects.filter(event__organizer=organizer), slug, code)
-                if order and order.code not in {o.code for o in orders}:
-                    orders.append(order)
+            order = self._find_order_for_code(slug, code) or self._invoice_orders.get((slug, code))
+            if order and order.code not in {o.code for o in orders}:
+                orders.append(order)
+        for order in orders:
+            if order.pk in self._handed_out:
+                # An earlier transaction of this batch might have changed the order
+                order.refresh_from_db()
+            self._handed_out.add(order.pk)
+        return orders
+
+
+@transaction.atomic
+def _handle_transaction(trans: BankTransaction, matches: tuple, event: Event = None, organizer: Organizer = None,
+                        matcher: OrderMatcher = None):
+    if not matcher:
+        matcher = OrderMatcher(event=event, organizer=organizer)
+        matcher.prefetch(matches)
+    orders = matcher.orders_for(matches)
 
     if not orders:
         # No match
@@ -311,6 +368,7 @@ def _get_unknown_transactions(job: BankImportJob, data: list, event: Event = Non
     known_by_external_id = set((t['external_id'], t['date'], t['amount']) for t in BankTransaction.objects.filter(
         Q(event=event) if event else Q(organizer=organizer), external_id__isnull=False
     ).values('external_id', 'date', 'amount'))
+    region = (event and event.settings.region) or (organizer and organizer.settings.region) or None
 
     transactions = []
     for row in data:
@@ -339,15 +397,28 @@ def _get_unknown_transactions(job: BankImportJob, data: list, event: Event = Non
                                 external_id=row.get('external_id'),
                                 currency=event.currency if event else job.currency)
 
-        trans.date_parsed = parse_date(trans.date, (event and event.settings.region) or (organizer and organizer.settings.region) or None)
+        trans.date_parsed = parse_date(trans.date, region)
 
         trans.checksum = trans.calculate_checksum()
         if trans.checksum not in known_checksums and (not trans.external_id or (trans.external_id, trans.date, trans.amount) not in known_by_external_id):
             trans.state = BankTransaction.STATE_UNCHECKED
-            trans.save()
             transactions.append(trans)
 
-    return transactions
+    return BankTransaction.objects.bulk_create(transactions, batch_size=MATCH_CHUNK_SIZE)
+
+
+def _find_matches(pattern, reference):
+    # Whitespace in references is unreliable since linebreaks and spaces can occur almost anywhere, e.g.
+    # DEMOCON-123\n45 should be matched to DEMOCON-12345. However, sometimes whitespace is important,
+    # e.g. when there are two references. "DEMOCON-12345 DEMOCON-45678" would otherwise be parsed as
+    # "DEMOCON-12345DE" in some conditions. We'll naively take whatever has more matches.
+    matches_with_whitespace = pattern.findall(reference.replace("\n", " ").upper())
+    matches_without_whitespace = pattern.findall(reference.replace(" ", "").replace("\n", "").upper())
+
+    if len(matches_without_whitespace) > len(matches_with_whitespace):
+        return matches_without_whitespace
+    else:
+        return matches_with_whitespace
 
 
 @app.task(base=TransactionAwareTask, bind=True, max_retries=5, default_retry_delay=1)
@@ -394,27 +465,30 @@ def process_banktransfers(self, job: int, data: list) -> None:
                     )
                 )
 
-                for trans in transactions:
-                    # Whitespace in references is unreliable since linebreaks and spaces can occur almost anywhere, e.g.
-                    # DEMOCON-123\n45 should be matched to DEMOCON-12345. However, sometimes whitespace is important,
-                    # e.g. when there are two references. "DEMOCON-12345 DEMOCON-45678" would otherwise be parsed as
-                    # "DEMOCON-12345DE" in some conditions. We'll naively take whatever has more matches.
-                    matches_with_whitespace = pattern.findall(trans.reference.replace("\n", " ").upper())
-                    matches_without_whitespace = pattern.findall(trans.reference.replace(" ", "").replace("\n", "").upper())
-
-                    if len(matches_without_whitespace) > len(matches_with_whitespace):
-                        matches = matches_without_whitespace
-                    else:
-                        matches = matches_with_whitespace
-
-                    if matches:
-                        if job.event:
-                            _handle_transaction(trans, matches, event=job.event)
+                def set_progress(percent):
+                    if not self.request.called_directly:
+                        self.update_state(
+                            state='PROGRESS',
+                            meta={'value': percent}
+                        )
+
+                for i in range(0, len(transactions), MATCH_CHUNK_SIZE):
+                    chunk = [(trans, _find_matches(pattern, trans.reference))
+                             for trans in transactions[i:i + MATCH_CHUNK_SIZE]]
+
+                    matcher = OrderMatcher(**job.owner_kwargs)
+                    matcher.prefetch(m for trans, matches in chunk for m in matches)
+
+                    nomatch = []
+                    for trans, matches in chunk:
+                        if matches and matcher.resolves(matches):
+                            _handle_transaction(trans, matches, matcher=matcher, **job.owner_kwargs)
                         else:
-                            _handle_transaction(trans, matches, organizer=job.organizer)
-                    else:
-                        trans.state = BankTransaction.STATE_NOMATCH
-                        trans.save()
+                            trans.state = BankTransaction.STATE_NOMATCH
+                            nomatch.append(trans.pk)
+                    BankTransaction.objects.filter(pk__in=nomatch).update(state=BankTransaction.STATE_NOMATCH)
+
+                    set_progress(100 * (i + len(chunk)) / len(transactions))
             except LockTimeoutException:
                 try:
                     self.retry()
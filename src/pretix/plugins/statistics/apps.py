@@ -41,3 +41,8 @@ class StatisticsApp(AppConfig):
 
     def ready(self):
         from . import signals  # NOQA
+
+    def uninstalled(self, event):
+        # Rollups are not maintained while the plugin is disabled, so they need to be rebuilt when it comes back
+        from .rollups import clear
+        clear(event)
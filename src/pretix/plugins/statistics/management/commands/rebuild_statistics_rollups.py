@@ -0,0 +1,49 @@
+#
+# This file is part of pretix (Community Edition).
+#
+# Copyright (C) 2014-2020 Raphael Michel and contributors
+# Copyright (C) 2020-2021 rami.io GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+#
+from django.core.management.base import BaseCommand
+from django_scopes import scopes_disabled
+from tqdm import tqdm
+
+from pretix.base.models import Event
+from pretix.plugins.statistics import rollups
+
+
+class Command(BaseCommand):
+    help = "Build the pre-aggregated sales statistics of all events using the statistics plugin"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--missing-only",
+            action="store_true",
+            help="Only build statistics of events that do not have them yet.",
+        )
+
+    @scopes_disabled()
+    def handle(self, *args, **options):
+        qs = Event.objects.filter(plugins__icontains="pretix.plugins.statistics").order_by("pk")
+        for event in tqdm(qs, total=qs.count()):
+            if "pretix.plugins.statistics" not in event.get_plugins():
+                continue
+            if options["missing_only"] and rollups.is_built(event):
+                continue
+            if not rollups.rebuild(event):
+                self.stderr.write(f"Skipped event {event.pk}, its statistics are currently being built elsewhere.")
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.30 on 2026-10-18 05:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('pretixbase', '0281_event_is_remote'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollupStatus',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False)),
+                ('built', models.DateTimeField()),
+                ('event', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pretixbase.event')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='OrderRollupContribution',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False)),
+                ('data', models.JSONField(default=dict)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pretixbase.event')),
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pretixbase.order')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('orders_placed', models.IntegerField(default=0)),
+                ('orders_paid', models.IntegerField(default=0)),
+                ('positions_placed', models.IntegerField(default=0)),
+                ('positions_paid', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=13)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pretixbase.event')),
+                ('item', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pretixbase.item')),
+                ('subevent', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pretixbase.subevent')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['event', 'subevent', 'item', 'date'], name='statistics__event_i_707d38_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('statistics', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='salesrollupstatus',
+            name='reconciled',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
@@ -0,0 +1,68 @@
+#
+# This file is part of pretix (Community Edition).
+#
+# Copyright (C) 2014-2020 Raphael Michel and contributors
+# Copyright (C) 2020-2021 rami.io GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+#
+from django.db import models
+
+
+class SalesRollup(models.Model):
+    """
+    Pre-aggregated sales numbers of an event, maintained by ``pretix.plugins.statistics.rollups``.
+
+    Rows with ``item`` set to ``None`` contain order-level numbers. Of those, rows with ``subevent`` set to
+    ``None`` count all orders of the event, while rows with a subevent only count orders containing at least
+    one position of that subevent. Rows with an ``item`` contain position-level numbers for this product and
+    the subevent of the positions. The same combination might occur in multiple rows, so all readers need to
+    sum them up.
+    """
+    event = models.ForeignKey('pretixbase.Event', on_delete=models.CASCADE, related_name='+')
+    subevent = models.ForeignKey('pretixbase.SubEvent', null=True, on_delete=models.CASCADE, related_name='+')
+    item = models.ForeignKey('pretixbase.Item', null=True, on_delete=models.CASCADE, related_name='+')
+    date = models.DateField()
+    orders_placed = models.IntegerField(default=0)
+    orders_paid = models.IntegerField(default=0)
+    positions_placed = models.IntegerField(default=0)
+    positions_paid = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=13, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["event", "subevent", "item", "date"]),
+        ]
+
+
+class OrderRollupContribution(models.Model):
+    """
+    Remembers what an order currently contributes to the ``SalesRollup`` rows of its event, so that a change
+    to the order can be applied as a difference.
+    """
+    event = models.ForeignKey('pretixbase.Event', on_delete=models.CASCADE, related_name='+')
+    order = models.OneToOneField('pretixbase.Order', on_delete=models.CASCADE, related_name='+')
+    data = models.JSONField(default=dict)
+
+
+class SalesRollupStatus(models.Model):
+    """
+    Exists for every event whose ``SalesRollup`` rows have been built and are maintained incrementally.
+    ``reconciled`` is the point in time up to which all modified orders have been applied again.
+    """
+    event = models.OneToOneField('pretixbase.Event', on_delete=models.CASCADE, related_name='+')
+    built = models.DateTimeField()
+    reconciled = models.DateTimeField(null=True)
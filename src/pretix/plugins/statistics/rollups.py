@@ -0,0 +1,375 @@
+#
+# This file is part of pretix (Community Edition).
+#
+# Copyright (C) 2014-2020 Raphael Michel and contributors
+# Copyright (C) 2020-2021 rami.io GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+#
+"""
+Maintains the pre-aggregated ``SalesRollup`` rows the statistics plugin reads from.
+
+For every order, we compute its *contribution* to the rollups from its current state and remember it in an
+``OrderRollupContribution``. Whenever an order changes, we compute its contribution again and apply the
+difference to the rollup rows. This keeps the rollups correct no matter which part of an order changed, at the
+cost of three small queries per order change. Events only get rollups maintained once they have been built
+from scratch, which happens in a background task queued on first use of the statistics page or through the
+``rebuild_statistics_rollups`` management command.
+
+A rebuild reads the orders without holding any lock and only blocks incremental updates while it writes the new
+rows. Afterwards, all orders that have been modified since the rebuild started are applied again, which covers
+changes the rebuild did not see as well as updates that have been skipped because the rollups were not built yet.
+Since not every change to an order is signalled, a periodic task applies all orders modified since the last run
+in the same way.
+"""
+import datetime
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import DateTimeField, F, Max, OuterRef, Q, Subquery, Sum
+from django.utils.timezone import now
+
+from pretix.base.models import Order, OrderPayment, OrderPosition
+from pretix.base.services.locking import LOCK_TRUST_WINDOW
+
+from .models import OrderRollupContribution, SalesRollup, SalesRollupStatus
+
+FIELDS = ('orders_placed', 'orders_paid', 'positions_placed', 'positions_paid', 'revenue')
+
+REBUILD_TIMEOUT = 3600
+UPDATE_CHUNK_SIZE = 500
+
+# Distinguishes our advisory locks from the ones of other applications sharing the database. The two-key form of
+# the advisory lock functions does not overlap with the single-key form used by pretix.base.services.locking.
+ADVISORY_LOCK_CLASS = 0x5354  # "ST"
+
+
+def _key(subevent_id, item_id, date):
+    return '{}|{}|{}'.format(subevent_id or '', item_id or '', date.isoformat())
+
+
+def _parse_key(key):
+    subevent_id, item_id, date = key.split('|')
+    return int(subevent_id) if subevent_id else None, int(item_id) if item_id else None, datetime.date.fromisoformat(date)
+
+
+def _zero():
+    return [0, 0, 0, 0, Decimal('0.00')]
+
+
+def _serialize(rows):
+    return {k: v[:4] + [str(v[4])] for k, v in rows.items()}
+
+
+def _deserialize(data):
+    return {k: v[:4] + [Decimal(v[4])] for k, v in data.items()}
+
+
+def compute_contributions(event, order_ids=None):
+    """
+    Returns what the given orders, or all orders of the event, contribute to the rollups as a dictionary mapping
+    order IDs to dictionaries mapping row keys to a list of values in the order of ``FIELDS``.
+    """
+    tz = event.timezone
+    p_date = OrderPayment.objects.filter(
+        order=OuterRef('pk'),
+        state__in=(OrderPayment.PAYMENT_STATE_CONFIRMED, OrderPayment.PAYMENT_STATE_REFUNDED),
+        payment_date__isnull=False
+    ).values('order').annotate(
+        m=Max('payment_date')
+    ).values(
+        'm'
+    ).order_by()
+
+    oqs = Order.objects.filter(event=event)
+    pqs = OrderPosition.objects.filter(order__event=event)
+    if order_ids is not None:
+        oqs = oqs.filter(pk__in=order_ids)
+        pqs = pqs.filter(order_id__in=order_ids)
+
+    positions = defaultdict(list)
+    for p in pqs.values('order_id', 'subevent_id', 'item_id', 'price').order_by():
+        positions[p['order_id']].append(p)
+
+    result = {}
+    oqs = oqs.annotate(
+        payment_date=Subquery(p_date, output_field=DateTimeField())
+    ).values('pk', 'datetime', 'status', 'total', 'payment_date').order_by()
+    for o in oqs:
+        rows = defaultdict(_zero)
+        ops = positions[o['pk']]
+        order_day = o['datetime'].astimezone(tz).date()
+        paid_day = o['payment_date'].astimezone(tz).date() if o['payment_date'] else None
+        is_paid = o['status'] == Order.STATUS_PAID
+
+        # Order-level numbers, once for the event as a whole and once for every subevent the order contains
+        for subevent_id in [None] + sorted({p['subevent_id'] for p in ops if p['subevent_id']}):
+            rows[_key(subevent_id, None, order_day)][0] += 1
+            if paid_day:
+                row = rows[_key(subevent_id, None, paid_day)]
+                row[1] += 1
+                if is_paid:
+                    if subevent_id:
+                        row[4] += sum(p['price'] for p in ops if p['subevent_id'] == subevent_id)
+                    else:
+                        row[4] += o['total']
+
+        # Position-level numbers
+        for p in ops:
+            row = rows[_key(p['subevent_id'], p['item_id'], order_day)]
+            row[2] += 1
+            if is_paid:
+                row[3] += 1
+
+        result[o['pk']] = dict(rows)
+    return result
+
+
+def _apply(event, delta):
+    for key, values in delta.items():
+        if not any(values):
+            continue
+        subevent_id, item_id, date = _parse_key(key)
+        qs = SalesRollup.objects.filter(event=event, subevent_id=subevent_id, item_id=item_id, date=date)
+        # There might be more than one row for the key if two rows have been created concurrently, so we only
+        # update one of them.
+        updated = SalesRollup.objects.filter(pk__in=qs.values('pk')[:1]).update(
+            **{f: F(f) + v for f, v in zip(FIELDS, values)}
+        )
+        if not updated:
+            SalesRollup.objects.create(
+                event=event, subevent_id=subevent_id, item_id=item_id, date=date, **dict(zip(FIELDS, values))
+            )
+
+
+def is_built(event):
+    return SalesRollupStatus.objects.filter(event=event).exists()
+
+
+def _lock(event, shared):
+    """
+    Incremental updates take a shared lock, so they can run in parallel, while writing a rebuild takes an exclusive
+    one. This MUST be called within a transaction.
+    """
+    if 'postgresql' not in settings.DATABASES['default']['ENGINE']:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_advisory_xact_lock{}(%s, %s)'.format('_shared' if shared else ''),
+            [ADVISORY_LOCK_CLASS | ((settings.DATABASE_ADVISORY_LOCK_INDEX % 256) << 16), event.pk % 2147483648]
+        )
+
+
+def update_orders(event, order_ids):
+    """
+    Brings the rollups of the event up to date with the current state of the given orders. Orders that do not
+    exist any more are removed from the rollups. Returns the number of orders whose contribution changed.
+    """
+    if not order_ids:
+        return 0
+
+    with transaction.atomic():
+        _lock(event, shared=True)
+        if not is_built(event):
+            # The rebuild that is possibly running right now applies all orders modified in the meantime once it
+            # is done
+            return 0
+
+        # Serialize concurrent updates of the same order
+        list(Order.objects.select_for_update().filter(pk__in=order_ids).values_list('pk', flat=True))
+
+        new = compute_contributions(event, order_ids)
+        old = {
+            c.order_id: c for c in OrderRollupContribution.objects.filter(order_id__in=order_ids)
+        }
+        delta = defaultdict(_zero)
+        changed = 0
+        for order_id in set(order_ids):
+            new_data = _serialize(new[order_id]) if order_id in new else None
+            old_data = old[order_id].data if order_id in old else None
+            if new_data == old_data:
+                continue
+            changed += 1
+            for k, v in new.get(order_id, {}).items():
+                delta[k] = [a + b for a, b in zip(delta[k], v)]
+            if old_data is not None:
+                for k, v in _deserialize(old_data).items():
+                    delta[k] = [a - b for a, b in zip(delta[k], v)]
+
+            if order_id in old and order_id in new:
+                old[order_id].data = new_data
+                old[order_id].save(update_fields=['data'])
+            elif order_id in new:
+                OrderRollupContribution.objects.create(event=event, order_id=order_id, data=new_data)
+        _apply(event, delta)
+        OrderRollupContribution.objects.filter(order_id__in=set(old) - set(new)).delete()
+        return changed
+
+
+def update_modified_orders(event, since):
+    """
+    Applies all orders of the event that have been modified since the given point in time. Since the modification
+    time is set before a transaction is committed, we also look at orders modified a little earlier. Returns the
+    number of orders whose contribution changed.
+    """
+    order_ids = list(
+        Order.objects.filter(
+            event=event, last_modified__gte=since - datetime.timedelta(seconds=LOCK_TRUST_WINDOW)
+        ).order_by('pk').values_list('pk', flat=True)
+    )
+    changed = 0
+    for i in range(0, len(order_ids), UPDATE_CHUNK_SIZE):
+        changed += update_orders(event, order_ids[i:i + UPDATE_CHUNK_SIZE])
+    return changed
+
+
+def remove_order(order):
+    """
+    Removes an order from the rollups before it is deleted.
+    """
+    try:
+        contribution = OrderRollupContribution.objects.get(order=order)
+    except OrderRollupContribution.DoesNotExist:
+        return
+    with transaction.atomic():
+        _lock(order.event, shared=True)
+        _apply(order.event, {k: [-a for a in v] for k, v in _deserialize(contribution.data).items()})
+        contribution.delete()
+
+
+def _rebuild_lock_key(event_id):
+    return f'pretix_statistics_rollups_rebuilding:{event_id}'
+
+
+def rebuild(event):
+    """
+    Builds the rollups of the event from scratch. Returns ``False`` without doing anything if the rollups of the
+    event are already being built elsewhere.
+    """
+    key = _rebuild_lock_key(event.pk)
+    uniqid = str(uuid.uuid4())
+    if not cache.add(key, uniqid, timeout=REBUILD_TIMEOUT):
+        return False
+    try:
+        _rebuild(event)
+    finally:
+        if cache.get(key) == uniqid:
+            cache.delete(key)
+    return True
+
+
+def _rebuild(event):
+    started = now()
+    contributions = compute_contributions(event)
+
+    with transaction.atomic():
+        _lock(event, shared=False)
+        # Orders deleted in the meantime would violate the foreign key of their contribution. Orders deleted from now
+        # on need to wait for us since we reference them.
+        existing = set(Order.objects.filter(event=event).values_list('pk', flat=True))
+        contributions = {k: v for k, v in contributions.items() if k in existing}
+
+        SalesRollup.objects.filter(event=event).delete()
+        OrderRollupContribution.objects.filter(event=event).delete()
+
+        totals = defaultdict(_zero)
+        for rows in contributions.values():
+            for k, v in rows.items():
+                totals[k] = [a + b for a, b in zip(totals[k], v)]
+
+        rollups = []
+        for k, v in totals.items():
+            subevent_id, item_id, date = _parse_key(k)
+            rollups.append(SalesRollup(
+                event=event, subevent_id=subevent_id, item_id=item_id, date=date, **dict(zip(FIELDS, v))
+            ))
+        SalesRollup.objects.bulk_create(rollups, batch_size=1000)
+        OrderRollupContribution.objects.bulk_create([
+            OrderRollupContribution(event=event, order_id=order_id, data=_serialize(rows))
+            for order_id, rows in contributions.items()
+        ], batch_size=1000)
+        SalesRollupStatus.objects.update_or_create(event=event, defaults={'built': started, 'reconciled': started})
+
+    # Apply everything that changed while we were reading
+    update_modified_orders(event, started)
+
+
+def reconcile(status):
+    """
+    Applies all orders of the event that have been modified since the last reconciliation and returns the number of
+    orders whose contribution had drifted.
+    """
+    started = now()
+    drift = update_modified_orders(status.event, status.reconciled or status.built)
+    SalesRollupStatus.objects.filter(pk=status.pk).update(reconciled=started)
+    return drift
+
+
+def clear(event):
+    SalesRollupStatus.objects.filter(event=event).delete()
+    SalesRollup.objects.filter(event=event).delete()
+    OrderRollupContribution.objects.filter(event=event).delete()
+
+
+def _rollups(event, subevent, order_level):
+    qs = SalesRollup.objects.filter(event=event)
+    if order_level:
+        qs = qs.filter(item__isnull=True, subevent=subevent)
+    else:
+        qs = qs.filter(item__isnull=False)
+        if subevent:
+            qs = qs.filter(subevent=subevent)
+    return qs.order_by()
+
+
+def orders_by_day(event, subevent=None):
+    """
+    Returns a dictionary mapping days to a tuple of the number of orders placed and paid on that day.
+    """
+    return {
+        r['date']: (r['ordered'], r['paid'])
+        for r in _rollups(event, subevent, True).values('date').annotate(
+            ordered=Sum('orders_placed'), paid=Sum('orders_paid')
+        ).filter(Q(ordered__gt=0) | Q(paid__gt=0))
+    }
+
+
+def positions_by_item(event, subevent=None):
+    """
+    Returns a dictionary mapping item IDs to a tuple of the number of positions ordered and paid.
+    """
+    return {
+        r['item']: (r['ordered'], r['paid'])
+        for r in _rollups(event, subevent, False).values('item').annotate(
+            ordered=Sum('positions_placed'), paid=Sum('positions_paid')
+        ).filter(ordered__gt=0)
+    }
+
+
+def revenue_by_day(event, subevent=None):
+    """
+    Returns a dictionary mapping days to the revenue of orders that have been paid on that day.
+    """
+    return {
+        r['date']: r['revenue']
+        for r in _rollups(event, subevent, True).values('date').annotate(
+            revenue=Sum('revenue')
+        ).exclude(revenue=0)
+    }
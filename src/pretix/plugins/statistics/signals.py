@@ -19,12 +19,31 @@
 # You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
 # <https://www.gnu.org/licenses/>.
 #
+import logging
+from datetime import timedelta
+
+from django.db.models import Exists, OuterRef
+from django.db.models.functions import Coalesce
 from django.dispatch import receiver
 from django.urls import resolve, reverse
 from django.utils.translation import gettext_lazy as _
+from django_scopes import scopes_disabled
 
-from pretix.base.signals import order_paid, order_placed
+from pretix.base.models import Order
+from pretix.base.services.locking import LOCK_TRUST_WINDOW
+from pretix.base.signals import (
+    order_approved, order_canceled, order_changed, order_denied, order_expired,
+    order_gracefully_delete, order_paid, order_placed, order_reactivated,
+    order_split, periodic_task,
+)
 from pretix.control.signals import nav_event
+from pretix.helpers.periodic import minimum_interval
+
+from . import rollups
+from .models import SalesRollupStatus
+from .tasks import update_rollups
+
+logger = logging.getLogger(__name__)
 
 
 @receiver(nav_event, dispatch_uid="statistics_nav")
@@ -49,12 +68,38 @@ def control_nav_import(sender, request=None, **kwargs):
     ]
 
 
-def clear_cache(sender, *args, **kwargs):
-    cache = sender.cache
-    cache.delete('statistics_obd_data')
-    cache.delete('statistics_obp_data')
-    cache.delete('statistics_rev_data')
+def update_order_rollups(sender, order, **kwargs):
+    update_rollups.apply_async(kwargs={'event': sender.pk, 'orders': [order.pk]})
+
+
+for signal in (order_placed, order_paid, order_canceled, order_reactivated, order_expired, order_changed,
+               order_approved, order_denied):
+    signal.connect(update_order_rollups, dispatch_uid="statistics_update_order_rollups")
+
+
+@receiver(order_split, dispatch_uid="statistics_order_split")
+def update_split_order_rollups(sender, original, split_order, **kwargs):
+    update_rollups.apply_async(kwargs={'event': sender.pk, 'orders': [original.pk, split_order.pk]})
+
+
+@receiver(order_gracefully_delete, dispatch_uid="statistics_order_gracefully_delete")
+def remove_order_rollups(sender, order, **kwargs):
+    # This needs to happen right away, the order will be gone when a task would run
+    rollups.remove_order(order)
 
 
-order_placed.connect(clear_cache)
-order_paid.connect(clear_cache)
+@receiver(signal=periodic_task, dispatch_uid="statistics_reconcile_rollups")
+@scopes_disabled()
+@minimum_interval(minutes_after_success=30)
+def reconcile_rollups(sender, **kwargs):
+    statuses = SalesRollupStatus.objects.annotate(
+        modified=Exists(Order.objects.filter(
+            event=OuterRef('event'),
+            last_modified__gte=Coalesce(OuterRef('reconciled'), OuterRef('built')) - timedelta(seconds=LOCK_TRUST_WINDOW),
+        ))
+    ).filter(modified=True).select_related('event')
+    drift = 0
+    for status in statuses:
+        drift += rollups.reconcile(status)
+    if drift:
+        logger.info(f'Repaired the statistics rollups of {drift} orders.')
@@ -0,0 +1,55 @@
+#
+# This file is part of pretix (Community Edition).
+#
+# Copyright (C) 2014-2020 Raphael Michel and contributors
+# Copyright (C) 2020-2021 rami.io GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+#
+from django.core.cache import cache
+
+from pretix.base.models import Event
+from pretix.base.services.tasks import (
+    ProfiledEventTask, TransactionAwareProfiledEventTask,
+)
+from pretix.celery_app import app
+
+from . import rollups
+
+
+@app.task(base=TransactionAwareProfiledEventTask, acks_late=True)
+def update_rollups(event: Event, orders: list):
+    rollups.update_orders(event, orders)
+
+
+def _scheduled_key(event_id):
+    return f'pretix_statistics_rollups_scheduled:{event_id}'
+
+
+@app.task(base=ProfiledEventTask, acks_late=True)
+def build_rollups(event: Event):
+    try:
+        rollups.rebuild(event)
+    finally:
+        cache.delete(_scheduled_key(event.pk))
+
+
+def schedule_build(event):
+    """
+    Queues building the rollups of the event in the background, unless this already happened.
+    """
+    if cache.add(_scheduled_key(event.pk), True, timeout=rollups.REBUILD_TIMEOUT):
+        build_rollups.apply_async(kwargs={'event': event.pk})
@@ -45,7 +45,7 @@ from ...base.pdf import PdfLayoutValidator
 from ...helpers.http import ChunkBasedFileResponse
 from ...multidomain.utils import static_absolute
 from .models import TicketLayout, TicketLayoutItem
-from .tasks import bulk_render
+from .tasks import start_bulk_render
 
 
 class ItemAssignmentSerializer(I18nAwareModelSerializer):
@@ -268,8 +268,8 @@ class TicketRendererViewSet(viewsets.ViewSet):
         cf.date = now()
         cf.expires = now() + timedelta(hours=24)
         cf.save()
-        async_result = bulk_render.apply_async(args=(
-            self.request.event.id,
+        async_result = start_bulk_render(
+            self.request.event,
             str(cf.id),
             [
                 {
@@ -278,7 +278,7 @@ class TicketRendererViewSet(viewsets.ViewSet):
                     "override_channel": r["override_channel"].id if r.get("override_channel") else None,
                 } for r in serializer.validated_data["parts"]
             ]
-        ))
+        )
 
         url_kwargs = {
             'asyncid': str(async_result.id),
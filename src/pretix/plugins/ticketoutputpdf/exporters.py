@@ -33,23 +33,20 @@
 # License for the specific language governing permissions and limitations under the License.
 
 import logging
+import tempfile
 from collections import OrderedDict
-from io import BytesIO
 
 from django import forms
-from django.core.files.base import ContentFile
 from django.db import DataError, models
 from django.db.models import Case, OuterRef, Q, Subquery, Value, When
 from django.db.models.functions import Cast, Coalesce
 from django.utils.timezone import now
 from django.utils.translation import gettext as _, gettext_lazy, pgettext_lazy
-from pypdf import PdfWriter
 
 from pretix.base.exporter import BaseExporter
 from pretix.base.i18n import language
-from pretix.base.models import (
-    Event, Order, OrderPosition, Question, QuestionAnswer,
-)
+from pretix.base.models import Order, OrderPosition, Question, QuestionAnswer
+from pretix.base.pdf import SHARD_SIZE, render_sharded
 from pretix.base.settings import PERSON_NAME_SCHEMES
 
 from ...base.services.export import ExportError
@@ -57,6 +54,7 @@ from ...base.timeframes import (
     DateFrameField,
     resolve_timeframe_to_datetime_start_inclusive_end_exclusive,
 )
+from ...helpers.iter import chunked_iterable
 from ...helpers.templatetags.jsonfield import JSONExtract
 from .ticketoutput import PdfTicketOutput
 
@@ -117,8 +115,7 @@ class AllTicketsPDF(BaseExporter):
 
         return d
 
-    def render(self, form_data):
-        merger = PdfWriter()
+    def render(self, form_data, output_file=None):
         qs = OrderPosition.objects.filter(
             order__event__in=self.events
         ).prefetch_related(
@@ -137,6 +134,8 @@ class AllTicketsPDF(BaseExporter):
             if dt_end:
                 qs = qs.filter(Q(subevent__date_from__lt=dt_end) | Q(subevent__isnull=True, order__event__date_from__lt=dt_end))
 
+        base_qs = qs
+
         if form_data.get('order_by') == 'name':
             qs = qs.annotate(
                 resolved_name=Case(
@@ -212,14 +211,17 @@ class AllTicketsPDF(BaseExporter):
                 'question_answer'
             )
 
-        o = PdfTicketOutput(Event.objects.none())
-        try:
-            for op in qs:
+        def render_shard(ids, collector):
+            positions = base_qs.in_bulk(ids)
+            outputs = {}
+            for pk in ids:
+                op = positions[pk]
                 if not op.generate_ticket:
                     continue
 
-                if op.order.event != o.event:
-                    o = PdfTicketOutput(op.event)
+                if op.order.event_id not in outputs:
+                    outputs[op.order.event_id] = PdfTicketOutput(op.event)
+                o = outputs[op.order.event_id]
 
                 with language(op.order.locale, o.event.settings.region):
                     layout = o.layout_map.get(
@@ -229,13 +231,18 @@ class AllTicketsPDF(BaseExporter):
                             o.default_layout
                         )
                     )
-                    outbuffer = o._draw_page(layout, op, op.order)
-                    merger.append(ContentFile(outbuffer.read()))
+                    collector.add(o._get_renderer(layout), op.order, op)
 
-            outbuffer = BytesIO()
-            merger.write(outbuffer)
-            merger.close()
-            outbuffer.seek(0)
+        try:
+            shards = chunked_iterable(qs.values_list('pk', flat=True), SHARD_SIZE)
+            if output_file:
+                render_sharded(shards, render_shard, _('Tickets'), output_file, self.progress_callback)
+                data = None
+            else:
+                with tempfile.TemporaryFile() as f:
+                    render_sharded(shards, render_shard, _('Tickets'), f, self.progress_callback)
+                    f.seek(0)
+                    data = f.read()
         except DataError:
             logging.exception('DataError during export')
             raise ExportError(
@@ -244,6 +251,6 @@ class AllTicketsPDF(BaseExporter):
             )
 
         if self.is_multievent:
-            return '{}_tickets.pdf'.format(self.organizer.slug), 'application/pdf', outbuffer.read()
+            return '{}_tickets.pdf'.format(self.organizer.slug), 'application/pdf', data
         else:
-            return '{}_tickets.pdf'.format(self.event.slug), 'application/pdf', outbuffer.read()
+            return '{}_tickets.pdf'.format(self.event.slug), 'application/pdf', data
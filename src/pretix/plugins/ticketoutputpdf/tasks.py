@@ -21,11 +21,19 @@
 #
 import json
 import logging
-from io import BytesIO
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from functools import partial
+from uuid import UUID
 
+from celery import chord
+from django.conf import settings
+from django.core.files import File
 from django.core.files.base import ContentFile
 from django.db.models import Prefetch, prefetch_related_objects
-from pypdf import PdfWriter
+from django.utils.timezone import now
 
 from pretix.base.models import (
     CachedFile, Checkin, Event, EventMetaValue, ItemMetaValue,
@@ -37,7 +45,11 @@ from pretix.base.services.tasks import EventTask
 from pretix.celery_app import app
 
 from ...base.i18n import language
+from ...base.pdf import (
+    SHARD_SIZE, concatenate_parts, render_shard_to_file, render_sharded,
+)
 from ...base.services.export import ExportError
+from ...helpers.iter import chunked_iterable
 from .models import TicketLayout
 from .ticketoutput import PdfTicketOutput
 
@@ -56,13 +68,7 @@ def tickets_create_pdf(event: Event, fileid: int, position: int, channel) -> int
     return file.pk
 
 
-@app.task(base=EventTask, throws=(OrderError, ExportError,))
-def bulk_render(event: Event, fileid: int, parts: list) -> int:
-    file = CachedFile.objects.get(id=fileid)
-
-    channels = SalesChannel.objects.in_bulk([p["override_channel"] for p in parts if p.get("override_channel")])
-    layouts = TicketLayout.objects.in_bulk([p["override_layout"] for p in parts if p.get("override_layout")])
-
+def _positions(event):
     positions = OrderPosition.objects.all()
     prefetch_related_objects([event.organizer], 'meta_properties')
     prefetch_related_objects(
@@ -114,13 +120,25 @@ def bulk_render(event: Event, fileid: int, parts: list) -> int:
     ).select_related(
         'addon_to', 'seat', 'addon_to__seat'
     )
-    positions = positions.in_bulk([p["orderposition"] for p in parts])
+    return positions
+
 
-    merger = PdfWriter()
-    for part in parts:
-        p = positions[part["orderposition"]]
+def render_bulk_shard(event, shard, collector):
+    """
+    Adds the tickets of one shard of a ``bulk_render`` job to ``collector``.
+    """
+    positions = _positions(event)
+    channels = SalesChannel.objects.in_bulk([p["override_channel"] for p in shard if p.get("override_channel")])
+    layouts = TicketLayout.objects.in_bulk([p["override_layout"] for p in shard if p.get("override_layout")])
+
+    shard_positions = positions.in_bulk([p["orderposition"] for p in shard])
+    # One output object per combination of overrides, so every layout is only compiled once per shard
+    outputs = {}
+    for part in shard:
+        p = shard_positions[part["orderposition"]]
         p.order.event = event  # performance optimization
-        with (language(p.order.locale)):
+        key = (part.get("override_channel"), part.get("override_layout"))
+        if key not in outputs:
             kwargs = {}
             if part.get("override_channel"):
                 kwargs["override_channel"] = channels[part["override_channel"]].identifier
@@ -128,19 +146,82 @@ def bulk_render(event: Event, fileid: int, parts: list) -> int:
                 l = layouts[part["override_layout"]]
                 kwargs["override_layout"] = json.loads(l.layout)
                 kwargs["override_background"] = l.background
-            prov = PdfTicketOutput(
+            outputs[key] = PdfTicketOutput(
                 event,
                 **kwargs,
             )
-            filename, ctype, data = prov.generate(p)
-            merger.append(ContentFile(data))
+        with language(p.order.locale, event.settings.region):
+            outputs[key].add_to_collector(collector, p, p.order)
 
-    outbuffer = BytesIO()
-    merger.write(outbuffer)
-    merger.close()
-    outbuffer.seek(0)
 
+def _save_cached_file(file, f):
+    f.seek(0)
     file.type = "application/pdf"
-    file.file.save(cachedfile_name(file, file.filename), ContentFile(outbuffer.getvalue()))
+    file.file.save(cachedfile_name(file, file.filename), File(f))
     file.save()
+
+
+@app.task(base=EventTask, throws=(OrderError, ExportError,))
+def bulk_render_shard(event: Event, shard: list):
+    """
+    Renders one shard of a ``bulk_render`` job into a temporary file and returns its ID, or ``None`` if the shard
+    does not contain any pages.
+    """
+    with tempfile.TemporaryFile() as f:
+        if not render_shard_to_file(shard, partial(render_bulk_shard, event), 'Tickets', f):
+            return None
+        part = CachedFile(web_download=False, date=now(), expires=now() + timedelta(hours=24), filename='part.pdf')
+        part.save()
+        _save_cached_file(part, f)
+        return str(part.pk)
+
+
+@app.task(base=EventTask, throws=(OrderError, ExportError,))
+def bulk_render_concatenate(part_ids: list, event: Event, fileid: int) -> int:
+    file = CachedFile.objects.get(id=fileid)
+    parts = CachedFile.objects.in_bulk([p for p in part_ids if p])
+    with tempfile.TemporaryDirectory() as d:
+        file_names = []
+        for i, part_id in enumerate(p for p in part_ids if p):
+            file_name = os.path.join(d, f'part-{i}.pdf')
+            with open(file_name, 'wb') as f, parts[UUID(part_id)].file.open('rb') as part:
+                shutil.copyfileobj(part, f)
+            file_names.append(file_name)
+        with tempfile.TemporaryFile() as f:
+            concatenate_parts(file_names, f)
+            _save_cached_file(file, f)
+    for part in parts.values():
+        part.delete()
     return file.pk
+
+
+@app.task(base=EventTask, throws=(OrderError, ExportError,), bind=True)
+def bulk_render(self, event: Event, fileid: int, parts: list) -> int:
+    def set_progress(val):
+        if not self.request.called_directly:
+            self.update_state(
+                state='PROGRESS',
+                meta={'value': val}
+            )
+
+    file = CachedFile.objects.get(id=fileid)
+    with tempfile.TemporaryFile() as f:
+        render_sharded(chunked_iterable(parts, SHARD_SIZE), partial(render_bulk_shard, event), 'Tickets', f,
+                       set_progress)
+        _save_cached_file(file, f)
+    return file.pk
+
+
+def start_bulk_render(event: Event, fileid: str, parts: list):
+    """
+    Starts rendering the given parts into the given cached file and returns the ``AsyncResult`` of the task that
+    writes the file. Rendering is CPU-bound, so large jobs are split into shards that are rendered in parallel tasks
+    (possibly on different machines) and joined by a final task.
+    """
+    shards = [list(s) for s in chunked_iterable(parts, SHARD_SIZE)]
+    if settings.HAS_CELERY and len(shards) > 1:
+        return chord(
+            [bulk_render_shard.si(event=event.pk, shard=shard) for shard in shards],
+            bulk_render_concatenate.s(event=event.pk, fileid=fileid),
+        ).apply_async()
+    return bulk_render.apply_async(args=(event.pk, fileid, parts))
@@ -38,17 +38,15 @@ from io import BytesIO
 
 from django.contrib.staticfiles import finders
 from django.core.files import File
-from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
 from django.http import HttpRequest
 from django.template.loader import get_template
 from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
-from pypdf import PdfWriter
 
 from pretix.base.i18n import language
 from pretix.base.models import Order, OrderPosition
-from pretix.base.pdf import Renderer
+from pretix.base.pdf import PdfCollector, Renderer
 from pretix.base.ticketoutput import BaseTicketOutput
 from pretix.plugins.ticketoutputpdf.models import (
     DEFAULT_TICKET_LAYOUT, TicketLayout, TicketLayoutItem,
@@ -71,6 +69,10 @@ class PdfTicketOutput(BaseTicketOutput):
         self.override_channel = override_channel
         super().__init__(event)
 
+    @cached_property
+    def _renderers(self):
+        return {}
+
     @cached_property
     def layout_map(self):
         if not hasattr(self.event, '_ticketoutputpdf_cache_layoutmap'):
@@ -94,50 +96,38 @@ class PdfTicketOutput(BaseTicketOutput):
     def _register_fonts(self):
         Renderer._register_fonts(self.event)
 
-    def _draw_page(self, layout: TicketLayout, op: OrderPosition, order: Order):
-        buffer = BytesIO()
-        objs = self.override_layout or json.loads(layout.layout) or self._legacy_layout()
+    def _get_renderer(self, layout: TicketLayout):
+        """
+        Returns a renderer for the given layout. Renderers are cached for the lifetime of this output object, since
+        compiling the layout and parsing the background is much more expensive than drawing a single ticket.
+        """
         bg_file = layout.background
+        key = (layout.pk, layout.layout, bg_file.name if isinstance(bg_file, File) else None)
+        if key not in self._renderers:
+            objs = self.override_layout or json.loads(layout.layout) or self._legacy_layout()
+
+            if self.override_background:
+                bgf = default_storage.open(self.override_background.name, "rb")
+            elif isinstance(bg_file, File) and bg_file.name:
+                bgf = default_storage.open(bg_file.name, "rb")
+            else:
+                bgf = self._get_default_background()
+
+            self._register_fonts()
+            with bgf:
+                self._renderers[key] = Renderer(self.event, objs, bgf)
+        return self._renderers[key]
 
-        if self.override_background:
-            bgf = default_storage.open(self.override_background.name, "rb")
-        elif isinstance(bg_file, File) and bg_file.name:
-            bgf = default_storage.open(bg_file.name, "rb")
-        else:
-            bgf = self._get_default_background()
-
+    def _draw_page(self, layout: TicketLayout, op: OrderPosition, order: Order):
+        buffer = BytesIO()
         p = self._create_canvas(buffer)
-        renderer = Renderer(self.event, objs, bgf)
+        renderer = self._get_renderer(layout)
         renderer.draw_page(p, order, op)
         p.save()
         return renderer.render_background(buffer, _('Ticket'))
 
-    def generate_order(self, order: Order):
-        merger = PdfWriter()
-        with language(order.locale, self.event.settings.region):
-            for op in self.get_tickets_to_print(order):
-                layout = override_layout.send_chained(
-                    order.event, 'layout', orderposition=op, layout=self.layout_map.get(
-                        (op.item_id, self.override_channel or order.sales_channel.identifier),
-                        self.layout_map.get(
-                            (op.item_id, 'web'),
-                            self.default_layout
-                        )
-                    )
-                )
-                outbuffer = self._draw_page(layout, op, order)
-                merger.append(ContentFile(outbuffer.read()))
-
-        outbuffer = BytesIO()
-        merger.write(outbuffer)
-        merger.close()
-        outbuffer.seek(0)
-        return 'order%s%s.pdf' % (self.event.slug, order.code), 'application/pdf', outbuffer.read()
-
-    def generate(self, op):
-        order = op.order
-
-        layout = override_layout.send_chained(
+    def _get_layout(self, op: OrderPosition, order: Order):
+        return override_layout.send_chained(
             order.event, 'layout', orderposition=op, layout=self.layout_map.get(
                 (op.item_id, self.override_channel or order.sales_channel.identifier),
                 self.layout_map.get(
@@ -146,6 +136,25 @@ class PdfTicketOutput(BaseTicketOutput):
                 )
             )
         )
+
+    def add_to_collector(self, collector: PdfCollector, op: OrderPosition, order: Order):
+        """
+        Draws the ticket of ``op`` onto ``collector``, using the same layout ``generate`` would use.
+        """
+        collector.add(self._get_renderer(self._get_layout(op, order)), order, op)
+
+    def generate_order(self, order: Order):
+        collector = PdfCollector(_('Ticket'))
+        with language(order.locale, self.event.settings.region):
+            for op in self.get_tickets_to_print(order):
+                self.add_to_collector(collector, op, order)
+
+        return 'order%s%s.pdf' % (self.event.slug, order.code), 'application/pdf', collector.read()
+
+    def generate(self, op):
+        order = op.order
+
+        layout = self._get_layout(op, order)
         with language(order.locale, self.event.settings.region):
             outbuffer = self._draw_page(layout, op, order)
         return 'order%s%s.pdf' % (self.event.slug, order.code), 'application/pdf', outbuffer.read()
@@ -357,11 +357,15 @@ receivers are expected to return HTML.
 
 render_seating_plan = EventPluginSignal()
 """
-Arguments: ``request``, ``subevent``, ``voucher``
+Arguments: ``request``, ``subevent``, ``voucher``, ``occupancy``
 
 This signal is sent out to render a seating plan, if one is configured for the specific event.
 You will be passed the ``request`` as a keyword argument. If applicable, a ``subevent`` or
-``voucher`` argument might be given.
+``voucher`` argument might be given. ``occupancy`` is a
+``pretix.base.services.seatoccupancy.SeatOccupancy`` snapshot of the seats, which should be used
+to render the seating plan instead of querying the state of every seat. The page also contains the
+JSON representation of the snapshot in the ``#seating-availability`` element, and the URL to poll
+for updates of it in the ``data-seating-availability-url`` attribute of the form.
 
 As with all plugin signals, the ``sender`` keyword argument will contain the event. The
 receivers are expected to return HTML.
@@ -69,6 +69,11 @@ frame_wrapped_urls = [
             name='event.seatingplan'),
     re_path(r'^(?P<subevent>[0-9]+)/seatingframe/$', pretix.presale.views.event.SeatingPlanView.as_view(),
             name='event.seatingplan'),
+    re_path(r'^seatingframe/availability$', pretix.presale.views.event.SeatingPlanAvailabilityView.as_view(),
+            name='event.seatingplan.availability'),
+    re_path(r'^(?P<subevent>[0-9]+)/seatingframe/availability$',
+            pretix.presale.views.event.SeatingPlanAvailabilityView.as_view(),
+            name='event.seatingplan.availability'),
     re_path(r'^(?P<subevent>[0-9]+)/$', pretix.presale.views.event.EventIndex.as_view(), name='event.index'),
     re_path(r'^waitinglist/remove$', pretix.presale.views.waiting.WaitingRemoveView.as_view(), name='event.waitinglist.remove'),
     re_path(r'^waitinglist', pretix.presale.views.waiting.WaitingView.as_view(), name='event.waitinglist'),
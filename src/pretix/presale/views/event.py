@@ -51,7 +51,9 @@ from django.db.models import (
     Count, Exists, IntegerField, OuterRef, Prefetch, Q, Value,
 )
 from django.db.models.lookups import Exact
-from django.http import Http404, HttpResponse
+from django.http import (
+    Http404, HttpResponse, HttpResponseNotModified, JsonResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
 from django.utils.decorators import method_decorator
 from django.utils.formats import get_format
@@ -72,6 +74,7 @@ from pretix.base.models.event import Event, SubEvent
 from pretix.base.models.items import (
     Item, ItemAddOn, ItemBundle, SubEventItem, SubEventItemVariation,
 )
+from pretix.base.services import seatoccupancy
 from pretix.base.services.placeholders import PlaceholderContext
 from pretix.base.services.quotas import QuotaAvailability
 from pretix.base.timemachine import time_machine_now
@@ -893,9 +896,57 @@ class SeatingPlanView(EventViewMixin, TemplateView):
             voucher = None
         context['voucher'] = voucher
 
+        # The seating plan is rendered from the occupancy snapshot and then polls for changes
+        occupancy = seatoccupancy.read(self.request.event, self.subevent)
+        context['seating_occupancy'] = occupancy
+        context['seating_availability'] = occupancy.as_json(
+            self.request.event, self.subevent, self.request.sales_channel.identifier
+        )
+        context['seating_availability_url'] = eventreverse(
+            self.request.event, 'presale:event.seatingplan.availability',
+            kwargs={'subevent': self.subevent.pk} if self.subevent else {}
+        )
+
         return context
 
 
+class SeatingPlanAvailabilityView(EventViewMixin, View):
+    """
+    Returns which seats of the seating plan can currently be selected, for the seating plan to poll while it is open.
+    The response contains the GUIDs of all seats and a base64-encoded bitmap in which the most significant bit of the
+    first byte refers to the first seat.
+    """
+
+    def get(self, request, *args, **kwargs):
+        subevent = None
+        if request.event.has_subevents:
+            if 'subevent' not in kwargs:
+                raise Http404()
+            subevent = request.event.subevents.using(settings.DATABASE_REPLICA).filter(
+                pk=kwargs['subevent'], active=True
+            ).first()
+            if not subevent or not subevent.seating_plan:
+                raise Http404()
+        elif 'subevent' in kwargs or not request.event.seating_plan:
+            raise Http404()
+
+        occupancy = seatoccupancy.read(request.event, subevent)
+        etag = '"{}"'.format(hashlib.sha1('{}-{}-{}-{}-{}'.format(
+            occupancy.etag,
+            request.sales_channel.identifier,
+            request.event.settings.seating_minimal_distance,
+            request.event.settings.seating_distance_within_row,
+            request.sales_channel.identifier in request.event.settings.seating_allow_blocked_seats_for_channel,
+        ).encode()).hexdigest())
+        if request.headers.get('If-None-Match') == etag:
+            return HttpResponseNotModified()
+
+        resp = JsonResponse(occupancy.as_json(request.event, subevent, request.sales_channel.identifier))
+        resp['ETag'] = etag
+        resp['Cache-Control'] = 'no-cache'
+        return resp
+
+
 class EventIcalDownload(EventViewMixin, View):
     def get(self, request, *args, **kwargs):
         if not self.request.event:
@@ -188,6 +188,12 @@ PRETIX_REGISTRATION = config.getboolean('pretix', 'registration', fallback=False
 PRETIX_PASSWORD_RESET = config.getboolean('pretix', 'password_reset', fallback=True)
 PRETIX_LONG_SESSIONS = config.getboolean('pretix', 'long_sessions', fallback=True)
 PRETIX_ADMIN_AUDIT_COMMENTS = config.getboolean('pretix', 'audit_comments', fallback=False)
+PRETIX_QUOTA_COUNTERS = config.getboolean('pretix', 'quota_counters', fallback=False)
+PRETIX_CHECKIN_COUNTERS = config.getboolean('pretix', 'checkin_counters', fallback=False)
+PRETIX_SEAT_OCCUPANCY = config.getboolean('pretix', 'seat_occupancy', fallback=False)
+PRETIX_SIGNAL_RECEIVER_METRICS = config.getboolean('pretix', 'signal_receiver_metrics', fallback=False)
+PRETIX_IMPORT_CHUNK_SIZE = config.getint('pretix', 'import_chunk_size', fallback=500)
+PRETIX_EXPORT_WORKERS = config.getint('pretix', 'export_workers', fallback=1)
 
 _obligatory_2fa = config.get('pretix', 'obligatory_2fa', fallback="False")
 _mapping = {'1': True, 'yes': True, 'true': True, 'on': True, '0': False, 'no': False, 'false': False, 'off': False, 'staff': 'staff'}
@@ -331,6 +337,12 @@ if HAS_REDIS:
         SESSION_ENGINE = "django.contrib.sessions.backends.cache"
         SESSION_CACHE_ALIAS = "redis_sessions"
 
+# Optional in-process cache tier in front of the shared cache for NamespacedCache and ObjectRelatedCache, see
+# pretix.base.cache. Requires redis, which is used to broadcast invalidations to all processes.
+CACHE_LOCAL_TIER = HAS_REDIS and config.getboolean('cache', 'local_tier', fallback=False)
+CACHE_LOCAL_TIER_SIZE = config.getint('cache', 'local_tier_size', fallback=10000)
+CACHE_LOCAL_TIER_TIMEOUT = config.getint('cache', 'local_tier_timeout', fallback=5)
+
 if not SESSION_ENGINE:
     if REAL_CACHE_USED:
         SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
@@ -692,6 +704,7 @@ CELERY_TASK_ROUTES = ([
     ('pretix.base.services.orders.*', {'queue': 'checkout'}),
     ('pretix.base.services.mail.*', {'queue': 'mail'}),
     ('pretix.base.services.update_check.*', {'queue': 'background'}),
+    ('pretix.base.services.periodic.*', {'queue': 'background'}),
     ('pretix.base.services.quotas.*', {'queue': 'background'}),
     ('pretix.base.services.waitinglist.*', {'queue': 'background'}),
     ('pretix.base.services.notifications.*', {'queue': 'notifications'}),
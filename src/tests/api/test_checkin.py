@@ -20,6 +20,8 @@
 # <https://www.gnu.org/licenses/>.
 #
 import datetime
+import gzip
+import json
 import time
 from decimal import Decimal
 from unittest import mock
@@ -35,7 +37,7 @@ from tests.const import SAMPLE_PNG
 
 from pretix.api.serializers.item import QuestionSerializer
 from pretix.base.models import (
-    Checkin, CheckinList, InvoiceAddress, Order, OrderPosition,
+    CachedFile, Checkin, CheckinList, InvoiceAddress, Order, OrderPosition,
 )
 
 
@@ -1366,3 +1368,82 @@ def test_expand(token_client, organizer, event, clist, clist_all, item, other_it
     ))
     assert resp.status_code == 200
     assert 'value' in resp.data['results'][0]['variation']
+
+
+@pytest.mark.django_db
+def test_snapshot(token_client, organizer, clist, event, order):
+    with scopes_disabled():
+        p = order.positions.first()
+        Checkin.objects.create(position=p, list=clist)
+    resp = token_client.get('/api/v1/organizers/{}/events/{}/checkinlists/{}/snapshot/'.format(
+        organizer.slug, event.slug, clist.pk,
+    ))
+    assert resp.status_code == 200
+    assert resp['Content-Type'] == 'application/gzip'
+    data = json.loads(gzip.decompress(b''.join(resp.streaming_content)))
+    assert data['version'] == 1
+    assert data['list'] == clist.pk
+    assert data['sync_token']
+    assert [r['id'] for r in data['positions']] == [p.pk]
+    assert data['positions'][0]['secret'] == p.secret
+    assert data['positions'][0]['attendee_name'] == 'Peter'
+    assert data['positions'][0]['active']
+    assert [c['type'] for c in data['positions'][0]['checkins']] == ['entry']
+
+    # The snapshot is shared and not generated again
+    with scopes_disabled():
+        assert CachedFile.objects.count() == 1
+    resp = token_client.get('/api/v1/organizers/{}/events/{}/checkinlists/{}/snapshot/'.format(
+        organizer.slug, event.slug, clist.pk,
+    ))
+    assert resp.status_code == 200
+    with scopes_disabled():
+        assert CachedFile.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_changes(token_client, organizer, clist, event, order):
+    def fetch(since=None, limit=None):
+        url = '/api/v1/organizers/{}/events/{}/checkinlists/{}/changes/?'.format(organizer.slug, event.slug, clist.pk)
+        if since:
+            url += 'since={}&'.format(since)
+        if limit:
+            url += 'limit={}&'.format(limit)
+        resp = token_client.get(url)
+        assert resp.status_code == 200
+        return resp.data
+
+    # A full sync, page by page
+    ids = []
+    data = {'has_more': True, 'sync_token': None}
+    while data['has_more']:
+        data = fetch(data['sync_token'], 2)
+        ids += [(r['id'], r['active']) for r in data['results']]
+    with scopes_disabled():
+        p1, p2, p3 = order.positions.order_by('pk')
+    assert ids == [(p1.pk, True), (p2.pk, False), (p3.pk, False)]
+    sync_token = data['sync_token']
+
+    # Changes shortly before the end of the last sync are sent again, in case they have been committed late
+    assert len(fetch(sync_token)['results']) == 3
+    with scopes_disabled():
+        Order.objects.filter(pk=order.pk).update(last_modified=order.last_modified - datetime.timedelta(hours=1))
+    assert fetch(sync_token)['results'] == []
+
+    with scopes_disabled():
+        Checkin.objects.create(position=p1, list=clist)
+    data = fetch(sync_token)
+    assert [r['id'] for r in data['results']] == [p1.pk, p2.pk, p3.pk]
+    assert [c['type'] for c in data['results'][0]['checkins']] == ['entry']
+    assert not data['has_more']
+
+    with scopes_disabled():
+        p1.canceled = True
+        p1.save()
+    data = fetch(sync_token)
+    assert not data['results'][0]['active']
+
+    resp = token_client.get('/api/v1/organizers/{}/events/{}/checkinlists/{}/changes/?since=foo'.format(
+        organizer.slug, event.slug, clist.pk,
+    ))
+    assert resp.status_code == 400
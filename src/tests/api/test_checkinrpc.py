@@ -25,6 +25,8 @@ from unittest import mock
 
 import pytest
 from django.core.files.base import ContentFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils.timezone import now
 from django_countries.fields import Country
 from django_scopes import scopes_disabled
@@ -817,6 +819,26 @@ def test_redeem_unknown_revoked_force(token_client, organizer, clist, event, ord
         assert ci.position == p
 
 
+@pytest.mark.django_db(transaction=True)
+def test_redeem_unknown_negative_cache(token_client, organizer, clist, event, order, fakeredis_client):
+    with CaptureQueriesContext(connection) as first:
+        resp = _redeem(token_client, organizer, clist, 'unknown_secret', {})
+    assert resp.status_code == 404
+    with CaptureQueriesContext(connection) as second:
+        resp = _redeem(token_client, organizer, clist, 'unknown_secret', {})
+    assert resp.status_code == 404
+    assert resp.data["reason"] == "invalid"
+    assert len(second) < len(first)
+
+    with scopes_disabled():
+        p = order.positions.first()
+        p.secret = 'unknown_secret'
+        p.save()
+    resp = _redeem(token_client, organizer, clist, 'unknown_secret', {})
+    assert resp.status_code == 201
+    assert resp.data["status"] == "ok"
+
+
 @pytest.mark.django_db
 def test_redeem_addon_if_match_disabled(token_client, organizer, clist, other_item, event, order):
     with scopes_disabled():
@@ -41,6 +41,7 @@ import pytest
 from django.utils.timezone import now
 
 from pretix.base.models import CachedFile, User
+from pretix.helpers.columnar import columnar_formats_available
 
 SAMPLE_EXPORTER_CONFIG = {
     "identifier": "orderlist",
@@ -49,17 +50,12 @@ SAMPLE_EXPORTER_CONFIG = {
         {
             "name": "_format",
             "required": True,
-            "choices": [
-                "xlsx",
-                "orders:default",
-                "orders:excel",
-                "orders:semicolon",
-                "positions:default",
-                "positions:excel",
-                "positions:semicolon",
-                "fees:default",
-                "fees:excel",
-                "fees:semicolon"
+            "choices": ["xlsx"] + [
+                f"{sheet}:{fmt}"
+                for sheet in ("orders", "positions", "fees")
+                for fmt in ("default", "excel", "semicolon") + (
+                    ("parquet", "arrow") if columnar_formats_available() else ()
+                )
             ]
         },
         {
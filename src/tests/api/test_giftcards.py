@@ -371,3 +371,24 @@ def test_giftcard_transactions(token_client, organizer, giftcard):
             }
         ]
     }
+
+
+@pytest.mark.django_db
+def test_giftcard_transactions_cursor_pagination(token_client, organizer, giftcard):
+    with scopes_disabled():
+        for i in range(4):
+            giftcard.transactions.create(value=Decimal('1.00'), acceptor=organizer)
+        # Same timestamp for all of them, the cursor needs to fall back to the ID
+        giftcard.transactions.update(datetime=now())
+        expected = list(giftcard.transactions.order_by('datetime', 'pk').values_list('pk', flat=True))
+
+    ids = []
+    url = '/api/v1/organizers/{}/giftcards/{}/transactions/?pagination=cursor&page_size=2'.format(
+        organizer.slug, giftcard.pk
+    )
+    while url:
+        resp = token_client.get(url)
+        assert resp.status_code == 200
+        ids += [r['id'] for r in resp.data['results']]
+        url = resp.data['next']
+    assert ids == expected
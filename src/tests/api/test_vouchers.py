@@ -256,6 +256,32 @@ def test_voucher_list(token_client, organizer, event, voucher, item, quota, sube
     assert [] == resp.data['results']
 
 
+@pytest.mark.django_db
+def test_voucher_list_cursor_pagination(token_client, organizer, event, item):
+    with scopes_disabled():
+        for i in range(7):
+            event.vouchers.create(item=item, code='CODE{}'.format(6 - i), max_usages=i % 2 + 1)
+        expected = list(event.vouchers.order_by('-max_usages', '-pk').values_list('code', flat=True))
+
+    codes = []
+    url = '/api/v1/organizers/{}/events/{}/vouchers/?pagination=cursor&page_size=3&ordering=-max_usages'.format(
+        organizer.slug, event.slug
+    )
+    while url:
+        resp = token_client.get(url)
+        assert resp.status_code == 200
+        assert 'count' not in resp.data
+        assert len(resp.data['results']) <= 3
+        codes += [r['code'] for r in resp.data['results']]
+        url = resp.data['next']
+    assert codes == expected
+
+    resp = token_client.get(
+        '/api/v1/organizers/{}/events/{}/vouchers/?pagination=cursor&cursor=foo'.format(organizer.slug, event.slug)
+    )
+    assert resp.status_code == 404
+
+
 @pytest.mark.django_db
 def test_voucher_detail(token_client, organizer, event, voucher, item):
     res = dict(TEST_VOUCHER_RES)
@@ -48,6 +48,8 @@ TEST_WEBHOOK_RES = {
     "limit_events": ['dummy'],
     "action_types": ['pretix.event.order.paid', 'pretix.event.order.placed'],
     "comment": None,
+    "batch_size": None,
+    "batch_delay": 10,
 }
 
 
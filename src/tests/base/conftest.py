@@ -0,0 +1,63 @@
+#
+# This file is part of pretix (Community Edition).
+#
+# Copyright (C) 2014-2020 Raphael Michel and contributors
+# Copyright (C) 2020-2021 rami.io GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+#
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.utils.timezone import now
+from django_scopes import scope
+
+from pretix.base.models import Event, Item, Order, OrderPosition, Organizer
+
+
+@pytest.fixture
+def redis_event(fakeredis_client):
+    """
+    An event within its organizer's scope, with redis available for the caches and counters kept outside of the
+    database.
+    """
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    event = Event.objects.create(
+        organizer=o, name='Dummy', slug='dummy',
+        date_from=now() + timedelta(days=10), live=True,
+    )
+    with scope(organizer=o):
+        yield event
+
+
+@pytest.fixture
+def redis_item(redis_event):
+    return Item.objects.create(event=redis_event, name="Ticket", default_price=23)
+
+
+@pytest.fixture
+def create_order():
+    def create_order(event, item, status, count=1, **position_kwargs):
+        o = Order.objects.create(
+            event=event, status=status, expires=now() + timedelta(days=3), total=Decimal('23.00') * count,
+            sales_channel=event.organizer.sales_channels.get(identifier="web"),
+        )
+        for i in range(count):
+            OrderPosition.objects.create(order=o, item=item, price=Decimal('23.00'), positionid=i + 1, **position_kwargs)
+        o.create_transactions(is_new=True)
+        return o
+    return create_order
@@ -19,12 +19,21 @@
 # You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
 # <https://www.gnu.org/licenses/>.
 #
+import json
+import os
 import random
+import time
 
+import pytest
 from django.core.cache import cache as django_cache
 from django.test import TestCase, override_settings
 from django.utils.timezone import now
 
+from pretix.base import cache as cache_module
+from pretix.base.cache import (
+    INVALIDATION_CHANNEL, LocalCacheTier, ObjectRelatedCache,
+    handle_invalidation,
+)
 from pretix.base.models import Event, Organizer
 
 
@@ -71,3 +80,109 @@ class CacheTest(TestCase):
         }
         self.cache.set_many(inp)
         self.assertEqual(inp, self.cache.get_many(inp.keys()))
+
+
+@pytest.fixture
+def local_tier_event(fakeredis_client, monkeypatch):
+    # Do not start the background listener, we feed invalidations in manually
+    monkeypatch.setattr(cache_module, '_listener_pid', os.getpid())
+    monkeypatch.setattr(cache_module, '_local_tiers', {})
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    event = Event.objects.create(organizer=o, name='Dummy', slug='dummy', date_from=now())
+    with override_settings(CACHE_LOCAL_TIER=True, CACHE_LOCAL_TIER_SIZE=100, CACHE_LOCAL_TIER_TIMEOUT=5):
+        yield event
+
+
+@pytest.mark.django_db
+def test_local_tier_serves_without_shared_cache(local_tier_event):
+    c = ObjectRelatedCache(local_tier_event)
+    c.set('foo', {'a': 1})
+    django_cache.clear()
+
+    c = ObjectRelatedCache(local_tier_event)
+    assert c.get('foo') == {'a': 1}
+    c.get('foo')['a'] = 2
+    assert c.get('foo') == {'a': 1}
+    assert c.get_many(['foo', 'bar']) == {'foo': {'a': 1}}
+    assert c.get_or_set('foo', lambda: 'other') == {'a': 1}
+
+
+def _next_message(pubsub):
+    for i in range(10):
+        message = pubsub.get_message(timeout=0.1)
+        if message:
+            return json.loads(message['data'])
+
+
+@pytest.mark.django_db
+def test_local_tier_delete_and_clear(local_tier_event, fakeredis_client):
+    pubsub = fakeredis_client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(INVALIDATION_CHANNEL)
+
+    c = ObjectRelatedCache(local_tier_event)
+    c.set('foo', 'bar')
+    c.delete('foo')
+    assert c.get('foo') is None
+    message = _next_message(pubsub)
+    assert message['alias'] == 'default'
+    assert len(message['keys']) == 1
+
+    c.set('foo', 'bar')
+    c.clear()
+    assert c.get('foo') is None
+    message = _next_message(pubsub)
+    assert message == {'alias': 'default', 'prefix': c.prefixkey, 'keys': []}
+
+
+@pytest.mark.django_db
+def test_local_tier_remote_invalidation(local_tier_event):
+    c = ObjectRelatedCache(local_tier_event)
+    c.set('foo', 'bar')
+    # Simulate another process clearing the namespace
+    django_cache.incr(c.prefixkey)
+    assert ObjectRelatedCache(local_tier_event).get('foo') == 'bar'
+    handle_invalidation(json.dumps({'alias': 'default', 'prefix': c.prefixkey, 'keys': []}))
+    assert ObjectRelatedCache(local_tier_event).get('foo') is None
+
+
+def test_local_tier_lru_and_ttl(monkeypatch):
+    tier = LocalCacheTier(max_entries=2, timeout=5)
+    tier.set('a', 1)
+    tier.set('b', 2)
+    assert tier.get('a') == 1
+    tier.set('c', 3)
+    assert tier.get('b') is cache_module._MISSING
+    assert tier.get('a') == 1
+    assert tier.get('c') == 3
+
+    tier.set('d', None)
+    assert tier.get('d') is cache_module._MISSING
+
+    t = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: t + 6)
+    assert tier.get('a') is cache_module._MISSING
+
+
+def test_local_tier_prefix_batch(monkeypatch):
+    class Shared:
+        calls = []
+        data = {'ns1': 1, 'ns2': 2, 'ns3': 3}
+
+        def get_many(self, keys):
+            self.calls.append(sorted(keys))
+            return {k: self.data[k] for k in keys if k in self.data}
+
+    shared = Shared()
+    tier = LocalCacheTier(max_entries=10, timeout=5)
+    assert tier.get_prefix('ns1', shared) == 1
+    assert tier.get_prefix('ns2', shared) == 2
+    assert tier.get_prefix('ns1', shared) == 1
+    assert shared.calls == [['ns1'], ['ns2']]
+
+    t = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: t + 6)
+    shared.data['ns2'] = 5
+    assert tier.get_prefix('ns3', shared) == 3
+    assert shared.calls[-1] == ['ns1', 'ns2', 'ns3']
+    assert tier.get_prefix('ns2', shared) == 5
+    assert len(shared.calls) == 3
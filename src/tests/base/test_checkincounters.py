@@ -0,0 +1,172 @@
+#
+# This file is part of pretix (Community Edition).
+#
+# Copyright (C) 2014-2020 Raphael Michel and contributors
+# Copyright (C) 2020-2021 rami.io GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+#
+from datetime import timedelta
+
+import pytest
+from django.db import transaction
+from django.test import override_settings
+from django.utils.timezone import now
+
+from pretix.base.models import Checkin, Item, Order
+from pretix.base.services import checkincounters
+
+
+@pytest.fixture
+def event(redis_event):
+    with override_settings(PRETIX_CHECKIN_COUNTERS=True):
+        yield redis_event
+
+
+@pytest.fixture
+def item(redis_item):
+    return redis_item
+
+
+@pytest.fixture
+def clist(event):
+    return event.checkin_lists.create(name="Default", all_products=True)
+
+
+def _summary(clist):
+    counts = checkincounters.read(clist)
+    return sum(counts['positions'].values()), sum(counts['checkins'].values()), counts['inside']
+
+
+@pytest.mark.django_db
+def test_list_properties_served_from_counters(event, item, clist, django_assert_num_queries, create_order):
+    o = create_order(event, item, Order.STATUS_PAID, 2)
+    create_order(event, item, Order.STATUS_PENDING, 1)
+    Checkin.objects.create(position=o.positions.first(), list=clist)
+    assert checkincounters.reconcile([clist]) == 0
+
+    with django_assert_num_queries(0):
+        assert checkincounters.read(clist) == {
+            'positions': {(item.pk, None): 2},
+            'checkins': {(item.pk, None): 1},
+            'inside': 1,
+        }
+        assert clist.position_count == 2
+        assert clist.checkin_count == 1
+        assert clist.inside_count == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_checkin_lifecycle(event, item, clist, create_order):
+    checkincounters.reconcile([clist])
+
+    with transaction.atomic():
+        o = create_order(event, item, Order.STATUS_PAID, 2)
+    assert _summary(clist) == (2, 0, 0)
+
+    p = o.positions.first()
+    with transaction.atomic():
+        Checkin.objects.create(position=p, list=clist)
+    assert _summary(clist) == (2, 1, 1)
+
+    with transaction.atomic():
+        Checkin.objects.create(position=p, list=clist, type=Checkin.TYPE_EXIT)
+    assert _summary(clist) == (2, 1, 0)
+
+    with transaction.atomic():
+        Checkin.objects.create(position=p, list=clist)
+    assert _summary(clist) == (2, 1, 1)
+
+    with transaction.atomic():
+        # Late upload of an exit that happened before the last entry does not change anything
+        Checkin.objects.create(position=p, list=clist, type=Checkin.TYPE_EXIT, datetime=now() - timedelta(hours=1))
+        Checkin.objects.create(position=p, list=clist, successful=False, error_reason=Checkin.REASON_ALREADY_REDEEMED)
+    assert _summary(clist) == (2, 1, 1)
+
+    with transaction.atomic():
+        o.status = Order.STATUS_CANCELED
+        o.save(update_fields=['status'])
+        o.create_transactions()
+    assert _summary(clist) == (0, 0, 0)
+    assert checkincounters.reconcile([clist]) == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_pending_orders(event, item, clist, create_order):
+    clist2 = event.checkin_lists.create(name="Pending", all_products=True, include_pending=True)
+    checkincounters.reconcile([clist, clist2])
+
+    with transaction.atomic():
+        o = create_order(event, item, Order.STATUS_PENDING, 1)
+        Checkin.objects.create(position=o.positions.first(), list=clist2)
+    assert _summary(clist) == (0, 0, 0)
+    assert _summary(clist2) == (1, 1, 1)
+
+    with transaction.atomic():
+        o.valid_if_pending = True
+        o.save(update_fields=['valid_if_pending'])
+    assert _summary(clist) == (1, 0, 0)
+
+    with transaction.atomic():
+        o.status = Order.STATUS_PAID
+        o.save(update_fields=['status'])
+        o.create_transactions()
+    assert _summary(clist) == (1, 0, 0)
+    assert _summary(clist2) == (1, 1, 1)
+    assert checkincounters.reconcile([clist, clist2]) == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_limited_products(event, item, clist, create_order):
+    item2 = Item.objects.create(event=event, name="Parking", default_price=5)
+    clist.all_products = False
+    clist.save()
+    clist.limit_products.add(item)
+    checkincounters.reconcile([clist])
+
+    with transaction.atomic():
+        create_order(event, item, Order.STATUS_PAID, 1)
+        o = create_order(event, item2, Order.STATUS_PAID, 1)
+        Checkin.objects.create(position=o.positions.first(), list=clist, force_sent=True)
+    assert _summary(clist) == (1, 0, 0)
+    assert checkincounters.reconcile([clist]) == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_reconcile_repairs_drift_of_bulk_deletions(event, item, clist, create_order):
+    checkincounters.reconcile([clist])
+    with transaction.atomic():
+        o = create_order(event, item, Order.STATUS_PAID, 4)
+        for p in o.positions.all():
+            Checkin.objects.create(position=p, list=clist)
+    assert _summary(clist) == (4, 4, 4)
+
+    # Deleting through a queryset bypasses Checkin.delete(), so the counters do not notice
+    Checkin.objects.filter(list=clist).delete()
+    assert _summary(clist) == (4, 4, 4)
+    assert clist.checkin_count == 4
+    assert checkincounters.reconcile([clist]) == 8
+    assert _summary(clist) == (4, 0, 0)
+    assert clist.checkin_count == 0
+
+
+@pytest.mark.django_db
+def test_list_change_invalidates(event, clist):
+    checkincounters.reconcile([clist])
+    assert checkincounters.read(clist) is not None
+    clist.include_pending = True
+    clist.save()
+    assert checkincounters.read(clist) is None
@@ -0,0 +1,67 @@
+#
+# This file is part of pretix (Community Edition).
+#
+# Copyright (C) 2014-2020 Raphael Michel and contributors
+# Copyright (C) 2020-2021 rami.io GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+#
+import pytest
+from django.db import transaction
+
+from pretix.base.models import Order
+from pretix.base.services import checkinlookup
+
+
+def _key(event, barcode):
+    return checkinlookup.negative_cache_key(event.organizer_id, [event.pk], barcode, 'barcode')
+
+
+@pytest.mark.django_db
+def test_find_position_ids(redis_event, redis_item, create_order, django_assert_num_queries):
+    o = create_order(redis_event, redis_item, Order.STATUS_PAID, 2)
+    p1, p2 = o.positions.all()
+    p2.addon_to = p1
+    p2.save()
+    p1.canceled = True
+    p1.save()
+
+    with django_assert_num_queries(1):
+        assert checkinlookup.find_position_ids([redis_event.pk], p1.secret) == []
+    with django_assert_num_queries(1):
+        assert checkinlookup.find_position_ids([redis_event.pk], p1.secret, addon_match=True) == [p2.pk]
+    with django_assert_num_queries(1):
+        assert checkinlookup.find_position_ids([redis_event.pk], str(p2.pk), allow_pk=True) == [p2.pk]
+    assert checkinlookup.find_position_ids([redis_event.pk], str(p2.pk)) == []
+    assert checkinlookup.find_position_ids([redis_event.pk + 1], p2.secret) == []
+
+
+@pytest.mark.django_db(transaction=True)
+def test_new_secret_invalidates_only_its_own_negative_entries(redis_event, redis_item, create_order):
+    checkinlookup.remember_unknown(_key(redis_event, 'foo bar'))
+    checkinlookup.remember_unknown(_key(redis_event, 'foo+bar'))
+    checkinlookup.remember_unknown(_key(redis_event, 'baz'))
+
+    with transaction.atomic():
+        o = create_order(redis_event, redis_item, Order.STATUS_PAID, 1)
+        p = o.positions.get()
+        p.secret = 'foo bar'
+        p.save(update_fields=['secret'])
+        assert checkinlookup.is_known_unknown(_key(redis_event, 'foo bar'))
+
+    assert not checkinlookup.is_known_unknown(_key(redis_event, 'foo bar'))
+    assert not checkinlookup.is_known_unknown(_key(redis_event, 'foo+bar'))
+    assert checkinlookup.is_known_unknown(_key(redis_event, 'baz'))
@@ -0,0 +1,53 @@
+#
+# This file is part of pretix (Community Edition).
+#
+# Copyright (C) 2014-2020 Raphael Michel and contributors
+# Copyright (C) 2020-2021 rami.io GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+#
+import time
+
+from pretix.base.services import counters
+from pretix.base.services.counters import RecentlyRead, is_reconciled
+
+
+class Obj:
+    def __init__(self, pk):
+        self.pk = pk
+
+
+def test_is_reconciled():
+    assert not is_reconciled({})
+    assert is_reconciled({'reconciled': str(time.time())})
+    assert not is_reconciled({'reconciled': str(time.time() - counters.MAX_AGE - 1)})
+
+
+def test_recently_read(fakeredis_client):
+    known = RecentlyRead('test:known')
+    known.touch(fakeredis_client, [1, 2, 3])
+    fakeredis_client.zadd('test:known', {'4': time.time() - counters.KEEP_ALIVE - 1})
+
+    reconciled = []
+
+    def reconcile(objects):
+        reconciled.append([o.pk for o in objects])
+        return len(objects)
+
+    # Object 2 does not exist any more, object 4 has not been read for too long
+    assert known.reconcile(lambda ids: [Obj(i) for i in ids if i != 2], reconcile, 2) == 2
+    assert reconciled == [[1], [3]]
+    assert {int(i) for i in fakeredis_client.zrange('test:known', 0, -1)} == {1, 3}
@@ -19,18 +19,28 @@
 # You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
 # <https://www.gnu.org/licenses/>.
 #
+import io
+import zipfile
 from datetime import datetime, time, timedelta, timezone
+from decimal import Decimal
+from unittest import mock
 
 import pytest
 from django.core import mail as djmail
+from django.test import override_settings
 from django.utils.timezone import now
 from django_scopes import scope
 from freezegun import freeze_time
 
+from pretix.base.exporters.invoices import InvoiceExporter
+from pretix.base.exporters.orderlist import OrderListExporter
 from pretix.base.models import (
-    Event, Organizer, ScheduledEventExport, ScheduledOrganizerExport, User,
+    Event, Order, OrderPosition, Organizer, ScheduledEventExport,
+    ScheduledOrganizerExport, User,
 )
 from pretix.base.services.export import run_scheduled_exports
+from pretix.base.services.invoices import generate_invoice, invoice_pdf_task
+from pretix.helpers.iter import chunked_iterable
 
 
 @pytest.fixture(scope='function')
@@ -360,3 +370,71 @@ def test_organizer_ok(event, user, team):
     assert len(djmail.outbox[0].attachments) == 1
     assert djmail.outbox[0].attachments[0][0] == "dummy_events.csv"
     assert len(djmail.outbox[0].attachments[0][1].splitlines()) == 3
+
+
+@pytest.mark.django_db(transaction=True)
+def test_orderlist_positions_with_export_workers(event):
+    item = event.items.create(name="Ticket", default_price=23)
+    for i in range(5):
+        o = Order.objects.create(
+            event=event, status=Order.STATUS_PAID, expires=now() + timedelta(days=3), total=23 * 3,
+            datetime=now() - timedelta(hours=i), sales_channel=event.organizer.sales_channels.get(identifier="web"),
+        )
+        for j in range(3):
+            OrderPosition.objects.create(order=o, item=item, price=23, positionid=j + 1)
+
+    form_data = {'_format': 'positions:default', 'paid_only': False, 'group_multiple_choice': False}
+    with override_settings(PRETIX_EXPORT_WORKERS=1):
+        expected = OrderListExporter(event, event.organizer).render(form_data)
+    small_chunks = mock.patch('pretix.base.exporters.orderlist.chunked_iterable', lambda it, size: chunked_iterable(it, 2))
+    with override_settings(PRETIX_EXPORT_WORKERS=3), small_chunks:
+        assert OrderListExporter(event, event.organizer).render(form_data) == expected
+    assert expected[2].count(b'\n') == 16
+
+
+@pytest.mark.django_db
+def test_orderlist_positions_parquet(event):
+    pyarrow_parquet = pytest.importorskip('pyarrow.parquet')
+    item = event.items.create(name="Ticket", default_price=23)
+    with scope(organizer=event.organizer):
+        o = Order.objects.create(
+            event=event, status=Order.STATUS_PAID, expires=now() + timedelta(days=3), total=23,
+            datetime=datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+            sales_channel=event.organizer.sales_channels.get(identifier="web"),
+        )
+        OrderPosition.objects.create(order=o, item=item, price=23, positionid=1)
+
+        form_data = {'_format': 'positions:parquet', 'paid_only': False, 'group_multiple_choice': False}
+        filename, content_type, data = OrderListExporter(event, event.organizer).render(form_data)
+    assert filename.endswith('.parquet')
+    assert content_type == 'application/vnd.apache.parquet'
+    rows = pyarrow_parquet.read_table(io.BytesIO(data)).to_pylist()
+    assert len(rows) == 1
+    assert rows[0]['Order code'] == o.code
+    assert rows[0]['Product ID'] == item.pk
+    assert rows[0]['Price'] == Decimal('23.00')
+    assert str(rows[0]['Order date']) == '2024-01-02'
+
+
+@pytest.mark.django_db
+def test_invoice_zip_generates_missing_files(event):
+    item = event.items.create(name="Ticket", default_price=23)
+    invoices = []
+    for i in range(3):
+        o = Order.objects.create(
+            event=event, status=Order.STATUS_PAID, expires=now() + timedelta(days=3), total=23,
+            sales_channel=event.organizer.sales_channels.get(identifier="web"),
+        )
+        OrderPosition.objects.create(order=o, item=item, price=23, positionid=1)
+        invoices.append(generate_invoice(o, trigger_pdf=False))
+    invoice_pdf_task.apply(args=(invoices[0].pk,))
+
+    progress = mock.Mock()
+    filename, content_type, data = InvoiceExporter(event, event.organizer, progress).render({})
+    assert filename == 'dummy_invoices.zip'
+    with zipfile.ZipFile(io.BytesIO(data)) as zipf:
+        assert sorted(zipf.namelist()) == sorted('{}-{}.pdf'.format(i.number, i.order.code) for i in invoices)
+        assert all(zipf.read(n).startswith(b'%PDF') for n in zipf.namelist())
+    for i in invoices:
+        i.refresh_from_db()
+        assert i.file
@@ -0,0 +1,67 @@
+#
+# This file is part of pretix (Community Edition).
+#
+# Copyright (C) 2014-2020 Raphael Michel and contributors
+# Copyright (C) 2020-2021 rami.io GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+#
+import pytest
+from django.utils.timezone import now
+
+from pretix.base.models import Event, Organizer
+from pretix.base.services import locking
+from pretix.base.services.locking import (
+    LOCK_CONTENTION_HIGH, LOCK_GRANULARITY_THRESHOLD_MAX, adapt_lock_threshold,
+    get_lock_contention, record_lock_contention,
+)
+
+
+@pytest.fixture
+def event():
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    return Event.objects.create(organizer=o, name='Dummy', slug='dummy', date_from=now())
+
+
+def test_threshold_unchanged_without_contention():
+    assert adapt_lock_threshold(20, {}) == 20
+    assert adapt_lock_threshold(20, {1: 0.0}) == 20
+    assert adapt_lock_threshold(None, {1: 1.0}) is None
+
+
+def test_threshold_grows_with_contention():
+    assert adapt_lock_threshold(20, {1: LOCK_CONTENTION_HIGH / 2}) == 20 + (LOCK_GRANULARITY_THRESHOLD_MAX - 20) // 2
+    assert adapt_lock_threshold(20, {1: 0.0, 2: LOCK_CONTENTION_HIGH}) == LOCK_GRANULARITY_THRESHOLD_MAX
+    assert adapt_lock_threshold(20, {1: LOCK_CONTENTION_HIGH * 10}) == LOCK_GRANULARITY_THRESHOLD_MAX
+    assert adapt_lock_threshold(500, {1: LOCK_CONTENTION_HIGH}) == 500
+
+
+@pytest.mark.django_db
+def test_contention_moving_average(event, fakeredis_client):
+    contention = get_lock_contention({event})
+    assert contention == {event.pk: 0.0}
+
+    record_lock_contention(contention, 1.0)
+    contention = get_lock_contention({event})
+    assert contention[event.pk] == pytest.approx(locking.LOCK_CONTENTION_WEIGHT)
+
+    for i in range(50):
+        record_lock_contention(get_lock_contention({event}), 1.0)
+    assert get_lock_contention({event})[event.pk] == pytest.approx(1.0, abs=0.01)
+
+    for i in range(50):
+        record_lock_contention(get_lock_contention({event}), 0.0)
+    assert get_lock_contention({event})[event.pk] == pytest.approx(0.0, abs=0.01)
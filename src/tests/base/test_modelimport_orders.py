@@ -27,13 +27,14 @@ from io import StringIO
 import pytest
 from django.conf import settings as django_settings
 from django.core.files.base import ContentFile
+from django.test import override_settings
 from django.utils.timezone import now
 from django_scopes import scopes_disabled
 from i18nfield.strings import LazyI18nString
 
 from pretix.base.models import (
-    CachedFile, Event, Item, Order, OrderPayment, OrderPosition, Organizer,
-    Question, QuestionAnswer, User,
+    CachedFile, Event, Item, LogEntry, Order, OrderPayment, OrderPosition,
+    Organizer, Question, QuestionAnswer, Transaction, User,
 )
 from pretix.base.services.modelimport import DataImportError, import_orders
 
@@ -160,6 +161,80 @@ def test_import_simple(event, item, user):
     assert OrderPosition.objects.count() == 3
 
 
+@pytest.mark.django_db
+@scopes_disabled()
+def test_import_in_chunks(event, item, user):
+    settings = dict(DEFAULT_SETTINGS)
+    settings['item'] = 'static:{}'.format(item.pk)
+    with override_settings(PRETIX_IMPORT_CHUNK_SIZE=5):
+        import_orders.apply(
+            args=(event.pk, inputfile_factory(multiplier=4).id, settings, 'en', user.pk)
+        ).get()
+    assert event.orders.count() == 12
+    assert len(set(event.orders.values_list('code', flat=True))) == 12
+    assert len(set(OrderPosition.objects.values_list('secret', flat=True))) == 12
+    assert OrderPayment.objects.filter(order__event=event).count() == 12
+    assert Transaction.objects.filter(order__event=event).count() == 12
+    assert LogEntry.objects.filter(action_type='pretix.event.order.placed').count() == 12
+    for o in event.orders.all():
+        assert o.invoice_address.country == 'DE'
+        assert o.positions.get().attendee_name_cached == ''
+
+
+@pytest.mark.django_db
+@scopes_disabled()
+def test_import_broken_row_imports_nothing(event, item, user):
+    settings = dict(DEFAULT_SETTINGS)
+    settings['item'] = 'static:{}'.format(item.pk)
+    settings['attendee_email'] = 'csv:C'
+    cf = inputfile_factory(multiplier=2)
+    data = cf.file.read().decode()
+    cf.file.save("input.csv", ContentFile(data + "Foo,Bar,invalid,,,,,,,,,,,\r\n"))
+    with override_settings(PRETIX_IMPORT_CHUNK_SIZE=2):
+        with pytest.raises(DataImportError):
+            import_orders.apply(
+                args=(event.pk, cf.id, settings, 'en', user.pk)
+            ).get()
+    assert event.orders.count() == 0
+
+
+@pytest.mark.django_db
+@scopes_disabled()
+def test_import_resumes_after_failing_chunk(event, item, user, monkeypatch):
+    from pretix.base.services import modelimport
+
+    settings = dict(DEFAULT_SETTINGS)
+    settings['item'] = 'static:{}'.format(item.pk)
+    cf = inputfile_factory(multiplier=4)
+    save_orders = modelimport._save_orders
+    calls = []
+
+    def fail_on_second_chunk(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 2:
+            raise DataImportError('Failure.')
+        save_orders(*args, **kwargs)
+
+    monkeypatch.setattr(modelimport, '_save_orders', fail_on_second_chunk)
+    with override_settings(PRETIX_IMPORT_CHUNK_SIZE=5):
+        with pytest.raises(DataImportError) as excinfo:
+            import_orders.apply(
+                args=(event.pk, cf.id, settings, 'en', user.pk)
+            ).get()
+    assert 'The first 5 of 12 rows of your file have already been imported.' in str(excinfo.value)
+    assert event.orders.count() == 5
+
+    monkeypatch.setattr(modelimport, '_save_orders', save_orders)
+    with override_settings(PRETIX_IMPORT_CHUNK_SIZE=5):
+        import_orders.apply(
+            args=(event.pk, cf.id, settings, 'en', user.pk)
+        ).get()
+    assert event.orders.count() == 12
+    assert OrderPosition.objects.count() == 12
+    assert LogEntry.objects.filter(action_type='pretix.event.order.placed').count() == 12
+    assert not CachedFile.objects.filter(pk=cf.pk).exists()
+
+
 @pytest.mark.django_db
 @scopes_disabled()
 def test_import_as_one_order(user, event, item):
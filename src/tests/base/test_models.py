@@ -38,7 +38,9 @@ import time
 import zoneinfo
 from datetime import date, timedelta
 from decimal import Decimal
+from unittest import mock
 
+import django_redis
 import pytest
 from dateutil.tz import tzoffset
 from django.conf import settings
@@ -63,7 +65,7 @@ from pretix.base.models.items import (
 )
 from pretix.base.reldate import RelativeDate, RelativeDateWrapper
 from pretix.base.services.orders import OrderError, cancel_order, perform_order
-from pretix.base.services.quotas import QuotaAvailability
+from pretix.base.services.quotas import QuotaAvailability, QuotaTopology
 from pretix.testutils.scope import classscope
 
 
@@ -543,6 +545,73 @@ class QuotaTestCase(BaseQuotaTestCase):
         qa.compute(allow_cache=True)
         assert qa.results[self.quota] == (Quota.AVAILABILITY_OK, 5)
 
+    @classscope(attr='o')
+    def test_expired_cache_single_flight(self):
+        self.quota.items.add(self.item1)
+        rc = django_redis.get_redis_connection("redis")
+        rc.hset(f'quotas:{self.event.pk}:availabilitycache', str(self.quota.pk), f'100,1,{int(time.time()) - 300},0.5')
+
+        # Someone else is already recomputing, so we keep using the expired entry
+        rc.set(f'quotas:availabilitycacherefresh:{self.quota.pk}', '1')
+        qa = QuotaAvailability()
+        qa.queue(self.quota)
+        with self.assertNumQueries(0):
+            qa.compute(allow_cache=True)
+        assert qa.results[self.quota] == (Quota.AVAILABILITY_OK, 1)
+
+        # Nobody is recomputing, so we do it ourselves
+        rc.delete(f'quotas:availabilitycacherefresh:{self.quota.pk}')
+        qa = QuotaAvailability()
+        qa.queue(self.quota)
+        qa.compute(allow_cache=True)
+        assert qa.results[self.quota] == (Quota.AVAILABILITY_OK, 2)
+        assert not rc.exists(f'quotas:availabilitycacherefresh:{self.quota.pk}')
+        data = rc.hget(f'quotas:{self.event.pk}:availabilitycache', str(self.quota.pk)).decode().split(',')
+        assert data[:2] == ['100', '2']
+        assert time.time() - int(data[2]) < 10
+
+    @classscope(attr='o')
+    def test_cache_entry_expired_early(self):
+        assert not QuotaAvailability._cache_entry_expired(60, 0)
+        assert QuotaAvailability._cache_entry_expired(120, 0)
+        with mock.patch('pretix.base.services.quotas.random.random', return_value=0.999999):
+            # The longer a computation takes, the earlier we refresh
+            assert not QuotaAvailability._cache_entry_expired(60, 0.5)
+            assert QuotaAvailability._cache_entry_expired(60, 5)
+
+    @classscope(attr='o')
+    def test_topology_cached(self):
+        self.quota.items.add(self.item1)
+        self.quota.size = 5
+        self.quota.save()
+        qa = QuotaAvailability(full_results=True)
+        qa.queue(self.quota)
+        qa.compute()
+        assert qa.results[self.quota] == (Quota.AVAILABILITY_OK, 5)
+        assert QuotaTopology.for_events([self.event])[self.event.pk].items == {self.quota.pk: [self.item1.pk]}
+
+        with self.assertNumQueries(4):  # orders, vouchers, carts, waiting list
+            qa = QuotaAvailability(full_results=True)
+            qa.queue(self.quota)
+            qa.compute()
+
+        self.quota.items.add(self.item2)
+        self.quota.variations.add(self.var1)
+        topology = QuotaTopology.for_events([self.event])[self.event.pk]
+        assert sorted(topology.items[self.quota.pk]) == sorted([self.item1.pk, self.item2.pk])
+        assert topology.variations[self.quota.pk] == [(self.var1.pk, self.item2.pk)]
+
+        cp = CartPosition.objects.create(event=self.event, item=self.item2, variation=self.var1, price=2,
+                                         expires=now() + timedelta(days=3))
+        qa = QuotaAvailability()
+        qa.queue(self.quota)
+        qa.compute()
+        assert qa.results[self.quota] == (Quota.AVAILABILITY_OK, 4)
+        cp.delete()
+
+        self.quota.variations.remove(self.var1)
+        assert QuotaTopology.for_events([self.event])[self.event.pk].variations == {}
+
     @classscope(attr='o')
     def test_waitinglist_variation_fulfilled(self):
         self.quota.variations.add(self.var1)
@@ -2796,6 +2865,48 @@ class SeatingTestCase(TestCase):
         assert not self.seat_a1.is_available()
         assert self.seat_a2.is_available()
 
+    @classscope(attr='organizer')
+    def test_blocked_in_proximity_large_plan(self):
+        seats = {}
+        for row in range(20):
+            for number in range(20):
+                seats[row, number] = self.event.seats.create(
+                    seat_number=str(number), row_name=str(row), product=self.ticket, x=number * 2, y=row * 3
+                )
+        o = Order.objects.create(
+            code='FOO', event=self.event, email='dummy@dummy.test', total=Decimal("30"),
+            sales_channel=self.event.organizer.sales_channels.get(identifier="web"),
+            locale='en', status=Order.STATUS_PAID, datetime=now(),
+            expires=now() + timedelta(days=10),
+        )
+        for taken in ((0, 0), (5, 5), (5, 6), (19, 19)):
+            OrderPosition.objects.create(
+                order=o, item=self.ticket, variation=None, price=Decimal("12"), seat=seats[taken]
+            )
+
+        self.event.settings.seating_minimal_distance = 3.5
+        expected_free = {
+            s for (row, number), s in seats.items()
+            if not any(
+                (number * 2 - tn * 2) ** 2 + (row * 3 - tr * 3) ** 2 < 3.5 ** 2
+                for tr, tn in ((0, 0), (5, 5), (5, 6), (19, 19))
+            )
+        }
+        free = set(self.event.free_seats().filter(pk__in=[s.pk for s in seats.values()]))
+        assert free == expected_free
+        assert seats[4, 5] not in free
+        assert seats[5, 7] not in free
+        assert seats[5, 8] in free
+        for s in (seats[4, 5], seats[5, 7], seats[5, 8], seats[10, 10]):
+            assert s.is_available() == (s in expected_free)
+
+        self.event.settings.seating_distance_within_row = True
+        free = set(self.event.free_seats().filter(pk__in=[s.pk for s in seats.values()]))
+        assert seats[4, 5] in free
+        assert seats[5, 7] not in free
+        assert seats[4, 5].is_available()
+        assert not seats[5, 7].is_available()
+
     @classscope(attr='organizer')
     def test_order_pending(self):
         o = Order.objects.create(
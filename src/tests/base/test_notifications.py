@@ -29,7 +29,7 @@ from django.utils.timezone import now
 from django_scopes import scope
 
 from pretix.base.models import (
-    Event, Item, Order, OrderPosition, Organizer, User,
+    Event, Item, LogEntry, Order, OrderPosition, Organizer, User,
 )
 
 
@@ -151,4 +151,52 @@ def test_notification_ignore_insufficient_permissions(event, order, user, team,
         order.log_action('pretix.event.order.paid', {})
     assert len(djmail.outbox) == 0
 
+
+@pytest.mark.django_db
+def test_notification_digest(event, order, user, monkeypatch_on_commit):
+    djmail.outbox = []
+    user.notification_settings.create(
+        method='mail', event=None, action_type='pretix.event.order.paid', enabled=True
+    )
+    user.notification_settings.create(
+        method='mail', event=None, action_type='pretix.event.order.canceled', enabled=True
+    )
+    with transaction.atomic():
+        LogEntry.bulk_create_and_postprocess([
+            LogEntry(content_object=order, action_type=a, event=event, organizer_id=event.organizer_id, data='{}')
+            for a in ('pretix.event.order.paid', 'pretix.event.order.canceled', 'pretix.event.order.placed')
+        ])
+    assert len(djmail.outbox) == 1
+    assert djmail.outbox[0].subject.endswith("DUMMY: 2 new notifications")
+    assert "Order FOO has been marked as paid." in djmail.outbox[0].body
+    assert "Order FOO has been canceled." in djmail.outbox[0].body
+
+
+@pytest.mark.django_db
+def test_notification_recipients_cache_invalidation(event, order, user, team, fakeredis_client,
+                                                    monkeypatch_on_commit):
+    djmail.outbox = []
+    ns = user.notification_settings.create(
+        method='mail', event=event, action_type='pretix.event.order.paid', enabled=True
+    )
+    with transaction.atomic():
+        order.log_action('pretix.event.order.paid', {})
+    assert len(djmail.outbox) == 1
+
+    team.members.remove(user)
+    with transaction.atomic():
+        order.log_action('pretix.event.order.paid', {})
+    assert len(djmail.outbox) == 1
+
+    team.members.add(user)
+    with transaction.atomic():
+        order.log_action('pretix.event.order.paid', {})
+    assert len(djmail.outbox) == 2
+
+    ns.enabled = False
+    ns.save()
+    with transaction.atomic():
+        order.log_action('pretix.event.order.paid', {})
+    assert len(djmail.outbox) == 2
+
 # TODO: Test email content
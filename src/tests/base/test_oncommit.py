@@ -0,0 +1,79 @@
+#
+# This file is part of pretix (Community Edition).
+#
+# Copyright (C) 2014-2020 Raphael Michel and contributors
+# Copyright (C) 2020-2021 rami.io GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+#
+import pytest
+from django.db import transaction
+
+from pretix.base.models._oncommit import OnCommitCounter
+
+
+@pytest.fixture
+def flushed():
+    return []
+
+
+@pytest.fixture
+def counter(flushed):
+    return OnCommitCounter(lambda counts: flushed.append(dict(counts)))
+
+
+@pytest.mark.django_db(transaction=True)
+def test_flushed_once_per_transaction(counter, flushed):
+    with transaction.atomic():
+        counter.add('a')
+        counter.add('a', 2)
+        counter.add('b', -1)
+        assert flushed == []
+    assert flushed == [{'a': 3, 'b': -1}]
+
+    with transaction.atomic():
+        counter.add('b')
+    assert flushed == [{'a': 3, 'b': -1}, {'b': 1}]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_rolled_back_transaction_is_dropped(counter, flushed):
+    with pytest.raises(ZeroDivisionError):
+        with transaction.atomic():
+            counter.add('a')
+            1 / 0
+    assert flushed == []
+
+    with transaction.atomic():
+        counter.add('b')
+    assert flushed == [{'b': 1}]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_outside_of_transaction(counter, flushed):
+    counter.add('a')
+    counter.add('a')
+    assert flushed == [{'a': 1}, {'a': 1}]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_independent_counters(flushed):
+    first = OnCommitCounter(lambda counts: flushed.append(('first', dict(counts))))
+    second = OnCommitCounter(lambda counts: flushed.append(('second', dict(counts))))
+    with transaction.atomic():
+        first.add('a')
+        second.add('b')
+    assert flushed == [('first', {'a': 1}), ('second', {'b': 1})]
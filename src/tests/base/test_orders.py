@@ -54,6 +54,7 @@ from pretix.base.services.orders import (
     deny_order, expire_orders, reactivate_order, send_download_reminders,
     send_expiry_warnings,
 )
+from pretix.base.services.quotas import QuotaAvailability
 from pretix.plugins.banktransfer.payment import BankTransfer
 from pretix.testutils.mock import mocker_context
 from pretix.testutils.scope import classscope
@@ -357,6 +358,35 @@ def test_expiring_paid_invoice(event):
     assert o2.transactions.aggregate(s=Sum(F('price') * F('count')))['s'] == Decimal('12.00')
 
 
+@pytest.mark.django_db
+def test_expiring_in_chunks(event, fakeredis_client):
+    ticket = Item.objects.create(event=event, name='Early-bird ticket', default_price=Decimal('12.00'))
+    orders = []
+    for i in range(60):
+        o = Order.objects.create(
+            code='FO{}'.format(i), event=event, email='dummy@dummy.test',
+            status=Order.STATUS_PENDING, locale='en',
+            datetime=now(), expires=now() - timedelta(days=1),
+            total=12,
+            sales_channel=event.organizer.sales_channels.get(identifier="web"),
+        )
+        OrderPosition.objects.create(order=o, item=ticket, price=Decimal("12.00"), positionid=1)
+        o.create_transactions()
+        orders.append(o)
+    Order.objects.filter(pk=orders[-1].pk).update(status=Order.STATUS_PAID)
+    keys = [
+        f'quotas:{event.pk}:availabilitycache{QuotaAvailability(count_waitinglist=cw, ignore_closed=ic)._cache_key_suffix}'
+        for cw in (True, False) for ic in (True, False)
+    ]
+    for k in keys:
+        fakeredis_client.hset(k, 'foo', 'bar')
+
+    expire_orders(None)
+    assert Order.objects.filter(status=Order.STATUS_EXPIRED).count() == 59
+    assert event.logentry_set.filter(action_type='pretix.event.order.expired').count() == 59
+    assert not fakeredis_client.exists(*keys)
+
+
 @pytest.mark.django_db
 def test_expire_twice(event):
     o2 = Order.objects.create(
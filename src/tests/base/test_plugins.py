@@ -19,11 +19,14 @@
 # You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
 # <https://www.gnu.org/licenses/>.
 #
+from unittest import mock
+
 import pytest
 from django.conf import settings
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.utils.timezone import now
 
+from pretix.base import metrics
 from pretix.base.models import Event, Organizer
 from pretix.base.plugins import get_all_plugins
 from pretix.base.signals import register_ticket_outputs
@@ -68,3 +71,39 @@ class PluginSignalTest(TestCase):
         responses = register_ticket_outputs.send(self.event, **payload)
         self.assertEqual(len(responses), 1)
         self.assertIn('tests.testdummy.signals', [r[0].__module__ for r in responses])
+
+    def test_dispatch_table_follows_plugins(self):
+        self.event.plugins = 'tests.testdummy'
+        self.assertEqual(len(register_ticket_outputs.send(self.event)), 1)
+        self.event.plugins = ''
+        self.assertEqual(len(register_ticket_outputs.send(self.event)), 0)
+        self.event.plugins = 'tests.testdummy'
+        self.assertEqual(len(register_ticket_outputs.send(self.event)), 1)
+
+    def test_dispatch_table_invalidated_on_connect(self):
+        self.event.plugins = 'tests.testdummy'
+        register_ticket_outputs.send(self.event)
+
+        def core_receiver(sender, **kwargs):
+            return 'core'
+        core_receiver.__module__ = 'pretix.base.signals'
+
+        register_ticket_outputs.connect(core_receiver)
+        try:
+            responses = register_ticket_outputs.send(self.event)
+            self.assertEqual([r[1] for r in responses][0], 'core')
+            self.assertEqual(len(responses), 2)
+        finally:
+            register_ticket_outputs.disconnect(core_receiver)
+        self.assertEqual(len(register_ticket_outputs.send(self.event)), 1)
+
+    def test_receiver_metrics(self):
+        self.event.plugins = 'tests.testdummy'
+        with mock.patch.object(metrics.pretix_plugin_receiver_duration_seconds, 'observe') as observe:
+            register_ticket_outputs.send(self.event)
+            observe.assert_not_called()
+            with override_settings(PRETIX_SIGNAL_RECEIVER_METRICS=True):
+                register_ticket_outputs.send(self.event)
+            observe.assert_called_once()
+            self.assertEqual(observe.call_args.kwargs['plugin'], 'tests.testdummy')
+            self.assertTrue(observe.call_args.kwargs['receiver'].startswith('tests.testdummy.signals.'))
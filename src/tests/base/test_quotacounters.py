@@ -0,0 +1,179 @@
+#
+# This file is part of pretix (Community Edition).
+#
+# Copyright (C) 2014-2020 Raphael Michel and contributors
+# Copyright (C) 2020-2021 rami.io GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+#
+from datetime import timedelta
+
+import pytest
+from django.db import transaction
+from django.test import override_settings
+from django.utils.timezone import now
+
+from pretix.base.models import (
+    CartPosition, Order, Quota, Voucher, WaitingListEntry,
+)
+from pretix.base.services import quotacounters
+from pretix.base.services.quotas import QuotaAvailability
+
+
+@pytest.fixture
+def event(redis_event):
+    with override_settings(PRETIX_QUOTA_COUNTERS=True):
+        yield redis_event
+
+
+@pytest.fixture
+def item(redis_item):
+    return redis_item
+
+
+@pytest.fixture
+def quota(event, item):
+    q = Quota.objects.create(name="Test", size=10, event=event)
+    q.items.add(item)
+    return q
+
+
+def _cached_availability(quota):
+    qa = QuotaAvailability()
+    qa.queue(quota)
+    qa.compute(allow_cache=True)
+    return qa.results[quota]
+
+
+@pytest.mark.django_db
+def test_counters_not_used_before_reconciliation(event, item, quota, fakeredis_client):
+    assert quotacounters.read([quota]) == {}
+    assert fakeredis_client.zscore(quotacounters.KNOWN_KEY, str(quota.pk))
+
+
+@pytest.mark.django_db
+def test_reconcile_and_read(event, item, quota, django_assert_num_queries, create_order):
+    create_order(event, item, Order.STATUS_PAID, 2)
+    create_order(event, item, Order.STATUS_PENDING, 1)
+    assert quotacounters.reconcile([quota]) == 0
+    assert quotacounters.read([quota])[quota] == {
+        'paid': 2, 'pending': 1, 'exited': 0, 'vouchers': 0, 'cart': 0, 'waitinglist': 0,
+    }
+
+    with django_assert_num_queries(0):
+        assert _cached_availability(quota) == (Quota.AVAILABILITY_OK, 7)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_order_lifecycle(event, item, quota, create_order):
+    quotacounters.reconcile([quota])
+
+    with transaction.atomic():
+        o = create_order(event, item, Order.STATUS_PENDING, 3)
+    assert quotacounters.read([quota])[quota]['pending'] == 3
+    assert _cached_availability(quota) == (Quota.AVAILABILITY_OK, 7)
+
+    with transaction.atomic():
+        o.status = Order.STATUS_PAID
+        o.save(update_fields=['status'])
+        o.create_transactions()
+    counts = quotacounters.read([quota])[quota]
+    assert counts['pending'] == 0
+    assert counts['paid'] == 3
+
+    with transaction.atomic():
+        o.status = Order.STATUS_CANCELED
+        o.save(update_fields=['status'])
+        o.create_transactions()
+    counts = quotacounters.read([quota])[quota]
+    assert counts['pending'] == 0
+    assert counts['paid'] == 0
+    assert quotacounters.reconcile([quota]) == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_carts_vouchers_and_waitinglist(event, item, quota):
+    quota.size = 3
+    quota.save()
+    quotacounters.reconcile([quota])
+
+    with transaction.atomic():
+        cp = CartPosition.objects.create(
+            event=event, item=item, price=23, expires=now() + timedelta(minutes=10), cart_id='foo'
+        )
+    assert _cached_availability(quota) == (Quota.AVAILABILITY_OK, 2)
+
+    with transaction.atomic():
+        v = Voucher.objects.create(event=event, item=item, block_quota=True, max_usages=2)
+    assert _cached_availability(quota) == (Quota.AVAILABILITY_RESERVED, 0)
+
+    with transaction.atomic():
+        cp.delete()
+        v.max_usages = 1
+        v.save()
+    assert _cached_availability(quota) == (Quota.AVAILABILITY_OK, 2)
+
+    with transaction.atomic():
+        wle = WaitingListEntry.objects.create(event=event, item=item, email='foo@example.org')
+    assert _cached_availability(quota) == (Quota.AVAILABILITY_OK, 1)
+
+    with transaction.atomic():
+        wle.voucher = v
+        wle.save()
+        v.delete()
+    assert _cached_availability(quota) == (Quota.AVAILABILITY_OK, 3)
+    assert quotacounters.reconcile([quota]) == 0
+
+
+@pytest.mark.django_db
+def test_reconcile_repairs_drift(event, item, quota, fakeredis_client, create_order):
+    quotacounters.reconcile([quota])
+    with override_settings(PRETIX_QUOTA_COUNTERS=False):
+        create_order(event, item, Order.STATUS_PAID, 4)
+    assert quotacounters.read([quota])[quota]['paid'] == 0
+    assert quotacounters.reconcile([quota]) == 4
+    assert quotacounters.read([quota])[quota]['paid'] == 4
+
+
+@pytest.mark.django_db
+def test_quota_change_invalidates(event, item, quota):
+    quotacounters.reconcile([quota])
+    assert quota in quotacounters.read([quota])
+    quota.size = 5
+    quota.save()
+    assert quotacounters.read([quota]) == {}
+
+
+@pytest.mark.django_db
+def test_closed_and_unlimited_quotas_are_not_counted(event, item, quota):
+    quota.size = None
+    quota.save()
+    quotacounters.reconcile([quota])
+    assert _cached_availability(quota) == (Quota.AVAILABILITY_OK, None)
+
+
+def test_availability_from_counts():
+    q = Quota(size=5, release_after_exit=True)
+    counts = {s: 0 for s in quotacounters.STATES}
+    assert quotacounters.availability_from_counts(q, counts) == (Quota.AVAILABILITY_OK, 5)
+    assert quotacounters.availability_from_counts(q, {**counts, 'paid': 5}) == (Quota.AVAILABILITY_GONE, 0)
+    assert quotacounters.availability_from_counts(q, {**counts, 'paid': 5, 'exited': 2}) == (Quota.AVAILABILITY_OK, 2)
+    assert quotacounters.availability_from_counts(q, {**counts, 'paid': 3, 'pending': 2}) == (Quota.AVAILABILITY_ORDERED, 0)
+    assert quotacounters.availability_from_counts(q, {**counts, 'vouchers': 2, 'cart': 3}) == (Quota.AVAILABILITY_RESERVED, 0)
+    assert quotacounters.availability_from_counts(q, {**counts, 'waitinglist': 5}) == (Quota.AVAILABILITY_ORDERED, 0)
+    assert quotacounters.availability_from_counts(q, {**counts, 'waitinglist': 5}, count_waitinglist=False) == (
+        Quota.AVAILABILITY_OK, 5
+    )
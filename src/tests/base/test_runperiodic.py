@@ -20,10 +20,77 @@
 # <https://www.gnu.org/licenses/>.
 #
 import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
 
+from pretix.base import metrics
 from pretix.base.signals import periodic_task
+from pretix.helpers.periodic import is_due, minimum_interval
 
 
 @pytest.mark.django_db
 def test_all_periodic_tasks():
     periodic_task.send(sender=None)
+
+
+calls = []
+
+
+def _task(signal, sender, **kwargs):
+    calls.append(sender)
+
+
+@minimum_interval(minutes_after_success=60)
+def _limited_task(signal, sender, **kwargs):
+    calls.append(sender)
+
+
+def _failing_task(signal, sender, **kwargs):
+    raise ZeroDivisionError()
+
+
+@pytest.fixture
+def receivers(fakeredis_client, monkeypatch):
+    calls.clear()
+    monkeypatch.setattr(metrics, "redis", fakeredis_client, raising=False)
+    for r in (_task, _limited_task, _failing_task):
+        periodic_task.connect(r)
+    yield fakeredis_client
+    for r in (_task, _limited_task, _failing_task):
+        periodic_task.disconnect(r)
+
+
+@pytest.mark.django_db
+def test_dispatch(receivers):
+    call_command('runperiodic', dispatch=True, tasks='tests.base.test_runperiodic._task')
+    assert calls == [None]
+    call_command('runperiodic', dispatch=True, tasks='tests.base.test_runperiodic._task')
+    assert calls == [None, None]
+
+
+@pytest.mark.django_db
+def test_dispatch_skips_queued_task(receivers):
+    assert cache.add('pretix_periodic_tests.base.test_runperiodic._task_dispatched', '1')
+    call_command('runperiodic', dispatch=True, tasks='tests.base.test_runperiodic._task')
+    assert calls == []
+
+
+@pytest.mark.django_db
+def test_dispatch_minimum_interval(receivers):
+    call_command('runperiodic', dispatch=True, tasks='tests.base.test_runperiodic._limited_task')
+    assert not is_due(_limited_task)
+    call_command('runperiodic', dispatch=True, tasks='tests.base.test_runperiodic._limited_task')
+    assert calls == [None]
+
+
+@pytest.mark.django_db
+@override_settings(METRICS_ENABLED=True)
+def test_metrics(receivers):
+    call_command('runperiodic', tasks='tests.base.test_runperiodic._limited_task,tests.base.test_runperiodic._failing_task')
+    call_command('runperiodic', tasks='tests.base.test_runperiodic._limited_task')
+    stored = {k.decode(): float(v) for k, v in receivers.hgetall(metrics.REDIS_KEY).items()}
+    assert stored['pretix_periodic_task_runs_total{task_name="tests.base.test_runperiodic._limited_task",status="success"}'] == 1
+    assert stored['pretix_periodic_task_runs_total{task_name="tests.base.test_runperiodic._limited_task",status="skipped"}'] == 1
+    assert stored['pretix_periodic_task_runs_total{task_name="tests.base.test_runperiodic._failing_task",status="error"}'] == 1
+    assert stored['pretix_periodic_task_duration_seconds_count{task_name="tests.base.test_runperiodic._limited_task"}'] == 1
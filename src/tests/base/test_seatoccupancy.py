@@ -0,0 +1,182 @@
+#
+# This file is part of pretix (Community Edition).
+#
+# Copyright (C) 2014-2020 Raphael Michel and contributors
+# Copyright (C) 2020-2021 rami.io GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+#
+import base64
+from datetime import timedelta
+
+import pytest
+from django.db import transaction
+from django.test import override_settings
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+
+from pretix.base.models import CartPosition, Item, Order, SeatingPlan, Voucher
+from pretix.base.services import seatoccupancy
+
+
+@pytest.fixture
+def event(redis_event):
+    redis_event.seating_plan = SeatingPlan.objects.create(name="Plan", organizer=redis_event.organizer, layout="{}")
+    redis_event.save()
+    with override_settings(PRETIX_SEAT_OCCUPANCY=True):
+        yield redis_event
+
+
+@pytest.fixture
+def item(redis_item):
+    return redis_item
+
+
+@pytest.fixture
+def seats(event, item):
+    return [
+        event.seats.create(seat_guid=f"A{i}", seat_number=str(i), row_name="A", product=item, x=i * 10, y=0)
+        for i in range(1, 11)
+    ]
+
+
+def _available(event, sales_channel='web'):
+    occupancy = seatoccupancy.read(event)
+    data = occupancy.available(event, sales_channel=sales_channel)
+    return {
+        guid for i, guid in enumerate(occupancy.guids)
+        if data[i // 8] & (0x80 >> (i % 8))
+    }
+
+
+@pytest.mark.django_db
+def test_snapshot_is_reused(event, seats, django_assert_num_queries):
+    assert len(_available(event)) == 10
+    with django_assert_num_queries(0):
+        occupancy = seatoccupancy.read(event)
+    assert occupancy.guids == [s.seat_guid for s in seats]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_writes_invalidate_snapshot(event, item, seats, create_order):
+    version = seatoccupancy.read(event).etag
+
+    with transaction.atomic():
+        cp = CartPosition.objects.create(
+            event=event, item=item, price=23, expires=now() + timedelta(minutes=10), cart_id='foo', seat=seats[0]
+        )
+    assert seatoccupancy.read(event).etag != version
+    assert 'A1' not in _available(event)
+
+    with transaction.atomic():
+        v = Voucher.objects.create(event=event, item=item, seat=seats[1])
+    assert _available(event) == {f'A{i}' for i in range(3, 11)}
+
+    with transaction.atomic():
+        o = create_order(event, item, Order.STATUS_PENDING, seat=seats[2])
+        cp.delete()
+        v.delete()
+    assert _available(event) == {'A1', 'A2'} | {f'A{i}' for i in range(4, 11)}
+
+    with transaction.atomic():
+        o.status = Order.STATUS_EXPIRED
+        o.save()
+        seats[3].blocked = True
+        seats[3].save()
+    assert _available(event) == {'A1', 'A2', 'A3'} | {f'A{i}' for i in range(5, 11)}
+
+    event.settings.seating_allow_blocked_seats_for_channel = ['web']
+    assert 'A4' in _available(event)
+
+
+@pytest.mark.django_db
+def test_snapshot_expires_with_reservations(event, item, seats, fakeredis_client):
+    CartPosition.objects.create(
+        event=event, item=item, price=23, expires=now() + timedelta(minutes=10), cart_id='foo', seat=seats[0]
+    )
+    assert 'A1' not in _available(event)
+    with override_settings(PRETIX_SEAT_OCCUPANCY=False):
+        CartPosition.objects.update(expires=now() - timedelta(minutes=1))
+    fakeredis_client.hset(seatoccupancy._key(event.pk, None), 'valid_until', 0)
+    assert 'A1' in _available(event)
+
+
+@pytest.mark.django_db
+def test_minimal_distance(event, item, seats):
+    event.settings.seating_minimal_distance = 15
+    CartPosition.objects.create(
+        event=event, item=item, price=23, expires=now() + timedelta(minutes=10), cart_id='foo', seat=seats[4]
+    )
+    expected = {s.seat_guid for s in event.free_seats()}
+    assert _available(event) == expected == {'A1', 'A2', 'A3', 'A7', 'A8', 'A9', 'A10'}
+
+
+@pytest.mark.django_db
+def test_availability_view(client, event, item, seats):
+    with scopes_disabled():
+        CartPosition.objects.create(
+            event=event, item=item, price=23, expires=now() + timedelta(minutes=10), cart_id='foo', seat=seats[0]
+        )
+    response = client.get('/dummy/dummy/seatingframe/availability')
+    assert response.status_code == 200
+    data = response.json()
+    assert data['seats'] == [s.seat_guid for s in seats]
+    assert base64.b64decode(data['available']) == bytes([0b01111111, 0b11000000])
+
+    response = client.get('/dummy/dummy/seatingframe/availability', HTTP_IF_NONE_MATCH=response['ETag'])
+    assert response.status_code == 304
+
+
+@pytest.mark.django_db
+def test_outdated_snapshot_is_rebuilt_by_one_worker(event, item, seats, fakeredis_client, django_assert_num_queries):
+    occupancy = seatoccupancy.read(event)
+    fakeredis_client.incr(seatoccupancy._version_key(event.pk, None))
+    fakeredis_client.set(seatoccupancy._build_lock_key(event.pk, None), '1')
+    with django_assert_num_queries(0):
+        assert seatoccupancy.read(event).etag == occupancy.etag
+
+    fakeredis_client.delete(seatoccupancy._build_lock_key(event.pk, None))
+    assert seatoccupancy.read(event).etag != occupancy.etag
+    assert not fakeredis_client.exists(seatoccupancy._build_lock_key(event.pk, None))
+
+
+@pytest.mark.django_db
+def test_free_seats_by_product(event, item, seats):
+    other = Item.objects.create(event=event, name="Reduced", default_price=12)
+    seats[5].product = other
+    seats[5].save()
+    seats[3].blocked = True
+    seats[3].save()
+    CartPosition.objects.create(
+        event=event, item=item, price=23, expires=now() + timedelta(minutes=10), cart_id='foo', seat=seats[0]
+    )
+    assert seatoccupancy.read(event).free_seats_by_product(event) == {
+        item.pk: event.free_seats().filter(product=item).count(),
+        other.pk: 1,
+    }
+
+
+@pytest.mark.django_db
+def test_seatingplan_view(client, event, item, seats):
+    with scopes_disabled():
+        CartPosition.objects.create(
+            event=event, item=item, price=23, expires=now() + timedelta(minutes=10), cart_id='foo', seat=seats[0]
+        )
+    response = client.get('/dummy/dummy/seatingframe/')
+    assert response.status_code == 200
+    assert response.context['seating_occupancy'].guids == [s.seat_guid for s in seats]
+    assert response.context['seating_availability_url'].endswith('/dummy/dummy/seatingframe/availability')
+    assert 'id="seating-availability"' in response.content.decode()
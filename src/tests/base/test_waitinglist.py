@@ -27,7 +27,8 @@ from django.utils.timezone import now
 from django_scopes import scope
 
 from pretix.base.models import (
-    Event, Item, ItemVariation, Organizer, Quota, Voucher, WaitingListEntry,
+    Event, Item, ItemVariation, LogEntry, Organizer, Quota, Voucher,
+    WaitingListEntry,
 )
 from pretix.base.models.waitinglist import WaitingListException
 from pretix.base.reldate import RelativeDate, RelativeDateWrapper
@@ -194,6 +195,25 @@ class WaitingListTestCase(TestCase):
             assert WaitingListEntry.objects.filter(voucher__isnull=True).count() == 10
             assert Voucher.objects.count() == 10
 
+    def test_send_auto_bulk(self):
+        with scope(organizer=self.o):
+            self.quota.items.add(self.item1)
+            self.quota.size = 120
+            self.quota.save()
+            for i in range(150):
+                WaitingListEntry.objects.create(
+                    event=self.event, item=self.item1, email='foo{}@bar.com'.format(i), priority=i % 3
+                )
+
+        assert assign_automatically.apply(args=(self.event.pk,)).get() == 120
+        with scope(organizer=self.o):
+            assert WaitingListEntry.objects.filter(voucher__isnull=True, priority=0).count() == 30
+            assert Voucher.objects.filter(waitinglistentries__isnull=False).count() == 120
+            assert len({v.code for v in Voucher.objects.all()}) == 120
+            assert LogEntry.objects.filter(action_type='pretix.voucher.added.waitinglist').count() == 120
+            assert LogEntry.objects.filter(action_type='pretix.event.orders.waitinglist.voucher_assigned').count() == 120
+        assert len(djmail.outbox) == 120
+
     def test_send_auto_no_seat(self):
         with scope(organizer=self.o):
             self.quota.items.add(self.item1)
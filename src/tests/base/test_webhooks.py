@@ -223,3 +223,120 @@ def test_webhook_disable_gone(event, order, webhook, monkeypatch_on_commit):
     assert len(responses.calls) == 1
     webhook.refresh_from_db()
     assert not webhook.enabled
+
+
+def _log_bulk(order, action_types):
+    from pretix.base.models import LogEntry
+
+    entries = [
+        LogEntry(content_object=order, action_type=a, event=order.event, organizer_id=order.event.organizer_id,
+                 data='{}')
+        for a in action_types
+    ]
+    with transaction.atomic():
+        LogEntry.bulk_create_and_postprocess(entries)
+    return entries
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_webhook_batched(event, order, webhook, monkeypatch_on_commit):
+    webhook.batch_size = 2
+    webhook.save()
+    responses.add(responses.POST, 'https://google.com', status=200)
+    entries = _log_bulk(order, ['pretix.event.order.placed', 'pretix.event.order.paid', 'pretix.event.order.paid'])
+    assert len(responses.calls) == 2
+    assert [p["notification_id"] for p in json.loads(force_str(responses.calls[0].request.body))] == [
+        entries[0].pk, entries[1].pk
+    ]
+    assert json.loads(force_str(responses.calls[1].request.body)) == [{
+        "notification_id": entries[2].pk,
+        "organizer": "dummy",
+        "event": "dummy",
+        "code": "FOO",
+        "action": "pretix.event.order.paid"
+    }]
+    with scopes_disabled():
+        first = webhook.calls.order_by('pk').first()
+        assert first.action_type == 'pretix.event.order.paid, pretix.event.order.placed'
+        assert first.success
+        assert not webhook.queued_events.exists()
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_webhook_batched_failure_keeps_queue(event, order, webhook, monkeypatch_on_commit):
+    from pretix.api.webhooks import send_webhook_batch
+
+    webhook.batch_size = 2
+    webhook.save()
+    responses.add(responses.POST, 'https://google.com', status=500)
+    _log_bulk(order, ['pretix.event.order.placed', 'pretix.event.order.paid', 'pretix.event.order.paid'])
+    assert len(responses.calls) == 1
+    with scopes_disabled():
+        assert list(webhook.queued_events.values_list('retry_count', flat=True)) == [1, 1, 0]
+        assert webhook.queued_events.first().retry_not_before > now()
+        webhook.queued_events.update(retry_not_before=now() - timedelta(seconds=1))
+
+    responses.replace(responses.POST, 'https://google.com', status=200)
+    send_webhook_batch.apply_async(args=(webhook.pk,))
+    assert len(responses.calls) == 3
+    with scopes_disabled():
+        calls = list(webhook.calls.order_by('pk'))
+        assert [c.is_retry for c in calls] == [False, True, False]
+        assert [c.success for c in calls] == [False, True, True]
+        assert not webhook.queued_events.exists()
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_webhook_batch_locked(event, order, webhook, fakeredis_client):
+    from django.core.cache import cache
+
+    from pretix.api.webhooks import send_webhook_batch
+
+    webhook.batch_size = 2
+    webhook.save()
+    responses.add(responses.POST, 'https://google.com', status=200)
+    with scopes_disabled():
+        webhook.queued_events.create(logentry=order.log_action('pretix.event.order.paid'), action_type='pretix.event.order.paid')
+
+    cache.set(f'webhook_batch_sending:{webhook.pk}', 'other', 60)
+    assert send_webhook_batch.apply(args=(webhook.pk,)).get() == 'locked'
+    assert len(responses.calls) == 0
+
+    cache.delete(f'webhook_batch_sending:{webhook.pk}')
+    assert send_webhook_batch.apply(args=(webhook.pk,)).get() == 'ok'
+    assert len(responses.calls) == 1
+    assert not cache.get(f'webhook_batch_sending:{webhook.pk}')
+
+
+@pytest.mark.django_db
+def test_periodic_batch_scheduling_is_deduplicated(event, order, webhook, fakeredis_client, monkeypatch, settings):
+    from pretix.api import webhooks
+
+    settings.HAS_CELERY = True
+    scheduled = []
+    monkeypatch.setattr(webhooks.send_webhook_batch, 'apply_async', lambda **kwargs: scheduled.append(kwargs))
+    webhook.batch_size = 2
+    webhook.save()
+    with scopes_disabled():
+        webhook.queued_events.create(logentry=order.log_action('pretix.event.order.paid'), action_type='pretix.event.order.paid')
+
+    webhooks.schedule_webhook_batch(webhook)
+    webhooks.schedule_webhook_batches_on_celery(sender=None)
+    webhooks.schedule_webhook_batches_on_celery(sender=None)
+    assert scheduled == [{'args': (webhook.pk,), 'countdown': webhook.batch_delay}]
+
+
+@responses.activate
+def test_webhook_session_does_not_keep_cookies():
+    from pretix.api.webhooks import get_session
+
+    responses.add(responses.POST, 'https://google.com', status=200, headers={'Set-Cookie': 'session=foo; Path=/'})
+    session = get_session('https://google.com/webhook')
+    session.post('https://google.com', json={})
+    session.post('https://google.com', json={})
+    assert len(responses.calls) == 2
+    assert 'Cookie' not in responses.calls[1].request.headers
+    assert not session.cookies
@@ -0,0 +1,80 @@
+#
+# This file is part of pretix (Community Edition).
+#
+# Copyright (C) 2014-2020 Raphael Michel and contributors
+# Copyright (C) 2020-2021 rami.io GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+#
+import io
+from datetime import date, datetime, time, timezone
+from decimal import Decimal
+
+import pytest
+
+from pretix.helpers.columnar import (
+    FORMAT_ARROW, FORMAT_PARQUET, write_columnar,
+)
+
+pyarrow = pytest.importorskip('pyarrow')
+
+
+def _read(fmt, data):
+    if fmt == FORMAT_PARQUET:
+        import pyarrow.parquet
+        return pyarrow.parquet.read_table(io.BytesIO(data))
+    import pyarrow.ipc
+    return pyarrow.ipc.open_file(pyarrow.BufferReader(data)).read_all()
+
+
+@pytest.mark.parametrize('fmt', [FORMAT_PARQUET, FORMAT_ARROW])
+def test_types_are_inferred(fmt):
+    f = io.BytesIO()
+    dt = datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    write_columnar(
+        ['Code', 'ID', 'Total', 'Date', 'Time', 'Datetime', 'Paid', 'Mixed'],
+        [
+            ['ABC12', 1, Decimal('23.00'), date(2024, 1, 2), time(3, 4), dt, True, 1],
+            ['DEF34', 2, Decimal('1.5'), None, None, '', False, 'Yes'],
+        ],
+        f, fmt
+    )
+    t = _read(fmt, f.getvalue())
+    assert [str(field.type) for field in t.schema] == [
+        'string', 'int64', 'decimal128(4, 2)', 'date32[day]', 'time64[us]', 'timestamp[us, tz=UTC]', 'bool', 'string',
+    ]
+    assert t.to_pylist()[0] == {
+        'Code': 'ABC12', 'ID': 1, 'Total': Decimal('23.00'), 'Date': date(2024, 1, 2), 'Time': time(3, 4),
+        'Datetime': dt, 'Paid': True, 'Mixed': '1',
+    }
+    assert t.to_pylist()[1]['Date'] is None
+    assert t.to_pylist()[1]['Datetime'] is None
+
+
+def test_duplicate_headers_and_ragged_rows():
+    f = io.BytesIO()
+    write_columnar(['Name', 'Name'], [['a', 'b'], ['c', 'd', 'e'], ['f']], f, FORMAT_PARQUET)
+    t = _read(FORMAT_PARQUET, f.getvalue())
+    assert t.column_names == ['Name', 'Name (2)', 'Column 3']
+    assert t.to_pylist()[2] == {'Name': 'f', 'Name (2)': None, 'Column 3': None}
+
+
+def test_batches(monkeypatch):
+    monkeypatch.setattr('pretix.helpers.columnar.BATCH_SIZE', 3)
+    f = io.BytesIO()
+    write_columnar(['Number'], ([i] for i in range(10)), f, FORMAT_ARROW)
+    t = _read(FORMAT_ARROW, f.getvalue())
+    assert t.column('Number').to_pylist() == list(range(10))
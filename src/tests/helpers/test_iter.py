@@ -0,0 +1,76 @@
+#
+# This file is part of pretix (Community Edition).
+#
+# Copyright (C) 2014-2020 Raphael Michel and contributors
+# Copyright (C) 2020-2021 rami.io GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+#
+import time
+
+import pytest
+from django.utils import translation
+
+from pretix.helpers.iter import (
+    chunked_iterable, iterate_in_background, ordered_parallel_map,
+)
+
+
+def test_chunked_iterable():
+    assert list(chunked_iterable(range(5), 2)) == [(0, 1), (2, 3), (4,)]
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_ordered_parallel_map(workers):
+    def slow_square(i):
+        time.sleep(0.01 * (10 - i))
+        return i * i
+
+    assert list(ordered_parallel_map(slow_square, range(10), workers)) == [i * i for i in range(10)]
+
+
+def test_ordered_parallel_map_keeps_context():
+    with translation.override('de'):
+        assert set(ordered_parallel_map(lambda i: translation.get_language(), range(4), 2)) == {'de'}
+
+
+def test_iterate_in_background():
+    assert list(iterate_in_background(iter(range(100)), buffer_size=3)) == list(range(100))
+
+
+def test_iterate_in_background_raises():
+    def gen():
+        yield 1
+        raise ValueError()
+
+    it = iterate_in_background(gen())
+    assert next(it) == 1
+    with pytest.raises(ValueError):
+        next(it)
+
+
+def test_iterate_in_background_stops_producer():
+    produced = []
+
+    def gen():
+        for i in range(1000):
+            produced.append(i)
+            yield i
+
+    it = iterate_in_background(gen(), buffer_size=2)
+    assert next(it) == 0
+    it.close()
+    assert len(produced) < 10
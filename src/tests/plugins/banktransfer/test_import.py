@@ -792,6 +792,48 @@ def test_ignore_by_external_id(env, job):
         assert BankTransaction.objects.count() == 2
 
 
+@pytest.mark.django_db
+def test_same_order_twice_in_one_import(env, job):
+    process_banktransfers(job, [{
+        'payer': 'Karla Kundin',
+        'reference': 'Bestellung DUMMY1Z3AS',
+        'date': '2016-01-26',
+        'amount': '23.00'
+    }, {
+        'payer': 'Karla Kundin',
+        'reference': 'Bestellung DUMMY1Z3AS',
+        'date': '2016-01-27',
+        'amount': '23.00'
+    }])
+    env[2].refresh_from_db()
+    assert env[2].status == Order.STATUS_PAID
+    with scopes_disabled():
+        assert env[2].payments.count() == 1
+        assert list(BankTransaction.objects.order_by('pk').values_list('state', flat=True)) == [
+            BankTransaction.STATE_VALID, BankTransaction.STATE_DUPLICATE
+        ]
+
+
+@pytest.mark.django_db
+def test_lookups_are_batched(env, job, django_assert_max_num_queries):
+    data = [{
+        'payer': 'Karla Kundin',
+        'reference': 'Bestellung DUMMY{:05d}'.format(i),
+        'date': '2016-01-26',
+        'amount': '23.00'
+    } for i in range(100)]
+    data += [{
+        'payer': 'Karla Kundin',
+        'reference': 'Foobar {}'.format(i),
+        'date': '2016-01-26',
+        'amount': '23.00'
+    } for i in range(100)]
+    with django_assert_max_num_queries(30):
+        process_banktransfers(job, data)
+    with scopes_disabled():
+        assert BankTransaction.objects.filter(state=BankTransaction.STATE_NOMATCH).count() == 200
+
+
 @pytest.mark.django_db
 def test_ambigious_date_without_region(env, job):
     process_banktransfers(job, [{
@@ -0,0 +1,294 @@
+#
+# This file is part of pretix (Community Edition).
+#
+# Copyright (C) 2014-2020 Raphael Michel and contributors
+# Copyright (C) 2020-2021 rami.io GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+#
+import datetime
+import json
+from decimal import Decimal
+
+import pytest
+from django.utils.timezone import now
+from django_scopes import scope
+
+from pretix.base.models import (
+    Event, Item, Order, OrderPayment, OrderPosition, Organizer, Team, User,
+)
+from pretix.plugins.statistics import rollups
+from pretix.plugins.statistics.models import SalesRollup, SalesRollupStatus
+
+DAY1 = datetime.datetime(2023, 3, 1, 12, 0, 0, tzinfo=datetime.timezone.utc)
+DAY2 = datetime.datetime(2023, 3, 3, 12, 0, 0, tzinfo=datetime.timezone.utc)
+
+
+@pytest.fixture
+def event():
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    with scope(organizer=o):
+        event = Event.objects.create(
+            organizer=o, name='Dummy', slug='dummy',
+            date_from=now(),
+            plugins='pretix.plugins.statistics',
+        )
+        yield event
+
+
+@pytest.fixture
+def items(event):
+    return (
+        Item.objects.create(event=event, name="Ticket", default_price=23),
+        Item.objects.create(event=event, name="Shirt", default_price=10),
+    )
+
+
+def _order(event, items, status, code, dt=DAY1, paid_at=None, subevent=None):
+    o = Order.objects.create(
+        code=code, event=event, status=status, datetime=dt, expires=dt + datetime.timedelta(days=10),
+        total=Decimal('33.00'), sales_channel=event.organizer.sales_channels.get(identifier="web"),
+    )
+    OrderPosition.objects.create(order=o, item=items[0], price=Decimal('23.00'), subevent=subevent)
+    OrderPosition.objects.create(order=o, item=items[1], price=Decimal('10.00'), subevent=subevent)
+    if paid_at:
+        o.payments.create(
+            provider='manual', amount=o.total, state=OrderPayment.PAYMENT_STATE_CONFIRMED, payment_date=paid_at
+        )
+    return o
+
+
+def _snapshot(event, subevent=None):
+    return (
+        rollups.orders_by_day(event, subevent),
+        rollups.positions_by_item(event, subevent),
+        rollups.revenue_by_day(event, subevent),
+    )
+
+
+@pytest.mark.django_db
+def test_rebuild(event, items):
+    _order(event, items, Order.STATUS_PAID, 'PAID1', paid_at=DAY2)
+    _order(event, items, Order.STATUS_PENDING, 'PEND1')
+    _order(event, items, Order.STATUS_CANCELED, 'CANC1', dt=DAY2)
+    rollups.rebuild(event)
+
+    assert rollups.orders_by_day(event) == {
+        DAY1.date(): (2, 0),
+        DAY2.date(): (1, 1),
+    }
+    assert rollups.positions_by_item(event) == {
+        items[0].pk: (3, 1),
+        items[1].pk: (3, 1),
+    }
+    assert rollups.revenue_by_day(event) == {DAY2.date(): Decimal('33.00')}
+
+
+@pytest.mark.django_db
+def test_incremental_update_matches_rebuild(event, items):
+    _order(event, items, Order.STATUS_PAID, 'PAID1', paid_at=DAY2)
+    o = _order(event, items, Order.STATUS_PENDING, 'PEND1')
+    rollups.rebuild(event)
+
+    o.status = Order.STATUS_PAID
+    o.save()
+    o.payments.create(
+        provider='manual', amount=o.total, state=OrderPayment.PAYMENT_STATE_CONFIRMED, payment_date=DAY2
+    )
+    o.positions.filter(item=items[1]).update(canceled=True)
+    o2 = _order(event, items, Order.STATUS_PENDING, 'PEND2', dt=DAY2)
+    rollups.update_orders(event, [o.pk, o2.pk])
+    incremental = _snapshot(event)
+    rows = SalesRollup.objects.filter(event=event).count()
+
+    rollups.rebuild(event)
+    assert _snapshot(event) == incremental
+    assert SalesRollup.objects.filter(event=event).count() <= rows
+    assert rollups.revenue_by_day(event) == {DAY2.date(): Decimal('66.00')}
+
+
+@pytest.mark.django_db
+def test_subevents(event, items):
+    event.has_subevents = True
+    event.save()
+    se1 = event.subevents.create(name='SE1', date_from=now())
+    se2 = event.subevents.create(name='SE2', date_from=now())
+    _order(event, items, Order.STATUS_PAID, 'PAID1', paid_at=DAY2, subevent=se1)
+    o = _order(event, items, Order.STATUS_PENDING, 'PEND1', subevent=se2)
+    rollups.rebuild(event)
+
+    assert rollups.orders_by_day(event, se1) == {DAY1.date(): (1, 0), DAY2.date(): (0, 1)}
+    assert rollups.orders_by_day(event, se2) == {DAY1.date(): (1, 0)}
+    assert rollups.orders_by_day(event) == {DAY1.date(): (2, 0), DAY2.date(): (0, 1)}
+    assert rollups.positions_by_item(event, se2) == {items[0].pk: (1, 0), items[1].pk: (1, 0)}
+    assert rollups.revenue_by_day(event, se1) == {DAY2.date(): Decimal('33.00')}
+    assert rollups.revenue_by_day(event, se2) == {}
+
+    OrderPosition.objects.filter(order=o, item=items[1]).update(subevent=se1)
+    rollups.update_orders(event, [o.pk])
+    assert rollups.orders_by_day(event, se1) == {DAY1.date(): (2, 0), DAY2.date(): (0, 1)}
+    assert rollups.positions_by_item(event, se1) == {items[0].pk: (1, 1), items[1].pk: (2, 1)}
+
+
+@pytest.mark.django_db
+def test_not_maintained_before_built(event, items):
+    o = _order(event, items, Order.STATUS_PENDING, 'PEND1')
+    rollups.update_orders(event, [o.pk])
+    assert not SalesRollup.objects.filter(event=event).exists()
+
+
+@pytest.mark.django_db
+def test_changes_during_build_are_applied(event, items, monkeypatch):
+    o = _order(event, items, Order.STATUS_PENDING, 'PEND1')
+    compute_contributions = rollups.compute_contributions
+
+    def compute_and_change(*args, **kwargs):
+        result = compute_contributions(*args, **kwargs)
+        if kwargs.get('order_ids') is None and len(args) < 2:
+            # Changes that happen while the rebuild is reading are not seen by it and can't be applied yet
+            o.status = Order.STATUS_PAID
+            o.save()
+            o.payments.create(
+                provider='manual', amount=o.total, state=OrderPayment.PAYMENT_STATE_CONFIRMED, payment_date=DAY2
+            )
+            _order(event, items, Order.STATUS_PENDING, 'PEND2', dt=DAY2)
+            assert rollups.update_orders(event, [o.pk]) == 0
+        return result
+
+    monkeypatch.setattr(rollups, 'compute_contributions', compute_and_change)
+    rollups.rebuild(event)
+    assert rollups.orders_by_day(event) == {DAY1.date(): (1, 0), DAY2.date(): (1, 1)}
+    assert rollups.revenue_by_day(event) == {DAY2.date(): Decimal('33.00')}
+
+
+@pytest.mark.django_db
+def test_reconcile_repairs_drift(event, items):
+    o = _order(event, items, Order.STATUS_PENDING, 'PEND1')
+    rollups.rebuild(event)
+    status = SalesRollupStatus.objects.get(event=event)
+    assert rollups.reconcile(status) == 0
+
+    # Changes without a signal
+    Order.objects.filter(pk=o.pk).update(status=Order.STATUS_PAID, last_modified=now())
+    status.refresh_from_db()
+    assert rollups.reconcile(status) == 1
+    assert rollups.positions_by_item(event) == {items[0].pk: (1, 1), items[1].pk: (1, 1)}
+    reconciled = _snapshot(event)
+    rollups.rebuild(event)
+    assert _snapshot(event) == reconciled
+
+
+@pytest.mark.django_db
+def test_order_signals(event, items, django_capture_on_commit_callbacks):
+    rollups.rebuild(event)
+    o = _order(event, items, Order.STATUS_PENDING, 'PEND1')
+    with django_capture_on_commit_callbacks(execute=True):
+        o.payments.create(
+            provider='manual', amount=o.total, state=OrderPayment.PAYMENT_STATE_CREATED
+        ).confirm()
+    assert rollups.positions_by_item(event) == {items[0].pk: (1, 1), items[1].pk: (1, 1)}
+    assert sum(rollups.revenue_by_day(event).values()) == Decimal('33.00')
+
+
+@pytest.mark.django_db
+def test_gracefully_deleted_order(event, items):
+    event.testmode = True
+    event.save()
+    o = _order(event, items, Order.STATUS_PENDING, 'PEND1')
+    o.testmode = True
+    o.save()
+    rollups.rebuild(event)
+    assert rollups.orders_by_day(event) == {DAY1.date(): (1, 0)}
+    o.gracefully_delete(user=None)
+    assert rollups.orders_by_day(event) == {}
+
+
+@pytest.mark.django_db
+def test_uninstall_clears(event, items):
+    _order(event, items, Order.STATUS_PENDING, 'PEND1')
+    rollups.rebuild(event)
+    event.disable_plugin('pretix.plugins.statistics')
+    assert not rollups.is_built(event)
+    assert not SalesRollup.objects.filter(event=event).exists()
+
+
+@pytest.mark.django_db
+def test_view(client, event, items):
+    _order(event, items, Order.STATUS_PAID, 'PAID1', paid_at=DAY2)
+    user = User.objects.create_user('dummy@dummy.dummy', 'dummy')
+    t = Team.objects.create(organizer=event.organizer, can_view_orders=True)
+    t.members.add(user)
+    t.limit_events.add(event)
+    client.login(email='dummy@dummy.dummy', password='dummy')
+
+    r = client.get('/control/event/dummy/dummy/statistics/')
+    assert r.status_code == 200
+    assert rollups.is_built(event)
+    obp = json.loads(r.context['obp_data'])
+    assert obp == [
+        {'item': 'Ticket', 'item_short': 'Ticket', 'ordered': 1, 'paid': 1},
+        {'item': 'Shirt', 'item_short': 'Shirt', 'ordered': 1, 'paid': 1},
+    ]
+    rev = json.loads(r.context['rev_data'])
+    assert rev == [{'date': '2023-03-03', 'revenue': 33.0}]
+
+
+@pytest.mark.django_db
+def test_view_while_building(client, event, items, monkeypatch, fakeredis_client):
+    from pretix.plugins.statistics import tasks
+
+    _order(event, items, Order.STATUS_PAID, 'PAID1', paid_at=DAY2)
+    user = User.objects.create_user('dummy@dummy.dummy', 'dummy')
+    t = Team.objects.create(organizer=event.organizer, can_view_orders=True)
+    t.members.add(user)
+    t.limit_events.add(event)
+    client.login(email='dummy@dummy.dummy', password='dummy')
+
+    scheduled = []
+    monkeypatch.setattr(tasks.build_rollups, 'apply_async', lambda **kwargs: scheduled.append(kwargs))
+    r = client.get('/control/event/dummy/dummy/statistics/')
+    assert r.status_code == 200
+    assert r.context['rollups_pending']
+    assert 'being computed' in r.content.decode()
+    r = client.get('/control/event/dummy/dummy/statistics/')
+    assert r.context['rollups_pending']
+    assert scheduled == [{'kwargs': {'event': event.pk}}]
+    assert not rollups.is_built(event)
+
+
+@pytest.mark.django_db
+def test_rebuild_locked(event, items, fakeredis_client):
+    from django.core.cache import cache
+
+    _order(event, items, Order.STATUS_PAID, 'PAID1', paid_at=DAY2)
+    cache.set(rollups._rebuild_lock_key(event.pk), 'other', 60)
+    assert not rollups.rebuild(event)
+    assert not rollups.is_built(event)
+    cache.delete(rollups._rebuild_lock_key(event.pk))
+    assert rollups.rebuild(event)
+    assert rollups.is_built(event)
+
+
+@pytest.mark.django_db
+def test_periodic_reconcile(event, items):
+    from pretix.plugins.statistics.signals import reconcile_rollups
+
+    o = _order(event, items, Order.STATUS_PENDING, 'PEND1')
+    rollups.rebuild(event)
+    Order.objects.filter(pk=o.pk).update(status=Order.STATUS_PAID, last_modified=now())
+    reconcile_rollups(sender=None)
+    assert rollups.positions_by_item(event) == {items[0].pk: (1, 1), items[1].pk: (1, 1)}
+    assert SalesRollupStatus.objects.get(event=event).reconciled > o.last_modified
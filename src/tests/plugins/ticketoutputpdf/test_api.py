@@ -23,15 +23,17 @@ import copy
 import json
 from datetime import timedelta
 from decimal import Decimal
+from io import BytesIO
 
 import pytest
 from django.core.files.base import ContentFile
 from django.utils.timezone import now
 from django_scopes import scopes_disabled
+from pypdf import PdfReader
 from rest_framework.test import APIClient
 
 from pretix.base.models import (
-    Event, Item, Order, OrderPosition, Organizer, Team,
+    CachedFile, Event, Item, Order, OrderPosition, Organizer, Team,
 )
 from pretix.plugins.ticketoutputpdf.models import TicketLayoutItem
 
@@ -268,6 +270,31 @@ def test_renderer_batch_valid(env, token_client, position):
     assert resp["Content-Type"] == "application/pdf"
 
 
+@pytest.mark.django_db
+@pytest.mark.parametrize("has_celery", [False, True])
+def test_renderer_batch_sharded(env, token_client, position, monkeypatch, settings, has_celery):
+    settings.HAS_CELERY = has_celery
+    monkeypatch.setattr('pretix.plugins.ticketoutputpdf.tasks.SHARD_SIZE', 2)
+    resp = token_client.post(
+        '/api/v1/organizers/{}/events/{}/ticketpdfrenderer/render_batch/'.format(env[0].slug, env[0].slug),
+        {
+            "parts": [
+                {
+                    "orderposition": position.pk,
+                }
+            ] * 5
+        },
+        format='json',
+    )
+    assert resp.status_code == 202
+    resp = token_client.get("/" + resp.data["download"].split("/", 3)[3])
+    assert resp.status_code == 200
+    pdf = PdfReader(BytesIO(b"".join(resp.streaming_content)))
+    assert len(pdf.pages) == 5
+    with scopes_disabled():
+        assert CachedFile.objects.filter(filename="part.pdf").count() == 0
+
+
 @pytest.mark.django_db
 def test_renderer_batch_invalid(env, token_client, position):
     resp = token_client.post(
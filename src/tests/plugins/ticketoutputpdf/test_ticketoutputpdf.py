@@ -31,6 +31,7 @@ from pypdf import PdfReader
 from pretix.base.models import (
     Event, Item, ItemVariation, Order, OrderPosition, Organizer,
 )
+from pretix.plugins.ticketoutputpdf.exporters import AllTicketsPDF
 from pretix.plugins.ticketoutputpdf.ticketoutput import PdfTicketOutput
 
 
@@ -73,3 +74,33 @@ def test_generate_pdf(env0):
         assert ftype == 'application/pdf'
         pdf = PdfReader(BytesIO(buf))
         assert len(pdf.pages) == 1
+
+
+@pytest.mark.django_db
+def test_generate_order_pdf(env0):
+    event, order = env0
+    with scope(organizer=event.organizer):
+        o = PdfTicketOutput(event)
+        fname, ftype, buf = o.generate_order(order)
+        assert ftype == 'application/pdf'
+        pdf = PdfReader(BytesIO(buf))
+        assert len(pdf.pages) == 2
+        assert '1234' in pdf.pages[0].extract_text()
+        assert '5678' in pdf.pages[1].extract_text()
+        assert len(o._renderers) == 1
+
+
+@pytest.mark.django_db
+def test_all_tickets_pdf_sharded(env0, monkeypatch):
+    monkeypatch.setattr('pretix.plugins.ticketoutputpdf.exporters.SHARD_SIZE', 1)
+    event, order = env0
+    with scope(organizer=event.organizer):
+        order.status = Order.STATUS_PAID
+        order.save()
+        progress = []
+        fname, ftype, buf = AllTicketsPDF(event, event.organizer, progress.append).render({'order_by': 'code'})
+        pdf = PdfReader(BytesIO(buf))
+        assert len(pdf.pages) == 2
+        assert '1234' in pdf.pages[0].extract_text()
+        assert '5678' in pdf.pages[1].extract_text()
+        assert progress == [50, 100]